@@ -3,7 +3,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
 from app.utils.response import error_response
-from app.routers import stops, routes, schedule
+from app.routers import stops, routes, schedule, trips, tiles
 from app.routers import realtime
 from app.services import gtfs_service
 from app.core.security import api_key_required
@@ -20,9 +20,51 @@ setup_logging()
 logger = logging.getLogger("cercanias")
 
 
+async def _start_worker(app: FastAPI) -> None:
+    """Multi-worker mode: serve from the supervisor's published state, never download or poll."""
+    from app.core.rt_fetcher import rt_fetcher
+    from app.core.supervisor import follow_snapshot
+
+    await asyncio.to_thread(gtfs_service._load_snapshot)
+    from app.core.warmup import warmup
+
+    if gtfs_service.gtfs_db_valid():
+        warmup.ensure(gtfs_service.gtfs_db_path())
+    gtfs_service.startup_status.update(mode="worker", ready=True)
+    rt_fetcher.follow()
+    app.state._rt_fetcher = rt_fetcher
+    app.state._snapshot_stop = asyncio.Event()
+    app.state._snapshot_follower = asyncio.get_event_loop().create_task(follow_snapshot(app.state._snapshot_stop))
+    logger.info("Started as worker (PROCESS_ROLE=worker)")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     """Lifespan handler: carga GTFS antes de servir y limpia recursos al cerrar."""
+    from app.core import shared_state
+
+    if shared_state.role() == "worker":
+        try:
+            await _start_worker(app)
+        except Exception as e:
+            logger.exception(f"Failed to start worker: {e}")
+        yield
+        stop = getattr(app.state, "_snapshot_stop", None)
+        if stop:
+            stop.set()
+            await asyncio.gather(app.state._snapshot_follower, return_exceptions=True)
+        rt = getattr(app.state, "_rt_fetcher", None)
+        if rt:
+            try:
+                await rt.stop()
+            except Exception:
+                logger.exception("Error while stopping RT fetcher")
+        return
+
+    from time import perf_counter
+
+    started = perf_counter()
+    status = gtfs_service.startup_status
     # carga GTFS en un thread para no bloquear el event loop
     try:
         # ensure data dir exists so services and downloader can write
@@ -33,7 +75,22 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
         except Exception:
             pass
 
-        await asyncio.to_thread(gtfs_service.load_if_present)
+        if settings.FAST_STARTUP and gtfs_service.gtfs_db_valid():
+            # gtfs.db can already answer reads: serve now, load/rebuild in the background
+            status.update(mode="fast", background_load="running")
+
+            async def _background_load():
+                try:
+                    await asyncio.to_thread(gtfs_service.load_if_present)
+                    status["background_load"] = "done"
+                except Exception:
+                    status["background_load"] = "failed"
+                    logger.exception("Background GTFS load failed")
+
+            app.state._background_load = asyncio.get_event_loop().create_task(_background_load())
+        else:
+            status.update(mode="blocking")
+            await asyncio.to_thread(gtfs_service.load_if_present)
     except AttributeError:
         # fallback si asyncio.to_thread no está disponible
         import concurrent.futures
@@ -72,6 +129,16 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
                 logger.exception("Failed to read GTFS downloader metadata on startup")
     except Exception as e:
         logger.exception(f"Failed to start GTFS downloader: {e}")
+    # read the hot index pages before /readyz lets traffic in
+    try:
+        from app.core.warmup import warmup
+
+        if gtfs_service.gtfs_db_valid():
+            warmup.ensure(gtfs_service.gtfs_db_path())
+    except Exception:
+        logger.exception("Failed to start the page-cache warm-up")
+    status.update(ready=True, startup_ms=round((perf_counter() - started) * 1000.0, 1))
+    logger.info("Startup complete in %.1fms (mode=%s)", status["startup_ms"], status["mode"])
     yield
     # shutdown: stop realtime fetcher if running
     rt = getattr(app.state, "_rt_fetcher", None)
@@ -108,6 +175,13 @@ tags_metadata = [
             "Las respuestas incluyen la fecha de servicio cuando aplica."
         ),
     },
+    {
+        "name": "Trips",
+        "description": (
+            "Detalle de viajes individuales: paradas en orden, forma y retraso en "
+            "tiempo real, leídos de una tabla `stop_times` agrupada por viaje."
+        ),
+    },
     {
         "name": "Realtime",
         "description": (
@@ -116,6 +190,27 @@ tags_metadata = [
             "que necesiten datos RT ligeros y serializables."
         ),
     },
+    {
+        "name": "Tiles",
+        "description": (
+            "Teselas vectoriales (Mapbox Vector Tiles) con paradas, formas de las rutas "
+            "y vehículos en tiempo real para mapas web."
+        ),
+    },
+    {
+        "name": "Analytics",
+        "description": (
+            "Analítica histórica calculada a partir del feed en tiempo real: retrasos "
+            "típicos por línea, parada y hora, y puntualidad diaria."
+        ),
+    },
+    {
+        "name": "Health",
+        "description": (
+            "Sondas de liveness (`/healthz`) y readiness (`/readyz`) para balanceadores "
+            "y orquestadores. No requieren API key."
+        ),
+    },
     {
         "name": "Admin",
         "description": (
@@ -149,26 +244,26 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(stops.router, dependencies=[Depends(api_key_required)])
 app.include_router(routes.router, dependencies=[Depends(api_key_required)])
 app.include_router(schedule.router, dependencies=[Depends(api_key_required)])
+app.include_router(trips.router, dependencies=[Depends(api_key_required)])
 app.include_router(realtime.router, dependencies=[Depends(api_key_required)])
+app.include_router(tiles.router, dependencies=[Depends(api_key_required)])
+from app.routers import analytics as analytics_router
+app.include_router(analytics_router.router, dependencies=[Depends(api_key_required)])
 from app.routers import admin as admin_router
 app.include_router(admin_router.router, dependencies=[Depends(api_key_required)])
 from app.routers import ui as ui_router
 app.include_router(ui_router.router)
+from app.routers import health as health_router
+app.include_router(health_router.router)
 
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Middleware simple para registrar peticiones entrantes y respuestas.
+from app.routers import metrics as metrics_router
+app.include_router(metrics_router.router, dependencies=[Depends(api_key_required)])
 
-    Registra: method, path, remote, status_code, elapsed_ms
-    """
-    import time
+from app.core.metrics import MetricsMiddleware
 
-    start = time.time()
-    response = await call_next(request)
-    elapsed = (time.time() - start) * 1000
-    logger.info(f"{request.method} {request.url.path} -> {response.status_code} ({elapsed:.1f}ms)")
-    return response
+# latencia por plantilla de ruta para /metrics (el log por petición queda en DEBUG, logger cercanias.access)
+app.add_middleware(MetricsMiddleware)
 
 
 
@@ -4,27 +4,34 @@ This module exposes the FastAPI instance defined in the top-level `app.py` file
 as the attribute `app`, so tests and other imports that do `from app import app`
 continue to work even though there is a package named `app`.
 
-We load `app.py` explicitly from the project root and expose its `app` symbol.
+`app.py` is loaded on first access to `app.app` (module `__getattr__`), so
+importing a submodule such as `app.core.supervisor` or `app.config.settings`
+does not build the whole FastAPI application and its routers.
 """
-from importlib import util, import_module
+from importlib import util
 import os
 import sys
 
 _root = os.path.dirname(os.path.dirname(__file__))
 _app_py = os.path.join(_root, "app.py")
 
-if os.path.exists(_app_py):
+__all__ = ["app"]
+
+
+def _load_app():
+	if not os.path.exists(_app_py):
+		return None
 	spec = util.spec_from_file_location("_cercanias_app_module", _app_py)
 	module = util.module_from_spec(spec)
 	sys.modules[spec.name] = module
 	spec.loader.exec_module(module)
 	# expose the FastAPI instance
-	try:
-		app = getattr(module, "app")
-	except Exception:
-		# fallback: module may not define app yet
-		app = None
-else:
-	app = None
+	return getattr(module, "app", None)
 
-__all__ = ["app"]
+
+def __getattr__(name):
+	if name == "app":
+		value = _load_app()
+		globals()["app"] = value
+		return value
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -41,6 +41,25 @@ class Settings:
             self.GTFS_DOWNLOAD_INTERVAL_HOURS: int = int(os.getenv("GTFS_DOWNLOAD_INTERVAL_HOURS", "24"))
         except Exception:
             self.GTFS_DOWNLOAD_INTERVAL_HOURS = 24
+        # Fast startup: when a valid gtfs.db already exists, serve immediately and
+        # run load_if_present (rebuilds, snapshot/zip loads) in the background
+        self.FAST_STARTUP: bool = _bool_env("FAST_STARTUP", False)
+        # Arrow snapshot of the typed tables next to gtfs.db (needs pyarrow)
+        self.GTFS_SNAPSHOT_ENABLED: bool = _bool_env("GTFS_SNAPSHOT_ENABLED", True)
+
+        # Multi-worker mode: "standalone" (one process does everything), "supervisor"
+        # (downloads, rebuilds and RT polling; publishes to SHARED_STATE_DIR) or
+        # "worker" (serves requests from the published state, read-only)
+        self.PROCESS_ROLE: str = os.getenv("PROCESS_ROLE", "standalone").strip().lower()
+        try:
+            self.WORKERS: int = int(os.getenv("WORKERS", "1"))
+        except Exception:
+            self.WORKERS = 1
+        self.SHARED_STATE_DIR: str = os.getenv("SHARED_STATE_DIR", "")
+        try:
+            self.SHARED_STATE_POLL_INTERVAL: float = float(os.getenv("SHARED_STATE_POLL_INTERVAL", "1.0"))
+        except Exception:
+            self.SHARED_STATE_POLL_INTERVAL = 1.0
 
         self.RT_ALERTS_URL: str = os.getenv("RT_ALERTS_URL", "https://gtfsrt.renfe.com/alerts.pb")
         self.RT_VEHICLES_URL: str = os.getenv("RT_VEHICLES_URL", "https://gtfsrt.renfe.com/vehicle_positions.pb")
@@ -57,6 +76,87 @@ class Settings:
             self.RT_MAX_RETRIES: int = int(os.getenv("RT_MAX_RETRIES", "3"))
         except Exception:
             self.RT_MAX_RETRIES = 3
+        # In-memory (pandas) schedule cache
+        try:
+            self.SCHEDULE_CACHE_MAX_MB: int = int(os.getenv("SCHEDULE_CACHE_MAX_MB", "256"))
+        except Exception:
+            self.SCHEDULE_CACHE_MAX_MB = 256
+        # Per-origin direct connection maps (/stops/{from}/to/{to}/departures)
+        try:
+            self.CONNECTIONS_CACHE_MAX_MB: int = int(os.getenv("CONNECTIONS_CACHE_MAX_MB", "64"))
+        except Exception:
+            self.CONNECTIONS_CACHE_MAX_MB = 64
+        self.SCHEDULE_PRECOMPUTE_ENABLED: bool = _bool_env("SCHEDULE_PRECOMPUTE_ENABLED", True)
+        try:
+            self.SCHEDULE_PRECOMPUTE_DAYS_BEFORE: int = int(os.getenv("SCHEDULE_PRECOMPUTE_DAYS_BEFORE", "1"))
+        except Exception:
+            self.SCHEDULE_PRECOMPUTE_DAYS_BEFORE = 1
+        try:
+            self.SCHEDULE_PRECOMPUTE_DAYS_AFTER: int = int(os.getenv("SCHEDULE_PRECOMPUTE_DAYS_AFTER", "7"))
+        except Exception:
+            self.SCHEDULE_PRECOMPUTE_DAYS_AFTER = 7
+
+        # Look-ahead of departure boards (/stops/{id}/upcoming), in hours
+        try:
+            self.UPCOMING_WINDOW_HOURS: float = float(os.getenv("UPCOMING_WINDOW_HOURS", "6"))
+        except Exception:
+            self.UPCOMING_WINDOW_HOURS = 6.0
+
+        # Douglas-Peucker tolerances (metres) precomputed per shape for /routes|/trips/{id}/shape
+        try:
+            self.SHAPE_TOLERANCES_M: list = [float(t) for t in os.getenv("SHAPE_TOLERANCES_M", "0,2,10,50,200").split(",") if t.strip()]
+        except Exception:
+            self.SHAPE_TOLERANCES_M = [0.0, 2.0, 10.0, 50.0, 200.0]
+
+        # Vector tiles (/tiles/{z}/{x}/{y}.mvt): encoded layer cache and first zoom with stops
+        try:
+            self.TILE_CACHE_MAX_MB: int = int(os.getenv("TILE_CACHE_MAX_MB", "64"))
+        except Exception:
+            self.TILE_CACHE_MAX_MB = 64
+        try:
+            self.TILE_STOPS_MIN_ZOOM: int = int(os.getenv("TILE_STOPS_MIN_ZOOM", "9"))
+        except Exception:
+            self.TILE_STOPS_MIN_ZOOM = 9
+
+        # Headway / service span tables (/analytics/headways, /analytics/service-span), per service date
+        try:
+            self.ANALYTICS_CACHE_MAX_MB: int = int(os.getenv("ANALYTICS_CACHE_MAX_MB", "32"))
+        except Exception:
+            self.ANALYTICS_CACHE_MAX_MB = 32
+
+        # Vehicle position interpolation between RT polls
+        try:
+            self.RT_INTERPOLATION_MAX_SECS: int = int(os.getenv("RT_INTERPOLATION_MAX_SECS", "120"))
+        except Exception:
+            self.RT_INTERPOLATION_MAX_SECS = 120
+        try:
+            self.RT_STREAM_INTERVAL: float = float(os.getenv("RT_STREAM_INTERVAL", "5"))
+        except Exception:
+            self.RT_STREAM_INTERVAL = 5.0
+
+        # Delay history (GTFS-RT trip_updates log + rollups)
+        self.DELAY_HISTORY_ENABLED: bool = _bool_env("DELAY_HISTORY_ENABLED", True)
+        # defaults to <GTFS_DATA_DIR>/delays.db when empty
+        self.DELAY_HISTORY_DB: Optional[str] = os.getenv("DELAY_HISTORY_DB") or None
+        try:
+            self.DELAY_LOG_RETENTION_DAYS: int = int(os.getenv("DELAY_LOG_RETENTION_DAYS", "14"))
+        except Exception:
+            self.DELAY_LOG_RETENTION_DAYS = 14
+        try:
+            self.DELAY_ROLLUP_RETENTION_DAYS: int = int(os.getenv("DELAY_ROLLUP_RETENTION_DAYS", "180"))
+        except Exception:
+            self.DELAY_ROLLUP_RETENTION_DAYS = 180
+        try:
+            self.DELAY_ON_TIME_THRESHOLD_SECS: int = int(os.getenv("DELAY_ON_TIME_THRESHOLD_SECS", "180"))
+        except Exception:
+            self.DELAY_ON_TIME_THRESHOLD_SECS = 180
+
+        # Opt-in GTFSStore query profiler (EXPLAIN QUERY PLAN per SQL shape + slow-query log)
+        self.QUERY_PROFILER_ENABLED: bool = _bool_env("QUERY_PROFILER_ENABLED", False)
+        try:
+            self.SLOW_QUERY_MS: float = float(os.getenv("SLOW_QUERY_MS", "100"))
+        except Exception:
+            self.SLOW_QUERY_MS = 100.0
 
 
 settings = Settings()
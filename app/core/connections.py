@@ -0,0 +1,109 @@
+"""Direct stop-to-stop connections ("next trains from A that also call at B").
+
+For an origin stop the index holds, per destination reachable without
+changing trains, the calls sorted by departure time at the origin as
+parallel arrays (departure / arrival seconds from the service day's
+midnight and a trip reference). It is built on first use from one indexed
+self-join of `stop_times` (`GTFSStore.get_origin_connections`) and cached per
+feed generation in a byte-bounded LRU, so a query is a dict lookup plus a
+`bisect` into the departure array for each service day.
+
+An all-pairs table built with the feed would grow with the square of the
+stops per trip; per-origin entries only exist for origins that are asked for.
+"""
+import bisect
+import heapq
+import itertools
+import sys
+from array import array
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+from app.core import metrics
+from app.core.cache import ByteLRUCache
+
+# per-trip fields kept for each call: trip_id, service_id, route_id, route_short_name, trip_headsign
+TripRef = Tuple[str, str, str, Optional[str], Optional[str]]
+
+
+class OriginConnections:
+    """destination stop_id -> (departure secs, arrival secs, trip refs), sorted by departure."""
+
+    __slots__ = ("origin", "by_destination", "nbytes")
+
+    def __init__(self, origin: str, rows: Iterable[Sequence]):
+        self.origin = origin
+        grouped: Dict[str, List[Tuple[int, int, TripRef]]] = {}
+        for dep, arr, dest, trip_id, service_id, route_id, short_name, headsign in rows:
+            if dep is None or arr is None:
+                continue
+            grouped.setdefault(str(dest), []).append(
+                (int(dep), int(arr), (str(trip_id), str(service_id), str(route_id), short_name, headsign))
+            )
+        self.by_destination: Dict[str, Tuple[array, array, List[TripRef]]] = {}
+        nbytes = sys.getsizeof(self.by_destination)
+        for dest, calls in grouped.items():
+            calls.sort(key=lambda c: c[0])
+            deps = array("i", (c[0] for c in calls))
+            arrs = array("i", (c[1] for c in calls))
+            trips = [c[2] for c in calls]
+            self.by_destination[dest] = (deps, arrs, trips)
+            # arrays plus the (shared) trip tuples referenced by the list
+            nbytes += deps.itemsize * len(deps) * 2 + sys.getsizeof(trips) + 64 * len(trips)
+        self.nbytes = nbytes
+
+    def calls(self, destination: str, service_days: Sequence[Tuple], now: datetime, window_secs: int, limit: int) -> List[Tuple]:
+        """Next `limit` calls to `destination` departing within `window_secs` of `now`.
+
+        `service_days` is [(date, active service_ids)]; each day is one bisect on the
+        departure array, and the per-day lists are merged on absolute departure time.
+        Returns (departure datetime, arrival datetime, service_date, departure secs,
+        arrival secs, TripRef); the seconds are GTFS times of that service date.
+        """
+        entry = self.by_destination.get(str(destination))
+        if entry is None:
+            return []
+        deps, arrs, trips = entry
+        per_day = []
+        for day, services in service_days:
+            if not services:
+                continue
+            active = services if isinstance(services, (set, frozenset)) else set(services)
+            day_start = datetime.combine(day, time())
+            lo = int((now - day_start).total_seconds())
+            hi = lo + window_secs
+            if hi < 0:
+                continue
+            out = []
+            i = bisect.bisect_left(deps, max(lo, 0))
+            while i < len(deps) and deps[i] <= hi and len(out) < limit:
+                ref = trips[i]
+                if ref[1] in active:
+                    dep, arr = deps[i], arrs[i]
+                    out.append((day_start + timedelta(seconds=dep), day_start + timedelta(seconds=arr), day, dep, arr, ref))
+                i += 1
+            per_day.append(out)
+        return list(itertools.islice(heapq.merge(*per_day, key=lambda call: call[0]), limit))
+
+
+class ConnectionIndex:
+    """Per-origin connection maps, cached by (feed generation, origin)."""
+
+    def __init__(self, max_bytes: int):
+        self.cache = ByteLRUCache(max_bytes)
+
+    def origin(self, store, generation: str, origin: str) -> OriginConnections:
+        key = (generation, str(origin))
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = OriginConnections(str(origin), store.get_origin_connections(str(origin)))
+            self.cache.put(key, entry, size=entry.nbytes)
+        return entry
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+connection_index = ConnectionIndex(max(int(settings.CONNECTIONS_CACHE_MAX_MB), 0) * 1024 * 1024)
+metrics.register_cache("connections", connection_index.cache)
@@ -0,0 +1,392 @@
+"""Append-only GTFS-RT delay log with pre-aggregated rollups.
+
+Each trip_updates poll is written in one batch to a daily partition table
+(`delay_log_YYYYMMDD`) inside a dedicated SQLite file (`delays.db`), kept apart
+from `gtfs.db` because the latter is replaced on every static feed rebuild.
+
+Only changes are logged: a (trip, stop) pair is appended the first time it is
+seen on a service date (the TripUpdate `start_date`, so trips past midnight
+stay on the day they started) and again whenever its delay changes. Each log row keeps
+the rollup hour it was counted in, so a restart keeps updating the same bucket. The same batch
+updates `delay_rollup`, keyed on service_date x route_id x stop_id x hour, so
+each (trip, stop) contributes exactly one sample carrying its latest delay.
+Analytics endpoints read only the rollups.
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.gtfs_service import gtfs_db_path
+
+logger = logging.getLogger("cercanias.delay_history")
+
+_PARTITION_PREFIX = "delay_log_"
+_PARTITION_RE = re.compile(r"^delay_log_(\d{8})$")
+
+_ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS delay_rollup (
+  service_date TEXT NOT NULL,
+  route_id TEXT NOT NULL,
+  stop_id TEXT NOT NULL,
+  hour INTEGER NOT NULL,
+  samples INTEGER NOT NULL DEFAULT 0,
+  delay_sum INTEGER NOT NULL DEFAULT 0,
+  delay_sq_sum INTEGER NOT NULL DEFAULT 0,
+  max_delay INTEGER NOT NULL DEFAULT 0,
+  on_time INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (service_date, route_id, stop_id, hour)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_delay_rollup_route ON delay_rollup(route_id, service_date);
+CREATE INDEX IF NOT EXISTS ix_delay_rollup_stop ON delay_rollup(stop_id, service_date);
+"""
+
+_ROLLUP_UPSERT = (
+    "INSERT INTO delay_rollup (service_date, route_id, stop_id, hour, samples, delay_sum, delay_sq_sum, max_delay, on_time) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(service_date, route_id, stop_id, hour) DO UPDATE SET "
+    "samples = samples + excluded.samples, "
+    "delay_sum = delay_sum + excluded.delay_sum, "
+    "delay_sq_sum = delay_sq_sum + excluded.delay_sq_sum, "
+    "max_delay = MAX(max_delay, excluded.max_delay), "
+    "on_time = on_time + excluded.on_time"
+)
+
+_GROUP_COLUMNS = {"hour": "hour", "route": "route_id", "stop": "stop_id", "date": "service_date"}
+
+
+def _stop_time_delay(stu) -> Tuple[Optional[int], Optional[int]]:
+    """Return (delay_secs, event_time) for a StopTimeUpdate, preferring arrival."""
+    for field in ("arrival", "departure"):
+        if stu.HasField(field):
+            ev = getattr(stu, field)
+            delay = ev.delay if ev.HasField("delay") else None
+            event_time = ev.time if ev.HasField("time") else None
+            if delay is not None:
+                return delay, event_time
+    return None, None
+
+
+def _service_bucket(scheduled: int, start_date: str) -> Tuple[str, int]:
+    """Return (YYYYMMDD service date, hour 0-23) for a scheduled epoch time.
+
+    The service date is the TripUpdate `start_date` when it is valid, so a trip
+    running past midnight (24:xx) stays on the day it started; the hour is that
+    of the scheduled HH:MM:SS modulo 24. Without `start_date` the wall-clock
+    date of the scheduled time is used.
+    """
+    if start_date:
+        try:
+            midnight = datetime.strptime(start_date, "%Y%m%d").timestamp()
+        except ValueError:
+            midnight = None
+        if midnight is not None and 0 <= scheduled - midnight < 2 * 86400:
+            return start_date, int((scheduled - midnight) // 3600) % 24
+    dt = datetime.fromtimestamp(scheduled)
+    return dt.strftime("%Y%m%d"), dt.hour
+
+
+def extract_delays(updates: Iterable) -> List[Dict]:
+    """Flatten TripUpdate protobufs into delay observations.
+
+    Each observation has trip_id, route_id, start_date (YYYYMMDD or ""),
+    stop_id, stop_sequence, delay and event_time (epoch seconds or None). Trips that only carry a trip-level
+    `delay` produce one observation with an empty stop_id.
+    """
+    out: List[Dict] = []
+    for u in updates:
+        trip = getattr(u, "trip", None)
+        trip_id = getattr(trip, "trip_id", "") or ""
+        route_id = getattr(trip, "route_id", "") or ""
+        start_date = getattr(trip, "start_date", "") or ""
+        found = False
+        for stu in getattr(u, "stop_time_update", []):
+            delay, event_time = _stop_time_delay(stu)
+            if delay is None:
+                continue
+            found = True
+            out.append({
+                "trip_id": trip_id,
+                "route_id": route_id,
+                "start_date": start_date,
+                "stop_id": stu.stop_id or "",
+                "stop_sequence": stu.stop_sequence if stu.HasField("stop_sequence") else None,
+                "delay": int(delay),
+                "event_time": int(event_time) if event_time else None,
+            })
+        if not found and u.HasField("delay"):
+            out.append({
+                "trip_id": trip_id,
+                "route_id": route_id,
+                "start_date": start_date,
+                "stop_id": "",
+                "stop_sequence": None,
+                "delay": int(u.delay),
+                "event_time": int(u.timestamp) if u.HasField("timestamp") else None,
+            })
+    return out
+
+
+class DelayHistory:
+    """SQLite-backed delay log and rollups.
+
+    `db_path` defaults to `<GTFS_DATA_DIR>/delays.db`, resolved on each call so
+    that settings changes (e.g. in tests) are honoured.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        # latest delay per (service_date, trip_id, stop_id) -> (delay, route_id, hour)
+        self._latest: Dict[Tuple[str, str, str], Tuple[int, str, int]] = {}
+        self._latest_dates: set = set()
+        self._schema_ready_for: Optional[str] = None
+
+    @property
+    def db_path(self) -> str:
+        if self._db_path:
+            return self._db_path
+        if settings.DELAY_HISTORY_DB:
+            return settings.DELAY_HISTORY_DB
+        return os.path.join(settings.GTFS_DATA_DIR or "data/gtfs", "delays.db")
+
+    def _connect(self):
+        path = self.db_path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+        except Exception:
+            pass
+        if self._schema_ready_for != path:
+            conn.executescript(_ROLLUP_SCHEMA)
+            self._schema_ready_for = path
+        return conn
+
+    @staticmethod
+    def _partition(date_key: str) -> str:
+        return f"{_PARTITION_PREFIX}{date_key}"
+
+    def _ensure_partition(self, conn, date_key: str) -> str:
+        table = self._partition(date_key)
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "observed_at INTEGER NOT NULL, trip_id TEXT NOT NULL, route_id TEXT, "
+            "stop_id TEXT NOT NULL, stop_sequence INTEGER, delay INTEGER NOT NULL, hour INTEGER)"
+        )
+        # partitions written before the rollup hour was logged
+        if not self._has_hour(conn, table):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN hour INTEGER")
+        return table
+
+    @staticmethod
+    def _has_hour(conn, table: str) -> bool:
+        return "hour" in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+    def _load_latest(self, conn, date_key: str) -> None:
+        """Rebuild the in-memory latest-delay map for a date from its partition (after restarts)."""
+        if date_key in self._latest_dates:
+            return
+        self._latest_dates.add(date_key)
+        table = self._partition(date_key)
+        cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        if not cur.fetchone():
+            return
+        hour_col = "l.hour" if self._has_hour(conn, table) else "NULL"
+        q = (
+            f"SELECT l.trip_id, l.stop_id, l.route_id, l.delay, l.observed_at, {hour_col} AS hour FROM {table} l "
+            f"JOIN (SELECT trip_id, stop_id, MAX(rowid) AS rid FROM {table} GROUP BY trip_id, stop_id) m "
+            "ON l.rowid = m.rid"
+        )
+        for r in conn.execute(q):
+            # rows logged before `hour` existed only have the observation time to go by
+            hour = r["hour"] if r["hour"] is not None else datetime.fromtimestamp(r["observed_at"]).hour
+            self._latest[(date_key, r["trip_id"], r["stop_id"])] = (r["delay"], r["route_id"] or "", hour)
+
+    def _resolve_routes(self, trip_ids: List[str]) -> Dict[str, str]:
+        """Map trip_id -> route_id through gtfs.db for feeds whose TripDescriptor omits route_id."""
+        db_path = gtfs_db_path()
+        if not trip_ids or not os.path.exists(db_path):
+            return {}
+        try:
+            conn = sqlite3.connect(db_path)
+            try:
+                out: Dict[str, str] = {}
+                for i in range(0, len(trip_ids), 500):
+                    chunk = trip_ids[i:i + 500]
+                    placeholders = ",".join("?" for _ in chunk)
+                    cur = conn.execute(f"SELECT trip_id, route_id FROM trips WHERE trip_id IN ({placeholders})", chunk)
+                    out.update({str(t): str(r) for t, r in cur.fetchall()})
+                return out
+            finally:
+                conn.close()
+        except Exception:
+            logger.debug("Could not resolve route_ids from gtfs.db", exc_info=True)
+            return {}
+
+    def record(self, updates: Iterable, observed_at: Optional[float] = None) -> int:
+        """Write one poll's delays in a single transaction. Returns the number of log rows appended."""
+        observations = extract_delays(updates)
+        if not observations:
+            return 0
+        observed_at = int(observed_at if observed_at is not None else datetime.now().timestamp())
+        threshold = settings.DELAY_ON_TIME_THRESHOLD_SECS
+
+        missing = sorted({o["trip_id"] for o in observations if not o["route_id"] and o["trip_id"]})
+        resolved = self._resolve_routes(missing)
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                log_rows: Dict[str, list] = {}
+                rollup: Dict[Tuple[str, str, str, int], list] = {}
+                for o in observations:
+                    delay = o["delay"]
+                    # bucket by service date and scheduled time (predicted event time minus delay)
+                    ts = (o["event_time"] - delay) if o["event_time"] else observed_at
+                    date_key, sched_hour = _service_bucket(ts, o["start_date"])
+                    self._load_latest(conn, date_key)
+                    key = (date_key, o["trip_id"], o["stop_id"])
+                    prev = self._latest.get(key)
+                    if prev is not None and prev[0] == delay:
+                        continue
+                    route_id = o["route_id"] or resolved.get(o["trip_id"], "")
+                    on_time = 1 if delay <= threshold else 0
+                    if prev is None:
+                        hour = sched_hour
+                        delta = [1, delay, delay * delay, delay, on_time]
+                    else:
+                        # replace the previous sample's contribution with the new delay
+                        old_delay, route_id, hour = prev[0], prev[1] or route_id, prev[2]
+                        old_on_time = 1 if old_delay <= threshold else 0
+                        delta = [0, delay - old_delay, delay * delay - old_delay * old_delay, delay, on_time - old_on_time]
+                    self._latest[key] = (delay, route_id, hour)
+                    log_rows.setdefault(date_key, []).append(
+                        (observed_at, o["trip_id"], route_id, o["stop_id"], o["stop_sequence"], delay, hour)
+                    )
+                    rkey = (f"{date_key[0:4]}-{date_key[4:6]}-{date_key[6:8]}", route_id, o["stop_id"], hour)
+                    acc = rollup.get(rkey)
+                    if acc is None:
+                        rollup[rkey] = delta
+                    else:
+                        acc[0] += delta[0]
+                        acc[1] += delta[1]
+                        acc[2] += delta[2]
+                        acc[3] = max(acc[3], delta[3])
+                        acc[4] += delta[4]
+
+                appended = 0
+                with conn:
+                    for date_key, rows in log_rows.items():
+                        table = self._ensure_partition(conn, date_key)
+                        conn.executemany(
+                            f"INSERT INTO {table} (observed_at, trip_id, route_id, stop_id, stop_sequence, delay, hour) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            rows,
+                        )
+                        appended += len(rows)
+                    conn.executemany(_ROLLUP_UPSERT, [k + tuple(v) for k, v in rollup.items()])
+                self._forget_old_dates()
+                return appended
+            finally:
+                conn.close()
+
+    def _forget_old_dates(self) -> None:
+        """Drop in-memory state for service dates older than yesterday."""
+        cutoff = (datetime.now() - timedelta(days=1)).strftime("%Y%m%d")
+        stale = [d for d in self._latest_dates if d < cutoff]
+        if not stale:
+            return
+        stale_set = set(stale)
+        self._latest = {k: v for k, v in self._latest.items() if k[0] not in stale_set}
+        self._latest_dates -= stale_set
+
+    def prune(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Drop log partitions and rollup rows past their retention windows."""
+        now = now or datetime.now()
+        log_cutoff = (now - timedelta(days=settings.DELAY_LOG_RETENTION_DAYS)).strftime("%Y%m%d")
+        rollup_cutoff = (now - timedelta(days=settings.DELAY_ROLLUP_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        with self._lock:
+            conn = self._connect()
+            try:
+                dropped = 0
+                cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'delay_log_%'")
+                for (name,) in cur.fetchall():
+                    m = _PARTITION_RE.match(name)
+                    if m and m.group(1) < log_cutoff:
+                        conn.execute(f"DROP TABLE {name}")
+                        dropped += 1
+                with conn:
+                    deleted = conn.execute("DELETE FROM delay_rollup WHERE service_date < ?", (rollup_cutoff,)).rowcount
+                return {"partitions_dropped": dropped, "rollup_rows_deleted": deleted}
+            finally:
+                conn.close()
+
+    def _rollup_filters(self, days: int, route_id: Optional[str], stop_id: Optional[str], hour: Optional[int]):
+        since = (datetime.now() - timedelta(days=max(days, 1) - 1)).strftime("%Y-%m-%d")
+        where = ["service_date >= ?"]
+        params: list = [since]
+        if route_id:
+            where.append("route_id = ?")
+            params.append(str(route_id))
+        if stop_id:
+            where.append("stop_id = ?")
+            params.append(str(stop_id))
+        if hour is not None:
+            where.append("hour = ?")
+            params.append(int(hour))
+        return " AND ".join(where), params
+
+    @staticmethod
+    def _summarize(r) -> Dict:
+        n = r["samples"] or 0
+        mean = (r["delay_sum"] / n) if n else None
+        std = None
+        if n:
+            var = r["delay_sq_sum"] / n - mean * mean
+            std = round(max(var, 0.0) ** 0.5, 1)
+        return {
+            "samples": n,
+            "avg_delay_secs": round(mean, 1) if mean is not None else None,
+            "stddev_delay_secs": std,
+            "max_delay_secs": r["max_delay"],
+            "punctuality": round(r["on_time"] / n, 4) if n else None,
+        }
+
+    def get_delay_stats(
+        self,
+        route_id: Optional[str] = None,
+        stop_id: Optional[str] = None,
+        hour: Optional[int] = None,
+        days: int = 7,
+        group_by: str = "hour",
+    ) -> List[Dict]:
+        """Aggregate rollups over the last `days` days grouped by hour, route, stop or date."""
+        col = _GROUP_COLUMNS.get(group_by)
+        if col is None:
+            raise ValueError(f"group_by must be one of {sorted(_GROUP_COLUMNS)}")
+        where, params = self._rollup_filters(days, route_id, stop_id, hour)
+        q = (
+            f"SELECT {col} AS grp, SUM(samples) AS samples, SUM(delay_sum) AS delay_sum, "
+            "SUM(delay_sq_sum) AS delay_sq_sum, MAX(max_delay) AS max_delay, SUM(on_time) AS on_time "
+            f"FROM delay_rollup WHERE {where} GROUP BY {col} ORDER BY {col}"
+        )
+        conn = self._connect()
+        try:
+            out = []
+            for r in conn.execute(q, params):
+                row = {group_by: r["grp"]}
+                row.update(self._summarize(r))
+                out.append(row)
+            return out
+        finally:
+            conn.close()
+
+
+delay_history = DelayHistory()
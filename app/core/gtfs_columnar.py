@@ -0,0 +1,145 @@
+"""Compact, typed in-memory representation of the GTFS tables held by `GTFSManager`.
+
+`load_gtfs_from_zip` returns object-dtype frames: every id and every time in
+`stop_times` is its own Python string. `compact_tables` re-encodes them in place:
+
+- identifier columns (`stop_id`, `trip_id`, ...) and `HH:MM:SS` times become
+  pandas categoricals (int codes + one copy of each distinct string);
+- `stop_times` gains `arrival_secs` / `departure_secs` as int32 seconds since
+  the start of the service day (-1 when missing, values >= 86400 after midnight);
+- `stop_sequence` is downcast to int16 (int32 when it does not fit) and small
+  enum/flag columns to int8.
+
+`PrimaryKeyIndex` maps an id to its row position for O(1) single-entity lookups.
+"""
+from __future__ import annotations
+
+from typing import Dict, Hashable, Optional
+
+from app.utils.lazy import lazy_import
+from app.utils.time_utils import parse_hhmmss_to_seconds
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+ID_COLUMNS = {
+    "agency_id", "stop_id", "parent_station", "zone_id", "level_id", "route_id", "trip_id",
+    "service_id", "shape_id", "block_id", "from_stop_id", "to_stop_id", "from_route_id",
+    "to_route_id", "from_trip_id", "to_trip_id",
+}
+TIME_COLUMNS = ("arrival_time", "departure_time")
+INT8_COLUMNS = {
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+    "exception_type", "direction_id", "location_type", "wheelchair_boarding", "route_type",
+    "pickup_type", "drop_off_type", "timepoint", "wheelchair_accessible", "bikes_allowed",
+    "transfer_type",
+}
+
+
+def table_memory(data: Dict[str, pd.DataFrame]) -> Dict[str, int]:
+    """Deep memory usage in bytes of each table."""
+    out = {}
+    for name, df in data.items():
+        try:
+            out[name] = int(df.memory_usage(deep=True).sum())
+        except Exception:
+            out[name] = 0
+    return out
+
+
+def time_codes_to_seconds(col: pd.Series) -> np.ndarray:
+    """int32 seconds for a `HH:MM:SS` column, parsing each distinct value once (-1 when missing)."""
+    cat = col if isinstance(col.dtype, pd.CategoricalDtype) else col.astype("category")
+    parsed = [parse_hhmmss_to_seconds(str(v)) for v in cat.cat.categories]
+    lookup = np.array([-1 if p is None else p for p in parsed] + [-1], dtype=np.int32)
+    # code -1 (NaN) picks the trailing -1 sentinel
+    return lookup[cat.cat.codes.to_numpy()]
+
+
+def _downcast_int(col: pd.Series, dtype) -> pd.Series:
+    if not pd.api.types.is_numeric_dtype(col) or col.isna().any():
+        return col
+    values = col.to_numpy()
+    if pd.api.types.is_float_dtype(col) and not np.array_equal(values, np.floor(values)):
+        return col
+    info = np.iinfo(dtype)
+    if values.size and (values.min() < info.min or values.max() > info.max):
+        return col
+    return col.astype(dtype)
+
+
+def compact_table(name: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Return a compacted copy of one table (see module docstring)."""
+    if df is None or df.empty:
+        return df
+    df = df.copy()
+    for col in df.columns:
+        try:
+            if col in ID_COLUMNS or (name == "stop_times" and col in TIME_COLUMNS):
+                if pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col]):
+                    df[col] = df[col].astype("category")
+            elif col == "stop_sequence":
+                seq = _downcast_int(df[col], np.int16)
+                df[col] = seq if seq.dtype == np.int16 else _downcast_int(df[col], np.int32)
+            elif col in INT8_COLUMNS:
+                df[col] = _downcast_int(df[col], np.int8)
+        except Exception:
+            # keep the original column if it cannot be converted
+            continue
+    if name == "stop_times":
+        for col in TIME_COLUMNS:
+            if col in df.columns:
+                try:
+                    df[col.replace("_time", "_secs")] = time_codes_to_seconds(df[col])
+                except Exception:
+                    pass
+    return df
+
+
+def compact_tables(data: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    return {name: compact_table(name, df) for name, df in data.items()}
+
+
+class PrimaryKeyIndex:
+    """id -> row position of a table, built once per frame.
+
+    Ids are matched as stripped strings; purely numeric ids also answer to
+    their integer form ("04040" and "4040" find the same row), mirroring the
+    numeric-tolerant comparisons of the previous full-column scans.
+    """
+
+    def __init__(self, series: pd.Series):
+        self._pos: Dict[Hashable, int] = {}
+        values = series.astype(str).str.strip().tolist() if len(series) else []
+        for i, v in enumerate(values):
+            if v in ("", "nan", "None"):
+                continue
+            self._pos.setdefault(v, i)
+        for v, i in list(self._pos.items()):
+            alias = self._numeric_alias(v)
+            if alias is not None:
+                self._pos.setdefault(alias, i)
+
+    @staticmethod
+    def _numeric_alias(value: str) -> Optional[str]:
+        try:
+            num = float(value)
+        except (TypeError, ValueError):
+            return None
+        if np.isnan(num) or num != int(num):
+            return None
+        return f"#{int(num)}"
+
+    def position(self, key) -> Optional[int]:
+        if key is None:
+            return None
+        key = str(key).strip()
+        pos = self._pos.get(key)
+        if pos is None:
+            alias = self._numeric_alias(key)
+            if alias is not None:
+                pos = self._pos.get(alias)
+        return pos
+
+    def __len__(self) -> int:
+        return len(self._pos)
@@ -5,13 +5,17 @@ import json
 import hashlib
 import zipfile
 import shutil
+import time
 from typing import Optional, Dict, Any
 from datetime import datetime, timezone
 
-import aiohttp
-
 from app.config.settings import settings
+from app.core import metrics
 from app.core.gtfs_manager import gtfs_manager
+from app.utils.lazy import lazy_import
+
+# loaded on the first download check, not when the app is imported
+aiohttp = lazy_import("aiohttp")
 
 logger = logging.getLogger("cercanias.gtfs_downloader")
 
@@ -67,8 +71,8 @@ class GTFSDownloader:
     def get_metadata(self) -> Dict[str, Any]:
         return self._read_meta()
 
-    async def _extract_and_rebuild(self, zip_path: str) -> None:
-        """Extract ZIP and rebuild SQLite database in a thread."""
+    async def _extract_and_rebuild(self, zip_path: str, file_hash: Optional[str] = None) -> None:
+        """Extract ZIP and rebuild SQLite database (and the Arrow snapshot) in a thread."""
         data_dir = settings.GTFS_DATA_DIR or "data/gtfs"
         extract_dir = os.path.join(data_dir, "fomento_transit")
         db_tmp = os.path.join(data_dir, "gtfs.db.tmp")
@@ -84,12 +88,14 @@ class GTFSDownloader:
             
             # Extract ZIP
             logger.info(f"Extracting GTFS ZIP to {extract_dir}")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_dir)
+            with metrics.REBUILD_PHASE_SECONDS.time("extract"):
+                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                    zip_ref.extractall(extract_dir)
             
             # Rebuild database from extracted directory
             logger.info(f"Building SQLite database from {extract_dir}")
-            from app.core.gtfs_sqlite_loader import build_sqlite_from_directory
+            from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+            from app.core.load_gtfs import load_gtfs_from_directory
             
             # Remove old DB files
             for p in [db_final, db_final + "-wal", db_final + "-shm", db_tmp]:
@@ -99,10 +105,28 @@ class GTFSDownloader:
                 except Exception:
                     pass
             
-            build_sqlite_from_directory(extract_dir, db_tmp)
+            # parse the CSVs once for both the DB and the snapshot
+            with metrics.REBUILD_PHASE_SECONDS.time("parse"):
+                tables = load_gtfs_from_directory(extract_dir)
+            with metrics.REBUILD_PHASE_SECONDS.time("sqlite_build"):
+                build_sqlite_from_dict(tables, db_tmp)
             os.replace(db_tmp, db_final)
             logger.info(f"SQLite database built successfully at {db_final}")
 
+            if settings.GTFS_SNAPSHOT_ENABLED:
+                try:
+                    from app.core import shared_state
+                    from app.core.gtfs_snapshot import write_snapshot
+
+                    # the supervisor serves no requests; workers pick the snapshot up themselves
+                    with metrics.REBUILD_PHASE_SECONDS.time("snapshot_write"):
+                        written = write_snapshot(tables, data_dir, file_hash)
+                    if written and shared_state.role() != "supervisor":
+                        with metrics.REBUILD_PHASE_SECONDS.time("snapshot_load"):
+                            gtfs_manager.load_snapshot(data_dir, file_hash)
+                except Exception:
+                    logger.exception("Failed to write or load the GTFS snapshot")
+
         # Run in thread pool
         try:
             import asyncio as _asyncio
@@ -131,6 +155,7 @@ class GTFSDownloader:
         # update checked timestamp
         meta["last_checked_at"] = datetime.now(timezone.utc).isoformat()
         try:
+            download_start = time.perf_counter()
             async with aiohttp.ClientSession() as session:
                 async with session.get(url, headers=headers, timeout=timeout) as resp:
                     if resp.status == 304:
@@ -170,6 +195,7 @@ class GTFSDownloader:
                         size = None
                     # replace
                     os.replace(tmp, dest)
+                    metrics.REBUILD_PHASE_SECONDS.observe(time.perf_counter() - download_start, "download")
                     # update meta
                     meta.update({
                         "etag": new_etag,
@@ -183,7 +209,7 @@ class GTFSDownloader:
 
                     # Extract ZIP and rebuild database
                     try:
-                        await self._extract_and_rebuild(dest)
+                        await self._extract_and_rebuild(dest, file_hash=file_hash)
                     except Exception:
                         logger.exception("Failed to extract and rebuild GTFS database")
                         meta["status"] = "error_extract"
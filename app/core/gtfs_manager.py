@@ -1,46 +1,119 @@
+from __future__ import annotations
+
 from typing import Optional, List, Dict
-import pandas as pd
-import numpy as np
+import logging
+import threading
+from datetime import date as _date, datetime, timedelta
+
+from app.config.settings import settings
+from app.core import metrics, shared_state
+from app.core.cache import ByteLRUCache, estimate_size
+from app.core.gtfs_columnar import PrimaryKeyIndex, compact_tables, table_memory
+from app.core.rt_index import AlertIndex, TripUpdateIndex, VehicleIndex
+from app.utils.lazy import lazy_import
+
+# pandas/NumPy are only needed once tables are loaded or queried
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+
+logger = logging.getLogger("cercanias")
+
+# active service_id sets are small; a few MB holds years of dates
+SERVICE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# sorted filtered schedules kept for keyset pages (`get_schedule_page`)
+SCHEDULE_PAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# key of `/schedule/` pages, as in app.services.gtfs_service._schedule_key
+SCHEDULE_PAGE_KEY = ("stop_id", "departure_time", "trip_id", "stop_sequence")
 
 
 class GTFSManager:
     def __init__(self) -> None:
         self.data: Dict[str, pd.DataFrame] = {}
         # containers for GTFS-RT data
-        self.rt_alerts = []
-        self.rt_vehicles = []
-        self.rt_trip_updates = []
+        # RT feeds are decoded and indexed once per poll (see app.core.rt_index)
+        self.rt_alert_index = AlertIndex()
+        self.rt_vehicle_index = VehicleIndex()
+        self.rt_trip_update_index = TripUpdateIndex()
         # metadata about the GTFS zip and last operations
         # Example keys: last_downloaded_at, etag, last_modified, file_size, file_hash, last_checked_at, last_reload_at, status
         self.metadata: Dict[str, str] = {}
         # cache of active service_ids keyed by YYYYMMDD date string
-        self._service_cache: Dict[str, set] = {}
-        # cache of prebuilt schedule DataFrames per date (YYYYMMDD)
-        self._schedules_by_date: Dict[str, pd.DataFrame] = {}
+        self._service_cache = ByteLRUCache(SERVICE_CACHE_MAX_BYTES)
+        # sorted schedule frames per (data generation, filters) for keyset pages
+        self._schedule_pages = ByteLRUCache(SCHEDULE_PAGE_CACHE_MAX_BYTES)
+        # cache of prebuilt schedule DataFrames per date (YYYYMMDD), bounded by
+        # DataFrame.memory_usage(deep=True)
+        self._schedules_by_date = ByteLRUCache(max(int(settings.SCHEDULE_CACHE_MAX_MB), 0) * 1024 * 1024)
+        # background precompute of the [yesterday, today + N] window
+        self._precompute_thread: Optional[threading.Thread] = None
+        self._precompute_wakeup = threading.Event()
+        self._precompute_stop = threading.Event()
+        self._precompute_stats: Dict[str, object] = {"runs": 0, "built": 0, "last_run_at": None, "last_run_ms": None, "window": []}
+        # bumped by `set_tables`; a schedule frame built from older tables is not cached
+        self._data_generation = 0
+        # primary-key indexes (id -> row position) keyed by table name; see `_pk_index`
+        self._pk_indexes: Dict[str, tuple] = {}
+        # deep memory usage of the tables before/after `compact_tables`
+        self.memory_stats: Dict[str, object] = {}
 
     def load(self, zip_path: str) -> None:
         from app.core.load_gtfs import load_gtfs_from_zip
+        from time import perf_counter
+
+        start = perf_counter()
+        self.set_tables(load_gtfs_from_zip(zip_path), source=zip_path, start=start)
 
-        import logging
-        logger = logging.getLogger("cercanias")
+    def load_snapshot(self, data_dir: str, expected_hash: Optional[str]) -> bool:
+        """Load the memory-mapped Arrow snapshot in `data_dir` (see app.core.gtfs_snapshot).
+
+        Returns False when there is no snapshot for the feed `expected_hash`.
+        """
+        from app.core.gtfs_snapshot import read_snapshot
         from time import perf_counter
+
         start = perf_counter()
+        tables = read_snapshot(data_dir, expected_hash)
+        if tables is None:
+            return False
+        # snapshot tables are already compacted
+        self.set_tables(tables, source=f"snapshot:{data_dir}", start=start, compact=False)
+        self.metadata["snapshot_hash"] = expected_hash
+        return True
+
+    def set_tables(self, data: Dict[str, pd.DataFrame], source: str = "", start: Optional[float] = None, compact: bool = True) -> None:
+        """Install a freshly loaded set of GTFS tables and reset every derived cache."""
+        from time import perf_counter
 
-        self.data = load_gtfs_from_zip(zip_path)
+        start = perf_counter() if start is None else start
+        data = dict(data)
 
         # normalize expected tables
         for k in ["stops", "routes", "trips", "stop_times", "calendar", "agency"]:
-            if k not in self.data:
-                self.data[k] = pd.DataFrame()
+            if k not in data:
+                data[k] = pd.DataFrame()
         # calendar_dates may also exist
-        if "calendar_dates" not in self.data:
-            self.data["calendar_dates"] = pd.DataFrame()
+        if "calendar_dates" not in data:
+            data["calendar_dates"] = pd.DataFrame()
 
         # normalize date columns if present
-        if not self.data.get("calendar").empty:
+        if not data.get("calendar").empty:
             for col in ["start_date", "end_date"]:
-                if col in self.data["calendar"].columns:
-                    self.data["calendar"][col] = self.data["calendar"][col].astype(str)
+                if col in data["calendar"].columns:
+                    data["calendar"][col] = data["calendar"][col].astype(str)
+
+        self.data = data
+        self._data_generation += 1
+        # category ids, int32 seconds, int16 sequences (see app.core.gtfs_columnar)
+        if compact:
+            self.compact()
+        else:
+            self._pk_indexes = {}
+            after = table_memory(self.data)
+            self.memory_stats = {
+                "before_bytes": None,
+                "after_bytes": sum(after.values()),
+                "tables": {name: {"before_bytes": None, "after_bytes": size} for name, size in after.items()},
+            }
         # record reload time
         try:
             from datetime import datetime, timezone
@@ -49,43 +122,79 @@ class GTFSManager:
             self.metadata.setdefault("status", "loaded")
             # clear any cached service date lookups when reloading data
             try:
-                self._service_cache = {}
+                self._service_cache.clear()
             except Exception:
                 pass
-            # clear schedule cache
+            # clear schedule caches
             try:
-                self._schedules_by_date = {}
+                self._schedules_by_date.clear()
+                self._schedule_pages.clear()
             except Exception:
                 pass
         except Exception:
             pass
 
-        # precompute schedule for today (local system date) to speed up typical queries
-        try:
-            from datetime import datetime
-
-            today = datetime.now().date()
-            today_str = today.strftime("%Y%m%d")
-            sched_df = self._build_schedule_for_date(today_str)
-            if sched_df is not None:
-                self._schedules_by_date[today_str] = sched_df
-                try:
-                    self.metadata["today_schedule_count"] = str(len(sched_df))
-                except Exception:
-                    pass
-        except Exception:
-            pass
+        # precompute the schedules around today in the background so loading returns
+        # as soon as the tables are in memory; workers of a multi-worker deployment
+        # build a date's frame only when a request needs it, instead of each holding
+        # a copy of the whole window
+        if settings.SCHEDULE_PRECOMPUTE_ENABLED and shared_state.role() != "worker":
+            self.start_precompute()
 
         # log load summary
         try:
             end = perf_counter()
             elapsed_ms = (end - start) * 1000.0
+            self.metadata["load_ms"] = f"{elapsed_ms:.1f}"
             counts = {k: (len(v) if hasattr(v, "__len__") else 0) for k, v in self.data.items()}
             logger.info(
-                f"GTFS loaded: routes={counts.get('routes',0)} stops={counts.get('stops',0)} trips={counts.get('trips',0)} stop_times={counts.get('stop_times',0)} calendar={counts.get('calendar',0)} calendar_dates={counts.get('calendar_dates',0)} agency={counts.get('agency',0)}; build_time={elapsed_ms:.1f}ms"
+                f"GTFS loaded from {source}: routes={counts.get('routes',0)} stops={counts.get('stops',0)} trips={counts.get('trips',0)} stop_times={counts.get('stop_times',0)} calendar={counts.get('calendar',0)} calendar_dates={counts.get('calendar_dates',0)} agency={counts.get('agency',0)}; build_time={elapsed_ms:.1f}ms"
+            )
+        except Exception:
+            pass
+
+    def compact(self) -> Dict[str, object]:
+        """Re-encode `self.data` compactly and record memory usage before and after."""
+        before = table_memory(self.data)
+        try:
+            self.data = compact_tables(self.data)
+        except Exception:
+            logger.exception("Could not compact GTFS tables; keeping the original frames")
+        after = table_memory(self.data)
+        self._pk_indexes = {}
+        self.memory_stats = {
+            "before_bytes": sum(before.values()),
+            "after_bytes": sum(after.values()),
+            "tables": {name: {"before_bytes": before.get(name, 0), "after_bytes": after.get(name, 0)} for name in after},
+        }
+        try:
+            logger.info(
+                "GTFS tables compacted: %.1f MB -> %.1f MB",
+                self.memory_stats["before_bytes"] / 1e6,
+                self.memory_stats["after_bytes"] / 1e6,
             )
         except Exception:
             pass
+        return self.memory_stats
+
+    def _pk_index(self, table: str, column: str) -> Optional[PrimaryKeyIndex]:
+        """Primary-key index for `table`, rebuilt whenever the frame object changes."""
+        df = self.data.get(table)
+        if df is None or df.empty or column not in df.columns:
+            return None
+        cached = self._pk_indexes.get(table)
+        if cached is not None and cached[0] is df:
+            return cached[1]
+        index = PrimaryKeyIndex(df[column])
+        self._pk_indexes[table] = (df, index)
+        return index
+
+    def _row_by_pk(self, table: str, column: str, key) -> Optional[Dict]:
+        index = self._pk_index(table, column)
+        pos = index.position(key) if index is not None else None
+        if pos is None:
+            return None
+        return self.data[table].iloc[pos].to_dict()
 
     def update_metadata(self, meta: Dict[str, str]) -> None:
         """Merge provided metadata into manager.metadata."""
@@ -94,8 +203,118 @@ class GTFSManager:
         self.metadata.update({k: v for k, v in meta.items() if v is not None})
 
     def get_metadata(self) -> Dict[str, str]:
-        """Return a shallow copy of known metadata."""
-        return dict(self.metadata)
+        """Return a shallow copy of known metadata plus schedule cache statistics."""
+        meta = dict(self.metadata)
+        meta["schedule_cache"] = dict(self._schedules_by_date.stats(), precompute=dict(self._precompute_stats))
+        meta["service_cache"] = self._service_cache.stats()
+        if self.memory_stats:
+            meta["memory"] = self.memory_stats
+        return meta
+
+    # --- schedule precompute -------------------------------------------------
+
+    @staticmethod
+    def _precompute_dates(today: _date) -> List[str]:
+        """YYYYMMDD dates of the precompute window: today first, then the rest in order.
+
+        Today goes first so it is the first date cached after a reload and the
+        last one left out when the byte budget cannot hold the whole window.
+        """
+        before = max(int(settings.SCHEDULE_PRECOMPUTE_DAYS_BEFORE), 0)
+        after = max(int(settings.SCHEDULE_PRECOMPUTE_DAYS_AFTER), 0)
+        days = [today] + [today + timedelta(days=d) for d in range(-before, after + 1) if d != 0]
+        return [d.strftime("%Y%m%d") for d in days]
+
+    def _schedule_for_date(self, date_str: str, build: bool = True):
+        """Cached schedule frame for `date_str`; built and cached on a miss when `build`."""
+        df = self._schedules_by_date.get(date_str)
+        if df is None and build:
+            generation = self._data_generation
+            df = self._build_schedule_for_date(date_str)
+            if df is not None and generation == self._data_generation:
+                self._schedules_by_date.put(date_str, df)
+        return df
+
+    def precompute_window(self, today: Optional[_date] = None) -> List[str]:
+        """Build every missing schedule frame of the window around `today`; returns the built dates.
+
+        Dates that fell out of the window (before yesterday) are dropped first
+        so they do not hold memory until LRU eviction gets to them. Building
+        stops at the first frame that would not fit in the remaining byte
+        budget: caching it would evict a date of the window (today included)
+        and the next run would only build it again.
+        """
+        from time import perf_counter
+
+        start = perf_counter()
+        today = today or datetime.now().date()
+        window = self._precompute_dates(today)
+        for date_str in self._schedules_by_date.keys():
+            if date_str < min(window):
+                self._schedules_by_date.pop(date_str)
+        generation = self._data_generation
+        built = []
+        for date_str in window:
+            if self._precompute_stop.is_set() or generation != self._data_generation:
+                break
+            if date_str in self._schedules_by_date:
+                continue
+            try:
+                df = self._build_schedule_for_date(date_str)
+            except Exception:
+                logger.exception("Schedule precompute failed for %s", date_str)
+                continue
+            # the tables were replaced while building: the frame is stale and the
+            # reload has already scheduled a new run
+            if df is None or generation != self._data_generation:
+                break
+            cache = self._schedules_by_date.stats()
+            if cache["bytes"] + estimate_size(df) > cache["max_bytes"]:
+                logger.info("Schedule cache budget full; precomputed %d of %d dates", len(self._schedules_by_date), len(window))
+                break
+            self._schedules_by_date.put(date_str, df)
+            built.append(date_str)
+        today_df = self._schedules_by_date.peek(window[0])
+        if today_df is not None:
+            self.metadata["today_schedule_count"] = str(len(today_df))
+        self._precompute_stats.update(
+            runs=int(self._precompute_stats.get("runs") or 0) + 1,
+            built=int(self._precompute_stats.get("built") or 0) + len(built),
+            last_run_at=datetime.now().isoformat(timespec="seconds"),
+            last_run_ms=round((perf_counter() - start) * 1000.0, 1),
+            window=[min(window), max(window)],
+        )
+        return built
+
+    @staticmethod
+    def _seconds_until_midnight(now: Optional[datetime] = None) -> float:
+        now = now or datetime.now()
+        tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        # a few seconds past midnight so date.today() has already rolled over
+        return max((tomorrow - now).total_seconds(), 0.0) + 5.0
+
+    def _precompute_loop(self) -> None:
+        while not self._precompute_stop.is_set():
+            self._precompute_wakeup.clear()
+            try:
+                self.precompute_window()
+            except Exception:
+                logger.exception("Schedule precompute run failed")
+            # sleep until the next service day starts or a reload asks for a new run
+            self._precompute_wakeup.wait(self._seconds_until_midnight())
+
+    def start_precompute(self) -> None:
+        """Start (or wake) the background thread that keeps the date window precomputed."""
+        self._precompute_stop.clear()
+        if self._precompute_thread is not None and self._precompute_thread.is_alive():
+            self._precompute_wakeup.set()
+            return
+        self._precompute_thread = threading.Thread(target=self._precompute_loop, name="schedule-precompute", daemon=True)
+        self._precompute_thread.start()
+
+    def stop_precompute(self) -> None:
+        self._precompute_stop.set()
+        self._precompute_wakeup.set()
 
     def _service_active_on(self, service_id: str, date_str: str) -> bool:
         """Determina si el service_id está activo en la fecha YYYYMMDD.
@@ -221,70 +440,46 @@ class GTFSManager:
         The returned DataFrame contains stop_times merged with trips and route_short_name
         where the trip's service_id is active on the given date. Adds a `service_date`
         column in `YYYY-MM-DD` format to each row to link the schedule to the date.
+
+        Same path as `get_schedule`: the active services mask the small `trips`
+        table, one `isin` mask selects the stop_times rows and route ids / short
+        names are mapped onto them, so neither table is copied or merged whole.
         """
         if not date_str:
             return None
         st = self.data.get("stop_times", pd.DataFrame())
         trips = self.data.get("trips", pd.DataFrame())
         routes = self.data.get("routes", pd.DataFrame())
-        if st.empty or trips.empty:
+        if st.empty or trips.empty or "trip_id" not in st.columns or "trip_id" not in trips.columns or "service_id" not in trips.columns:
             return pd.DataFrame()
 
         # determine active service ids set
-        active_sids = self._service_cache.get(date_str)
-        if active_sids is None:
-            active_sids = self._active_service_ids(date_str)
-            self._service_cache[date_str] = active_sids
-
+        active_sids = self._cached_active_service_ids(date_str)
         if not active_sids:
             # no active services
             return pd.DataFrame()
 
-        # filter trips by active service ids
-        try:
-            # trips['service_id'] may be numeric or string; compare as str
-            trips_local = trips.copy()
-            trips_local['service_id'] = trips_local['service_id'].astype(str)
-            valid_trips = trips_local[trips_local['service_id'].isin(set(map(str, active_sids)))]
-        except Exception:
-            valid_trips = trips[trips['service_id'].isin(active_sids)] if 'service_id' in trips.columns else pd.DataFrame()
-
-        if valid_trips.empty:
+        # trips['service_id'] may be numeric or string; compare as str
+        trip_mask = trips["service_id"].astype(str).isin(set(map(str, active_sids)))
+        trips_f = trips.loc[trip_mask, [c for c in ["trip_id", "route_id"] if c in trips.columns]]
+        if trips_f.empty:
             return pd.DataFrame()
 
-        # merge stop_times with valid trips
-        try:
-            merged = st.merge(valid_trips, on='trip_id', how='inner', suffixes=("", "_trip"))
-        except Exception:
-            # fallback: ensure trip_id exists
-            if 'trip_id' not in st.columns or 'trip_id' not in trips.columns:
-                return pd.DataFrame()
-            merged = st.merge(valid_trips, on='trip_id', how='inner', suffixes=("", "_trip"))
-
-        # attach route_short_name if available
-        if not routes.empty and 'route_id' in routes.columns and 'route_id' in merged.columns:
-            try:
-                routes_subset = routes[[c for c in ['route_id', 'route_short_name'] if c in routes.columns]]
-                merged = merged.merge(routes_subset, on='route_id', how='left')
-            except Exception:
-                pass
+        st_cols = [c for c in ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"] if c in st.columns]
+        df_out = st.loc[st["trip_id"].isin(trips_f["trip_id"]), st_cols]
 
-        # select sensible columns
-        wanted = [c for c in ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'route_id', 'route_short_name'] if c in merged.columns]
-        df_out = merged[wanted].copy()
+        # attach route_id and route_short_name if available
+        if "route_id" in trips_f.columns:
+            trip_route = trips_f.drop_duplicates("trip_id").set_index("trip_id")["route_id"]
+            df_out = df_out.assign(route_id=df_out["trip_id"].map(trip_route))
+            if not routes.empty and "route_id" in routes.columns and "route_short_name" in routes.columns:
+                short = routes.drop_duplicates("route_id").set_index("route_id")["route_short_name"]
+                df_out = df_out.assign(route_short_name=df_out["route_id"].map(short))
 
         # sort and add service_date column in ISO format YYYY-MM-DD
-        df_out = df_out.sort_values(by=[c for c in ['route_id', 'stop_sequence'] if c in df_out.columns])
-        try:
-            # accept YYYYMMDD input and convert
-            if '-' in date_str:
-                iso_date = date_str
-            else:
-                iso_date = f"{date_str[0:4]}-{date_str[4:6]}-{date_str[6:8]}"
-        except Exception:
-            iso_date = date_str
-        df_out['service_date'] = iso_date
-        return df_out
+        df_out = df_out.sort_values(by=[c for c in ["route_id", "stop_sequence"] if c in df_out.columns], kind="stable")
+        iso_date = date_str if "-" in date_str else f"{date_str[0:4]}-{date_str[4:6]}-{date_str[6:8]}"
+        return df_out.assign(service_date=iso_date)
 
     def get_stops(self, limit: Optional[int] = None) -> List[Dict]:
         df = self.data.get("stops", pd.DataFrame())
@@ -324,31 +519,12 @@ class GTFSManager:
             return []
 
     def get_stop(self, stop_id: str) -> Optional[Dict]:
-        df = self.data.get("stops", pd.DataFrame())
-        if df.empty or "stop_id" not in df.columns:
-            return None
-
-        # try numeric comparison if possible
-        try:
-            series_num = pd.to_numeric(df["stop_id"], errors="coerce")
-            val_num = pd.to_numeric(stop_id, errors="coerce")
-            if not np.isnan(val_num):
-                row = df.loc[series_num == val_num]
-            else:
-                # fallback to string compare
-                row = df.loc[df["stop_id"].astype(str).str.strip() == str(stop_id).strip()]
-        except Exception:
-            row = df.loc[df["stop_id"].astype(str).str.strip() == str(stop_id).strip()]
-        if row.empty:
+        result = self._row_by_pk("stops", "stop_id", stop_id)
+        if result is None:
             return None
-        result = row.iloc[0].to_dict()
-        # ensure stop_id is int
-        if "stop_id" in result:
-            try:
-                result["stop_id"] = int(result["stop_id"])
-            except (ValueError, TypeError):
-                pass
-        return result
+        # StopOut.stop_id is a string (numeric ids come back as int from the typed columns)
+        if result.get("stop_id") is not None:
+            result["stop_id"] = str(result["stop_id"])
         return result
 
     def get_routes(self) -> List[Dict]:
@@ -359,114 +535,210 @@ class GTFSManager:
         return df[cols].to_dict(orient="records")
 
     def get_route(self, route_id: str) -> Optional[Dict]:
-        df = self.data.get("routes", pd.DataFrame())
-        if df.empty or "route_id" not in df.columns:
-            return None
-        # try numeric comparison first
-        try:
-            series_num = pd.to_numeric(df["route_id"], errors="coerce")
-            val_num = pd.to_numeric(route_id, errors="coerce")
+        return self._row_by_pk("routes", "route_id", route_id)
+
+    def get_trip(self, trip_id: str) -> Optional[Dict]:
+        return self._row_by_pk("trips", "trip_id", trip_id)
+
+    def _cached_active_service_ids(self, date_str: str) -> set:
+        """`_active_service_ids` memoized per YYYYMMDD date in `_service_cache`."""
+        active_sids = self._service_cache.get(date_str)
+        if active_sids is None:
+            active_sids = self._active_service_ids(date_str)
+            self._service_cache.put(date_str, active_sids)
+        return active_sids
+
+    @staticmethod
+    def _id_mask(series: pd.Series, value: str) -> pd.Series:
+        """Boolean mask of rows whose id equals `value`, tolerating numeric ids ("4040" == "04040").
+
+        The numeric comparison runs over the distinct ids only, not every row.
+        """
+        value = str(value).strip()
+        uniques = pd.Series(series.dropna().unique())
+        matches = uniques[uniques.astype(str).str.strip() == value]
+        if matches.empty:
+            val_num = pd.to_numeric(value, errors="coerce")
             if not np.isnan(val_num):
-                row = df.loc[series_num == val_num]
-            else:
-                row = df.loc[df["route_id"].astype(str).str.strip() == str(route_id).strip()]
-        except Exception:
-            row = df.loc[df["route_id"].astype(str).str.strip() == str(route_id).strip()]
-        if row.empty:
-            return None
-        return row.iloc[0].to_dict()
+                matches = uniques[pd.to_numeric(uniques, errors="coerce") == val_num]
+        return series.isin(matches)
 
     def get_schedule(self, stop_id: Optional[str] = None, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200) -> List[Dict]:
         """Devuelve horarios combinando stop_times -> trips -> routes.
 
         - stop_id: filtra por parada
         - route_id: filtra por ruta
-        - date: sin implementar filtros por servicio en profundidad (requeriría calendar parsing)
+        - date: limita a los servicios activos en la fecha (`calendar` + `calendar_dates`)
+
+        Filters are applied to the small `trips` table first and then as one
+        boolean mask over `stop_times`, so only matching rows are ever copied.
+        """
+        df = self._schedule_frame(stop_id, route_id, date, build=True)
+        if df is None:
+            return []
+        if not df.attrs.get("sorted"):
+            df = df.sort_values(by=[c for c in ["route_id", "stop_sequence"] if c in df.columns], kind="stable")
+        if limit:
+            df = df.head(limit)
+        return df.to_dict(orient="records")
+
+    def get_schedule_page(self, stop_id: Optional[str] = None, route_id: Optional[str] = None, date: Optional[str] = None,
+                          after: Optional[List] = None, limit: int = 200) -> List[Dict]:
+        """`limit` schedule rows after the keyset `after`, ordered by (stop_id, departure_time, trip_id, stop_sequence).
+
+        The filtered rows are sorted by that key once per (tables, filters) and
+        kept in `_schedule_pages`; a page is then a vectorized key comparison
+        over the cached frame and a slice, not a fresh sort of every row.
+        """
+        cache_key = (self._data_generation, stop_id, route_id, date)
+        ordered = self._schedule_pages.get(cache_key)
+        if ordered is None:
+            df = self._schedule_frame(stop_id, route_id, date, build=True)
+            if df is None:
+                return []
+            key_cols = [c for c in SCHEDULE_PAGE_KEY if c in df.columns]
+            df = df.assign(**{c: df[c].astype(object) for c in key_cols if isinstance(df[c].dtype, pd.CategoricalDtype)})
+            ordered = df.sort_values(by=key_cols, kind="stable", na_position="first").reset_index(drop=True)
+            self._schedule_pages.put(cache_key, ordered)
+        start = 0
+        if after is not None and len(ordered):
+            start = self._first_after(ordered, after)
+        return ordered.iloc[start:start + limit].to_dict(orient="records")
+
+    @staticmethod
+    def _first_after(df: pd.DataFrame, after: List) -> int:
+        """Position of the first row of `df` (sorted by `SCHEDULE_PAGE_KEY`) whose key is > `after`.
+
+        NULLs sort first, as in SQLite and `app.core.pagination.sort_key`.
+        """
+        greater = pd.Series(False, index=df.index)
+        equal = pd.Series(True, index=df.index)
+        for col, value in zip(SCHEDULE_PAGE_KEY, after):
+            if col not in df.columns:
+                continue
+            values = df[col]
+            if value is None:
+                col_gt, col_eq = values.notna(), values.isna()
+            else:
+                with np.errstate(invalid="ignore"):
+                    col_gt = values.notna() & (values > value)
+                    col_eq = values == value
+            greater |= equal & col_gt
+            equal &= col_eq
+        # the frame is sorted by the key, so `greater` is False up to one position and True after it
+        positions = np.flatnonzero(greater.to_numpy())
+        return int(positions[0]) if len(positions) else len(df)
+
+    def _schedule_frame(self, stop_id: Optional[str], route_id: Optional[str], date: Optional[str], build: bool):
+        """Unsorted, unlimited rows of `get_schedule` (None when there are no tables).
+
+        Frames taken from the per-date cache are flagged `attrs["sorted"]`
+        (route_id, stop_sequence); unfiltered requests build that frame on a
+        miss when `build`.
         """
         stop_times = self.data.get("stop_times", pd.DataFrame())
         trips = self.data.get("trips", pd.DataFrame())
         routes = self.data.get("routes", pd.DataFrame())
 
-        if stop_times.empty or trips.empty:
-            return []
+        if stop_times.empty or trips.empty or "trip_id" not in stop_times.columns or "trip_id" not in trips.columns:
+            return None
 
-        # If a precomputed schedule for the date exists and no extra filters, use it
-        df = stop_times.copy()
-        date_str = None
+        date_str = date.replace("-", "") if date else None
+        iso_date = None
         if date:
-            date_str = date.replace("-", "")
-            try:
-                if date_str in self._schedules_by_date and (not stop_id and not route_id):
-                    df = self._schedules_by_date[date_str].copy()
-                else:
-                    df = stop_times.copy()
-            except Exception:
-                df = stop_times.copy()
-        # if date provided, filter trips by service_id using calendar/calendar_dates
-        if date and "service_id" in trips.columns:
-            # expect date in YYYY-MM-DD or YYYYMMDD
-            date_str = date.replace("-", "")
-            valid_trips = trips[trips["service_id"].apply(lambda sid: self._service_active_on(sid, date_str) if sid is not None else False)]
-            df = df[df["trip_id"].isin(valid_trips["trip_id"]) ]
-        if "trip_id" in df.columns and "trip_id" in trips.columns:
-            df = df.merge(trips, on="trip_id", how="left", suffixes=("", "_trip"))
-        if route_id and "route_id" in df.columns:
-            df = df[df["route_id"] == route_id]
-        if stop_id and "stop_id" in df.columns:
-            # robust matching for numeric or string stop_id
-            try:
-                series_num = pd.to_numeric(df["stop_id"], errors="coerce")
-                val_num = pd.to_numeric(stop_id, errors="coerce")
-                if not np.isnan(val_num):
-                    df = df[series_num == val_num]
-                else:
-                    df = df[df["stop_id"].astype(str).str.strip() == str(stop_id).strip()]
-            except Exception:
-                df = df[df["stop_id"].astype(str).str.strip() == str(stop_id).strip()]
+            iso_date = date if "-" in date else f"{date[0:4]}-{date[4:6]}-{date[6:8]}"
+
+        # the per-date frame already has everything we need: unfiltered requests build
+        # and cache it on a miss, filtered ones only use it when it is already there
+        if date_str:
+            cached = self._schedule_for_date(date_str, build=build and not stop_id and not route_id)
+            if cached is not None:
+                df = cached
+                if route_id and not df.empty:
+                    df = df.loc[df["route_id"] == route_id] if "route_id" in df.columns else df.iloc[0:0]
+                if stop_id and not df.empty and "stop_id" in df.columns:
+                    df = df.loc[self._id_mask(df["stop_id"], stop_id)]
+                df = df.copy(deep=False)
+                df.attrs["sorted"] = True
+                return df
+
+        # 1) filter trips (one row per trip) by service date and route
+        trip_mask = pd.Series(True, index=trips.index)
+        if date_str and "service_id" in trips.columns:
+            active = self._cached_active_service_ids(date_str)
+            trip_mask &= trips["service_id"].astype(str).isin(active)
+        if route_id and "route_id" in trips.columns:
+            trip_mask &= trips["route_id"] == route_id
+        trips_f = trips.loc[trip_mask, [c for c in ["trip_id", "route_id"] if c in trips.columns]]
+
+        # 2) one mask over stop_times; copy only the selected rows and columns
+        st_mask = None
+        if not trip_mask.all():
+            st_mask = stop_times["trip_id"].isin(trips_f["trip_id"])
+        if stop_id and "stop_id" in stop_times.columns:
+            stop_mask = self._id_mask(stop_times["stop_id"], stop_id)
+            st_mask = stop_mask if st_mask is None else (st_mask & stop_mask)
+        st_cols = [c for c in ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"] if c in stop_times.columns]
+        df = stop_times.loc[st_mask, st_cols] if st_mask is not None else stop_times[st_cols]
+
+        # 3) hash-join route_id and route_short_name onto the (small) result
+        if "route_id" in trips_f.columns:
+            trip_route = trips_f.drop_duplicates("trip_id").set_index("trip_id")["route_id"]
+            df = df.assign(route_id=df["trip_id"].map(trip_route))
+            if not routes.empty and "route_id" in routes.columns and "route_short_name" in routes.columns:
+                short = routes.drop_duplicates("route_id").set_index("route_id")["route_short_name"]
+                df = df.assign(route_short_name=df["route_id"].map(short))
+        if route_id and "route_id" not in trips_f.columns:
+            return None
 
-        # attach route short name if available
-        if not routes.empty and "route_id" in routes.columns and "route_id" in df.columns:
-            df = df.merge(routes[[c for c in ["route_id", "route_short_name"] if c in routes.columns]], on="route_id", how="left")
+        # when a date was provided, annotate results with ISO service_date for clarity
+        if iso_date:
+            df = df.assign(service_date=iso_date)
+        return df
 
-        # select sensible columns
-        wanted = [c for c in ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "route_id", "route_short_name"] if c in df.columns]
-        df = df[wanted]
-        df = df.sort_values(by=[c for c in ["route_id", "stop_sequence"] if c in df.columns])
-        if limit:
-            df = df.head(limit)
+    @property
+    def rt_alerts(self):
+        return self.rt_alert_index.alerts
 
-        # when a date was provided, annotate results with ISO service_date for clarity
-        try:
-            if date:
-                if '-' in date:
-                    iso_date = date
-                else:
-                    iso_date = f"{date[0:4]}-{date[4:6]}-{date[6:8]}"
-                df['service_date'] = iso_date
-        except Exception:
-            pass
+    @rt_alerts.setter
+    def rt_alerts(self, alerts):
+        self.rt_alert_index = AlertIndex(alerts or [])
 
-        return df.to_dict(orient="records")
+    @property
+    def rt_trip_updates(self):
+        return self.rt_trip_update_index.updates
+
+    @rt_trip_updates.setter
+    def rt_trip_updates(self, updates):
+        self.rt_trip_update_index = TripUpdateIndex(updates or [])
+
+    @property
+    def rt_vehicles(self):
+        return self.rt_vehicle_index.vehicles
+
+    @rt_vehicles.setter
+    def rt_vehicles(self, vehicles):
+        self.rt_vehicle_index = VehicleIndex(vehicles or [])
 
     # Real-time getters
     def get_rt_alerts(self):
         return self.rt_alerts or []
 
     def get_rt_vehicles(self, route_id: Optional[str] = None, trip_id: Optional[str] = None):
-        vehicles = self.rt_vehicles or []
+        index = self.rt_vehicle_index
+        rows = range(len(index.vehicles))
         if route_id:
-            vehicles = [v for v in vehicles if getattr(v, "trip", None) and getattr(v.trip, "route_id", None) == route_id]
+            rows = index.by_route.get(route_id, [])
         if trip_id:
-            vehicles = [v for v in vehicles if getattr(v, "trip", None) and getattr(v.trip, "trip_id", None) == trip_id]
-        return vehicles
+            trip_rows = set(index.by_trip.get(trip_id, []))
+            rows = [i for i in rows if i in trip_rows]
+        return [index.vehicles[i] for i in rows]
 
     def get_rt_trip_updates(self, trip_id: Optional[str] = None, route_id: Optional[str] = None):
-        updates = self.rt_trip_updates or []
-        if trip_id:
-            updates = [u for u in updates if getattr(u.trip, "trip_id", None) == trip_id]
-        if route_id:
-            updates = [u for u in updates if getattr(u.trip, "route_id", None) == route_id]
-        return updates
+        return self.rt_trip_update_index.updates_for(trip_id=trip_id, route_id=route_id)
 
 
 gtfs_manager = GTFSManager()
+metrics.register_cache("schedule_by_date", gtfs_manager._schedules_by_date)
+metrics.register_cache("service_days", gtfs_manager._service_cache)
+metrics.register_cache("schedule_pages", gtfs_manager._schedule_pages)
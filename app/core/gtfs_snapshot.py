@@ -0,0 +1,152 @@
+"""Typed GTFS snapshot in Arrow IPC (Feather v2) format, written next to `gtfs.db`.
+
+Building the in-memory tables from the CSVs takes minutes on the national feed
+and used to be repeated by every worker. After a rebuild the cleaned, compacted
+tables (see `app.core.gtfs_columnar`) are written uncompressed to
+`<data_dir>/snapshot-<hash>/<table>.arrow` and `<data_dir>/snapshot.json` is
+atomically replaced to point at the new directory. Workers open the files with
+`pyarrow.memory_map`, so the bytes come from one shared page-cache copy and a
+cold start is a few column conversions instead of a CSV parse.
+
+Categorical id and time columns are written as plain Arrow strings and read
+back as Arrow-backed pandas strings, which wrap the mapped buffers instead of
+copying every value into the worker (a pandas Categorical would rebuild its
+categories and codes in each process).
+
+The manifest records the feed `file_hash` the downloader computed; a snapshot
+is only used when that hash matches the feed currently on disk.
+
+`pyarrow` is optional: without it snapshots are neither written nor read.
+"""
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import pandas as pd
+
+from app.core.gtfs_columnar import compact_tables
+
+try:  # optional dependency
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = None
+    feather = None
+
+logger = logging.getLogger("cercanias.gtfs_snapshot")
+
+SNAPSHOT_FORMAT_VERSION = 2
+MANIFEST_NAME = "snapshot.json"
+
+
+def available() -> bool:
+    return pa is not None
+
+
+def manifest_path(data_dir: str) -> str:
+    return os.path.join(data_dir, MANIFEST_NAME)
+
+
+def read_manifest(data_dir: str) -> Optional[Dict]:
+    try:
+        with open(manifest_path(data_dir), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return manifest if isinstance(manifest, dict) else None
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Unreadable GTFS snapshot manifest in %s", data_dir, exc_info=True)
+        return None
+
+
+def write_snapshot(tables: Dict[str, pd.DataFrame], data_dir: str, file_hash: Optional[str]) -> Optional[str]:
+    """Write `tables` as a snapshot for the feed `file_hash`; returns the manifest path (None if skipped)."""
+    if not available():
+        logger.info("pyarrow is not installed; skipping GTFS snapshot")
+        return None
+    if not file_hash:
+        logger.info("No feed file_hash known; skipping GTFS snapshot")
+        return None
+    from time import perf_counter
+
+    start = perf_counter()
+    name = f"snapshot-{file_hash[:16]}"
+    final_dir = os.path.join(data_dir, name)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    info = {}
+    for table, df in compact_tables(tables).items():
+        if df is None:
+            continue
+        path = os.path.join(tmp_dir, f"{table}.arrow")
+        df = df.reset_index(drop=True)
+        categorical = [c for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        if categorical:
+            df = df.astype({c: object for c in categorical})
+        # uncompressed so the file can be memory-mapped without decoding
+        feather.write_feather(df, path, compression="uncompressed")
+        info[table] = {"rows": int(len(df)), "bytes": os.path.getsize(path)}
+
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "file_hash": file_hash,
+        "directory": name,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "tables": info,
+    }
+    tmp_manifest = manifest_path(data_dir) + ".tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_manifest, manifest_path(data_dir))
+
+    # drop older snapshot directories (processes still mapping them keep their open files)
+    for entry in os.listdir(data_dir):
+        if entry.startswith("snapshot-") and entry != name:
+            shutil.rmtree(os.path.join(data_dir, entry), ignore_errors=True)
+
+    logger.info("GTFS snapshot written to %s in %.1fms", final_dir, (perf_counter() - start) * 1000.0)
+    return manifest_path(data_dir)
+
+
+def _arrow_strings(arrow_type):
+    """`types_mapper` for `to_pandas`: Arrow-backed pandas strings (NaN for nulls, as object columns had)."""
+    if arrow_type not in (pa.string(), pa.large_string()):
+        return None
+    try:
+        return pd.StringDtype("pyarrow", na_value=float("nan"))
+    except TypeError:  # pandas < 2.3
+        return pd.StringDtype("pyarrow")
+
+
+def read_snapshot(data_dir: str, expected_hash: Optional[str]) -> Optional[Dict[str, pd.DataFrame]]:
+    """Memory-map the snapshot in `data_dir` if it was built from the feed `expected_hash`."""
+    if not available() or not expected_hash:
+        return None
+    manifest = read_manifest(data_dir)
+    if not manifest:
+        return None
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION or manifest.get("file_hash") != expected_hash:
+        logger.info("GTFS snapshot in %s does not match the current feed; ignoring it", data_dir)
+        return None
+    snap_dir = os.path.join(data_dir, manifest.get("directory") or "")
+    tables: Dict[str, pd.DataFrame] = {}
+    try:
+        for table in manifest.get("tables", {}):
+            source = pa.memory_map(os.path.join(snap_dir, f"{table}.arrow"), "r")
+            arrow_table = pa.ipc.open_file(source).read_all()
+            # split_blocks avoids consolidating columns into new 2-D blocks, so
+            # null-free numeric columns stay views over the mapped file; strings
+            # stay Arrow arrays over it (see the module docstring)
+            tables[table] = arrow_table.to_pandas(split_blocks=True, types_mapper=_arrow_strings)
+    except Exception:
+        logger.warning("Could not read GTFS snapshot from %s", snap_dir, exc_info=True)
+        return None
+    return tables
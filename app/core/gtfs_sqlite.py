@@ -1,6 +1,31 @@
+import heapq
+import itertools
 import os
 import sqlite3
-from typing import List, Dict, Optional
+import time
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from app.config.settings import settings
+from app.core import metrics, query_profiler
+from app.core.metrics import timed_method
+from app.core.connections import connection_index
+from app.core.pagination import db_feed_generation, keyset_clause, sort_key
+from app.utils.time_utils import parse_hhmmss_to_seconds, seconds_to_hhmmss
+
+
+def _secs_expr(col: str) -> str:
+    """SQL seconds of a `H:MM:SS` / `HH:MM:SS` column, for databases built before `*_secs` existed."""
+    return (
+        f"(CAST(substr({col}, 1, instr({col}, ':') - 1) AS INTEGER) * 3600"
+        f" + CAST(substr({col}, instr({col}, ':') + 1, 2) AS INTEGER) * 60"
+        f" + CAST(substr({col}, -2) AS INTEGER))"
+    )
+
+
+# keyset order of schedule rows (see app.core.pagination); departure_secs replaces
+# departure_time on databases that have it
+SCHEDULE_KEY_COLUMNS = ["stop_id", "departure_time", "trip_id", "stop_sequence"]
+SCHEDULE_SECS_KEY_COLUMNS = ["stop_id", "departure_secs", "trip_id", "stop_sequence"]
 
 
 class GTFSStore:
@@ -16,7 +41,10 @@ class GTFSStore:
 
     def _connect(self):
         # Open connection with row factory for dict-like rows
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        if settings.QUERY_PROFILER_ENABLED:
+            conn = query_profiler.connect(self.db_path)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         try:
             cur = conn.cursor()
@@ -26,6 +54,7 @@ class GTFSStore:
             pass
         return conn
 
+    @timed_method()
     def get_routes(self, limit: int = 1000) -> List[Dict]:
         q = "SELECT route_id, route_short_name, route_long_name, route_type FROM routes LIMIT ?"
         conn = self._connect()
@@ -36,6 +65,7 @@ class GTFSStore:
         finally:
             conn.close()
 
+    @timed_method()
     def get_route(self, route_id: str) -> Optional[Dict]:
         q = "SELECT * FROM routes WHERE route_id = ? LIMIT 1"
         conn = self._connect()
@@ -46,35 +76,53 @@ class GTFSStore:
         finally:
             conn.close()
 
-    def get_route_stops(self, route_id: str) -> List[Dict]:
+    @timed_method()
+    def get_route_stops(self, route_id: str, limit: Optional[int] = None, after: Optional[List] = None) -> List[Dict]:
         """Return stops for a route grouped by direction_id.
 
-        Returns a list of dicts with keys: direction_id, stop_sequence, stop_id, stop_name, stop_lat, stop_lon.
-        The result is ordered by direction_id and stop_sequence.
+        Returns a list of dicts with keys: direction_id, stop_sequence, stop_id, stop_name, stop_lat, stop_lon, trip_id.
+        The result is ordered by direction_id, stop_sequence and trip_id; `after` is the
+        keyset (direction_id, stop_sequence, trip_id) of the last row of the previous page.
         """
         q = (
-            "SELECT t.direction_id as direction_id, st.stop_sequence as stop_sequence, st.stop_id as stop_id, s.stop_name as stop_name, s.stop_lat as stop_lat, s.stop_lon as stop_lon "
+            "SELECT t.direction_id as direction_id, st.stop_sequence as stop_sequence, st.stop_id as stop_id, s.stop_name as stop_name, s.stop_lat as stop_lat, s.stop_lon as stop_lon, st.trip_id as trip_id "
             "FROM trips t JOIN stop_times st ON t.trip_id = st.trip_id LEFT JOIN stops s ON st.stop_id = s.stop_id "
             "WHERE t.route_id = ? "
-            "ORDER BY t.direction_id, st.stop_sequence"
         )
+        params = [route_id]
+        if after is not None:
+            clause, key_params = keyset_clause(["t.direction_id", "st.stop_sequence", "st.trip_id"], after)
+            q += f"AND {clause} "
+            params.extend(key_params)
+        q += "ORDER BY t.direction_id, st.stop_sequence, st.trip_id"
+        if limit:
+            q += " LIMIT ?"
+            params.append(limit)
         conn = self._connect()
         try:
-            cur = conn.execute(q, (route_id,))
+            cur = conn.execute(q, tuple(params))
             rows = [dict(r) for r in cur.fetchall()]
             return rows
         finally:
             conn.close()
 
-    def get_stops(self, limit: int = 1000) -> List[Dict]:
-        q = "SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops LIMIT ?"
+    @timed_method()
+    def get_stops(self, limit: int = 1000, after: Optional[List] = None) -> List[Dict]:
+        """Stops ordered by stop_id; `after` is the (stop_id,) keyset of the previous page."""
+        q = "SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops"
+        params = []
+        if after is not None:
+            clause, params = keyset_clause(["stop_id"], after)
+            q += f" WHERE {clause}"
+        q += " ORDER BY stop_id LIMIT ?"
         conn = self._connect()
         try:
-            cur = conn.execute(q, (limit,))
+            cur = conn.execute(q, tuple(params) + (limit,))
             return [dict(r) for r in cur.fetchall()]
         finally:
             conn.close()
 
+    @timed_method()
     def search_stops(self, name_query: str, limit: int = 100) -> List[Dict]:
         """Case-insensitive search on stop_name using LIKE.
 
@@ -89,16 +137,26 @@ class GTFSStore:
         finally:
             conn.close()
 
-    def list_stop_names(self, limit: int = 1000) -> List[Dict]:
-        """Return distinct stop_id and stop_name pairs ordered by stop_name."""
-        q = "SELECT DISTINCT stop_id, stop_name FROM stops ORDER BY stop_name LIMIT ?"
+    @timed_method()
+    def list_stop_names(self, limit: int = 1000, after: Optional[List] = None) -> List[Dict]:
+        """Return distinct stop_id and stop_name pairs ordered by stop_name (then stop_id).
+
+        `after` is the (stop_name, stop_id) keyset of the last row of the previous page.
+        """
+        q = "SELECT DISTINCT stop_id, stop_name FROM stops"
+        params = []
+        if after is not None:
+            clause, params = keyset_clause(["stop_name", "stop_id"], after)
+            q += f" WHERE {clause}"
+        q += " ORDER BY stop_name, stop_id LIMIT ?"
         conn = self._connect()
         try:
-            cur = conn.execute(q, (limit,))
+            cur = conn.execute(q, tuple(params) + (limit,))
             return [dict(r) for r in cur.fetchall()]
         finally:
             conn.close()
 
+    @timed_method()
     def get_stop(self, stop_id: str) -> Optional[Dict]:
         q = "SELECT * FROM stops WHERE stop_id = ? LIMIT 1"
         conn = self._connect()
@@ -109,6 +167,7 @@ class GTFSStore:
         finally:
             conn.close()
 
+    @timed_method()
     def get_schedule_by_stop_date(self, stop_id: str, date: str, limit: int = 200) -> List[Dict]:
         """Convenience method to query the materialized `schedules` table by stop and date.
 
@@ -140,12 +199,20 @@ class GTFSStore:
         finally:
             conn.close()
 
-    def get_schedule(self, stop_id: Optional[str] = None, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200) -> List[Dict]:
+    @timed_method()
+    def get_schedule(self, stop_id: Optional[str] = None, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200, after: Optional[List] = None) -> List[Dict]:
         """Query schedule for stop and/or route on a date.
 
         date should be YYYY-MM-DD or YYYYMMDD. This method will try to use a `schedules`
         materialized table if present; otherwise it computes active service_ids via SQL
         and filters stop_times JOIN trips JOIN routes accordingly.
+
+        Rows are ordered by (stop_id, departure_secs, trip_id, stop_sequence), which
+        is the `ix_stop_times_stop_departure` key (departure_time text on databases
+        built before `departure_secs`); `after` is that keyset for the last row of
+        the previous page, and rows carry `departure_secs` for it. With `stop_id`
+        the page is `(departure_secs, trip_id, stop_sequence) > after` inside the
+        stop's index entries: a range read, without sorting the stop's rows.
         """
         conn = self._connect()
         try:
@@ -178,7 +245,11 @@ class GTFSStore:
                     if route_id:
                         q += " AND route_id = ?"
                         params.append(str(route_id))
-                    q += " ORDER BY route_id, stop_sequence LIMIT ?"
+                    if after is not None:
+                        clause, key_params = keyset_clause(SCHEDULE_KEY_COLUMNS, after)
+                        q += f" AND {clause}"
+                        params.extend(key_params)
+                    q += f" ORDER BY {', '.join(SCHEDULE_KEY_COLUMNS)} LIMIT ?"
                     params.append(limit)
                     cur.execute(q, tuple(params))
                     return [dict(r) for r in cur.fetchall()]
@@ -220,10 +291,14 @@ class GTFSStore:
                     active_sids = None
 
             # Build main query joining stop_times -> trips -> routes
+            has_secs = self._has_time_seconds(cur)
+            # with a stop, CROSS JOIN keeps stop_times (its index range) as the outer loop
+            # even where the statistics make scanning a small trips table look cheaper
             q = (
-                "SELECT st.trip_id, st.arrival_time, st.departure_time, st.stop_id, st.stop_sequence, t.route_id, r.route_short_name, t.trip_headsign "
-                "FROM stop_times st "
-                "JOIN trips t ON st.trip_id = t.trip_id "
+                "SELECT st.trip_id, st.arrival_time, st.departure_time, st.stop_id, st.stop_sequence, t.route_id, r.route_short_name, t.trip_headsign"
+                + (", st.departure_secs " if has_secs else " ")
+                + "FROM stop_times st "
+                + ("CROSS JOIN" if stop_id else "JOIN") + " trips t ON st.trip_id = t.trip_id "
                 "LEFT JOIN routes r ON t.route_id = r.route_id "
                 "WHERE 1=1 "
             )
@@ -239,7 +314,16 @@ class GTFSStore:
             if route_id:
                 q += " AND t.route_id = ?"
                 params.append(str(route_id))
-            q += " ORDER BY t.route_id, st.stop_sequence LIMIT ?"
+            key_columns = [f"st.{c}" for c in (SCHEDULE_SECS_KEY_COLUMNS if has_secs else SCHEDULE_KEY_COLUMNS)]
+            if stop_id and (after is None or str(after[0]) == str(stop_id)):
+                # stop_id is fixed: the rest of the key is one range of the stop's index entries
+                key_columns = key_columns[1:]
+                after = after[1:] if after is not None else None
+            if after is not None:
+                clause, key_params = keyset_clause(key_columns, after)
+                q += f" AND {clause}"
+                params.extend(key_params)
+            q += f" ORDER BY {', '.join(key_columns)} LIMIT ?"
             params.append(limit)
 
             cur.execute(q, tuple(params))
@@ -254,177 +338,674 @@ class GTFSStore:
         finally:
             conn.close()
 
-    def get_upcoming_trains(self, stop_id: str, current_time: Optional[str] = None, limit: int = 10) -> Dict:
-        """Get upcoming departures and arrivals for a stop.
-        
-        Args:
-            stop_id: Stop ID to query
-            current_time: Current time in HH:MM:SS format (defaults to now)
-            limit: Maximum number of trains to return for each category
-            
-        Returns:
-            Dict with:
-            - stop_id, stop_name, current_time
-            - departures: list of upcoming trains departing from this stop
-            - arrivals: list of upcoming trains arriving at this stop
-            Each train includes: trip_id, route info, headsign, scheduled time, minutes_until
+    @timed_method()
+    def get_station_schedule(self, stop_id: str, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200, after: Optional[List] = None) -> List[Dict]:
+        """Schedule of the whole station `stop_id` is or belongs to, in departure order.
+
+        Each platform is read as its own `ix_stop_times_stop_departure` range,
+        already sorted by departure, and the per-platform lists are heap-merged.
+        Rows are ordered by (departure_secs, stop_id, trip_id, stop_sequence)
+        (departure_time on databases built before `departure_secs`); `after` is
+        that keyset for the last row of the previous page.
         """
         import datetime
-        
+
+        date_iso = None
+        if date:
+            date_key = date.replace('-', '')
+            date_iso = f"{date_key[0:4]}-{date_key[4:6]}-{date_key[6:8]}"
         conn = self._connect()
         try:
             cur = conn.cursor()
-            
-            # Get stop info
-            cur.execute("SELECT stop_id, stop_name FROM stops WHERE stop_id = ? LIMIT 1", (stop_id,))
-            stop_row = cur.fetchone()
-            if not stop_row:
-                return {
-                    'stop_id': stop_id,
-                    'stop_name': None,
-                    'current_time': current_time or '00:00:00',
-                    'departures': [],
-                    'arrivals': []
-                }
-            
-            stop_name = stop_row['stop_name']
-            
-            # Determine current time
-            if not current_time:
-                now = datetime.datetime.now()
-                current_time = now.strftime('%H:%M:%S')
-            
-            # Parse current time to minutes since midnight for calculations
-            time_parts = current_time.split(':')
-            current_minutes = int(time_parts[0]) * 60 + int(time_parts[1])
-            
-            # Get active service IDs for today
-            today = datetime.date.today()
-            weekday = today.weekday()  # 0=Monday, 6=Sunday
-            date_key = today.strftime('%Y%m%d')
-            
-            # Map weekday to GTFS column names
-            weekday_cols = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-            weekday_col = weekday_cols[weekday]
-            
-            # Get active services from calendar
-            active_services_query = f"""
-                SELECT DISTINCT service_id FROM calendar 
-                WHERE {weekday_col} = 1 
-                AND start_date <= ? 
-                AND end_date >= ?
-            """
-            cur.execute(active_services_query, (date_key, date_key))
-            active_services = [row['service_id'] for row in cur.fetchall()]
-            
-            if not active_services:
-                return {
-                    'stop_id': stop_id,
-                    'stop_name': stop_name,
-                    'current_time': current_time,
-                    'departures': [],
-                    'arrivals': []
-                }
-            
-            placeholders = ','.join('?' for _ in active_services)
-            
-            # Query for DEPARTURES (trains leaving this stop)
-            departures_query = f"""
-                SELECT 
-                    st.trip_id,
-                    st.departure_time as scheduled_time,
-                    st.stop_sequence,
-                    t.trip_headsign,
-                    r.route_id,
-                    r.route_short_name,
-                    r.route_long_name
-                FROM stop_times st
-                JOIN trips t ON st.trip_id = t.trip_id
-                JOIN routes r ON t.route_id = r.route_id
-                WHERE st.stop_id = ?
-                AND t.service_id IN ({placeholders})
-                AND st.departure_time >= ?
-                ORDER BY st.departure_time
-                LIMIT ?
-            """
-            
-            params = [stop_id] + active_services + [current_time, limit]
-            cur.execute(departures_query, params)
-            departure_rows = cur.fetchall()
-            
-            # Query for ARRIVALS (trains arriving at this stop)
-            arrivals_query = f"""
-                SELECT 
+            _station_id, platforms = self._station_platforms(cur, str(stop_id))
+            active_sids = None
+            if date_iso:
+                try:
+                    active_sids = self._active_services(cur, datetime.date.fromisoformat(date_iso))
+                except ValueError:
+                    active_sids = None
+            has_secs = self._has_time_seconds(cur)
+            dep_col = "st.departure_secs" if has_secs else "st.departure_time"
+            key_columns = [dep_col, "st.stop_id", "st.trip_id", "st.stop_sequence"]
+            per_stop = []
+            for platform in platforms:
+                q = (
+                    "SELECT st.trip_id, st.arrival_time, st.departure_time, st.stop_id, st.stop_sequence, t.route_id, r.route_short_name, t.trip_headsign"
+                    + (", st.departure_secs " if has_secs else " ")
+                    + "FROM stop_times st "
+                    "CROSS JOIN trips t ON st.trip_id = t.trip_id "
+                    "LEFT JOIN routes r ON t.route_id = r.route_id "
+                    "WHERE st.stop_id = ?"
+                )
+                params: List = [platform]
+                if active_sids is not None:
+                    q += f" AND t.service_id IN ({','.join('?' for _ in active_sids)})"
+                    params.extend(active_sids)
+                if route_id:
+                    q += " AND t.route_id = ?"
+                    params.append(str(route_id))
+                if after is not None:
+                    clause, key_params = self._platform_after(platform, dep_col, after)
+                    if clause:
+                        q += f" AND {clause}"
+                        params.extend(key_params)
+                q += f" ORDER BY {dep_col}, st.trip_id, st.stop_sequence LIMIT ?"
+                params.append(limit)
+                cur.execute(q, tuple(params))
+                per_stop.append([dict(r) for r in cur.fetchall()])
+            dep_key = 'departure_secs' if has_secs else 'departure_time'
+            rows = list(itertools.islice(
+                heapq.merge(*per_stop, key=lambda r: sort_key((r[dep_key], r['stop_id'], r['trip_id'], r['stop_sequence']))),
+                limit,
+            ))
+            if date_iso:
+                for r in rows:
+                    r['service_date'] = date_iso
+            return rows
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _platform_after(platform: str, dep_col: str, after: List) -> Tuple[str, List]:
+        """`(departure, stop_id, trip_id, stop_sequence) > after` for the rows of one platform.
+
+        stop_id is fixed per platform, so the condition is a range of its
+        `(stop_id, departure_secs, trip_id, stop_sequence)` index entries: later
+        platforms start at the cursor's departure, earlier ones after it, and the
+        cursor's own platform continues after its (departure, trip, sequence).
+        """
+        departure, after_stop, trip_id, sequence = after
+        if str(platform) == str(after_stop):
+            return keyset_clause([dep_col, "st.trip_id", "st.stop_sequence"], [departure, trip_id, sequence])
+        if str(platform) < str(after_stop):
+            return keyset_clause([dep_col], [departure])
+        # NULL sorts first: every departure is >= a NULL one
+        return (f"{dep_col} >= ?", [departure]) if departure is not None else ("", [])
+
+    @timed_method()
+    def get_service_day_calls(self, day) -> Dict:
+        """Every call of the trips running on service date `day`, for `app.core.service_analytics`.
+
+        Returns a dict with:
+        - `calls`: (trip_id, route_id, stop_id, secs), `secs` being the departure
+          (the arrival where there is none) from the service day's midnight;
+        - `frequencies`: (trip_id, start secs, end secs, headway secs) of those trips
+          from `frequencies.txt`, empty when the feed has none;
+        - `routes` / `stops`: route_id -> route_short_name and stop_id -> stop_name.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            services = self._active_services(cur, day)
+            if self._has_time_seconds(cur):
+                secs = "COALESCE(st.departure_secs, st.arrival_secs)"
+            else:
+                secs = f"COALESCE({_secs_expr('st.departure_time')}, {_secs_expr('st.arrival_time')})"
+            calls: List[Tuple] = []
+            frequencies: List[Tuple] = []
+            if services:
+                placeholders = ','.join('?' for _ in services)
+                cur.execute(
+                    f"""
+                    SELECT st.trip_id, t.route_id, st.stop_id, {secs}
+                    FROM trips t
+                    CROSS JOIN stop_times st ON st.trip_id = t.trip_id
+                    WHERE t.service_id IN ({placeholders})
+                    """,
+                    services,
+                )
+                calls = [tuple(row) for row in cur.fetchall()]
+                if self._has_table(cur, 'frequencies'):
+                    try:
+                        cur.execute(
+                            f"""
+                            SELECT f.trip_id, {_secs_expr('f.start_time')}, {_secs_expr('f.end_time')}, f.headway_secs
+                            FROM frequencies f JOIN trips t ON t.trip_id = f.trip_id
+                            WHERE t.service_id IN ({placeholders}) AND f.headway_secs > 0
+                            """,
+                            services,
+                        )
+                        frequencies = [tuple(row) for row in cur.fetchall()]
+                    except sqlite3.Error:
+                        frequencies = []
+            cur.execute("SELECT route_id, route_short_name FROM routes")
+            routes = {row[0]: row[1] for row in cur.fetchall()}
+            cur.execute("SELECT stop_id, stop_name FROM stops")
+            stops = {row[0]: row[1] for row in cur.fetchall()}
+            return {'calls': calls, 'frequencies': frequencies, 'routes': routes, 'stops': stops}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _active_services(cur, day) -> List[str]:
+        """service_ids running on `day`: `calendar` weekday/range plus `calendar_dates` exceptions."""
+        weekday_cols = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        weekday_col = weekday_cols[day.weekday()]
+        date_key = day.strftime('%Y%m%d')
+        active = set()
+        try:
+            cur.execute(
+                f"SELECT DISTINCT service_id FROM calendar WHERE {weekday_col} = 1 AND start_date <= ? AND end_date >= ?",
+                (date_key, date_key),
+            )
+            active = {str(row[0]) for row in cur.fetchall()}
+        except sqlite3.Error:
+            pass
+        try:
+            cur.execute("SELECT service_id, exception_type FROM calendar_dates WHERE date = ?", (date_key,))
+            for service_id, exception_type in cur.fetchall():
+                if str(exception_type) == '1':
+                    active.add(str(service_id))
+                elif str(exception_type) == '2':
+                    active.discard(str(service_id))
+        except sqlite3.Error:
+            pass
+        return sorted(active)
+
+    def _service_days(self, cur, now) -> List[Tuple]:
+        """(service_date, active service_ids) for yesterday, today and tomorrow.
+
+        Yesterday's trips still run after midnight with times >= 24:00:00 and
+        tomorrow's first trips fall inside a window opened late in the evening.
+        """
+        import datetime
+
+        today = now.date()
+        return [(day, self._active_services(cur, day)) for day in (today - datetime.timedelta(days=1), today, today + datetime.timedelta(days=1))]
+
+    @staticmethod
+    def _has_time_seconds(cur) -> bool:
+        try:
+            cur.execute("PRAGMA table_info(stop_times)")
+            return {"departure_secs", "arrival_secs"} <= {row[1] for row in cur.fetchall()}
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _next_calls(cur, stop_id: str, kind: str, now, service_days: List[Tuple], limit: int, window_secs: int, has_secs: bool) -> List[Tuple]:
+        """Next `limit` calls (`kind` = departure | arrival) at a stop within `window_secs` of `now`.
+
+        For each service day the window is translated into seconds from that
+        day's midnight and read as one range of `(stop_id, <kind>_secs)`; the
+        three already sorted lists are merged on their absolute time.
+        Returns (absolute datetime, service_date, row) tuples.
+        """
+        import datetime
+
+        secs_col = f"st.{kind}_secs" if has_secs else _secs_expr(f"st.{kind}_time")
+        per_day = []
+        for day, services in service_days:
+            if not services:
+                continue
+            day_start = datetime.datetime.combine(day, datetime.time())
+            lo = int((now - day_start).total_seconds())
+            hi = lo + window_secs
+            if hi < 0:
+                continue
+            placeholders = ','.join('?' for _ in services)
+            q = f"""
+                SELECT
                     st.trip_id,
-                    st.arrival_time as scheduled_time,
+                    st.stop_id,
+                    st.{kind}_time as scheduled_time,
+                    {secs_col} as secs,
                     st.stop_sequence,
                     t.trip_headsign,
                     r.route_id,
                     r.route_short_name,
                     r.route_long_name
                 FROM stop_times st
-                JOIN trips t ON st.trip_id = t.trip_id
+                CROSS JOIN trips t ON st.trip_id = t.trip_id
                 JOIN routes r ON t.route_id = r.route_id
                 WHERE st.stop_id = ?
+                AND {secs_col} BETWEEN ? AND ?
                 AND t.service_id IN ({placeholders})
-                AND st.arrival_time >= ?
-                ORDER BY st.arrival_time
+                ORDER BY {secs_col}, st.trip_id, st.stop_sequence
                 LIMIT ?
             """
-            
-            cur.execute(arrivals_query, params)
-            arrival_rows = cur.fetchall()
-            
-            # Helper function to calculate minutes until
-            def calculate_minutes_until(scheduled_time_str: str) -> int:
-                """Calculate minutes from current_time to scheduled_time."""
-                parts = scheduled_time_str.split(':')
-                scheduled_minutes = int(parts[0]) * 60 + int(parts[1])
-                
-                # Handle times past midnight (like 25:30:00 for 1:30 AM next day)
-                if scheduled_minutes < current_minutes and scheduled_minutes < 180:  # likely next day
-                    scheduled_minutes += 24 * 60
-                
-                return scheduled_minutes - current_minutes
-            
-            # Format departures
-            departures = []
-            for row in departure_rows:
-                departures.append({
-                    'trip_id': row['trip_id'],
-                    'route_short_name': row['route_short_name'],
-                    'route_long_name': row['route_long_name'],
-                    'trip_headsign': row['trip_headsign'] or 'Sin destino',
-                    'headsign': row['trip_headsign'] or 'Sin destino',
-                    'direction_id': None,  # Not available in this dataset
-                    'departure_time': row['scheduled_time'],
-                    'scheduled_time': row['scheduled_time'],
-                    'minutes_until': calculate_minutes_until(row['scheduled_time']),
-                    'stop_sequence': row['stop_sequence']
-                })
-            
-            # Format arrivals
-            arrivals = []
-            for row in arrival_rows:
-                arrivals.append({
-                    'trip_id': row['trip_id'],
-                    'route_short_name': row['route_short_name'],
-                    'route_long_name': row['route_long_name'],
-                    'trip_headsign': row['trip_headsign'] or 'Sin origen',
-                    'headsign': row['trip_headsign'] or 'Sin origen',
-                    'direction_id': None,  # Not available in this dataset
-                    'arrival_time': row['scheduled_time'],
-                    'scheduled_time': row['scheduled_time'],
-                    'minutes_until': calculate_minutes_until(row['scheduled_time']),
-                    'stop_sequence': row['stop_sequence']
-                })
-            
+            cur.execute(q, [stop_id, max(lo, 0), hi] + list(services) + [limit])
+            per_day.append([(day_start + datetime.timedelta(seconds=row['secs']), day, row) for row in cur.fetchall()])
+        return list(itertools.islice(heapq.merge(*per_day, key=lambda call: call[0]), limit))
+
+    def _station_platforms(self, cur, stop_id: str) -> Tuple[str, List[str]]:
+        """(station_id, boarding stop_ids) of the station `stop_id` is, or belongs to.
+
+        Read from the `station_platforms` map built with the database; databases
+        built before it use `stops.parent_station`. A stop outside any station
+        is its own single platform.
+        """
+        if self._has_table(cur, 'station_platforms'):
+            cur.execute("SELECT station_id FROM station_platforms WHERE stop_id = ? LIMIT 1", (stop_id,))
+            row = cur.fetchone()
+            station_id = row[0] if row else stop_id
+            cur.execute("SELECT stop_id FROM station_platforms WHERE station_id = ? ORDER BY stop_id", (station_id,))
+        else:
+            try:
+                cur.execute("SELECT parent_station FROM stops WHERE stop_id = ? LIMIT 1", (stop_id,))
+                row = cur.fetchone()
+                station_id = row[0] if row and row[0] else stop_id
+                cur.execute("SELECT stop_id FROM stops WHERE parent_station = ? ORDER BY stop_id", (station_id,))
+            except sqlite3.Error:
+                return stop_id, [stop_id]
+        platforms = [str(r[0]) for r in cur.fetchall()]
+        return str(station_id), platforms or [str(stop_id)]
+
+    def _station_calls(self, cur, platforms: List[str], kind: str, now, service_days: List[Tuple], limit: int, window_secs: int, has_secs: bool) -> List[Tuple]:
+        """Next `limit` calls over several platforms: a heap merge of each platform's sorted `_next_calls`."""
+        per_stop = [self._next_calls(cur, p, kind, now, service_days, limit, window_secs, has_secs) for p in platforms]
+        if len(per_stop) == 1:
+            return per_stop[0]
+        return list(itertools.islice(heapq.merge(*per_stop, key=lambda call: call[0]), limit))
+
+    def _board(self, cur, stop_id: str, now, current_time: str, service_days: List[Tuple], limit: int, window_secs: int, has_secs: bool, station: bool = False) -> Dict:
+        """Departure/arrival board of one stop, or of its whole station with `station` (see `_next_calls`)."""
+        platforms = [stop_id]
+        if station:
+            stop_id, platforms = self._station_platforms(cur, stop_id)
+        cur.execute("SELECT stop_id, stop_name FROM stops WHERE stop_id = ? LIMIT 1", (stop_id,))
+        stop_row = cur.fetchone()
+        if not stop_row and station and platforms != [stop_id]:
+            # a parent_station missing from stops.txt: name the board after its first platform
+            cur.execute("SELECT stop_id, stop_name FROM stops WHERE stop_id = ? LIMIT 1", (platforms[0],))
+            stop_row = cur.fetchone()
+        if not stop_row:
             return {
                 'stop_id': stop_id,
-                'stop_name': stop_name,
+                'stop_name': None,
                 'current_time': current_time,
-                'departures': departures,
-                'arrivals': arrivals
+                'departures': [],
+                'arrivals': []
             }
+
+        def format_call(call, kind: str, fallback_headsign: str) -> Dict:
+            at, day, row = call
+            headsign = row['trip_headsign'] or fallback_headsign
+            return {
+                'trip_id': row['trip_id'],
+                'route_short_name': row['route_short_name'],
+                'route_long_name': row['route_long_name'],
+                'trip_headsign': headsign,
+                'headsign': headsign,
+                'direction_id': None,  # Not available in this dataset
+                f'{kind}_time': row['scheduled_time'],
+                'scheduled_time': row['scheduled_time'],
+                'service_date': day.isoformat(),
+                'scheduled_at': at.isoformat(timespec='seconds'),
+                # exact: both ends are absolute times, so 25:10:00 of yesterday is 70 minutes after 00:00
+                'minutes_until': int((at - now).total_seconds() // 60),
+                'stop_sequence': row['stop_sequence'],
+                'stop_id': row['stop_id']
+            }
+
+        departures = [
+            format_call(c, 'departure', 'Sin destino')
+            for c in self._station_calls(cur, platforms, 'departure', now, service_days, limit, window_secs, has_secs)
+        ]
+        arrivals = [
+            format_call(c, 'arrival', 'Sin origen')
+            for c in self._station_calls(cur, platforms, 'arrival', now, service_days, limit, window_secs, has_secs)
+        ]
+        board = {
+            'stop_id': stop_id,
+            'stop_name': stop_row['stop_name'],
+            'current_time': current_time,
+            'departures': departures,
+            'arrivals': arrivals
+        }
+        if station:
+            board['platforms'] = platforms
+        return board
+
+    @staticmethod
+    def _board_clock(current_time: Optional[str]) -> Tuple:
+        """(now as datetime, HH:MM:SS echoed back); `current_time` is a time of today."""
+        import datetime
+
+        now = datetime.datetime.now().replace(microsecond=0)
+        if not current_time:
+            return now, now.strftime('%H:%M:%S')
+        secs = parse_hhmmss_to_seconds(current_time)
+        if secs is None:
+            raise ValueError(f"Invalid current_time {current_time!r}, expected HH:MM:SS")
+        return datetime.datetime.combine(now.date(), datetime.time()) + datetime.timedelta(seconds=secs), current_time
+
+    @timed_method()
+    def get_upcoming_trains(self, stop_id: str, current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False) -> Dict:
+        """Get upcoming departures and arrivals for a stop.
+        
+        Args:
+            stop_id: Stop ID to query
+            current_time: Current time in HH:MM:SS format (defaults to now)
+            limit: Maximum number of trains to return for each category
+            hours: Look-ahead window (defaults to `UPCOMING_WINDOW_HOURS`)
+            station: Board of the whole station `stop_id` is or belongs to, merging
+                the trains of all its platforms (listed in `platforms`)
+            
+        Returns:
+            Dict with:
+            - stop_id, stop_name, current_time
+            - departures: list of upcoming trains departing from this stop
+            - arrivals: list of upcoming trains arriving at this stop
+            Each train includes: trip_id, route info, headsign, scheduled time,
+            service_date, scheduled_at and minutes_until. Yesterday's after-midnight
+            trips and tomorrow's early trips are included when they fall in the window.
+        """
+        now, current_time = self._board_clock(current_time)
+        window_secs = int(float(hours if hours is not None else settings.UPCOMING_WINDOW_HOURS) * 3600)
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            return self._board(cur, stop_id, now, current_time, self._service_days(cur, now), limit, window_secs, self._has_time_seconds(cur), station=station)
+        finally:
+            conn.close()
+
+    def iter_upcoming_trains(self, stop_ids: List[str], current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False) -> Iterator[Dict]:
+        """Boards of several stops, yielded one by one as each is read.
+
+        One connection and one active-services lookup for the whole batch; each
+        stop then costs its own LIMIT range reads on `stop_times`, so the
+        first board is ready without waiting for the others.
+        """
+        now, current_time = self._board_clock(current_time)
+        window_secs = int(float(hours if hours is not None else settings.UPCOMING_WINDOW_HOURS) * 3600)
+        start = time.perf_counter()
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            service_days = self._service_days(cur, now)
+            has_secs = self._has_time_seconds(cur)
+            for stop_id in stop_ids:
+                yield self._board(cur, stop_id, now, current_time, service_days, limit, window_secs, has_secs, station=station)
+        except Exception:
+            metrics.DB_QUERY_ERRORS.inc("iter_upcoming_trains")
+            raise
+        finally:
+            conn.close()
+            metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - start, "iter_upcoming_trains")
+
+    @timed_method()
+    def get_origin_connections(self, origin_id: str) -> List[Tuple]:
+        """Every later call of every trip through `origin_id`: one self-join of stop_times.
+
+        Rows are (departure secs at origin, arrival secs at destination, destination
+        stop_id, trip_id, service_id, route_id, route_short_name, trip_headsign).
+        The origin side is an index lookup on stop_id and each trip's
+        later stops come from its (trip_id, stop_sequence) index; CROSS JOIN keeps
+        that order even on databases without ANALYZE statistics.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            if self._has_time_seconds(cur):
+                dep, arr = "a.departure_secs", "b.arrival_secs"
+            else:
+                dep, arr = _secs_expr("a.departure_time"), _secs_expr("b.arrival_time")
+            cur.execute(
+                f"""
+                SELECT {dep} AS dep, {arr} AS arr, b.stop_id, a.trip_id, t.service_id, t.route_id,
+                       r.route_short_name, t.trip_headsign
+                FROM stop_times a
+                CROSS JOIN stop_times b ON b.trip_id = a.trip_id AND b.stop_sequence > a.stop_sequence
+                CROSS JOIN trips t ON t.trip_id = a.trip_id
+                LEFT JOIN routes r ON r.route_id = t.route_id
+                WHERE a.stop_id = ?
+                """,
+                (origin_id,),
+            )
+            return [tuple(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    @timed_method()
+    def get_direct_departures(self, from_stop_id: str, to_stop_id: str, current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False) -> Optional[Dict]:
+        """Next trains from `from_stop_id` that later call at `to_stop_id`, without changing.
+
+        Served from the per-origin map in `app.core.connections` (built once per
+        feed generation); returns None when either stop is unknown. With
+        `station`, both ends are whole stations and the calls of every
+        (origin platform, destination platform) pair are heap-merged.
+        """
+        now, current_time = self._board_clock(current_time)
+        window_secs = int(float(hours if hours is not None else settings.UPCOMING_WINDOW_HOURS) * 3600)
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT stop_id, stop_name FROM stops WHERE stop_id IN (?, ?)", (from_stop_id, to_stop_id))
+            names = {row['stop_id']: row['stop_name'] for row in cur.fetchall()}
+            if from_stop_id not in names or to_stop_id not in names:
+                return None
+            origins, destinations = [from_stop_id], [to_stop_id]
+            if station:
+                requested = (names[from_stop_id], names[to_stop_id])
+                from_stop_id, origins = self._station_platforms(cur, from_stop_id)
+                to_stop_id, destinations = self._station_platforms(cur, to_stop_id)
+                cur.execute("SELECT stop_id, stop_name FROM stops WHERE stop_id IN (?, ?)", (from_stop_id, to_stop_id))
+                names = {row['stop_id']: row['stop_name'] for row in cur.fetchall()}
+                # a parent_station missing from stops.txt keeps the requested stop's name
+                names.setdefault(from_stop_id, requested[0])
+                names.setdefault(to_stop_id, requested[1])
+            service_days = self._service_days(cur, now)
+        finally:
+            conn.close()
+        generation = db_feed_generation(self.db_path) or ''
+        per_pair = []
+        for origin_id in origins:
+            origin = connection_index.origin(self, generation, origin_id)
+            for destination_id in destinations:
+                if destination_id != origin_id:
+                    calls = origin.calls(destination_id, service_days, now, window_secs, limit)
+                    per_pair.append([(call, origin_id, destination_id) for call in calls])
+        merged = itertools.islice(heapq.merge(*per_pair, key=lambda item: item[0][0]), limit)
+        departures = []
+        for (departs_at, arrives_at, day, dep_secs, arr_secs, (trip_id, _service_id, route_id, short_name, headsign)), origin_id, destination_id in merged:
+            departures.append({
+                'trip_id': trip_id,
+                'route_id': route_id,
+                'route_short_name': short_name,
+                'trip_headsign': headsign,
+                'service_date': day.isoformat(),
+                'departure_time': seconds_to_hhmmss(dep_secs),
+                'arrival_time': seconds_to_hhmmss(arr_secs),
+                'departure_at': departs_at.isoformat(timespec='seconds'),
+                'arrival_at': arrives_at.isoformat(timespec='seconds'),
+                'duration_minutes': int((arrives_at - departs_at).total_seconds() // 60),
+                'minutes_until': int((departs_at - now).total_seconds() // 60),
+                'from_platform_id': origin_id,
+                'to_platform_id': destination_id,
+            })
+        return {
+            'from_stop_id': from_stop_id,
+            'from_stop_name': names[from_stop_id],
+            'to_stop_id': to_stop_id,
+            'to_stop_name': names[to_stop_id],
+            'current_time': current_time,
+            'departures': departures,
+        }
+
+    @staticmethod
+    def _has_table(cur, name: str) -> bool:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+        return cur.fetchone() is not None
+
+    @timed_method()
+    def get_trip(self, trip_id: str) -> Optional[Dict]:
+        """One trip: route info, ordered stop times and shape points.
+
+        Stop times come from `trip_stop_times` (clustered by trip, one range read);
+        databases built before it existed read `stop_times` through its
+        (trip_id, stop_sequence) index instead. Returns None for an unknown trip.
+        """
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT t.*, r.route_short_name, r.route_long_name, r.route_type
+                FROM trips t LEFT JOIN routes r ON r.route_id = t.route_id
+                WHERE t.trip_id = ? LIMIT 1
+                """,
+                (trip_id,),
+            )
+            trip_row = cur.fetchone()
+            if not trip_row:
+                return None
+            trip = dict(trip_row)
+            table = 'trip_stop_times' if self._has_table(cur, 'trip_stop_times') else 'stop_times'
+            cur.execute(
+                f"""
+                SELECT st.stop_sequence, st.stop_id, s.stop_name, s.stop_lat, s.stop_lon,
+                       st.arrival_time, st.departure_time
+                FROM {table} st LEFT JOIN stops s ON s.stop_id = st.stop_id
+                WHERE st.trip_id = ?
+                ORDER BY st.stop_sequence
+                """,
+                (trip_id,),
+            )
+            trip['stop_times'] = [dict(row) for row in cur.fetchall()]
+            shape = []
+            if trip.get('shape_id'):
+                try:
+                    cur.execute(
+                        "SELECT shape_pt_lat, shape_pt_lon FROM shapes WHERE shape_id = ? ORDER BY shape_pt_sequence",
+                        (trip['shape_id'],),
+                    )
+                    shape = [[row[0], row[1]] for row in cur.fetchall()]
+                except sqlite3.Error:
+                    shape = []
+            trip['shape'] = shape
+            return trip
+        finally:
+            conn.close()
+
+    def _shape_geometry(self, cur, shape_id: str, tolerance: float) -> Optional[Dict]:
+        """Encoded polyline of a shape at the largest precomputed tolerance <= `tolerance`."""
+        from app.core import shape_geometry
+
+        if self._has_table(cur, 'shape_geometry'):
+            cur.execute(
+                "SELECT shape_id, tolerance_m, n_points, length_m, polyline FROM shape_geometry "
+                "WHERE shape_id = ? AND tolerance_m <= ? ORDER BY tolerance_m DESC LIMIT 1",
+                (shape_id, max(float(tolerance), 0.0)),
+            )
+            row = cur.fetchone()
+            if not row:
+                return None
+            blob = row['polyline']
+            return {
+                'shape_id': row['shape_id'],
+                'tolerance_m': row['tolerance_m'],
+                'n_points': row['n_points'],
+                'length_m': row['length_m'],
+                'precision': shape_geometry.POLYLINE_PRECISION,
+                'polyline': blob.decode('ascii') if isinstance(blob, bytes) else blob,
+            }
+        # databases built before shape_geometry: simplify this shape on the fly
+        cur.execute("SELECT shape_pt_lat, shape_pt_lon FROM shapes WHERE shape_id = ? ORDER BY shape_pt_sequence", (shape_id,))
+        points = [(row[0], row[1]) for row in cur.fetchall() if row[0] is not None and row[1] is not None]
+        if not points:
+            return None
+        import numpy as np
+
+        lat = np.array([p[0] for p in points], dtype=np.float64)
+        lon = np.array([p[1] for p in points], dtype=np.float64)
+        chosen = shape_geometry.pick_tolerance(shape_geometry.configured_tolerances(), tolerance)
+        idx = shape_geometry.simplify(lat, lon, chosen)
+        return {
+            'shape_id': shape_id,
+            'tolerance_m': chosen,
+            'n_points': int(len(idx)),
+            'length_m': shape_geometry.path_length_m(lat, lon),
+            'precision': shape_geometry.POLYLINE_PRECISION,
+            'polyline': shape_geometry.encode_polyline(np.column_stack((lat[idx], lon[idx]))),
+        }
+
+    @timed_method()
+    def get_trip_shape(self, trip_id: str, tolerance: float = 0.0) -> Optional[Dict]:
+        """Shape of a trip (None for an unknown trip; `shape` is None when it has none)."""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT trip_id, route_id, shape_id FROM trips WHERE trip_id = ? LIMIT 1", (trip_id,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            shape = self._shape_geometry(cur, row['shape_id'], tolerance) if row['shape_id'] else None
+            return {'trip_id': row['trip_id'], 'route_id': row['route_id'], 'shape': shape}
+        finally:
+            conn.close()
+
+    @timed_method()
+    def get_route_shapes(self, route_id: str, tolerance: float = 0.0) -> Optional[Dict]:
+        """Distinct shapes run by a route's trips, most used first (None for an unknown route)."""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT route_id FROM routes WHERE route_id = ? LIMIT 1", (route_id,))
+            if not cur.fetchone():
+                return None
+            cur.execute(
+                "SELECT shape_id, COUNT(*) AS n_trips FROM trips WHERE route_id = ? AND shape_id IS NOT NULL "
+                "GROUP BY shape_id ORDER BY n_trips DESC, shape_id",
+                (route_id,),
+            )
+            shapes = []
+            for shape_id, n_trips in cur.fetchall():
+                shape = self._shape_geometry(cur, shape_id, tolerance)
+                if shape is not None:
+                    shapes.append(dict(shape, n_trips=n_trips))
+            return {'route_id': route_id, 'shapes': shapes}
+        finally:
+            conn.close()
+
+    @timed_method()
+    def get_stop_points(self) -> List[Tuple]:
+        """(stop_id, stop_name, stop_lat, stop_lon) of every located stop (vector tile stops layer)."""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT stop_id, stop_name, stop_lat, stop_lon FROM stops WHERE stop_lat IS NOT NULL AND stop_lon IS NOT NULL")
+            return [tuple(row) for row in cur.fetchall()]
+        finally:
+            conn.close()
+
+    @timed_method()
+    def get_shape_routes(self) -> Dict[str, Dict]:
+        """shape_id -> route attributes of the route running most of its trips."""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT * FROM routes")
+            routes = {row['route_id']: dict(row) for row in cur.fetchall()}
+            cur.execute(
+                "SELECT shape_id, route_id, COUNT(*) AS n FROM trips WHERE shape_id IS NOT NULL "
+                "GROUP BY shape_id, route_id ORDER BY shape_id, n DESC, route_id"
+            )
+            out: Dict[str, Dict] = {}
+            for shape_id, route_id, _n in cur.fetchall():
+                if shape_id in out:
+                    continue
+                route = routes.get(route_id, {})
+                out[shape_id] = {
+                    'shape_id': shape_id,
+                    'route_id': route_id,
+                    'route_short_name': route.get('route_short_name'),
+                    'route_type': route.get('route_type'),
+                    'route_color': route.get('route_color'),
+                }
+            return out
+        finally:
+            conn.close()
+
+    @timed_method()
+    def get_shape_polylines(self, tolerance: float = 0.0) -> List[Dict]:
+        """Every shape at the largest precomputed tolerance <= `tolerance` (see `_shape_geometry`)."""
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            table = 'shape_geometry' if self._has_table(cur, 'shape_geometry') else 'shapes'
+            cur.execute(f"SELECT DISTINCT shape_id FROM {table} WHERE shape_id IS NOT NULL")
+            shape_ids = [row[0] for row in cur.fetchall()]
+            shapes = [self._shape_geometry(cur, shape_id, tolerance) for shape_id in shape_ids]
+            return [shape for shape in shapes if shape is not None]
         finally:
             conn.close()
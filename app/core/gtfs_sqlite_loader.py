@@ -1,9 +1,119 @@
 import os
 import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
 from typing import Dict
 
 import pandas as pd
 
+from app.core import metrics
+
+
+def with_time_seconds(stop_times: pd.DataFrame) -> pd.DataFrame:
+    """Add `arrival_secs` / `departure_secs`: seconds from the service day's midnight.
+
+    GTFS times run past 24:00:00 for trips that cross midnight, so these stay
+    above 86400 instead of wrapping; missing or invalid times become NULL.
+    """
+    from app.core.gtfs_columnar import time_codes_to_seconds
+
+    extra = {}
+    for col in ("arrival_time", "departure_time"):
+        if col in stop_times.columns:
+            secs = pd.array(time_codes_to_seconds(stop_times[col]), dtype="Int32")
+            extra[col.replace("_time", "_secs")] = pd.Series(secs, index=stop_times.index).mask(lambda v: v < 0)
+    return stop_times.assign(**extra) if extra else stop_times
+
+
+# columns copied into trip_stop_times when stop_times has them
+TRIP_STOP_TIME_COLUMNS = [
+    ("stop_id", "TEXT"),
+    ("arrival_time", "TEXT"),
+    ("departure_time", "TEXT"),
+    ("arrival_secs", "INTEGER"),
+    ("departure_secs", "INTEGER"),
+    ("pickup_type", "INTEGER"),
+    ("drop_off_type", "INTEGER"),
+    ("shape_dist_traveled", "REAL"),
+]
+
+
+def build_trip_stop_times(cur) -> None:
+    """Trip-clustered copy of `stop_times` for `/trips/{trip_id}`.
+
+    A WITHOUT ROWID table keyed by (trip_id, stop_sequence) stores rows in
+    primary key order, so the primary key b-tree is the per-trip offset index and
+    a trip's stop times are one contiguous range read (no rowid lookups back
+    into `stop_times`).
+    """
+    cur.execute("PRAGMA table_info(stop_times)")
+    available = {row[1] for row in cur.fetchall()}
+    if not {"trip_id", "stop_sequence"} <= available:
+        return
+    columns = [(name, kind) for name, kind in TRIP_STOP_TIME_COLUMNS if name in available]
+    cur.execute("DROP TABLE IF EXISTS trip_stop_times;")
+    cur.execute(
+        "CREATE TABLE trip_stop_times ("
+        "trip_id TEXT NOT NULL, stop_sequence INTEGER NOT NULL, "
+        + "".join(f"{name} {kind}, " for name, kind in columns)
+        + "PRIMARY KEY (trip_id, stop_sequence)) WITHOUT ROWID;"
+    )
+    names = ", ".join(name for name, _ in columns)
+    # key order insert: pages fill sequentially; duplicated (trip, sequence) rows keep the first
+    cur.execute(
+        f"INSERT OR IGNORE INTO trip_stop_times (trip_id, stop_sequence, {names}) "
+        f"SELECT trip_id, CAST(stop_sequence AS INTEGER), {names} FROM stop_times "
+        "WHERE trip_id IS NOT NULL AND stop_sequence IS NOT NULL "
+        "ORDER BY trip_id, CAST(stop_sequence AS INTEGER);"
+    )
+
+
+def build_shape_geometry(cur, shapes: pd.DataFrame) -> None:
+    """Simplified, polyline-encoded shapes at every `SHAPE_TOLERANCES_M` (see app.core.shape_geometry)."""
+    from app.core.shape_geometry import configured_tolerances, shape_rows
+
+    cur.execute("DROP TABLE IF EXISTS shape_geometry;")
+    cur.execute(
+        "CREATE TABLE shape_geometry ("
+        "shape_id TEXT NOT NULL, tolerance_m REAL NOT NULL, n_points INTEGER, length_m REAL, polyline BLOB, "
+        "PRIMARY KEY (shape_id, tolerance_m)) WITHOUT ROWID;"
+    )
+    if not {"shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"} <= set(shapes.columns):
+        return
+    cur.executemany(
+        "INSERT OR REPLACE INTO shape_geometry (shape_id, tolerance_m, n_points, length_m, polyline) VALUES (?, ?, ?, ?, ?);",
+        shape_rows(shapes, configured_tolerances()),
+    )
+
+
+def build_station_platforms(cur) -> None:
+    """Station -> platform map for `aggregate=station` boards and schedules.
+
+    One row per boarding stop (`location_type` 0 or empty): its parent station,
+    or itself when it has none, so a station's platforms are one primary key
+    range and a platform's station is one `ix_station_platforms_stop` lookup.
+    Entrances, generic nodes and boarding areas are left out.
+    """
+    cur.execute("PRAGMA table_info(stops)")
+    available = {row[1] for row in cur.fetchall()}
+    cur.execute("DROP TABLE IF EXISTS station_platforms;")
+    cur.execute(
+        "CREATE TABLE station_platforms ("
+        "station_id TEXT NOT NULL, stop_id TEXT NOT NULL, "
+        "PRIMARY KEY (station_id, stop_id)) WITHOUT ROWID;"
+    )
+    if "stop_id" not in available:
+        return
+    parent = "COALESCE(NULLIF(parent_station, ''), stop_id)" if "parent_station" in available else "stop_id"
+    boarding = "AND COALESCE(NULLIF(CAST(location_type AS TEXT), ''), '0') IN ('0', '0.0')" if "location_type" in available else ""
+    cur.execute(
+        f"INSERT OR IGNORE INTO station_platforms (station_id, stop_id) "
+        f"SELECT {parent}, stop_id FROM stops WHERE stop_id IS NOT NULL {boarding} "
+        f"ORDER BY 1, 2;"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS ix_station_platforms_stop ON station_platforms(stop_id);")
+
 
 def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) -> None:
     """Build a comprehensive SQLite DB file from a dict of DataFrames and write to db_tmp_path.
@@ -31,9 +141,10 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
     # Order matters for foreign key relationships
     table_order = [
         'agency', 'routes', 'calendar', 'calendar_dates', 
-        'stops', 'shapes', 'trips', 'stop_times', 'transfers'
+        'stops', 'shapes', 'trips', 'stop_times', 'transfers', 'frequencies'
     ]
     
+    phase_start = time.perf_counter()
     for name in table_order:
         if name not in tables:
             logger.info(f"Skipping table {name} (not in source data)")
@@ -41,6 +152,8 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
             
         df = tables[name]
         table_name = name
+        if name == "stop_times":
+            df = with_time_seconds(df)
         logger.info(f"Creating table {table_name} with {len(df)} rows")
         
         try:
@@ -58,8 +171,30 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
             except Exception:
                 pass
 
+    metrics.REBUILD_PHASE_SECONDS.observe(time.perf_counter() - phase_start, "sqlite_tables")
+
+    with metrics.REBUILD_PHASE_SECONDS.time("sqlite_trip_stop_times"):
+        try:
+            build_trip_stop_times(cur)
+        except Exception as e:
+            logger.warning(f"Could not build trip_stop_times: {e}")
+
+    with metrics.REBUILD_PHASE_SECONDS.time("sqlite_station_platforms"):
+        try:
+            build_station_platforms(cur)
+        except Exception as e:
+            logger.warning(f"Could not build station_platforms: {e}")
+
+    if "shapes" in tables:
+        with metrics.REBUILD_PHASE_SECONDS.time("sqlite_shape_geometry"):
+            try:
+                build_shape_geometry(cur, tables["shapes"])
+            except Exception as e:
+                logger.warning(f"Could not build shape_geometry: {e}")
+
     # Now create comprehensive indexes after all tables are loaded
     logger.info("Creating indexes...")
+    phase_start = time.perf_counter()
     
     indexes = [
         # Agency indexes
@@ -83,6 +218,8 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
         ("ix_stops_parent_station", "stops", "parent_station"),
         ("ix_stops_location_type", "stops", "location_type"),
         ("ix_stops_zone_id", "stops", "zone_id"),
+        # keyset pagination of /stops/names
+        ("ix_stops_name", "stops", "stop_name, stop_id"),
         # Spatial index for lat/lon searches
         ("ix_stops_location", "stops", "stop_lat, stop_lon"),
         
@@ -104,6 +241,10 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
         # Composite indexes for common queries
         ("ix_stop_times_stop_trip", "stop_times", "stop_id, trip_id"),
         ("ix_stop_times_trip_sequence", "stop_times", "trip_id, stop_sequence"),
+        # departure boards and schedule pages: one range per stop and service day;
+        # trip_id, stop_sequence complete the keyset so pages never sort
+        ("ix_stop_times_stop_departure", "stop_times", "stop_id, departure_secs, trip_id, stop_sequence"),
+        ("ix_stop_times_stop_arrival", "stop_times", "stop_id, arrival_secs, trip_id, stop_sequence"),
         ("ix_stop_times_arrival", "stop_times", "arrival_time"),
         ("ix_stop_times_departure", "stop_times", "departure_time"),
         
@@ -111,6 +252,9 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
         ("ix_transfers_from_stop", "transfers", "from_stop_id"),
         ("ix_transfers_to_stop", "transfers", "to_stop_id"),
         ("ix_transfers_type", "transfers", "transfer_type"),
+
+        # frequency-based trips (headway analytics)
+        ("ix_frequencies_trip_id", "frequencies", "trip_id"),
     ]
     
     for index_name, table_name, columns in indexes:
@@ -123,6 +267,8 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
         except Exception as e:
             logger.warning(f"Could not create index {index_name}: {e}")
 
+    metrics.REBUILD_PHASE_SECONDS.observe(time.perf_counter() - phase_start, "sqlite_indexes")
+
     # Create useful views for common queries
     logger.info("Creating views...")
     
@@ -202,12 +348,23 @@ def build_sqlite_from_dict(tables: Dict[str, pd.DataFrame], db_tmp_path: str) ->
         except Exception as e:
             logger.warning(f"Could not create view {view_name}: {e}")
 
-    # Analyze tables for query optimizer
-    logger.info("Analyzing tables for query optimization...")
+    # Feed generation: a new id per build, carried by pagination cursors
     try:
-        cur.execute("ANALYZE;")
+        cur.execute("CREATE TABLE IF NOT EXISTS feed_meta (key TEXT PRIMARY KEY, value TEXT);")
+        cur.executemany(
+            "INSERT OR REPLACE INTO feed_meta (key, value) VALUES (?, ?);",
+            [("generation", uuid.uuid4().hex[:16]), ("built_at", datetime.now(timezone.utc).isoformat())],
+        )
     except Exception as e:
-        logger.warning(f"Could not analyze tables: {e}")
+        logger.warning(f"Could not write feed_meta: {e}")
+
+    # Analyze tables for query optimizer
+    logger.info("Analyzing tables for query optimization...")
+    with metrics.REBUILD_PHASE_SECONDS.time("sqlite_analyze"):
+        try:
+            cur.execute("ANALYZE;")
+        except Exception as e:
+            logger.warning(f"Could not analyze tables: {e}")
 
     conn.commit()
     conn.close()
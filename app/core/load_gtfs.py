@@ -72,7 +72,7 @@ def load_gtfs_from_directory(dir_path: str) -> Dict[str, pd.DataFrame]:
     """Carga archivos GTFS comunes desde un directorio descomprimido y devuelve dataframes.
 
     Soporta todos los archivos GTFS estándar: stops, routes, trips, stop_times, calendar,
-    calendar_dates, agency, shapes, transfers.
+    calendar_dates, agency, shapes, transfers, frequencies.
     Se limpian los textos de cada fichero para eliminar espacios raros y caracteres de control.
     """
     # Define columns that should be kept as strings (IDs often have leading zeros)
@@ -86,6 +86,7 @@ def load_gtfs_from_directory(dir_path: str) -> Dict[str, pd.DataFrame]:
         'agency.txt': {'agency_id': str},
         'shapes.txt': {'shape_id': str},
         'transfers.txt': {'from_stop_id': str, 'to_stop_id': str, 'from_route_id': str, 'to_route_id': str, 'from_trip_id': str, 'to_trip_id': str},
+        'frequencies.txt': {'trip_id': str},
     }
     
     dfs = {}
@@ -93,7 +94,7 @@ def load_gtfs_from_directory(dir_path: str) -> Dict[str, pd.DataFrame]:
     gtfs_files = [
         "agency.txt", "stops.txt", "routes.txt", "trips.txt", 
         "stop_times.txt", "calendar.txt", "calendar_dates.txt",
-        "shapes.txt", "transfers.txt"
+        "shapes.txt", "transfers.txt", "frequencies.txt"
     ]
     
     for name in gtfs_files:
@@ -125,7 +126,7 @@ def load_gtfs_from_zip(zip_path: str) -> Dict[str, pd.DataFrame]:
     """Carga archivos GTFS comunes desde un ZIP y devuelve dataframes.
 
     Soporta todos los archivos GTFS estándar: stops, routes, trips, stop_times, calendar,
-    calendar_dates, agency, shapes, transfers.
+    calendar_dates, agency, shapes, transfers, frequencies.
     Se limpian los textos de cada fichero para eliminar espacios raros y caracteres de control.
     """
     # Define columns that should be kept as strings (IDs often have leading zeros)
@@ -139,6 +140,7 @@ def load_gtfs_from_zip(zip_path: str) -> Dict[str, pd.DataFrame]:
         'agency.txt': {'agency_id': str},
         'shapes.txt': {'shape_id': str},
         'transfers.txt': {'from_stop_id': str, 'to_stop_id': str, 'from_route_id': str, 'to_route_id': str, 'from_trip_id': str, 'to_trip_id': str},
+        'frequencies.txt': {'trip_id': str},
     }
     
     dfs = {}
@@ -146,7 +148,7 @@ def load_gtfs_from_zip(zip_path: str) -> Dict[str, pd.DataFrame]:
     gtfs_files = [
         "agency.txt", "stops.txt", "routes.txt", "trips.txt", 
         "stop_times.txt", "calendar.txt", "calendar_dates.txt",
-        "shapes.txt", "transfers.txt"
+        "shapes.txt", "transfers.txt", "frequencies.txt"
     ]
     
     with zipfile.ZipFile(zip_path, "r") as z:
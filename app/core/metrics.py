@@ -0,0 +1,358 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Counters and histograms are sharded per thread: every thread increments its own
+plain lists (no lock, no shared cache line in the common case) and `/metrics`
+sums the shards when it is scraped. A lock is only taken the first time a
+thread touches a metric, to register its shard. Under the GIL a scrape may see
+an observation half-applied (bucket counted, sum not yet) — acceptable for
+monitoring and the price of a lock-free hot path.
+
+Gauges that mirror state kept elsewhere (cache statistics, warm-up duration,
+event-loop lag) are computed by callbacks at scrape time instead of being
+pushed on every change.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; request and query latencies
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# seconds; rebuild phases run for minutes on the national feed
+PHASE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+# bytes; GTFS-RT payloads
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+access_logger = logging.getLogger("cercanias.access")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Sharded:
+    """Per-thread `{label values: row}` dicts; rows are only written by their owning thread."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[LabelValues, list]] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[LabelValues, list]:
+        shard = getattr(self._local, "rows", None)
+        if shard is None:
+            shard = {}
+            self._local.rows = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _new_row(self) -> list:
+        raise NotImplementedError
+
+    def _merged(self) -> Dict[LabelValues, list]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[LabelValues, list] = {}
+        for shard in shards:
+            for labels, row in list(shard.items()):
+                total = merged.get(labels)
+                if total is None:
+                    merged[labels] = list(row)
+                else:
+                    for i, v in enumerate(row):
+                        total[i] += v
+        return merged
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def _new_row(self) -> list:
+        return [0.0]
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = self._new_row()
+        row[0] += amount
+
+    def value(self, *labels: str) -> float:
+        row = self._merged().get(tuple(labels))
+        return row[0] if row else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for labels, row in sorted(self._merged().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(row[0])}"
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def _new_row(self) -> list:
+        # one slot per bucket, one for +Inf, then the sum
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        row = shard.get(labels)
+        if row is None:
+            row = shard[labels] = self._new_row()
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def snapshot(self, *labels: str) -> Dict[str, float]:
+        """count and sum for one label set (mainly for tests and admin views)."""
+        row = self._merged().get(tuple(labels))
+        if not row:
+            return {"count": 0, "sum": 0.0}
+        return {"count": sum(row[:-1]), "sum": row[-1]}
+
+    def samples(self) -> Iterable[str]:
+        bounds = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        for labels, row in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, row[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', bound))} {cumulative}"
+            suffix = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{suffix} {_format_value(row[-1])}"
+            yield f"{self.name}_count{suffix} {cumulative}"
+
+
+class CallbackMetric:
+    """Gauge (or counter kept elsewhere) whose samples come from `fn() -> [(label values, value), ...]` at scrape time."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 fn: Callable[[], Iterable[Tuple[LabelValues, float]]], kind: str = "gauge"):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = list(self._fn())
+        except Exception:
+            # a broken collector must not take /metrics down
+            return
+        for labels, value in values:
+            if value is None:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def reset(self) -> None:
+        pass
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, labelnames: Sequence[str], fn, kind: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, labelnames, fn, kind))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "cercanias_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "cercanias_db_query_duration_seconds",
+    "gtfs.db query latency by GTFSStore method.",
+    ("method",),
+)
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "cercanias_db_query_errors_total",
+    "GTFSStore calls that raised, by method.",
+    ("method",),
+)
+RT_POLL_SECONDS = REGISTRY.histogram(
+    "cercanias_rt_poll_duration_seconds",
+    "GTFS-RT poll latency (download + decode + publish) by feed.",
+    ("feed",),
+)
+RT_DECODE_SECONDS = REGISTRY.histogram(
+    "cercanias_rt_decode_duration_seconds",
+    "GTFS-RT protobuf decode and snapshot build time by feed.",
+    ("feed",),
+)
+RT_PAYLOAD_BYTES = REGISTRY.histogram(
+    "cercanias_rt_payload_bytes",
+    "GTFS-RT payload size by feed.",
+    ("feed",),
+    buckets=SIZE_BUCKETS,
+)
+RT_POLL_ERRORS = REGISTRY.counter(
+    "cercanias_rt_poll_errors_total",
+    "Failed GTFS-RT polls by feed.",
+    ("feed",),
+)
+REBUILD_PHASE_SECONDS = REGISTRY.histogram(
+    "cercanias_gtfs_rebuild_phase_seconds",
+    "Duration of each GTFS rebuild phase (download, extract, parse, sqlite_*, snapshot_*).",
+    ("phase",),
+    buckets=PHASE_BUCKETS,
+)
+
+# name -> object with a ByteLRUCache-style `stats()`
+_caches: Dict[str, object] = {}
+
+
+def register_cache(name: str, cache) -> None:
+    """Expose `cache.stats()` (hits, misses, evictions, bytes, hit ratio) under `cache=name`."""
+    _caches[name] = cache
+
+
+def _cache_samples(field: str):
+    def collect():
+        for name, cache in list(_caches.items()):
+            yield (name,), cache.stats().get(field)
+
+    return collect
+
+
+for _field in ("hits", "misses", "evictions"):
+    REGISTRY.callback(f"cercanias_cache_{_field}_total", f"Cache {_field}.", ("cache",), _cache_samples(_field), kind="counter")
+REGISTRY.callback("cercanias_cache_hit_ratio", "Cache hit ratio since start.", ("cache",), _cache_samples("hit_ratio"))
+REGISTRY.callback("cercanias_cache_bytes", "Estimated bytes held by the cache.", ("cache",), _cache_samples("bytes"))
+REGISTRY.callback("cercanias_cache_entries", "Entries held by the cache.", ("cache",), _cache_samples("entries"))
+
+
+def timed_method(histogram: Histogram = DB_QUERY_SECONDS, errors: Optional[Counter] = DB_QUERY_ERRORS):
+    """Decorator observing the call duration under the method name."""
+
+    def decorator(func):
+        name = func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, name)
+
+        return wrapper
+
+    return decorator
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency labelled by the matched route template.
+
+    Labels use the template (`/stops/{stop_id}`), never the raw path, so the
+    number of series stays bounded; requests that match no route are grouped
+    under `<unmatched>`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope.get("method", ""), template, str(status["code"]))
+            if access_logger.isEnabledFor(logging.DEBUG):
+                access_logger.debug("%s %s -> %s (%.1fms)", scope.get("method"), scope.get("path"), status["code"], elapsed * 1000.0)
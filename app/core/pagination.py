@@ -0,0 +1,179 @@
+"""Keyset (cursor) pagination for list endpoints.
+
+A page is read as `ORDER BY <key columns>` with a `WHERE <key> > <last key>`
+condition, so page N costs the same index range read as page 1 instead of an
+OFFSET scan. The last key of a page travels to the client in an opaque cursor
+(`meta.next_cursor`) together with:
+
+- the feed generation: a random id written into `gtfs.db` (`feed_meta`) when
+  it is built; a cursor from another generation is rejected with 409 so a
+  client never mixes pages of two different feeds;
+- a short hash of the endpoint and its filters; reusing a cursor with other
+  filters is a 400.
+
+Cursors are base64url JSON, not signed: they only carry key values that the
+client could have read from the page anyway.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+CURSOR_VERSION = 1
+
+_generation_lock = threading.Lock()
+# (db_path, inode, mtime_ns) -> generation id
+_generations: Dict[Tuple[str, int, int], str] = {}
+
+
+class CursorError(ValueError):
+    """Invalid cursor for this request (HTTP 400)."""
+
+    status_code = 400
+
+
+class StaleCursorError(CursorError):
+    """Cursor issued for another feed generation (HTTP 409): restart pagination."""
+
+    status_code = 409
+
+
+def _plain(value: Any) -> Any:
+    """JSON-safe scalar (numpy / pandas scalars become int, float or str)."""
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    try:
+        if value != value:  # NaN
+            return None
+    except Exception:
+        pass
+    item = getattr(value, "item", None)
+    if callable(item):
+        try:
+            return item()
+        except Exception:
+            pass
+    return str(value)
+
+
+def scope_of(endpoint: str, **filters) -> str:
+    raw = json.dumps([endpoint, {k: _plain(v) for k, v in sorted(filters.items())}], separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:10]
+
+
+def encode_cursor(generation: str, scope: str, key: Sequence[Any]) -> str:
+    raw = json.dumps([CURSOR_VERSION, generation, scope, [_plain(v) for v in key]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, generation: str, scope: str) -> List[Any]:
+    """Key values stored in `token`; raises CursorError / StaleCursorError."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        version, cursor_generation, cursor_scope, key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise CursorError("Malformed cursor")
+    if version != CURSOR_VERSION or not isinstance(key, list):
+        raise CursorError("Unsupported cursor")
+    if cursor_scope != scope:
+        raise CursorError("Cursor was issued for a different query")
+    if cursor_generation != generation:
+        raise StaleCursorError("The GTFS feed changed since this cursor was issued; restart pagination")
+    return key
+
+
+def keyset_clause(columns: Sequence[str], key: Sequence[Any]) -> Tuple[str, List[Any]]:
+    """SQL condition `(columns) > (key)` in SQLite order (NULL sorts first).
+
+    Without NULLs in the key this is a row-value comparison, which SQLite turns
+    into an index range; otherwise it is expanded column by column.
+    """
+    if len(columns) != len(key):
+        raise CursorError("Cursor does not match this query")
+    if all(v is not None for v in key):
+        return f"({', '.join(columns)}) > ({', '.join('?' for _ in key)})", list(key)
+    ors, params = [], []
+    for i, (col, value) in enumerate(zip(columns, key)):
+        conds, cparams = [], []
+        for prev_col, prev_value in zip(columns[:i], key[:i]):
+            if prev_value is None:
+                conds.append(f"{prev_col} IS NULL")
+            else:
+                conds.append(f"{prev_col} = ?")
+                cparams.append(prev_value)
+        if value is None:
+            conds.append(f"{col} IS NOT NULL")
+        else:
+            conds.append(f"{col} > ?")
+            cparams.append(value)
+        ors.append("(" + " AND ".join(conds) + ")")
+        params.extend(cparams)
+    return "(" + " OR ".join(ors) + ")", params
+
+
+def sort_key(values: Sequence[Any]) -> Tuple:
+    """Python sort key matching SQLite ordering of NULLs (first) for in-memory fallbacks."""
+    return tuple((v is not None, v if v is not None else 0) for v in (_plain(v) for v in values))
+
+
+def rows_after(rows: List[Dict], key_fn: Callable[[Dict], Sequence[Any]], after: Optional[Sequence[Any]], limit: int) -> List[Dict]:
+    """Keyset over an in-memory list (backends without an index): sort, skip past `after`, slice."""
+    ordered = sorted(rows, key=lambda r: sort_key(key_fn(r)))
+    if after is not None:
+        bound = sort_key(after)
+        ordered = [r for r in ordered if sort_key(key_fn(r)) > bound]
+    return ordered[:limit]
+
+
+def db_feed_generation(db_path: str) -> Optional[str]:
+    """Generation id of `gtfs.db`: its `feed_meta.generation`, else derived from inode and mtime."""
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    file_key = (db_path, st.st_ino, st.st_mtime_ns)
+    with _generation_lock:
+        cached = _generations.get(file_key)
+    if cached is not None:
+        return cached
+    generation = None
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM feed_meta WHERE key = 'generation'").fetchone()
+            generation = str(row[0]) if row and row[0] else None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        generation = None
+    if generation is None:
+        # databases built before feed_meta existed
+        generation = hashlib.sha1(f"{st.st_ino}:{st.st_mtime_ns}".encode("ascii")).hexdigest()[:16]
+    with _generation_lock:
+        _generations.clear()
+        _generations[file_key] = generation
+    return generation
+
+
+def paginate(
+    endpoint: str,
+    filters: Dict[str, Any],
+    generation: str,
+    cursor: Optional[str],
+    limit: int,
+    fetch: Callable[[Optional[List[Any]], int], List[Dict]],
+    key_fn: Callable[[Dict], Sequence[Any]],
+) -> Tuple[List[Dict], Dict[str, Any]]:
+    """One page: `fetch(after_key, limit + 1)` and the `meta` block with `next_cursor`."""
+    scope = scope_of(endpoint, **filters)
+    after = decode_cursor(cursor, generation, scope) if cursor else None
+    rows = fetch(after, limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(generation, scope, key_fn(rows[-1]))
+    return rows, {"next_cursor": next_cursor, "generation": generation, "limit": limit}
@@ -0,0 +1,275 @@
+"""Opt-in query profiler for `GTFSStore` (`QUERY_PROFILER_ENABLED=true`).
+
+When enabled `GTFSStore._connect` opens its connections with
+`ProfilingConnection`, whose cursors time every statement (execute plus the
+fetches that follow it) and aggregate the timings per SQL *shape*: the
+statement with whitespace collapsed, literals replaced by `?` and `IN (?, ?, ...)`
+lists folded, so the same query with different parameters is one entry.
+
+The first time a shape is seen its `EXPLAIN QUERY PLAN` is recorded (with the
+parameters of that call) and flagged when it contains a full table scan or
+builds a temporary B-tree for ORDER BY / GROUP BY / DISTINCT. Statements slower
+than `SLOW_QUERY_MS` are logged with their parameters.
+
+`report()` feeds `/admin/queries`: the top-N shapes, the recent slow queries,
+which `gtfs.db` indexes no recorded plan uses and which are a leading prefix
+of a wider index on the same table (pruning candidates).
+"""
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.config.settings import settings
+
+logger = logging.getLogger("cercanias.query_profiler")
+
+MAX_SHAPES = 500
+SLOW_LOG_SIZE = 100
+
+_WS_RE = re.compile(r"\s+")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_INDEX_RE = re.compile(r"USING (?:COVERING |AUTOMATIC COVERING |AUTOMATIC PARTIAL COVERING )?INDEX (\w+)")
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL shape: collapsed whitespace, literals as `?`, IN lists folded to `(?+)`."""
+    shape = _WS_RE.sub(" ", sql).strip().rstrip(";")
+    shape = _STRING_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    return _IN_LIST_RE.sub("(?+)", shape)
+
+
+def plan_flags(plan: Sequence[str]) -> Dict[str, bool]:
+    """`full_scan`: a table is read without an index; `temp_btree`: a sort/group needs a temp B-tree."""
+    full_scan = any(d.startswith("SCAN ") and "USING" not in d and "CONSTANT ROW" not in d for d in plan)
+    temp_btree = any("USE TEMP B-TREE" in d for d in plan)
+    return {"full_scan": full_scan, "temp_btree": temp_btree}
+
+
+def plan_indexes(plan: Sequence[str]) -> List[str]:
+    return sorted({m for d in plan for m in _INDEX_RE.findall(d)})
+
+
+def _is_profiled(sql: str) -> bool:
+    head = sql.lstrip()[:7].upper()
+    return head.startswith("SELECT") or head.startswith("WITH")
+
+
+class QueryProfiler:
+    def __init__(self, slow_log_size: int = SLOW_LOG_SIZE, max_shapes: int = MAX_SHAPES):
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._max_shapes = max_shapes
+        self._db_paths: set = set()
+
+    def needs_plan(self, shape: str) -> bool:
+        with self._lock:
+            entry = self._shapes.get(shape)
+            return entry is None or entry["plan"] is None
+
+    def record(self, shape: str, sql: str, params, elapsed_ms: float, plan: Optional[List[str]] = None) -> None:
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                if len(self._shapes) >= self._max_shapes:
+                    return
+                entry = self._shapes[shape] = {
+                    "shape": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "max_params": None,
+                    "plan": None,
+                    "indexes": [],
+                    "full_scan": False,
+                    "temp_btree": False,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            if elapsed_ms >= entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+                entry["max_params"] = _jsonable(params)
+            if plan is not None and entry["plan"] is None:
+                entry["plan"] = plan
+                entry["indexes"] = plan_indexes(plan)
+                entry.update(plan_flags(plan))
+
+    def add_time(self, shape: str, elapsed_ms: float) -> None:
+        """Fetch time of the last statement of a cursor (rows are produced while fetching)."""
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is not None:
+                entry["total_ms"] += elapsed_ms
+
+    def slow(self, sql: str, params, elapsed_ms: float) -> None:
+        item = {"ms": round(elapsed_ms, 3), "sql": _WS_RE.sub(" ", sql).strip(), "params": _jsonable(params), "at": time.time()}
+        with self._lock:
+            self._slow.append(item)
+        logger.warning("Slow query (%.1fms): %s params=%r", elapsed_ms, item["sql"], params)
+
+    def add_db(self, db_path: str) -> None:
+        with self._lock:
+            self._db_paths.add(db_path)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._shapes.clear()
+            self._slow.clear()
+
+    def unused_indexes(self) -> Dict[str, List[str]]:
+        """Indexes of each profiled database that no recorded plan uses."""
+        with self._lock:
+            used = {ix for e in self._shapes.values() for ix in e["indexes"]}
+            paths = sorted(self._db_paths)
+        out = {}
+        for path in paths:
+            try:
+                conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+                try:
+                    names = [r[0] for r in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_autoindex%' ORDER BY name"
+                    )]
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                continue
+            out[path] = [n for n in names if n not in used]
+        return out
+
+    def redundant_indexes(self) -> Dict[str, Dict[str, str]]:
+        """Indexes whose columns are a leading prefix of another index on the same table."""
+        with self._lock:
+            paths = sorted(self._db_paths)
+        out = {}
+        for path in paths:
+            try:
+                conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+                try:
+                    columns = {}
+                    for name, table in conn.execute(
+                        "SELECT name, tbl_name FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"
+                    ):
+                        cols = tuple(r[2] for r in conn.execute(f"PRAGMA index_info({name})"))
+                        columns[name] = (table, cols)
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                continue
+            redundant = {}
+            for name, (table, cols) in columns.items():
+                for other, (other_table, other_cols) in columns.items():
+                    if other != name and other_table == table and len(other_cols) > len(cols) and other_cols[:len(cols)] == cols:
+                        redundant[name] = other
+                        break
+            out[path] = redundant
+        return out
+
+    def report(self, top: int = 20, order: str = "total") -> Dict[str, Any]:
+        key = {"total": "total_ms", "max": "max_ms", "avg": "avg_ms", "count": "count"}.get(order, "total_ms")
+        with self._lock:
+            shapes = [dict(e) for e in self._shapes.values()]
+            slow = list(self._slow)
+        for e in shapes:
+            e["avg_ms"] = round(e["total_ms"] / e["count"], 3) if e["count"] else 0.0
+            e["total_ms"] = round(e["total_ms"], 3)
+            e["max_ms"] = round(e["max_ms"], 3)
+        shapes.sort(key=lambda e: e[key], reverse=True)
+        return {
+            "enabled": settings.QUERY_PROFILER_ENABLED,
+            "slow_query_ms": settings.SLOW_QUERY_MS,
+            "shapes_tracked": len(shapes),
+            "order": order,
+            "top": shapes[:top],
+            "flagged": {
+                "full_scan": [e["shape"] for e in shapes if e["full_scan"]],
+                "temp_btree": [e["shape"] for e in shapes if e["temp_btree"]],
+            },
+            "slow_queries": slow[::-1],
+            "unused_indexes": self.unused_indexes(),
+            # name -> the wider index that already covers its columns
+            "redundant_indexes": self.redundant_indexes(),
+        }
+
+
+def _jsonable(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _jsonable_value(v) for k, v in params.items()}
+    try:
+        return [_jsonable_value(v) for v in params]
+    except TypeError:
+        return _jsonable_value(params)
+
+
+def _jsonable_value(v):
+    return v if isinstance(v, (int, float, str)) or v is None else repr(v)
+
+
+profiler = QueryProfiler()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    _shape: Optional[str] = None
+
+    def execute(self, sql, parameters=()):
+        if not _is_profiled(sql):
+            return super().execute(sql, parameters)
+        shape = normalize_sql(sql)
+        plan = None
+        if profiler.needs_plan(shape):
+            plan = self._explain(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            self._shape = shape
+            profiler.record(shape, sql, parameters, elapsed_ms, plan=plan)
+            if elapsed_ms >= settings.SLOW_QUERY_MS:
+                profiler.slow(sql, parameters, elapsed_ms)
+
+    def _explain(self, sql, parameters) -> Optional[List[str]]:
+        try:
+            rows = sqlite3.Cursor(self.connection).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+            return [str(r[3]) for r in rows]
+        except sqlite3.Error:
+            return None
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._shape is not None:
+                profiler.add_time(self._shape, (time.perf_counter() - start) * 1000.0)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        # sqlite3.Connection.execute does not go through self.cursor()
+        return self.cursor().execute(sql, parameters)
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    profiler.add_db(db_path)
+    return sqlite3.connect(db_path, check_same_thread=False, factory=ProfilingConnection)
@@ -1,43 +1,113 @@
+from __future__ import annotations
+
 import asyncio
 import logging
-from typing import Optional
-
-import aiohttp
-from google.transit import gtfs_realtime_pb2
+import time
+from typing import Callable, Dict, Optional
 
 from app.config.settings import settings
+from app.core import metrics, shared_state
 from app.core.gtfs_manager import gtfs_manager
+from app.core.rt_index import AlertIndex, TripUpdateIndex, VehicleIndex
+from app.utils.lazy import lazy_import
+
+# loaded on the first poll, not when the app is imported
+aiohttp = lazy_import("aiohttp")
+gtfs_realtime_pb2 = lazy_import("google.transit.gtfs_realtime_pb2")
 
 logger = logging.getLogger("cercanias.rt_fetcher")
 
+# gtfs_manager attribute that holds each feed's published snapshot
+_SNAPSHOT_ATTRS = {
+    "alerts": "rt_alert_index",
+    "vehicles": "rt_vehicle_index",
+    "trip_updates": "rt_trip_update_index",
+}
+
 
 class RTFetcher:
-    def __init__(self):
+    def __init__(self, lag_interval: float = 1.0):
         self._tasks = []
         self._stop = asyncio.Event()
+        # how often the lag monitor samples the event loop (seconds)
+        self._lag_interval = lag_interval
+        # runtime statistics: event-loop lag and per-feed decode timings
+        self._stats: Dict[str, Dict] = {
+            "loop_lag_ms": {"last": 0.0, "max": 0.0, "avg": 0.0, "samples": 0},
+            "feeds": {},
+        }
+        # YYYYMMDD of the last delay-history retention pass
+        self._last_prune: Optional[str] = None
+        # supervisor mode: directory where raw payloads are published for the workers
+        self._publish_dir: Optional[str] = None
+
+    def _builder_for(self, name: str) -> Callable:
+        return {
+            "alerts": self._build_alerts,
+            "vehicles": self._build_vehicles,
+            "trip_updates": self._build_trip_updates,
+        }[name]
 
-    async def _fetch_loop(self, name: str, url: str, interval: int, parser):
-        """Loop que consulta `url` cada `interval` segundos y pasa el contenido al `parser`."""
+    def _decode(self, name: str, data: bytes):
+        """Decode a raw GTFS-RT payload and build its snapshot.
+
+        Runs in a worker thread so protobuf parsing and list building never
+        block the event loop. Returns the finished snapshot; nothing shared is
+        mutated here.
+        """
+        start = time.perf_counter()
+        feed = gtfs_realtime_pb2.FeedMessage()
+        feed.ParseFromString(data)
+        snapshot = self._builder_for(name)(feed)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        return snapshot, elapsed_ms
+
+    def _publish(self, name: str, snapshot, parse_ms: Optional[float] = None, payload_bytes: Optional[int] = None):
+        """Hand a finished snapshot to readers with a single reference swap."""
+        setattr(gtfs_manager, _SNAPSHOT_ATTRS[name], snapshot)
+        feed_stats = {
+            "entities": len(snapshot),
+            "updated_at": time.time(),
+        }
+        if parse_ms is not None:
+            feed_stats["parse_ms"] = round(parse_ms, 3)
+            metrics.RT_DECODE_SECONDS.observe(parse_ms / 1000.0, name)
+        if payload_bytes is not None:
+            feed_stats["payload_bytes"] = payload_bytes
+            metrics.RT_PAYLOAD_BYTES.observe(payload_bytes, name)
+        self._stats["feeds"][name] = feed_stats
+        logger.debug(f"Published {len(snapshot)} {name}")
+
+    async def _fetch_loop(self, name: str, url: str, interval: int):
+        """Loop que consulta `url` cada `interval` segundos y publica el snapshot decodificado."""
         backoff = 1
         while not self._stop.is_set():
             try:
                 timeout = settings.RT_TIMEOUT
+                poll_start = time.perf_counter()
                 async with aiohttp.ClientSession() as session:
                     async with session.get(url, timeout=timeout) as resp:
                         if resp.status == 200:
                             data = await resp.read()
                             try:
-                                feed = gtfs_realtime_pb2.FeedMessage()
-                                feed.ParseFromString(data)
-                                parser(feed)
+                                snapshot, parse_ms = await asyncio.to_thread(self._decode, name, data)
+                                self._publish(name, snapshot, parse_ms=parse_ms, payload_bytes=len(data))
+                                metrics.RT_POLL_SECONDS.observe(time.perf_counter() - poll_start, name)
                                 backoff = 1
+                                if self._publish_dir:
+                                    await asyncio.to_thread(shared_state.publish_payload, name, data, self._publish_dir)
+                                if name == "trip_updates" and settings.DELAY_HISTORY_ENABLED:
+                                    await self._record_delays(snapshot.updates)
                             except Exception as e:
+                                metrics.RT_POLL_ERRORS.inc(name)
                                 logger.exception(f"Failed to parse GTFS-RT {name}: {e}")
                         else:
+                            metrics.RT_POLL_ERRORS.inc(name)
                             logger.warning(f"RT {name} returned status {resp.status}")
             except asyncio.CancelledError:
                 break
             except Exception as e:
+                metrics.RT_POLL_ERRORS.inc(name)
                 logger.exception(f"Error fetching RT {name}: {e}")
                 await asyncio.sleep(min(backoff, 60))
                 backoff = backoff * 2
@@ -47,14 +117,93 @@ class RTFetcher:
             except asyncio.TimeoutError:
                 continue
 
-    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+    async def _follow_loop(self, name: str, directory: str, interval: float):
+        """Worker mode: decode the payload the supervisor published whenever the file changes."""
+        path = shared_state.rt_payload_path(name, directory)
+        last = None
+        while not self._stop.is_set():
+            try:
+                stamp = shared_state.file_stamp(path)
+                if stamp is not None and stamp != last:
+                    data = await asyncio.to_thread(shared_state.read_payload, path)
+                    snapshot, parse_ms = await asyncio.to_thread(self._decode, name, data)
+                    self._publish(name, snapshot, parse_ms=parse_ms, payload_bytes=len(data))
+                    last = stamp
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.exception(f"Failed to load published GTFS-RT {name}: {e}")
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                continue
+
+    async def _record_delays(self, updates) -> None:
+        """Append this poll's delays to the history log (in a worker thread)."""
+        try:
+            from app.core.delay_history import delay_history
+
+            await asyncio.to_thread(delay_history.record, updates)
+            # retention is cheap to check; prune at most once per day
+            today = time.strftime("%Y%m%d")
+            if self._last_prune != today:
+                self._last_prune = today
+                await asyncio.to_thread(delay_history.prune)
+        except Exception:
+            logger.exception("Failed to record delay history")
+
+    def _record_lag(self, lag_ms: float) -> None:
+        lag = self._stats["loop_lag_ms"]
+        lag_ms = max(0.0, lag_ms)
+        n = lag["samples"] + 1
+        lag["last"] = round(lag_ms, 3)
+        lag["max"] = round(max(lag["max"], lag_ms), 3)
+        lag["avg"] = round(lag["avg"] + (lag_ms - lag["avg"]) / n, 3)
+        lag["samples"] = n
+
+    async def _lag_monitor(self):
+        """Measure how late the event loop wakes up a sleeping coroutine.
+
+        Any time spent above `_lag_interval` is time the loop was busy running
+        something else (e.g. synchronous parsing) instead of serving requests.
+        """
+        loop = asyncio.get_event_loop()
+        while not self._stop.is_set():
+            start = loop.time()
+            try:
+                await asyncio.sleep(self._lag_interval)
+            except asyncio.CancelledError:
+                break
+            self._record_lag((loop.time() - start - self._lag_interval) * 1000.0)
+
+    def get_stats(self) -> Dict:
+        """Return a copy of event-loop lag and per-feed decode statistics."""
+        return {
+            "loop_lag_ms": dict(self._stats["loop_lag_ms"]),
+            "feeds": {k: dict(v) for k, v in self._stats["feeds"].items()},
+        }
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None, publish_dir: Optional[str] = None):
+        """Poll Renfe; with `publish_dir` also publish every payload for worker processes."""
         loop = loop or asyncio.get_event_loop()
+        self._publish_dir = publish_dir
         # create background tasks
-        self._tasks.append(loop.create_task(self._fetch_loop("alerts", settings.RT_ALERTS_URL, settings.RT_POLL_INTERVAL, self._parse_alerts)))
-        self._tasks.append(loop.create_task(self._fetch_loop("vehicles", settings.RT_VEHICLES_URL, settings.RT_POLL_INTERVAL, self._parse_vehicles)))
-        self._tasks.append(loop.create_task(self._fetch_loop("trip_updates", settings.RT_TRIP_UPDATES_URL, settings.RT_POLL_INTERVAL, self._parse_trip_updates)))
+        self._tasks.append(loop.create_task(self._fetch_loop("alerts", settings.RT_ALERTS_URL, settings.RT_POLL_INTERVAL)))
+        self._tasks.append(loop.create_task(self._fetch_loop("vehicles", settings.RT_VEHICLES_URL, settings.RT_POLL_INTERVAL)))
+        self._tasks.append(loop.create_task(self._fetch_loop("trip_updates", settings.RT_TRIP_UPDATES_URL, settings.RT_POLL_INTERVAL)))
+        self._tasks.append(loop.create_task(self._lag_monitor()))
         logger.info("RTFetcher started background tasks")
 
+    def follow(self, loop: Optional[asyncio.AbstractEventLoop] = None, directory: Optional[str] = None):
+        """Worker mode: never poll Renfe, decode the supervisor's published payloads instead."""
+        loop = loop or asyncio.get_event_loop()
+        directory = directory or shared_state.shared_dir()
+        interval = settings.SHARED_STATE_POLL_INTERVAL
+        for name in _SNAPSHOT_ATTRS:
+            self._tasks.append(loop.create_task(self._follow_loop(name, directory, interval)))
+        self._tasks.append(loop.create_task(self._lag_monitor()))
+        logger.info("RTFetcher following published GTFS-RT payloads in %s", directory)
+
     async def stop(self):
         self._stop.set()
         for t in self._tasks:
@@ -62,30 +211,35 @@ class RTFetcher:
         await asyncio.gather(*self._tasks, return_exceptions=True)
         logger.info("RTFetcher stopped")
 
-    # parsers update gtfs_manager.rt_* structures
+    # builders turn a decoded feed into the snapshot published on gtfs_manager
+    def _build_alerts(self, feed: gtfs_realtime_pb2.FeedMessage):
+        entities = [e for e in feed.entity if e.HasField("alert")]
+        return AlertIndex([e.alert for e in entities], ids=[e.id for e in entities])
+
+    def _build_vehicles(self, feed: gtfs_realtime_pb2.FeedMessage):
+        vehicles = [e.vehicle for e in feed.entity if e.HasField("vehicle")]
+        return VehicleIndex(vehicles, feed_timestamp=feed.header.timestamp, previous=gtfs_manager.rt_vehicle_index)
+
+    def _build_trip_updates(self, feed: gtfs_realtime_pb2.FeedMessage):
+        return TripUpdateIndex([e.trip_update for e in feed.entity if e.HasField("trip_update")])
+
+    # parsers build and publish synchronously (used by tests and manual reloads)
     def _parse_alerts(self, feed: gtfs_realtime_pb2.FeedMessage):
-        alerts = []
-        for e in feed.entity:
-            if e.HasField("alert"):
-                alerts.append(e.alert)
-        gtfs_manager.rt_alerts = alerts
-        logger.debug(f"Parsed {len(alerts)} alerts")
+        self._publish("alerts", self._build_alerts(feed))
 
     def _parse_vehicles(self, feed: gtfs_realtime_pb2.FeedMessage):
-        vehicles = []
-        for e in feed.entity:
-            if e.HasField("vehicle"):
-                vehicles.append(e.vehicle)
-        gtfs_manager.rt_vehicles = vehicles
-        logger.debug(f"Parsed {len(vehicles)} vehicles")
+        self._publish("vehicles", self._build_vehicles(feed))
 
     def _parse_trip_updates(self, feed: gtfs_realtime_pb2.FeedMessage):
-        updates = []
-        for e in feed.entity:
-            if e.HasField("trip_update"):
-                updates.append(e.trip_update)
-        gtfs_manager.rt_trip_updates = updates
-        logger.debug(f"Parsed {len(updates)} trip_updates")
+        self._publish("trip_updates", self._build_trip_updates(feed))
 
 
 rt_fetcher = RTFetcher()
+
+
+def _loop_lag_samples(stat: str):
+    return lambda: [((), rt_fetcher.get_stats()["loop_lag_ms"][stat] / 1000.0)]
+
+
+metrics.REGISTRY.callback("cercanias_event_loop_lag_seconds", "Last event-loop wake-up lag sampled by the RT fetcher.", (), _loop_lag_samples("last"))
+metrics.REGISTRY.callback("cercanias_event_loop_lag_max_seconds", "Largest event-loop wake-up lag since start.", (), _loop_lag_samples("max"))
@@ -0,0 +1,380 @@
+"""In-memory indexes built once per GTFS-RT poll.
+
+Indexes are built off the event loop (see `RTFetcher._decode`) and published
+as a single object, so request handlers only ever see a complete snapshot.
+"""
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+# protobuf bindings are only needed to name enum values of decoded feeds
+gtfs_realtime_pb2 = lazy_import("google.transit.gtfs_realtime_pb2")
+
+# grid cell size in degrees (~5.5 km in latitude)
+DEFAULT_CELL_DEG = 0.05
+# beyond this many cells a bbox query just masks every vehicle
+_MAX_CELLS_SCANNED = 4096
+_EARTH_RADIUS_M = 6371000.0
+
+
+def _vehicle_key(v) -> str:
+    """Stable identity for a vehicle across polls: vehicle id, else trip id."""
+    vid = getattr(getattr(v, "vehicle", None), "id", "") or ""
+    if vid:
+        return vid
+    return getattr(getattr(v, "trip", None), "trip_id", "") or ""
+
+
+def vehicle_to_dict(v) -> Dict:
+    """Serialize a VehiclePosition into the lightweight dict served by `/realtime/vehicles`."""
+    pos = v.position if v.HasField("position") else None
+    return {
+        "vehicle_id": getattr(v.vehicle, "id", None) or None,
+        "trip_id": getattr(v.trip, "trip_id", None),
+        "route_id": getattr(v.trip, "route_id", None),
+        "latitude": pos.latitude if pos is not None else None,
+        "longitude": pos.longitude if pos is not None else None,
+        "bearing": pos.bearing if pos is not None else None,
+        "speed": pos.speed if pos is not None else None,
+        "current_status": v.current_status if hasattr(v, "current_status") else None,
+        "timestamp": v.timestamp or None,
+    }
+
+
+class VehicleIndex:
+    """Vehicle positions stored as NumPy arrays plus a uniform lat/lon grid.
+
+    - `vehicles`: the raw VehiclePosition protobufs (kept for existing getters)
+    - `records`: the serialized dicts, built once per poll
+    - `lat`, `lon`, `ts`: float64 / int64 arrays aligned with `records`
+    - grid: cell -> array of row indices, used to narrow bbox/near queries
+    """
+
+    def __init__(
+        self,
+        vehicles: Optional[Iterable] = None,
+        feed_timestamp: int = 0,
+        previous: Optional["VehicleIndex"] = None,
+        cell_deg: float = DEFAULT_CELL_DEG,
+    ):
+        self.vehicles: List = list(vehicles or [])
+        self.feed_timestamp = int(feed_timestamp or 0)
+        self.cell_deg = cell_deg
+        self.records: List[Dict] = []
+        for v in self.vehicles:
+            try:
+                self.records.append(vehicle_to_dict(v))
+            except Exception:
+                self.records.append({"raw": str(v)})
+        n = len(self.records)
+        self.keys: List[str] = [_vehicle_key(v) for v in self.vehicles]
+        self.lat = np.full(n, np.nan, dtype=np.float64)
+        self.lon = np.full(n, np.nan, dtype=np.float64)
+        self.ts = np.zeros(n, dtype=np.int64)
+        self.by_route: Dict[str, List[int]] = {}
+        self.by_trip: Dict[str, List[int]] = {}
+        for i, r in enumerate(self.records):
+            lat, lon = r.get("latitude"), r.get("longitude")
+            # protobuf defaults to 0.0 when a position is missing
+            if lat is not None and lon is not None and (lat or lon):
+                self.lat[i] = lat
+                self.lon[i] = lon
+            self.ts[i] = r.get("timestamp") or self.feed_timestamp
+            if r.get("route_id"):
+                self.by_route.setdefault(r["route_id"], []).append(i)
+            if r.get("trip_id"):
+                self.by_trip.setdefault(r["trip_id"], []).append(i)
+        self._build_grid()
+        # what the previous poll looked like, to answer delta requests
+        self.previous_feed_timestamp = previous.feed_timestamp if previous is not None else None
+        self.previous_keys = set(previous.keys) if previous is not None else set()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _cell(self, lat, lon):
+        return np.floor(lat / self.cell_deg).astype(np.int64), np.floor(lon / self.cell_deg).astype(np.int64)
+
+    def _build_grid(self) -> None:
+        self.grid: Dict[Tuple[int, int], np.ndarray] = {}
+        valid = np.flatnonzero(~np.isnan(self.lat))
+        if valid.size == 0:
+            return
+        cy, cx = self._cell(self.lat[valid], self.lon[valid])
+        order = np.lexsort((cx, cy))
+        cy, cx, rows = cy[order], cx[order], valid[order]
+        # boundaries where the (cy, cx) pair changes
+        change = np.flatnonzero((np.diff(cy) != 0) | (np.diff(cx) != 0)) + 1
+        for start, end in zip(np.r_[0, change], np.r_[change, rows.size]):
+            self.grid[(int(cy[start]), int(cx[start]))] = rows[start:end]
+
+    def _bbox_rows(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float) -> np.ndarray:
+        y0, x0 = (int(c) for c in self._cell(np.float64(min_lat), np.float64(min_lon)))
+        y1, x1 = (int(c) for c in self._cell(np.float64(max_lat), np.float64(max_lon)))
+        ncells = (y1 - y0 + 1) * (x1 - x0 + 1)
+        if ncells > _MAX_CELLS_SCANNED or ncells > len(self.grid):
+            candidates = np.arange(len(self.records))
+        else:
+            parts = [self.grid[(y, x)] for y in range(y0, y1 + 1) for x in range(x0, x1 + 1) if (y, x) in self.grid]
+            if not parts:
+                return np.empty(0, dtype=np.int64)
+            candidates = np.concatenate(parts)
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return candidates[mask]
+
+    def query(
+        self,
+        route_id: Optional[str] = None,
+        trip_id: Optional[str] = None,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        near: Optional[Tuple[float, float]] = None,
+        radius_m: float = 1000.0,
+        since: Optional[int] = None,
+    ) -> Tuple[List[Dict], Dict]:
+        """Return (records, meta) for vehicles matching all given filters.
+
+        `bbox` is (min_lon, min_lat, max_lon, max_lat). `near` is (lat, lon) and
+        results are sorted by distance with a `distance_m` field. `since` is a
+        feed timestamp previously returned in meta; see `_delta_rows`.
+        """
+        meta: Dict = {"feed_timestamp": self.feed_timestamp, "delta": False}
+        rows = np.arange(len(self.records))
+        if route_id:
+            rows = _intersect(rows, self.by_route.get(route_id, []))
+        if trip_id:
+            rows = _intersect(rows, self.by_trip.get(trip_id, []))
+        if since is not None:
+            changed, removed = self._delta_rows(int(since))
+            if changed is not None:
+                rows = _intersect(rows, changed)
+                meta["delta"] = True
+                meta["removed"] = removed
+        distances = None
+        if bbox is not None:
+            rows = _intersect(rows, self._bbox_rows(*bbox))
+        if near is not None:
+            lat0, lon0 = near
+            dlat = radius_m / 111320.0
+            dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat0)), 1e-6))
+            rows = _intersect(rows, self._bbox_rows(lon0 - dlon, lat0 - dlat, lon0 + dlon, lat0 + dlat))
+            distances = haversine_m(lat0, lon0, self.lat[rows], self.lon[rows])
+            keep = distances <= radius_m
+            rows, distances = rows[keep], distances[keep]
+            order = np.argsort(distances, kind="stable")
+            rows, distances = rows[order], distances[order]
+        out = [self.records[i] for i in rows.tolist()]
+        if distances is not None:
+            out = [dict(r, distance_m=round(float(d), 1)) for r, d in zip(out, distances.tolist())]
+        meta["count"] = len(out)
+        return out, meta
+
+    def _delta_rows(self, since: int):
+        """Rows changed after `since` or new since the previous poll, plus keys removed since it.
+
+        A vehicle that appeared with an older fix timestamp still counts as
+        changed, or a client would never learn about it. A delta can only be
+        computed if the client already holds the current or the previous
+        snapshot; otherwise (None, None) asks for a full response.
+        """
+        if since >= self.feed_timestamp:
+            return np.empty(0, dtype=np.int64), []
+        if self.previous_feed_timestamp is None or since < self.previous_feed_timestamp:
+            return None, None
+        new = np.fromiter((k not in self.previous_keys for k in self.keys), dtype=bool, count=len(self.keys))
+        changed = np.flatnonzero((self.ts > since) | new)
+        removed = sorted(self.previous_keys - set(self.keys))
+        return changed, removed
+
+
+def _translated(ts) -> Optional[str]:
+    """First translation of a TranslatedString, or None."""
+    try:
+        return ts.translation[0].text if ts.translation else None
+    except Exception:
+        return None
+
+
+def _enum_name(enum_type, value) -> Optional[str]:
+    try:
+        return enum_type.Name(value)
+    except Exception:
+        return None
+
+
+def alert_to_dict(a, alert_id: Optional[str] = None) -> Dict:
+    """Decode an Alert protobuf into plain JSON-serializable structures."""
+    informed = []
+    for e in a.informed_entity:
+        informed.append({
+            "agency_id": e.agency_id or None,
+            "route_id": e.route_id or None,
+            "route_type": e.route_type if e.HasField("route_type") else None,
+            "trip_id": (e.trip.trip_id or None) if e.HasField("trip") else None,
+            "stop_id": e.stop_id or None,
+            "direction_id": e.direction_id if e.HasField("direction_id") else None,
+        })
+    return {
+        "id": alert_id or None,
+        "cause": _enum_name(gtfs_realtime_pb2.Alert.Cause, a.cause),
+        "effect": _enum_name(gtfs_realtime_pb2.Alert.Effect, a.effect),
+        "active_periods": [
+            {"start": p.start or None, "end": p.end or None} for p in a.active_period
+        ],
+        "informed_entity": informed,
+        "header_text": _translated(a.header_text),
+        "description_text": _translated(a.description_text),
+        "url": _translated(a.url),
+    }
+
+
+def _is_active(record: Dict, now: float) -> bool:
+    periods = record.get("active_periods") or []
+    if not periods:
+        return True
+    for p in periods:
+        if (p["start"] is None or p["start"] <= now) and (p["end"] is None or now <= p["end"]):
+            return True
+    return False
+
+
+class AlertIndex:
+    """Alerts decoded once per poll and indexed by route_id, stop_id and trip_id."""
+
+    def __init__(self, alerts: Optional[Iterable] = None, ids: Optional[List[str]] = None):
+        self.alerts: List = list(alerts or [])
+        ids = ids or [None] * len(self.alerts)
+        self.records: List[Dict] = []
+        self.by_route: Dict[str, List[int]] = {}
+        self.by_stop: Dict[str, List[int]] = {}
+        self.by_trip: Dict[str, List[int]] = {}
+        for i, (a, alert_id) in enumerate(zip(self.alerts, ids)):
+            try:
+                rec = alert_to_dict(a, alert_id)
+            except Exception:
+                rec = {"raw": str(a), "informed_entity": []}
+            self.records.append(rec)
+            for e in rec["informed_entity"]:
+                for key, idx in (("route_id", self.by_route), ("stop_id", self.by_stop), ("trip_id", self.by_trip)):
+                    value = e.get(key)
+                    if value:
+                        rows = idx.setdefault(value, [])
+                        if not rows or rows[-1] != i:
+                            rows.append(i)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _select(self, rows: Iterable[int], active_only: bool) -> List[Dict]:
+        now = time.time()
+        out = [self.records[i] for i in rows]
+        if active_only:
+            out = [r for r in out if _is_active(r, now)]
+        return out
+
+    def query(self, route_id: Optional[str] = None, stop_id: Optional[str] = None, active_only: bool = False) -> List[Dict]:
+        rows: Iterable[int] = range(len(self.records))
+        if route_id:
+            rows = self.by_route.get(route_id, [])
+        if stop_id:
+            stop_rows = set(self.by_stop.get(stop_id, []))
+            rows = [i for i in rows if i in stop_rows]
+        return self._select(rows, active_only)
+
+    def for_route(self, route_id: str, active_only: bool = True) -> List[Dict]:
+        return self._select(self.by_route.get(route_id, []), active_only)
+
+    def for_stop(self, stop_id: str, active_only: bool = True) -> List[Dict]:
+        return self._select(self.by_stop.get(stop_id, []), active_only)
+
+
+def trip_update_to_dict(u) -> Dict:
+    """Decode a TripUpdate protobuf into plain structures (delays in seconds, times in epoch seconds)."""
+    stus = []
+    for st in u.stop_time_update:
+        arr = st.arrival if st.HasField("arrival") else None
+        dep = st.departure if st.HasField("departure") else None
+        stus.append({
+            "stop_sequence": st.stop_sequence if st.HasField("stop_sequence") else None,
+            "stop_id": st.stop_id or None,
+            "arrival_delay": arr.delay if arr is not None and arr.HasField("delay") else None,
+            "arrival_time": arr.time if arr is not None and arr.HasField("time") else None,
+            "departure_delay": dep.delay if dep is not None and dep.HasField("delay") else None,
+            "departure_time": dep.time if dep is not None and dep.HasField("time") else None,
+            "schedule_relationship": _enum_name(gtfs_realtime_pb2.TripUpdate.StopTimeUpdate.ScheduleRelationship, st.schedule_relationship),
+        })
+    return {
+        "trip_id": u.trip.trip_id or None,
+        "route_id": u.trip.route_id or None,
+        "start_date": u.trip.start_date or None,
+        "schedule_relationship": _enum_name(gtfs_realtime_pb2.TripDescriptor.ScheduleRelationship, u.trip.schedule_relationship),
+        "vehicle_id": (u.vehicle.id or None) if u.HasField("vehicle") else None,
+        "delay": u.delay if u.HasField("delay") else None,
+        "timestamp": u.timestamp or None,
+        "stop_time_updates": stus,
+    }
+
+
+class TripUpdateIndex:
+    """Trip updates decoded once per poll and indexed by trip_id, route_id and stop_id."""
+
+    def __init__(self, updates: Optional[Iterable] = None):
+        self.updates: List = list(updates or [])
+        self.records: List[Dict] = []
+        self.by_trip: Dict[str, int] = {}
+        self.by_route: Dict[str, List[int]] = {}
+        self.by_stop: Dict[str, List[int]] = {}
+        for i, u in enumerate(self.updates):
+            try:
+                rec = trip_update_to_dict(u)
+            except Exception:
+                rec = {"raw": str(u), "stop_time_updates": []}
+            self.records.append(rec)
+            if rec.get("trip_id"):
+                self.by_trip[rec["trip_id"]] = i
+            if rec.get("route_id"):
+                self.by_route.setdefault(rec["route_id"], []).append(i)
+            for stop_id in {st["stop_id"] for st in rec["stop_time_updates"] if st.get("stop_id")}:
+                self.by_stop.setdefault(stop_id, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, trip_id: str) -> Optional[Dict]:
+        i = self.by_trip.get(trip_id)
+        return self.records[i] if i is not None else None
+
+    def _rows(self, trip_id: Optional[str] = None, route_id: Optional[str] = None, stop_id: Optional[str] = None) -> List[int]:
+        rows: Iterable[int] = range(len(self.records))
+        if trip_id:
+            i = self.by_trip.get(trip_id)
+            rows = [i] if i is not None else []
+        for key, idx in ((route_id, self.by_route), (stop_id, self.by_stop)):
+            if key:
+                allowed = set(idx.get(key, []))
+                rows = [i for i in rows if i in allowed]
+        return list(rows)
+
+    def query(self, trip_id: Optional[str] = None, route_id: Optional[str] = None, stop_id: Optional[str] = None) -> List[Dict]:
+        return [self.records[i] for i in self._rows(trip_id, route_id, stop_id)]
+
+    def updates_for(self, trip_id: Optional[str] = None, route_id: Optional[str] = None) -> List:
+        """Raw protobufs matching the filters (for callers that still need them)."""
+        return [self.updates[i] for i in self._rows(trip_id, route_id)]
+
+
+def _intersect(rows: np.ndarray, other) -> np.ndarray:
+    return np.intersect1d(rows, np.asarray(other, dtype=np.int64))
+
+
+def haversine_m(lat0: float, lon0: float, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Vectorized great-circle distance in metres from (lat0, lon0)."""
+    p0 = math.radians(lat0)
+    p1 = np.radians(lat)
+    dp = p1 - p0
+    dl = np.radians(lon) - math.radians(lon0)
+    a = np.sin(dp / 2.0) ** 2 + math.cos(p0) * np.cos(p1) * np.sin(dl / 2.0) ** 2
+    return 2.0 * _EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
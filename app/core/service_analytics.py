@@ -0,0 +1,208 @@
+"""Headway and service-span tables of a service date (`/analytics/headways`, `/analytics/service-span`).
+
+For one service date every call of the running trips is read once
+(`GTFSStore.get_service_day_calls`) into NumPy arrays of route, stop and time
+codes; trips listed in `frequencies.txt` are expanded from their stop_times
+template into one call per scheduled start. The calls are then sorted by
+(route, stop, time) and both tables are reductions over contiguous runs of
+that order (`np.*.reduceat`), so a whole feed day costs a few array passes.
+
+The tables are cached per (feed generation, service date) in a byte-bounded
+LRU; a request only masks the cached arrays with its filters.
+
+Times are seconds from the service day's midnight: after-midnight calls have
+hours >= 24, as in GTFS.
+"""
+from __future__ import annotations
+
+import sys
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+from app.core import metrics
+from app.core.cache import ByteLRUCache
+from app.utils.lazy import lazy_import
+from app.utils.time_utils import seconds_to_hhmmss
+
+np = lazy_import("numpy")
+
+
+def _codes(values: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+    """(sorted unique values as str, int32 code of each value)."""
+    if not len(values):
+        return np.array([], dtype=str), np.array([], dtype=np.int32)
+    uniques, inverse = np.unique(np.array([str(v) for v in values]), return_inverse=True)
+    return uniques, inverse.astype(np.int32)
+
+
+def _run_starts(change: np.ndarray, n: int) -> np.ndarray:
+    """Start index of each run of a sorted array of length `n`; `change[i]` marks i + 1 starting a run."""
+    if n == 0:
+        return np.array([], dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], change)))
+
+
+def expand_frequencies(call_trip: np.ndarray, call_secs: np.ndarray, freq_trip: np.ndarray, start: np.ndarray,
+                       end: np.ndarray, headway: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(call index, secs) of frequency-based trips, one copy of the trip per start in [start, end).
+
+    `call_trip` / `call_secs` must be sorted by (trip, secs): each trip's calls
+    are then one slice whose first element is its template start. Every window
+    of `frequencies.txt` becomes `ceil((end - start) / headway)` shifted copies of
+    that slice, generated without a Python loop.
+    """
+    lo = np.searchsorted(call_trip, freq_trip, side="left")
+    per_trip = np.searchsorted(call_trip, freq_trip, side="right") - lo
+    starts = np.maximum(np.ceil((end - start) / headway), 0).astype(np.int64)
+    sizes = starts * per_trip
+    total = int(sizes.sum())
+    if total == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    row = np.repeat(np.arange(len(freq_trip)), sizes)
+    within = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    copy, offset = np.divmod(within, per_trip[row])
+    index = lo[row] + offset
+    secs = start[row] + copy * headway[row] + (call_secs[index] - call_secs[lo[row]])
+    return index, secs
+
+
+class DayAnalytics:
+    """Headway (route x stop x hour) and service span (route x stop) tables of one service date."""
+
+    def __init__(self, service_date: date, data: Dict):
+        self.service_date = service_date
+        calls = data.get("calls") or []
+        freqs = [f for f in (data.get("frequencies") or []) if None not in f[:4] and f[3] > 0]
+        trip_ids, trips = _codes([c[0] for c in calls] + [f[0] for f in freqs])
+        self.route_ids, route = _codes([c[1] for c in calls])
+        self.stop_ids, stop = _codes([c[2] for c in calls])
+        secs = np.array([np.nan if c[3] is None else c[3] for c in calls], dtype=np.float64)
+        trip, freq_trip = trips[:len(calls)], trips[len(calls):]
+        keep = np.isfinite(secs)
+        trip, route, stop, secs = trip[keep], route[keep], stop[keep], secs[keep].astype(np.int64)
+
+        if freqs:
+            order = np.lexsort((secs, trip))
+            trip, route, stop, secs = trip[order], route[order], stop[order], secs[order]
+            f = np.array([f[1:4] for f in freqs], dtype=np.int64)
+            index, freq_secs = expand_frequencies(trip, secs, freq_trip, f[:, 0], f[:, 1], f[:, 2])
+            template = np.isin(trip, freq_trip)
+            route = np.concatenate((route[~template], route[index]))
+            stop = np.concatenate((stop[~template], stop[index]))
+            secs = np.concatenate((secs[~template], freq_secs))
+
+        order = np.lexsort((secs, stop, route))
+        route, stop, secs = route[order], stop[order], secs[order]
+        same_pair = (route[1:] == route[:-1]) & (stop[1:] == stop[:-1])
+        # coupled units / duplicated trips calling at the same second count once
+        unique = _run_starts(~(same_pair & (secs[1:] == secs[:-1])), len(secs))
+        route, stop, secs = route[unique], stop[unique], secs[unique]
+        same_pair = (route[1:] == route[:-1]) & (stop[1:] == stop[:-1])
+
+        # service span: one run per (route, stop)
+        pair_starts = _run_starts(~same_pair, len(secs))
+        pair_ends = np.append(pair_starts[1:], len(secs))[:len(pair_starts)]
+        self.span_route, self.span_stop = route[pair_starts], stop[pair_starts]
+        self.span_first, self.span_last = secs[pair_starts], secs[pair_ends - 1]
+        self.span_calls = pair_ends - pair_starts
+
+        # headways: the gap before each call, counted in the hour of that call
+        hour = secs // 3600
+        runs = _run_starts(~same_pair | (hour[1:] != hour[:-1]), len(secs))
+        self.hw_route, self.hw_stop, self.hw_hour = route[runs], stop[runs], hour[runs]
+        self.hw_calls = np.diff(np.append(runs, len(secs)))
+        if len(runs):
+            gap = np.concatenate(([0], np.diff(secs))).astype(np.float64)
+            has_gap = np.concatenate(([False], same_pair))
+            n_gaps = np.add.reduceat(has_gap.astype(np.int64), runs)
+            total = np.add.reduceat(np.where(has_gap, gap, 0.0), runs)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self.hw_mean = np.where(n_gaps > 0, total / n_gaps, np.nan)
+            self.hw_min = np.minimum.reduceat(np.where(has_gap, gap, np.inf), runs)
+            self.hw_max = np.maximum.reduceat(np.where(has_gap, gap, -np.inf), runs)
+        else:
+            self.hw_mean = self.hw_min = self.hw_max = np.array([], dtype=np.float64)
+
+        routes, stops = data.get("routes") or {}, data.get("stops") or {}
+        self.route_names = [routes.get(r) for r in self.route_ids.tolist()]
+        self.stop_names = [stops.get(s) for s in self.stop_ids.tolist()]
+        arrays = (self.route_ids, self.stop_ids, self.span_route, self.span_stop, self.span_first, self.span_last,
+                  self.span_calls, self.hw_route, self.hw_stop, self.hw_hour, self.hw_calls, self.hw_mean,
+                  self.hw_min, self.hw_max)
+        self.nbytes = sum(a.nbytes for a in arrays) + 64 * (len(self.route_names) + len(self.stop_names))
+
+    @staticmethod
+    def _code(ids: np.ndarray, value: str) -> int:
+        """Code of `value` in the sorted `ids`, -1 when absent."""
+        i = int(np.searchsorted(ids, value))
+        return i if i < len(ids) and ids[i] == value else -1
+
+    def _mask(self, routes: np.ndarray, stops: np.ndarray, route_id: Optional[str], stop_id: Optional[str]) -> np.ndarray:
+        mask = np.ones(len(routes), dtype=bool)
+        if route_id is not None:
+            mask &= routes == self._code(self.route_ids, str(route_id))
+        if stop_id is not None:
+            mask &= stops == self._code(self.stop_ids, str(stop_id))
+        return mask
+
+    def _names(self, r: int, s: int) -> Dict:
+        return {
+            "route_id": str(self.route_ids[r]),
+            "route_short_name": self.route_names[r],
+            "stop_id": str(self.stop_ids[s]),
+            "stop_name": self.stop_names[s],
+        }
+
+    def headways(self, route_id: Optional[str] = None, stop_id: Optional[str] = None, hour: Optional[int] = None) -> List[Dict]:
+        """Rows (route, stop, hour): calls and mean / min / max seconds since the previous call."""
+        mask = self._mask(self.hw_route, self.hw_stop, route_id, stop_id)
+        if hour is not None:
+            mask &= self.hw_hour == int(hour)
+        rows = []
+        for i in np.flatnonzero(mask).tolist():
+            has_gap = bool(np.isfinite(self.hw_min[i]))
+            rows.append(dict(
+                self._names(int(self.hw_route[i]), int(self.hw_stop[i])),
+                hour=int(self.hw_hour[i]),
+                departures=int(self.hw_calls[i]),
+                avg_headway_secs=round(float(self.hw_mean[i]), 1) if has_gap else None,
+                min_headway_secs=int(self.hw_min[i]) if has_gap else None,
+                max_headway_secs=int(self.hw_max[i]) if has_gap else None,
+            ))
+        return rows
+
+    def service_span(self, route_id: Optional[str] = None, stop_id: Optional[str] = None) -> List[Dict]:
+        """Rows (route, stop): first and last train of the service date and calls in between."""
+        rows = []
+        for i in np.flatnonzero(self._mask(self.span_route, self.span_stop, route_id, stop_id)).tolist():
+            rows.append(dict(
+                self._names(int(self.span_route[i]), int(self.span_stop[i])),
+                first_departure=seconds_to_hhmmss(int(self.span_first[i])),
+                last_departure=seconds_to_hhmmss(int(self.span_last[i])),
+                span_minutes=int((self.span_last[i] - self.span_first[i]) // 60),
+                departures=int(self.span_calls[i]),
+            ))
+        return rows
+
+
+class ServiceAnalytics:
+    """`DayAnalytics` cached by (feed generation, service date)."""
+
+    def __init__(self, max_bytes: int):
+        self.cache = ByteLRUCache(max_bytes)
+
+    def day(self, store, generation: str, service_date: date) -> DayAnalytics:
+        key = (generation, service_date.isoformat())
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = DayAnalytics(service_date, store.get_service_day_calls(service_date))
+            self.cache.put(key, entry, size=max(entry.nbytes, sys.getsizeof(entry)))
+        return entry
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+service_analytics = ServiceAnalytics(max(int(settings.ANALYTICS_CACHE_MAX_MB), 0) * 1024 * 1024)
+metrics.register_cache("analytics", service_analytics.cache)
@@ -0,0 +1,183 @@
+"""Shape geometry for maps: Douglas-Peucker simplification and encoded polylines.
+
+At build time every shape in `shapes` is simplified at each tolerance of
+`SHAPE_TOLERANCES_M` and stored in `shape_geometry` (`WITHOUT ROWID`, key
+`(shape_id, tolerance_m)`) as a Google encoded polyline: ~2-4 bytes per
+coordinate instead of two REALs, and a request for a shape at a zoom level is
+one primary key read of one blob. GeoJSON is produced by decoding the blob.
+
+A tolerance of 0 keeps every point (the raw shape, encoded).
+"""
+from __future__ import annotations
+
+import math
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+POLYLINE_PRECISION = 5
+# metres per pixel at zoom 0 on the equator for 256 px web-mercator tiles
+_M_PER_PX_Z0 = 156543.03392
+_M_PER_DEG = math.pi * 6371000.0 / 180.0
+
+
+def encode_polyline(points: Sequence[Sequence[float]], precision: int = POLYLINE_PRECISION) -> str:
+    """Encode [(lat, lon), ...] with the Google polyline algorithm.
+
+    Rounding, deltas and the zigzag sign fold are done on whole arrays; only
+    the 5-bit chunking loops in Python.
+    """
+    coords = np.asarray(list(points) if not isinstance(points, np.ndarray) else points, dtype=np.float64).reshape(-1, 2)
+    if not len(coords):
+        return ""
+    ints = np.round(coords * (10 ** precision)).astype(np.int64)
+    deltas = np.diff(ints, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    folded = (deltas << 1) ^ (deltas >> 63)
+    out: List[str] = []
+    for value in folded.tolist():
+        while value >= 0x20:
+            out.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        out.append(chr(value + 63))
+    return "".join(out)
+
+
+def decode_polyline(encoded: str, precision: int = POLYLINE_PRECISION) -> List[List[float]]:
+    """Inverse of `encode_polyline`: [[lat, lon], ...]."""
+    factor = float(10 ** precision)
+    points: List[List[float]] = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            result = shift = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append([lat / factor, lon / factor])
+    return points
+
+
+def importance(lat: np.ndarray, lon: np.ndarray, floor_m: float = 0.0) -> np.ndarray:
+    """Douglas-Peucker significance of every point, in metres.
+
+    DP splits a span at its farthest point whatever the tolerance, so the
+    recursion tree is the same for every tolerance and DP at `t` keeps exactly
+    the points whose distance, and that of every split above them, exceeds `t`.
+    This records that minimum once (end points are `inf`, never-split points 0);
+    `importance(...) > t` is then the DP result at `t`, for every `t >= floor_m`
+    (spans are not split further once their farthest point is within `floor_m`).
+
+    Points are projected to a local equirectangular plane (metres) and each
+    split computes the distances of a whole span to its chord at once.
+    Distances are to the chord segment, not the infinite line, so loops and
+    out-and-back shapes keep their far end.
+    """
+    n = len(lat)
+    out = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return out
+    out[0] = out[-1] = np.inf
+    y = np.asarray(lat, dtype=np.float64) * _M_PER_DEG
+    x = np.asarray(lon, dtype=np.float64) * _M_PER_DEG * math.cos(math.radians(float(np.mean(lat))))
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        start, end, bound = stack.pop()
+        if end - start < 2:
+            continue
+        px, py = x[start + 1:end], y[start + 1:end]
+        ax, ay, bx, by = x[start], y[start], x[end], y[end]
+        dx, dy = bx - ax, by - ay
+        seg2 = dx * dx + dy * dy
+        if seg2 == 0.0:
+            dist = np.hypot(px - ax, py - ay)
+        else:
+            t = ((px - ax) * dx + (py - ay) * dy) / seg2
+            np.minimum(np.maximum(t, 0.0, out=t), 1.0, out=t)
+            dist = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+        i = int(dist.argmax())
+        if dist[i] <= floor_m:
+            continue
+        split = start + 1 + i
+        level = min(float(dist[i]), bound)
+        out[split] = level
+        stack.append((start, split, level))
+        stack.append((split, end, level))
+    return out
+
+
+def simplify(lat: np.ndarray, lon: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Douglas-Peucker: indices of the points kept at `tolerance_m` metres (0 keeps all)."""
+    if len(lat) <= 2 or tolerance_m <= 0:
+        return np.arange(len(lat))
+    return np.flatnonzero(importance(lat, lon, tolerance_m) > tolerance_m)
+
+
+def configured_tolerances() -> List[float]:
+    """`SHAPE_TOLERANCES_M`, sorted, always including 0 (full detail)."""
+    return sorted({0.0, *(float(t) for t in settings.SHAPE_TOLERANCES_M if float(t) >= 0)})
+
+
+def tolerance_for_zoom(zoom: float, lat: float = 40.0) -> float:
+    """Ground size of one 256 px web-mercator pixel at `zoom` and latitude `lat`."""
+    return _M_PER_PX_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+def shape_rows(shapes, tolerances: Sequence[float]) -> Iterator[Tuple[str, float, int, float, bytes]]:
+    """(shape_id, tolerance_m, n_points, length_m, polyline blob) for every shape and tolerance."""
+    df = shapes[["shape_id", "shape_pt_lat", "shape_pt_lon", "shape_pt_sequence"]].dropna()
+    df = df.sort_values(["shape_id", "shape_pt_sequence"], kind="stable")
+    for shape_id, group in df.groupby("shape_id", sort=False):
+        lat = group["shape_pt_lat"].to_numpy(dtype=np.float64)
+        lon = group["shape_pt_lon"].to_numpy(dtype=np.float64)
+        length_m = path_length_m(lat, lon)
+        # one DP pass serves every tolerance
+        positive = [t for t in tolerances if t > 0]
+        weight = importance(lat, lon, min(positive)) if positive and len(lat) > 2 else None
+        for tolerance in tolerances:
+            idx = np.arange(len(lat)) if weight is None or tolerance <= 0 else np.flatnonzero(weight > tolerance)
+            blob = encode_polyline(np.column_stack((lat[idx], lon[idx]))).encode("ascii")
+            yield str(shape_id), float(tolerance), int(len(idx)), length_m, blob
+
+
+def path_length_m(lat: np.ndarray, lon: np.ndarray) -> float:
+    if len(lat) < 2:
+        return 0.0
+    from app.core.vehicle_estimator import cumulative_distances
+
+    return float(cumulative_distances(lat, lon)[-1])
+
+
+def as_geojson(shape: dict) -> dict:
+    """GeoJSON LineString Feature of one shape from `GTFSStore.get_trip_shape` / `get_route_shapes`."""
+    coords = [[lon, lat] for lat, lon in decode_polyline(shape["polyline"], shape.get("precision", POLYLINE_PRECISION))]
+    properties = {k: v for k, v in shape.items() if k not in ("polyline", "precision")}
+    return {"type": "Feature", "geometry": {"type": "LineString", "coordinates": coords}, "properties": properties}
+
+
+def pick_tolerance(available: Sequence[float], tolerance: Optional[float]) -> float:
+    """Largest precomputed tolerance not above the requested one (0 = full detail)."""
+    if not tolerance or tolerance <= 0:
+        return 0.0
+    below = [t for t in available if t <= tolerance]
+    return max(below) if below else 0.0
+
+
+def requested_tolerance(zoom: Optional[float] = None, tolerance: Optional[float] = None) -> float:
+    """Tolerance asked for by a request: explicit metres, else one pixel at `zoom`, else full detail."""
+    if tolerance is not None:
+        return max(float(tolerance), 0.0)
+    if zoom is not None:
+        return tolerance_for_zoom(zoom)
+    return 0.0
@@ -0,0 +1,61 @@
+"""Files through which the supervisor shares state with read-only workers.
+
+In multi-worker mode (`run.py` with `WORKERS > 1`) only the supervisor process
+talks to Renfe: it downloads the feed, rebuilds `gtfs.db` plus the Arrow
+snapshot, and polls GTFS-RT. Workers never write. They share:
+
+- `gtfs.db` and the snapshot, which are opened read-only / memory-mapped so every
+  worker reads the same page-cache copy;
+- the raw GTFS-RT payloads, which the supervisor writes to
+  `<SHARED_STATE_DIR>/rt_<feed>.pb` via an atomic rename after every poll.
+
+Workers watch `(inode, mtime_ns, size)` of those files and re-decode on change
+(every atomic rename produces a new inode, even within one mtime tick).
+"""
+import logging
+import os
+from typing import Optional, Tuple
+
+from app.config.settings import settings
+
+logger = logging.getLogger("cercanias.shared_state")
+
+ROLES = ("standalone", "supervisor", "worker")
+
+
+def role() -> str:
+    value = (settings.PROCESS_ROLE or "standalone").strip().lower()
+    return value if value in ROLES else "standalone"
+
+
+def shared_dir() -> str:
+    return settings.SHARED_STATE_DIR or os.path.join(settings.GTFS_DATA_DIR or "data", "shared")
+
+
+def rt_payload_path(name: str, directory: Optional[str] = None) -> str:
+    return os.path.join(directory or shared_dir(), f"rt_{name}.pb")
+
+
+def publish_payload(name: str, data: bytes, directory: Optional[str] = None) -> str:
+    """Atomically replace the published payload of feed `name`; readers see old or new, never partial."""
+    path = rt_payload_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, mtime_ns, size) of `path`, or None when it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def read_payload(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
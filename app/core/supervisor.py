@@ -0,0 +1,92 @@
+"""Multi-worker mode: one supervisor owns every writer, workers only follow.
+
+`run.py` with `WORKERS > 1` starts the supervisor in a thread of the uvicorn
+manager process (which serves no requests) and sets `PROCESS_ROLE=worker` for
+the uvicorn worker processes. The supervisor downloads the feed, rebuilds
+`gtfs.db` and the Arrow snapshot, and polls GTFS-RT once for everybody,
+publishing the raw payloads through `app.core.shared_state`. Workers load the
+snapshot, follow `snapshot.json` for rebuilds and decode published payloads.
+"""
+import asyncio
+import logging
+import os
+import threading
+from typing import Optional
+
+from app.config.settings import settings
+from app.core import shared_state
+
+logger = logging.getLogger("cercanias.supervisor")
+
+
+class Supervisor:
+    def __init__(self) -> None:
+        self._stop: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    async def run(self) -> None:
+        from app.core.rt_fetcher import rt_fetcher
+        from app.services import gtfs_service
+
+        settings.PROCESS_ROLE = "supervisor"
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        directory = shared_state.shared_dir()
+        os.makedirs(directory, exist_ok=True)
+        os.makedirs(settings.GTFS_DATA_DIR or "data", exist_ok=True)
+
+        if settings.AUTO_DOWNLOAD_GTFS:
+            from app.core.gtfs_downloader import gtfs_downloader
+
+            gtfs_downloader.start()
+        else:
+            # build gtfs.db (and the snapshot) from a local zip/directory once
+            await asyncio.to_thread(gtfs_service.load_if_present)
+        rt_fetcher.start(publish_dir=directory)
+        logger.info("Supervisor running; publishing shared state in %s", directory)
+
+        await self._stop.wait()
+        await rt_fetcher.stop()
+        if settings.AUTO_DOWNLOAD_GTFS:
+            from app.core.gtfs_downloader import gtfs_downloader
+
+            await gtfs_downloader.stop()
+
+    def start_in_thread(self) -> threading.Thread:
+        """Run the supervisor on its own event loop in a daemon thread."""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="supervisor", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+
+async def follow_snapshot(stop: asyncio.Event, interval: Optional[float] = None) -> None:
+    """Worker mode: reload the in-memory tables whenever the supervisor publishes a new snapshot."""
+    from app.core.gtfs_snapshot import manifest_path
+    from app.services import gtfs_service
+
+    path = manifest_path(settings.GTFS_DATA_DIR or "data/gtfs")
+    interval = settings.SHARED_STATE_POLL_INTERVAL if interval is None else interval
+    last = shared_state.file_stamp(path)
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+            break
+        except asyncio.TimeoutError:
+            pass
+        stamp = shared_state.file_stamp(path)
+        if stamp is None or stamp == last:
+            continue
+        last = stamp
+        try:
+            if await asyncio.to_thread(gtfs_service._load_snapshot):
+                logger.info("Reloaded GTFS snapshot published by the supervisor")
+        except Exception:
+            logger.exception("Failed to reload the GTFS snapshot")
+
+
+supervisor = Supervisor()
@@ -0,0 +1,376 @@
+"""Mapbox Vector Tiles (MVT 2.1) for the web map: stops, route shapes and live vehicles.
+
+The protobuf wire format of MVT is small enough to write by hand (varints,
+zigzag deltas and length-delimited fields), so no tile library is needed.
+
+- Static layers (`stops`, `shapes`) come from data projected to web mercator
+  once per feed generation (`StaticLayers`); shapes use the precomputed
+  Douglas-Peucker polylines of `shape_geometry` at the tolerance of one pixel
+  at the tile's zoom.
+- The `vehicles` layer is built from the vehicle index published by each
+  GTFS-RT poll.
+
+Encoded layers are cached as bytes in one byte-bounded LRU keyed by
+(layer kind, generation, z, x, y): the feed generation for static layers, a
+counter that advances on every RT publish for vehicles. A tile is the
+concatenation of both: concatenated `Tile` messages merge their repeated
+`layers` field, so the static part is reused across polls untouched.
+"""
+from __future__ import annotations
+
+import math
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.core import metrics
+from app.core.cache import ByteLRUCache
+from app.utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+
+EXTENT = 4096
+# features are kept up to this many tile units outside the tile so lines and
+# symbols crossing a tile edge render without seams
+BUFFER = 64
+MAX_ZOOM = 22
+MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+_MOVE_TO, _LINE_TO = 1, 2
+_POINT, _LINESTRING = 1, 2
+
+
+# -- protobuf wire format ----------------------------------------------------
+
+def _varint(value: int, out: bytearray) -> None:
+    value &= 0xFFFFFFFFFFFFFFFF
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _key(field: int, wire: int, out: bytearray) -> None:
+    _varint((field << 3) | wire, out)
+
+
+def _len_field(field: int, payload: bytes, out: bytearray) -> None:
+    _key(field, 2, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _packed(values: Iterable[int]) -> bytes:
+    buf = bytearray()
+    for v in values:
+        _varint(v, buf)
+    return bytes(buf)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _value(value) -> Optional[bytes]:
+    """Encode a property value as an MVT `Value` message (None for unsupported types)."""
+    buf = bytearray()
+    if isinstance(value, bool):
+        _key(7, 0, buf)
+        _varint(int(value), buf)
+    elif isinstance(value, (int, np.integer)):
+        value = int(value)
+        if value >= 0:
+            _key(5, 0, buf)
+            _varint(value, buf)
+        else:
+            _key(6, 0, buf)
+            _varint(_zigzag(value), buf)
+    elif isinstance(value, (float, np.floating)):
+        if value != value:
+            return None
+        _key(3, 1, buf)
+        buf += struct.pack("<d", float(value))
+    elif isinstance(value, str):
+        _len_field(1, value.encode("utf-8"), buf)
+    else:
+        return None
+    return bytes(buf)
+
+
+class LayerEncoder:
+    """Accumulates the features of one layer; `encode()` returns a `Tile` with that layer."""
+
+    def __init__(self, name: str, extent: int = EXTENT):
+        self.name = name
+        self.extent = extent
+        self.features: List[bytes] = []
+        self.keys: Dict[str, int] = {}
+        self.values: Dict[bytes, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def _tags(self, props: Dict) -> List[int]:
+        tags: List[int] = []
+        for k, v in props.items():
+            if v is None:
+                continue
+            encoded = _value(v)
+            if encoded is None:
+                continue
+            tags.append(self.keys.setdefault(k, len(self.keys)))
+            tags.append(self.values.setdefault(encoded, len(self.values)))
+        return tags
+
+    def _feature(self, geom_type: int, geometry: List[int], props: Dict, fid: Optional[int]) -> None:
+        buf = bytearray()
+        if fid is not None:
+            _key(1, 0, buf)
+            _varint(int(fid), buf)
+        tags = self._tags(props)
+        if tags:
+            _len_field(2, _packed(tags), buf)
+        _key(3, 0, buf)
+        _varint(geom_type, buf)
+        _len_field(4, _packed(geometry), buf)
+        self.features.append(bytes(buf))
+
+    def add_point(self, x: int, y: int, props: Dict, fid: Optional[int] = None) -> None:
+        self._feature(_POINT, [(_MOVE_TO & 7) | (1 << 3), _zigzag(int(x)), _zigzag(int(y))], props, fid)
+
+    def add_line(self, xs: np.ndarray, ys: np.ndarray, props: Dict, fid: Optional[int] = None) -> None:
+        """Add a linestring in tile coordinates; repeated integer points are dropped."""
+        xi = np.round(np.asarray(xs, dtype=np.float64)).astype(np.int64)
+        yi = np.round(np.asarray(ys, dtype=np.float64)).astype(np.int64)
+        if len(xi) > 1:
+            moved = np.r_[True, (np.diff(xi) != 0) | (np.diff(yi) != 0)]
+            xi, yi = xi[moved], yi[moved]
+        if len(xi) < 2:
+            return
+        dx = np.diff(xi, prepend=0)
+        dy = np.diff(yi, prepend=0)
+        zz = np.empty(2 * len(xi), dtype=np.int64)
+        zz[0::2] = (dx << 1) ^ (dx >> 63)
+        zz[1::2] = (dy << 1) ^ (dy >> 63)
+        params = zz.tolist()
+        geometry = [(_MOVE_TO & 7) | (1 << 3), params[0], params[1], (_LINE_TO & 7) | ((len(xi) - 1) << 3)] + params[2:]
+        self._feature(_LINESTRING, geometry, props, fid)
+
+    def encode(self) -> bytes:
+        if not self.features:
+            return b""
+        layer = bytearray()
+        _key(15, 0, layer)
+        _varint(2, layer)
+        _len_field(1, self.name.encode("utf-8"), layer)
+        for feature in self.features:
+            _len_field(2, feature, layer)
+        for k in self.keys:
+            _len_field(3, k.encode("utf-8"), layer)
+        for v in self.values:
+            _len_field(4, v, layer)
+        _key(5, 0, layer)
+        _varint(self.extent, layer)
+        tile = bytearray()
+        _len_field(3, bytes(layer), tile)
+        return bytes(tile)
+
+
+# -- web mercator ------------------------------------------------------------
+
+def mercator(lat, lon) -> Tuple[np.ndarray, np.ndarray]:
+    """Normalized web mercator: x and y in [0, 1], y growing southwards."""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = (lon + 180.0) / 360.0
+    rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(rad) + 1.0 / np.cos(rad)) / math.pi) / 2.0
+    return x, y
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(min_lon, min_lat, max_lon, max_lat) of a tile."""
+    n = 2.0 ** z
+
+    def lat_of(ty: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return x / n * 360.0 - 180.0, lat_of(y + 1), (x + 1) / n * 360.0 - 180.0, lat_of(y)
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _to_tile(mx: np.ndarray, my: np.ndarray, z: int, x: int, y: int) -> Tuple[np.ndarray, np.ndarray]:
+    n = 2.0 ** z
+    return (mx * n - x) * EXTENT, (my * n - y) * EXTENT
+
+
+class _Lines:
+    """Shape polylines of one tolerance, projected, with per-line bounding boxes for culling."""
+
+    def __init__(self, shapes: List[Dict], props: Dict[str, Dict]):
+        from app.core.shape_geometry import decode_polyline
+
+        self.props: List[Dict] = []
+        self.coords: List[Tuple[np.ndarray, np.ndarray]] = []
+        boxes = []
+        for shape in shapes:
+            points = np.array(decode_polyline(shape["polyline"]), dtype=np.float64).reshape(-1, 2)
+            if len(points) < 2:
+                continue
+            mx, my = mercator(points[:, 0], points[:, 1])
+            self.coords.append((mx, my))
+            self.props.append(props.get(shape["shape_id"]) or {"shape_id": shape["shape_id"]})
+            boxes.append((mx.min(), my.min(), mx.max(), my.max()))
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+class StaticLayers:
+    """Stops and route shapes of one feed generation, projected to web mercator once."""
+
+    def __init__(self, store):
+        points = store.get_stop_points()
+        self.stop_ids = [str(p[0]) for p in points]
+        self.stop_names = [p[1] for p in points]
+        self.stop_x, self.stop_y = mercator([p[2] for p in points], [p[3] for p in points])
+        self._store = store
+        self._shape_props = store.get_shape_routes()
+        self._lines: Dict[float, _Lines] = {}
+        self._lock = threading.Lock()
+
+    def lines(self, zoom: int) -> _Lines:
+        from app.core.shape_geometry import configured_tolerances, pick_tolerance, tolerance_for_zoom
+
+        # one screen pixel of a 256 px tile at this zoom
+        tolerance = pick_tolerance(configured_tolerances(), tolerance_for_zoom(zoom))
+        with self._lock:
+            lines = self._lines.get(tolerance)
+        if lines is None:
+            lines = _Lines(self._store.get_shape_polylines(tolerance), self._shape_props)
+            with self._lock:
+                self._lines.setdefault(tolerance, lines)
+        return lines
+
+    def encode(self, z: int, x: int, y: int) -> bytes:
+        n = 2.0 ** z
+        pad = BUFFER / EXTENT / n
+        x0, y0, x1, y1 = x / n - pad, y / n - pad, (x + 1) / n + pad, (y + 1) / n + pad
+        out = b""
+
+        if z >= settings.TILE_STOPS_MIN_ZOOM and len(self.stop_ids):
+            stops = LayerEncoder("stops")
+            rows = np.flatnonzero((self.stop_x >= x0) & (self.stop_x <= x1) & (self.stop_y >= y0) & (self.stop_y <= y1))
+            tx, ty = _to_tile(self.stop_x[rows], self.stop_y[rows], z, x, y)
+            for i, px, py in zip(rows.tolist(), tx.tolist(), ty.tolist()):
+                stops.add_point(round(px), round(py), {"stop_id": self.stop_ids[i], "stop_name": self.stop_names[i]})
+            out += stops.encode()
+
+        lines = self.lines(z)
+        if len(lines.boxes):
+            shapes = LayerEncoder("shapes")
+            b = lines.boxes
+            hits = np.flatnonzero((b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0))
+            lo, hi = -BUFFER, EXTENT + BUFFER
+            for i in hits.tolist():
+                tx, ty = _to_tile(*lines.coords[i], z, x, y)
+                # keep runs of segments whose bounding box touches the buffered tile
+                seg = (
+                    (np.minimum(tx[:-1], tx[1:]) <= hi) & (np.maximum(tx[:-1], tx[1:]) >= lo)
+                    & (np.minimum(ty[:-1], ty[1:]) <= hi) & (np.maximum(ty[:-1], ty[1:]) >= lo)
+                )
+                edges = np.flatnonzero(np.diff(np.r_[0, seg.astype(np.int8), 0]))
+                for start, end in zip(edges[0::2].tolist(), edges[1::2].tolist()):
+                    shapes.add_line(tx[start:end + 1], ty[start:end + 1], lines.props[i])
+            out += shapes.encode()
+        return out
+
+
+def encode_vehicles(index, z: int, x: int, y: int) -> bytes:
+    """`vehicles` layer of a tile from a `VehicleIndex` snapshot."""
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(z, x, y)
+    pad_lon = (max_lon - min_lon) * BUFFER / EXTENT
+    pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+    records, _ = index.query(bbox=(min_lon - pad_lon, min_lat - pad_lat, max_lon + pad_lon, max_lat + pad_lat))
+    if not records:
+        return b""
+    mx, my = mercator([r["latitude"] for r in records], [r["longitude"] for r in records])
+    tx, ty = _to_tile(mx, my, z, x, y)
+    layer = LayerEncoder("vehicles")
+    for r, px, py in zip(records, tx.tolist(), ty.tolist()):
+        props = {k: r.get(k) for k in ("vehicle_id", "trip_id", "route_id", "bearing", "current_status", "timestamp")}
+        layer.add_point(round(px), round(py), props)
+    return layer.encode()
+
+
+class TileService:
+    """Tile bytes per (z, x, y), cached per static and vehicle generation."""
+
+    def __init__(self, max_bytes: int):
+        self.cache = ByteLRUCache(max_bytes)
+        self._static: Optional[Tuple[str, StaticLayers]] = None
+        self._vehicle_index = None
+        self._vehicle_generation = 0
+        self._lock = threading.Lock()
+
+    def static_layers(self, store, generation: str) -> StaticLayers:
+        with self._lock:
+            current = self._static
+        if current is not None and current[0] == generation:
+            return current[1]
+        layers = StaticLayers(store)
+        with self._lock:
+            self._static = (generation, layers)
+        return layers
+
+    def prepare(self, db_path: str) -> None:
+        """Project the static layers of `db_path` and decode its shapes at every tolerance.
+
+        Called by the `gtfs.db` warm-up thread once the warm-up is recorded, so
+        the first tiles of a new feed generation do not pay for it.
+        """
+        from app.core.gtfs_sqlite import GTFSStore
+        from app.core.pagination import db_feed_generation
+
+        generation = db_feed_generation(db_path)
+        if not generation:
+            return
+        layers = self.static_layers(GTFSStore(db_path), generation)
+        # zooms sharing a tolerance share its decoded lines
+        for zoom in range(MAX_ZOOM + 1):
+            layers.lines(zoom)
+
+    def vehicle_generation(self, index) -> int:
+        """Advances whenever a poll publishes a new vehicle index."""
+        with self._lock:
+            if index is not self._vehicle_index:
+                self._vehicle_index = index
+                self._vehicle_generation += 1
+            return self._vehicle_generation
+
+    def _cached(self, key, build) -> bytes:
+        data = self.cache.get(key)
+        if data is None:
+            data = build()
+            self.cache.put(key, data, size=len(data) + 64)
+        return data
+
+    def tile(self, z: int, x: int, y: int, store=None, generation: Optional[str] = None, vehicles=None) -> bytes:
+        out = b""
+        if store is not None and generation:
+            out += self._cached(("static", generation, z, x, y), lambda: self.static_layers(store, generation).encode(z, x, y))
+        if vehicles is not None and len(vehicles):
+            vgen = self.vehicle_generation(vehicles)
+            out += self._cached(("vehicles", vgen, z, x, y), lambda: encode_vehicles(vehicles, z, x, y))
+        return out
+
+    def clear(self) -> None:
+        self.cache.clear()
+        with self._lock:
+            self._static = None
+
+
+tile_service = TileService(max(int(settings.TILE_CACHE_MAX_MB), 0) * 1024 * 1024)
+metrics.register_cache("tiles", tile_service.cache)
@@ -0,0 +1,277 @@
+"""Server-side vehicle position estimation between GTFS-RT polls.
+
+A trip profile combines the trip's shape (`shapes`) with its schedule
+(`stop_times`): cumulative distances along the shape are precomputed once per
+trip and each stop is mapped to a distance. Estimating a position is then:
+
+1. project the last RT fix onto the shape segments near where the schedule
+   puts the trip -> interpolated distance travelled;
+2. compare with the schedule at that distance -> current delay;
+3. advance along the schedule by the time elapsed since the fix (keeping the
+   delay) -> estimated distance now;
+4. binary-search the cumulative distances for the shape segment and
+   interpolate lat/lon.
+
+Trips without a shape fall back to straight lines between their stops.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import settings
+from app.core.rt_index import haversine_m
+from app.utils.time_utils import parse_hhmmss_to_seconds
+
+logger = logging.getLogger("cercanias.vehicle_estimator")
+
+# a fix is matched against the shape between where the schedule puts the trip
+# this long before and after the fix time (late trains are behind the schedule)
+PROJECTION_BEHIND_SECS = 3600.0
+PROJECTION_AHEAD_SECS = 600.0
+# farther than this from every segment of the window, search the whole shape
+OFF_TRACK_M = 1000.0
+
+
+def cumulative_distances(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Cumulative great-circle distance (m) along a polyline, starting at 0."""
+    if lat.size == 0:
+        return np.zeros(0)
+    p1, p2 = np.radians(lat[:-1]), np.radians(lat[1:])
+    dl = np.radians(lon[1:] - lon[:-1])
+    a = np.sin((p2 - p1) / 2.0) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2.0) ** 2
+    seg = 2.0 * 6371000.0 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.concatenate(([0.0], np.cumsum(seg)))
+
+
+class TripProfile:
+    """Shape geometry with cumulative distances and the scheduled distance/time curve of one trip."""
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, stop_lat: np.ndarray, stop_lon: np.ndarray,
+                 arrivals: np.ndarray, departures: np.ndarray, source: str):
+        self.lat = lat
+        self.lon = lon
+        self.cum = cumulative_distances(lat, lon)
+        self.source = source
+        # map each stop to a distance along the shape, never going backwards
+        stop_dist = np.zeros(stop_lat.size)
+        start = 0
+        for i in range(stop_lat.size):
+            d = haversine_m(float(stop_lat[i]), float(stop_lon[i]), lat[start:], lon[start:])
+            j = start + int(np.argmin(d)) if d.size else start
+            stop_dist[i] = self.cum[j] if self.cum.size else 0.0
+            start = j
+        # time/distance curve with dwell: (arrival, d) then (departure, d) per stop
+        self.curve_t = np.column_stack((arrivals, departures)).ravel().astype(np.float64)
+        self.curve_d = np.repeat(stop_dist, 2)
+        self.first_time = float(self.curve_t[0]) if self.curve_t.size else 0.0
+        self.last_time = float(self.curve_t[-1]) if self.curve_t.size else 0.0
+
+    def project(self, lat: float, lon: float, near: Optional[Tuple[float, float]] = None) -> float:
+        """Distance along the shape of the point nearest to (lat, lon), interpolated within its segment.
+
+        `near` = (lo, hi) limits the search to the segments overlapping that
+        range of distances (found with `searchsorted` on `cum`), so an
+        out-and-back or looping shape is matched on the leg the trip is
+        scheduled to be on; the whole shape is searched when nothing in the
+        window is within `OFF_TRACK_M`.
+        """
+        n = self.cum.size
+        if n < 2:
+            return 0.0
+        if near is not None:
+            lo = max(int(np.searchsorted(self.cum, near[0], side="right")) - 1, 0)
+            hi = min(max(int(np.searchsorted(self.cum, near[1], side="left")), lo + 1), n - 1)
+            if hi > lo:
+                dist, off = self._project_segments(lat, lon, lo, hi)
+                if off <= OFF_TRACK_M:
+                    return dist
+        return self._project_segments(lat, lon, 0, n - 1)[0]
+
+    def _project_segments(self, lat: float, lon: float, lo: int, hi: int) -> Tuple[float, float]:
+        """(distance along the shape, metres off the track) of the best projection onto segments lo..hi-1."""
+        # local equirectangular metres around the fix: exact enough over a few km
+        k = np.radians(1.0) * 6371000.0
+        x = (self.lon[lo:hi + 1] - lon) * k * np.cos(np.radians(lat))
+        y = (self.lat[lo:hi + 1] - lat) * k
+        ax, ay, dx, dy = x[:-1], y[:-1], np.diff(x), np.diff(y)
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            f = np.where(length2 > 0, np.clip(-(ax * dx + ay * dy) / length2, 0.0, 1.0), 0.0)
+        off2 = (ax + f * dx) ** 2 + (ay + f * dy) ** 2
+        i = int(np.argmin(off2))
+        j = lo + i
+        dist = self.cum[j] + f[i] * (self.cum[j + 1] - self.cum[j])
+        return float(dist), float(np.sqrt(off2[i]))
+
+    def scheduled_time_at(self, dist: float) -> float:
+        # curve_d is non-decreasing; take the first time the trip reaches `dist`
+        j = int(np.searchsorted(self.curve_d, dist, side="left"))
+        if j <= 0:
+            return float(self.curve_t[0])
+        if j >= self.curve_d.size:
+            return float(self.curve_t[-1])
+        d0, d1 = self.curve_d[j - 1], self.curve_d[j]
+        t0, t1 = self.curve_t[j - 1], self.curve_t[j]
+        if d1 == d0:
+            return float(t1)
+        return float(t0 + (t1 - t0) * (dist - d0) / (d1 - d0))
+
+    def scheduled_distance_at(self, t: float) -> float:
+        return float(np.interp(t, self.curve_t, self.curve_d))
+
+    def point_at(self, dist: float):
+        """(lat, lon, bearing) at `dist` metres along the shape (binary search on cumulative distances)."""
+        n = self.cum.size
+        if n == 1:
+            return float(self.lat[0]), float(self.lon[0]), None
+        dist = min(max(dist, 0.0), float(self.cum[-1]))
+        j = int(np.searchsorted(self.cum, dist, side="right"))
+        j = min(max(j, 1), n - 1)
+        d0, d1 = self.cum[j - 1], self.cum[j]
+        f = 0.0 if d1 == d0 else (dist - d0) / (d1 - d0)
+        lat0, lon0, lat1, lon1 = self.lat[j - 1], self.lon[j - 1], self.lat[j], self.lon[j]
+        lat = lat0 + (lat1 - lat0) * f
+        lon = lon0 + (lon1 - lon0) * f
+        return float(lat), float(lon), _bearing(lat0, lon0, lat1, lon1)
+
+
+def _bearing(lat0, lon0, lat1, lon1) -> float:
+    p0, p1 = np.radians(lat0), np.radians(lat1)
+    dl = np.radians(lon1 - lon0)
+    x = np.sin(dl) * np.cos(p1)
+    y = np.cos(p0) * np.sin(p1) - np.sin(p0) * np.cos(p1) * np.cos(dl)
+    return round(float((np.degrees(np.arctan2(x, y)) + 360.0) % 360.0), 1)
+
+
+class VehicleEstimator:
+    """Estimate current vehicle positions from the last RT fix plus shape and schedule.
+
+    Trip profiles are cached (LRU, `max_profiles`) and invalidated when
+    `gtfs.db` is replaced.
+    """
+
+    def __init__(self, max_profiles: int = 2048):
+        self._profiles: "OrderedDict[str, Optional[TripProfile]]" = OrderedDict()
+        self._max_profiles = max_profiles
+        self._generation = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _db_path() -> str:
+        return os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+
+    def _load_profile(self, db_path: str, trip_id: str) -> Optional[TripProfile]:
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT st.arrival_time, st.departure_time, s.stop_lat, s.stop_lon "
+                "FROM stop_times st JOIN stops s ON st.stop_id = s.stop_id "
+                "WHERE st.trip_id = ? ORDER BY st.stop_sequence",
+                (trip_id,),
+            ).fetchall()
+            rows = [r for r in rows if r[2] is not None and r[3] is not None]
+            if len(rows) < 2:
+                return None
+            arrivals = np.array([parse_hhmmss_to_seconds(r[0]) or parse_hhmmss_to_seconds(r[1]) or 0 for r in rows], dtype=np.float64)
+            departures = np.array([parse_hhmmss_to_seconds(r[1]) or a for r, a in zip(rows, arrivals)], dtype=np.float64)
+            stop_lat = np.array([r[2] for r in rows], dtype=np.float64)
+            stop_lon = np.array([r[3] for r in rows], dtype=np.float64)
+
+            shape = []
+            try:
+                shape = conn.execute(
+                    "SELECT sh.shape_pt_lat, sh.shape_pt_lon FROM trips t JOIN shapes sh ON sh.shape_id = t.shape_id "
+                    "WHERE t.trip_id = ? ORDER BY sh.shape_pt_sequence",
+                    (trip_id,),
+                ).fetchall()
+            except sqlite3.Error:
+                shape = []
+            if len(shape) >= 2:
+                lat = np.array([p[0] for p in shape], dtype=np.float64)
+                lon = np.array([p[1] for p in shape], dtype=np.float64)
+                return TripProfile(lat, lon, stop_lat, stop_lon, arrivals, departures, source="shape")
+            return TripProfile(stop_lat, stop_lon, stop_lat, stop_lon, arrivals, departures, source="stops")
+        finally:
+            conn.close()
+
+    def profile(self, trip_id: str) -> Optional[TripProfile]:
+        db_path = self._db_path()
+        if not trip_id or not os.path.exists(db_path):
+            return None
+        generation = (db_path, os.path.getmtime(db_path))
+        with self._lock:
+            if generation != self._generation:
+                self._profiles.clear()
+                self._generation = generation
+            if trip_id in self._profiles:
+                self._profiles.move_to_end(trip_id)
+                return self._profiles[trip_id]
+        try:
+            prof = self._load_profile(db_path, trip_id)
+        except Exception:
+            logger.debug("Could not build trip profile for %s", trip_id, exc_info=True)
+            prof = None
+        with self._lock:
+            self._profiles[trip_id] = prof
+            while len(self._profiles) > self._max_profiles:
+                self._profiles.popitem(last=False)
+        return prof
+
+    def estimate(self, record: Dict, now: Optional[float] = None) -> Optional[Dict]:
+        """Estimate where the vehicle in `record` (as served by `/realtime/vehicles`) is now."""
+        lat, lon = record.get("latitude"), record.get("longitude")
+        fix_ts = record.get("timestamp")
+        if lat is None or lon is None or not (lat or lon) or not fix_ts:
+            return None
+        prof = self.profile(record.get("trip_id") or "")
+        if prof is None:
+            return None
+        now = time.time() if now is None else now
+        elapsed = min(max(now - fix_ts, 0.0), float(settings.RT_INTERPOLATION_MAX_SECS))
+
+        midnight = datetime.fromtimestamp(fix_ts).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        fix_secs = fix_ts - midnight
+        # trips past midnight are scheduled as 24:xx+ on the previous service day
+        if fix_secs < prof.first_time - 3600 and fix_secs + 86400 <= prof.last_time + 3600:
+            fix_secs += 86400
+
+        window = (prof.scheduled_distance_at(fix_secs - PROJECTION_BEHIND_SECS),
+                  prof.scheduled_distance_at(fix_secs + PROJECTION_AHEAD_SECS))
+        d_fix = prof.project(lat, lon, near=window)
+        delay = fix_secs - prof.scheduled_time_at(d_fix)
+        d_now = prof.scheduled_distance_at(fix_secs + elapsed - delay)
+        # never move a vehicle backwards from its last known fix
+        d_now = max(d_now, d_fix)
+        e_lat, e_lon, bearing = prof.point_at(d_now)
+        return {
+            "latitude": round(e_lat, 6),
+            "longitude": round(e_lon, 6),
+            "bearing": bearing,
+            "distance_m": round(d_now, 1),
+            "delay_secs": int(round(delay)),
+            "at": int(fix_ts + elapsed),
+            "source": prof.source,
+        }
+
+    def interpolate(self, records, now: Optional[float] = None):
+        """Return copies of `records` with an `estimated` field (None when no estimate is possible)."""
+        now = time.time() if now is None else now
+        out = []
+        for r in records:
+            try:
+                est = self.estimate(r, now=now)
+            except Exception:
+                logger.debug("Estimation failed for %s", r.get("trip_id"), exc_info=True)
+                est = None
+            out.append(dict(r, estimated=est))
+        return out
+
+
+vehicle_estimator = VehicleEstimator()
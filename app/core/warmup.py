@@ -0,0 +1,148 @@
+"""Page-cache warm-up of the hot `gtfs.db` indexes.
+
+Right after startup (or after a rebuild replaced `gtfs.db`) the first
+departure-board queries pay for reading index pages from disk. `Warmup.run`
+walks the indexes those queries use (`count(*) ... INDEXED BY` visits every
+page of the index b-tree) and reads the small service-calendar tables in full,
+so `/readyz` only reports ready once they are resident. The static vector
+tile layers of the new feed generation are projected at the same time.
+
+A warm-up is tied to a DB generation (path, inode, mtime); when the file is
+replaced `ensure()` re-runs it in a background thread.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+
+logger = logging.getLogger("cercanias.warmup")
+
+# (table, index) pairs read by departure boards, schedules and stop lookups
+HOT_INDEXES = (
+    ("stop_times", "ix_stop_times_stop_trip"),
+    ("stop_times", "ix_stop_times_stop_id"),
+    ("stop_times", "ix_stop_times_trip_sequence"),
+    ("trips", "ix_trips_trip_id"),
+    ("trips", "ix_trips_service_id"),
+    ("stops", "ix_stops_stop_id"),
+    ("routes", "ix_routes_route_id"),
+    ("calendar", "ix_calendar_service_id"),
+    ("calendar_dates", "ix_calendar_dates_service_id"),
+    ("calendar_dates", "ix_calendar_dates_date"),
+)
+# service calendar tables are small and read on every departure board: read them whole
+HOT_TABLES = ("calendar", "calendar_dates", "routes", "station_platforms")
+
+
+def db_generation(db_path: str) -> Optional[Tuple[str, int, int]]:
+    try:
+        st = os.stat(db_path)
+    except OSError:
+        return None
+    return db_path, st.st_ino, st.st_mtime_ns
+
+
+class Warmup:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.generation: Optional[Tuple[str, int, int]] = None
+        self.warming = False
+        self.runs = 0
+        self.last: Dict[str, object] = {}
+
+    def run(self, db_path: str) -> Dict[str, object]:
+        """Warm the hot indexes of `db_path` synchronously; returns the timing report."""
+        generation = db_generation(db_path)
+        start = time.perf_counter()
+        indexes: Dict[str, Dict[str, object]] = {}
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        try:
+            for table, index in HOT_INDEXES:
+                t0 = time.perf_counter()
+                try:
+                    rows = conn.execute(f"SELECT count(*) FROM {table} INDEXED BY {index}").fetchone()[0]
+                except sqlite3.Error:
+                    # index (or table) not present in this build
+                    continue
+                indexes[index] = {"rows": int(rows), "ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+            for table in HOT_TABLES:
+                try:
+                    conn.execute(f"SELECT * FROM {table}").fetchall()
+                except sqlite3.Error:
+                    continue
+        finally:
+            conn.close()
+        report = {
+            "db_path": db_path,
+            "duration_ms": round((time.perf_counter() - start) * 1000.0, 1),
+            "indexes": indexes,
+            "finished_at": time.time(),
+        }
+        with self._lock:
+            self.generation = generation
+            self.runs += 1
+            self.last = report
+        logger.info("Warmed %d hot indexes of %s in %.1fms", len(indexes), db_path, report["duration_ms"])
+        return report
+
+    def is_warm(self, db_path: str) -> bool:
+        generation = db_generation(db_path)
+        return generation is not None and generation == self.generation
+
+    def ensure(self, db_path: str) -> bool:
+        """Start a background warm-up if `db_path` changed since the last one; True if one was started."""
+        generation = db_generation(db_path)
+        if generation is None:
+            return False
+        with self._lock:
+            if self.warming or generation == self.generation:
+                return False
+            self.warming = True
+
+        def _target():
+            try:
+                self.run(db_path)
+            except Exception:
+                logger.exception("Page-cache warm-up failed for %s", db_path)
+            finally:
+                self.warming = False
+            # after the warm-up is recorded: readiness and its timing do not wait for the tiles
+            self.prepare_tiles(db_path)
+
+        self._thread = threading.Thread(target=_target, name="db-warmup", daemon=True)
+        self._thread.start()
+        return True
+
+    @staticmethod
+    def prepare_tiles(db_path: str) -> None:
+        """Build the static tile layers of `db_path` so the first tiles of a new feed do not pay for it."""
+        try:
+            from app.core.vector_tiles import tile_service
+
+            tile_service.prepare(db_path)
+        except Exception:
+            logger.warning("Could not prepare static tile layers of %s", db_path, exc_info=True)
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "warming": self.warming,
+                "runs": self.runs,
+                "duration_ms": self.last.get("duration_ms"),
+                "finished_at": self.last.get("finished_at"),
+                "indexes": len(self.last.get("indexes") or {}),
+            }
+
+
+warmup = Warmup()
+metrics.REGISTRY.callback(
+    "cercanias_warmup_duration_seconds",
+    "Duration of the last page-cache warm-up of the hot gtfs.db indexes.",
+    (),
+    lambda: [((), (warmup.last.get("duration_ms") or 0) / 1000.0)] if warmup.last else [],
+)
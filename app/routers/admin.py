@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from app.core.gtfs_manager import gtfs_manager
+from app.core.query_profiler import profiler
+from app.core.warmup import warmup
+from app.services import gtfs_service
 from app.core.security import api_key_required
 from app.utils.response import success_response
 
@@ -11,6 +14,8 @@ def get_gtfs_meta():
     """Returns metadata about the GTFS feed (disk meta + manager metadata).
 
     - `etag`, `last_modified`, `last_downloaded_at`, `file_hash`, `file_size`, `last_reload_at`, `status`, etc.
+    - `realtime`: event-loop lag and per-feed GTFS-RT decode timings.
+    - `startup`: startup mode (`blocking`/`fast`), readiness and background load state.
     """
     disk_meta = {}
     try:
@@ -27,5 +32,43 @@ def get_gtfs_meta():
     except Exception:
         manager_meta = {}
 
-    payload = {"disk": disk_meta, "manager": manager_meta}
+    realtime_stats = {}
+    try:
+        from app.core.rt_fetcher import rt_fetcher
+
+        realtime_stats = rt_fetcher.get_stats()
+    except Exception:
+        realtime_stats = {}
+
+    payload = {
+        "disk": disk_meta,
+        "manager": manager_meta,
+        "realtime": realtime_stats,
+        "startup": dict(gtfs_service.startup_status),
+        "warmup": warmup.status(),
+    }
     return success_response(payload)
+
+
+@router.get(
+    "/queries",
+    summary="Query profiler",
+    description=(
+        "Formas de consulta SQL de `GTFSStore` más lentas (requiere `QUERY_PROFILER_ENABLED=true`): "
+        "llamadas, tiempo total/medio/máximo, parámetros de la ejecución más lenta y el "
+        "`EXPLAIN QUERY PLAN` con avisos de escaneo completo (`full_scan`) y B-tree temporal "
+        "(`temp_btree`). Incluye el log de consultas lentas (`SLOW_QUERY_MS`) y los índices de "
+        "`gtfs.db` que ningún plan utiliza."
+    ),
+)
+def get_query_profile(
+    top: int = Query(20, ge=1, le=500, description="Número de formas a devolver"),
+    order: str = Query("total", pattern="^(total|max|avg|count)$", description="Orden: total, max, avg o count"),
+):
+    return success_response(profiler.report(top=top, order=order))
+
+
+@router.post("/queries/reset", summary="Reset query profiler", description="Vacía las estadísticas del profiler de consultas.")
+def reset_query_profile():
+    profiler.reset()
+    return success_response({"reset": True})
@@ -0,0 +1,106 @@
+from datetime import date as date_type
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.core.delay_history import delay_history
+from app.services.gtfs_service import get_headways, get_service_span
+from app.utils.response import success_response
+
+router = APIRouter(prefix="/analytics", tags=["Analytics"])
+
+
+@router.get(
+    "/delays",
+    summary="Retrasos típicos (histórico RT)",
+    description=(
+        "Estadísticas de retraso calculadas a partir del histórico de `trip_updates` en tiempo real. "
+        "Se leen únicamente los agregados precalculados (ruta × hora × parada), por lo que la consulta "
+        "es barata incluso con semanas de histórico.\n\n"
+        "Parámetros opcionales:\n- `route_id` (string): filtra por ruta.\n- `stop_id` (string): filtra por parada.\n"
+        "- `hour` (int 0-23): filtra por hora programada.\n- `days` (int): ventana en días (por defecto 7).\n"
+        "- `group_by` (`hour`|`route`|`stop`|`date`): agrupación del resultado (por defecto `hour`).\n\n"
+        "Cada fila incluye `samples`, `avg_delay_secs`, `stddev_delay_secs`, `max_delay_secs` y `punctuality` "
+        "(fracción de pasos con retraso menor o igual al umbral de puntualidad).\n\n"
+        "Ejemplo:\n``GET /analytics/delays?route_id=40T0001C3&hour=8``"
+    ),
+)
+def get_delays(
+    route_id: Optional[str] = None,
+    stop_id: Optional[str] = None,
+    hour: Optional[int] = Query(None, ge=0, le=23),
+    days: int = Query(7, ge=1, le=365),
+    group_by: str = "hour",
+):
+    try:
+        data = delay_history.get_delay_stats(route_id=route_id, stop_id=stop_id, hour=hour, days=days, group_by=group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return success_response(data, meta={"days": days, "group_by": group_by})
+
+
+@router.get(
+    "/delays/punctuality",
+    summary="Puntualidad diaria (histórico RT)",
+    description=(
+        "Serie diaria de puntualidad y retraso medio de los últimos `days` días, opcionalmente filtrada por "
+        "`route_id` y/o `stop_id`. Calculada sólo a partir de los agregados.\n\n"
+        "Ejemplo:\n``GET /analytics/delays/punctuality?route_id=40T0001C3&days=7``"
+    ),
+)
+def get_punctuality(route_id: Optional[str] = None, stop_id: Optional[str] = None, days: int = Query(7, ge=1, le=365)):
+    data = delay_history.get_delay_stats(route_id=route_id, stop_id=stop_id, days=days, group_by="date")
+    return success_response(data, meta={"days": days})
+
+
+def _service_date(date: Optional[str]) -> date_type:
+    if not date:
+        return date_type.today()
+    try:
+        return date_type.fromisoformat(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+
+
+@router.get(
+    "/headways",
+    summary="Frecuencia media por línea, parada y hora",
+    description=(
+        "Número de trenes e intervalo medio, mínimo y máximo entre trenes consecutivos de la misma "
+        "línea en cada parada, por hora, para un día de servicio. Incluye los viajes de "
+        "`frequencies.txt` cuando el feed lo trae. Se calcula una vez por día de servicio (vectorizado "
+        "sobre todas las salidas del día) y se guarda en memoria (`ANALYTICS_CACHE_MAX_MB`).\n\n"
+        "Parámetros opcionales:\n- `date` (string `YYYY-MM-DD`): día de servicio (por defecto hoy).\n"
+        "- `route_id` (string): filtra por ruta.\n- `stop_id` (string): filtra por parada.\n"
+        "- `hour` (int 0-47): filtra por hora; las horas >= 24 son trenes del día de servicio después de medianoche.\n\n"
+        "Cada fila incluye `departures` y `avg_headway_secs`/`min_headway_secs`/`max_headway_secs` "
+        "(segundos desde el tren anterior; `null` para el primero del día).\n\n"
+        "Ejemplo:\n``GET /analytics/headways?route_id=40T0001C3&stop_id=18000``"
+    ),
+    responses={400: {"description": "Invalid date"}},
+)
+def get_headways_endpoint(
+    date: Optional[str] = None,
+    route_id: Optional[str] = None,
+    stop_id: Optional[str] = None,
+    hour: Optional[int] = Query(None, ge=0, le=47),
+):
+    service_date = _service_date(date)
+    data = get_headways(service_date, route_id=route_id, stop_id=stop_id, hour=hour)
+    return success_response(data, meta={"date": service_date.isoformat(), "rows": len(data)})
+
+
+@router.get(
+    "/service-span",
+    summary="Primer y último tren por línea y parada",
+    description=(
+        "Primer y último tren de cada línea en cada parada para un día de servicio, con la duración "
+        "del servicio (`span_minutes`) y el número de trenes. Mismo cálculo y caché que `/analytics/headways`.\n\n"
+        "Parámetros opcionales:\n- `date` (string `YYYY-MM-DD`): día de servicio (por defecto hoy).\n"
+        "- `route_id` (string): filtra por ruta.\n- `stop_id` (string): filtra por parada.\n\n"
+        "Ejemplo:\n``GET /analytics/service-span?stop_id=18000&date=2025-06-02``"
+    ),
+    responses={400: {"description": "Invalid date"}},
+)
+def get_service_span_endpoint(date: Optional[str] = None, route_id: Optional[str] = None, stop_id: Optional[str] = None):
+    service_date = _service_date(date)
+    data = get_service_span(service_date, route_id=route_id, stop_id=stop_id)
+    return success_response(data, meta={"date": service_date.isoformat(), "rows": len(data)})
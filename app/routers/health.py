@@ -0,0 +1,70 @@
+from datetime import datetime
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.config.settings import settings
+from app.core.gtfs_manager import gtfs_manager
+from app.core.warmup import warmup
+from app.services import gtfs_service
+from app.utils.response import error_response, success_response
+
+# public on purpose: load balancers and orchestrators probe these without an API key
+router = APIRouter(prefix="", tags=["Health"])
+
+_started_at = time.time()
+
+
+def _readiness():
+    """Evaluate every readiness check; returns (ready, checks)."""
+    checks = {"startup": bool(gtfs_service.startup_status.get("ready"))}
+
+    db_path = gtfs_service.gtfs_db_path()
+    checks["database"] = gtfs_service.gtfs_db_valid(db_path)
+    if checks["database"]:
+        # (re)warm after startup or after a rebuild replaced the file
+        warmup.ensure(db_path)
+        # a re-warm after a rebuild keeps the instance ready; only the first one gates traffic
+        checks["warmup"] = warmup.generation is not None
+    else:
+        checks["warmup"] = False
+
+    st = gtfs_manager.data.get("stop_times")
+    manager_loaded = st is not None and not st.empty
+    checks["manager_loaded"] = manager_loaded
+    if manager_loaded and settings.SCHEDULE_PRECOMPUTE_ENABLED:
+        checks["schedule_today"] = datetime.now().strftime("%Y%m%d") in gtfs_manager._schedules_by_date
+
+    if checks["database"]:
+        data_ready = checks["warmup"]
+    else:
+        # without gtfs.db every read falls back to the in-memory tables
+        data_ready = manager_loaded and checks.get("schedule_today", True)
+    return checks["startup"] and data_ready, checks
+
+
+@router.get("/healthz", summary="Liveness", description="Indica que el proceso está vivo. No comprueba los datos.")
+def healthz():
+    return success_response({"alive": True, "uptime_secs": round(time.time() - _started_at, 1)})
+
+
+@router.get(
+    "/readyz",
+    summary="Readiness",
+    description=(
+        "Devuelve 200 cuando la instancia puede servir tráfico: arranque completado, `gtfs.db` "
+        "abierto y con los índices calientes (tablero de salidas, calendario de servicio) "
+        "precargados en la caché de páginas, o bien las tablas en memoria cargadas. "
+        "En caso contrario devuelve 503 con el detalle de cada comprobación."
+    ),
+)
+def readyz():
+    ready, checks = _readiness()
+    data = {"ready": ready, "checks": checks, "warmup": warmup.status()}
+    if not ready:
+        failing = ", ".join(k for k, v in checks.items() if v is False)
+        payload = error_response(title="Not Ready", status=503, detail=f"Failing checks: {failing}")
+        payload["data"] = data
+        return JSONResponse(status_code=503, content=payload)
+    return success_response(data)
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from app.core import metrics
+
+router = APIRouter(prefix="", tags=["Admin"])
+
+
+@router.get(
+    "/metrics",
+    summary="Métricas Prometheus",
+    description=(
+        "Métricas en formato de texto de Prometheus: histogramas de latencia por plantilla "
+        "de ruta (`cercanias_http_request_duration_seconds`) y por método de `GTFSStore` "
+        "(`cercanias_db_query_duration_seconds`), aciertos de las cachés, duración y tamaño "
+        "de cada consulta GTFS-RT, fases de la reconstrucción del feed y duración del "
+        "warm-up de índices."
+    ),
+    response_class=Response,
+)
+def get_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
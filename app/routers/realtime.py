@@ -1,6 +1,12 @@
-from fastapi import APIRouter, Query
+import asyncio
+import json
+import math
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
+from app.config.settings import settings
 from app.core.gtfs_manager import gtfs_manager
+from app.core.vehicle_estimator import vehicle_estimator
 from app.utils.response import success_response
 
 router = APIRouter(prefix="/realtime", tags=["Realtime"])
@@ -11,24 +17,53 @@ router = APIRouter(prefix="/realtime", tags=["Realtime"])
     summary="Alertas en tiempo real",
     description=(
         "Recupera alertas e incidencias en tiempo real extraídas del feed RT. "
-        "Las alertas se normalizan en un formato serializable para permitir su "
-        "consumo por integraciones externas."
+        "Las alertas se decodifican una vez por sondeo en estructuras planas: "
+        "`informed_entity` (ruta/parada/viaje afectados), `active_periods`, `cause` y `effect`.\n\n"
+        "Filtros opcionales (índices por ruta y parada):\n- `route_id` (string)\n- `stop_id` (string)\n"
+        "- `active` (bool): sólo alertas vigentes en este momento."
     ),
 )
-def get_alerts():
-    alerts = gtfs_manager.get_rt_alerts()
-    # The alerts are protobuf Alert objects; return as dicts where possible
-    result = []
-    for a in alerts:
-        try:
-            result.append({
-                "informed_entity": [e.SerializeToString().hex() for e in a.informed_entity] if hasattr(a, "informed_entity") else None,
-                "header_text": a.header_text.translation[0].text if a.header_text.translation else None,
-                "description_text": a.description_text.translation[0].text if a.description_text.translation else None,
-            })
-        except Exception:
-            result.append(str(a))
-    return success_response(result)
+def get_alerts(route_id: Optional[str] = Query(None), stop_id: Optional[str] = Query(None), active: bool = Query(False)):
+    index = gtfs_manager.rt_alert_index
+    return success_response(index.query(route_id=route_id, stop_id=stop_id, active_only=active))
+
+
+def _parse_floats(value: Optional[str], count: int, name: str):
+    """Parse a comma-separated list of `count` finite floats or raise 400."""
+    if value is None:
+        return None
+    try:
+        parts = tuple(float(p) for p in value.split(","))
+    except ValueError:
+        parts = ()
+    if len(parts) != count or not all(math.isfinite(p) for p in parts):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: expected {count} comma-separated numbers")
+    return parts
+
+
+def _check_lat_lon(lat: float, lon: float, name: str) -> None:
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: latitude must be within [-90, 90] and longitude within [-180, 180]")
+
+
+def _parse_bbox(value: Optional[str]):
+    """`min_lon,min_lat,max_lon,max_lat` with valid coordinates and min <= max, or raise 400."""
+    bbox = _parse_floats(value, 4, "bbox")
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        _check_lat_lon(min_lat, min_lon, "bbox")
+        _check_lat_lon(max_lat, max_lon, "bbox")
+        if min_lon > max_lon or min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="Invalid bbox: min_lon/min_lat must not exceed max_lon/max_lat")
+    return bbox
+
+
+def _parse_near(value: Optional[str]):
+    """`lat,lon` with valid coordinates, or raise 400."""
+    near = _parse_floats(value, 2, "near")
+    if near is not None:
+        _check_lat_lon(near[0], near[1], "near")
+    return near
 
 
 @router.get(
@@ -37,27 +72,82 @@ def get_alerts():
     description=(
         "Proporciona la posición y estado actual de vehículos en operación. "
         "Soporta filtros por `route_id` y `trip_id`. Los datos devueltos son "
-        "ligeros (lat/lon, bearing, velocidad y estado)."
+        "ligeros (lat/lon, bearing, velocidad y estado).\n\n"
+        "Filtros espaciales (índice en rejilla reconstruido en cada sondeo RT):\n"
+        "- `bbox` (string): `min_lon,min_lat,max_lon,max_lat`, sólo vehículos dentro del recuadro.\n"
+        "- `near` (string): `lat,lon`, vehículos a menos de `radius` metros, ordenados por distancia (`distance_m`).\n"
+        "- `radius` (float, opcional): radio en metros para `near` (por defecto 1000).\n\n"
+        "Respuestas delta: `meta.feed_timestamp` identifica el snapshot servido. Si se envía "
+        "`since=<feed_timestamp>` anterior, sólo se devuelven los vehículos actualizados desde entonces y "
+        "`meta.removed` lista los que han desaparecido (`meta.delta=true`). Si el snapshot del cliente es "
+        "demasiado antiguo se devuelve la lista completa (`meta.delta=false`).\n\n"
+        "Interpolación: con `interpolate=true` cada vehículo incluye `estimated` con la posición estimada "
+        "ahora mismo a partir del último fix RT, la forma (`shapes`) y el horario (`stop_times`) del viaje. "
+        "Para recibir posiciones periódicas sin sondear, usar `/realtime/vehicles/stream`.\n\n"
+        "Ejemplo:\n``GET /realtime/vehicles?bbox=-3.8,40.3,-3.6,40.5``"
+    ),
+)
+def get_vehicles(
+    route_id: Optional[str] = Query(None),
+    trip_id: Optional[str] = Query(None),
+    bbox: Optional[str] = Query(None),
+    near: Optional[str] = Query(None),
+    radius: float = Query(1000.0, gt=0, le=100000),
+    since: Optional[int] = Query(None),
+    interpolate: bool = Query(False),
+):
+    bbox_t = _parse_bbox(bbox)
+    near_t = _parse_near(near)
+    # read the published index once so every filter sees the same snapshot
+    index = gtfs_manager.rt_vehicle_index
+    out, meta = index.query(route_id=route_id, trip_id=trip_id, bbox=bbox_t, near=near_t, radius_m=radius, since=since)
+    if interpolate:
+        out = vehicle_estimator.interpolate(out)
+    return success_response(out, meta=meta)
+
+
+async def _vehicle_events(request, filters: dict, interval: float, interpolate: bool):
+    """Server-sent events with the (optionally interpolated) vehicles matching `filters`."""
+    while True:
+        if await request.is_disconnected():
+            break
+        out, meta = gtfs_manager.rt_vehicle_index.query(**filters)
+        if interpolate:
+            out = await asyncio.to_thread(vehicle_estimator.interpolate, out)
+        payload = json.dumps({"status": "ok", "data": out, "meta": meta}, ensure_ascii=False)
+        yield f"event: vehicles\ndata: {payload}\n\n"
+        await asyncio.sleep(interval)
+
+
+@router.get(
+    "/vehicles/stream",
+    summary="Stream de posiciones de vehículos (SSE)",
+    description=(
+        "Flujo `text/event-stream` que emite cada `interval` segundos un evento `vehicles` con el mismo "
+        "contenido que `/realtime/vehicles`. Por defecto las posiciones se interpolan entre sondeos RT "
+        "(`interpolate=true`), de modo que los mapas se mueven de forma suave sin consultar Renfe más a menudo. "
+        "Admite los filtros `route_id`, `trip_id`, `bbox`, `near` y `radius`."
     ),
 )
-def get_vehicles(route_id: Optional[str] = Query(None), trip_id: Optional[str] = Query(None)):
-    vehicles = gtfs_manager.get_rt_vehicles(route_id=route_id, trip_id=trip_id)
-    out = []
-    for v in vehicles:
-        try:
-            pos = v.position
-            out.append({
-                "trip_id": getattr(v.trip, "trip_id", None),
-                "route_id": getattr(v.trip, "route_id", None),
-                "latitude": pos.latitude if pos is not None else None,
-                "longitude": pos.longitude if pos is not None else None,
-                "bearing": pos.bearing if pos is not None else None,
-                "speed": pos.speed if pos is not None else None,
-                "current_status": v.current_status if hasattr(v, "current_status") else None,
-            })
-        except Exception:
-            out.append(str(v))
-    return success_response(out)
+async def stream_vehicles(
+    request: Request,
+    route_id: Optional[str] = Query(None),
+    trip_id: Optional[str] = Query(None),
+    bbox: Optional[str] = Query(None),
+    near: Optional[str] = Query(None),
+    radius: float = Query(1000.0, gt=0, le=100000),
+    interpolate: bool = Query(True),
+    interval: Optional[float] = Query(None, ge=1, le=300),
+):
+    filters = {
+        "route_id": route_id,
+        "trip_id": trip_id,
+        "bbox": _parse_bbox(bbox),
+        "near": _parse_near(near),
+        "radius_m": radius,
+    }
+    events = _vehicle_events(request, filters, interval or settings.RT_STREAM_INTERVAL, interpolate)
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @router.get(
@@ -65,20 +155,11 @@ def get_vehicles(route_id: Optional[str] = Query(None), trip_id: Optional[str] =
     summary="Trip updates en tiempo real",
     description=(
         "Actualizaciones en tiempo real sobre viajes: variaciones de horario, "
-        "cancelaciones y reprogramaciones. Se puede filtrar por `trip_id` o "
-        "`route_id`."
+        "cancelaciones y reprogramaciones. Se puede filtrar por `trip_id`, "
+        "`route_id` o `stop_id`. Cada `stop_time_updates` se devuelve decodificado "
+        "(`stop_id`, `stop_sequence`, retrasos y horas previstas en segundos epoch)."
     ),
 )
-def get_trip_updates(trip_id: Optional[str] = Query(None), route_id: Optional[str] = Query(None)):
-    updates = gtfs_manager.get_rt_trip_updates(trip_id=trip_id, route_id=route_id)
-    out = []
-    for u in updates:
-        try:
-            out.append({
-                "trip_id": getattr(u.trip, "trip_id", None),
-                "route_id": getattr(u.trip, "route_id", None),
-                "stop_time_updates": [st.SerializeToString().hex() for st in u.stop_time_update] if hasattr(u, "stop_time_update") else None,
-            })
-        except Exception:
-            out.append(str(u))
-    return success_response(out)
+def get_trip_updates(trip_id: Optional[str] = Query(None), route_id: Optional[str] = Query(None), stop_id: Optional[str] = Query(None)):
+    index = gtfs_manager.rt_trip_update_index
+    return success_response(index.query(trip_id=trip_id, route_id=route_id, stop_id=stop_id))
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.services.gtfs_service import get_routes, get_route
-from app.services.gtfs_service import get_route_stops
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from app.core.pagination import CursorError
+from app.core.shape_geometry import requested_tolerance
+from app.services.gtfs_service import get_routes, get_route, get_route_alerts
+from app.services.gtfs_service import get_route_stops_page, get_route_shape
 from app.schemas.route import Route
-from app.schemas.response import Envelope
+from app.schemas.response import Envelope, PagedEnvelope
 from app.utils.response import success_response
 
 router = APIRouter(prefix="/routes", tags=["Routes"])
@@ -31,7 +33,8 @@ def list_routes():
     response_model=Envelope[Route],
     description=(
         "Recupera los metadatos de una ruta concreta identificada por `route_id`. "
-        "Útil para obtener información detallada o para enlazar con `trips`.\n\n"
+        "Útil para obtener información detallada o para enlazar con `trips`. "
+        "Incluye en `alerts` las alertas en tiempo real vigentes que afectan a la ruta.\n\n"
         "Parámetros:\n- `route_id` (string): identificador de la ruta en el feed GTFS.\n\n"
         "Ejemplo:\n``GET /routes/40T0001C1``\n\n"
         "Respuestas de error:\n- `404 Not Found`: ruta no encontrada (Problem Details)."
@@ -43,18 +46,57 @@ def read_route(route_id: str):
     r = get_route(route_id)
     if not r:
         raise HTTPException(status_code=404, detail="Route not found")
+    r = dict(r, alerts=get_route_alerts(r.get("route_id", route_id)))
     return success_response(r)
 
 
 @router.get(
     "/{route_id}/stops",
     summary="Obtener paradas de una ruta",
-    response_model=Envelope[List[dict]],
+    response_model=PagedEnvelope[List[dict]],
     description=(
         "Devuelve las paradas asociadas a una ruta, ordenadas por `stop_sequence` y agrupadas "
-        "por `direction_id`. Útil para desplegar el recorrido de ida y vuelta."
+        "por `direction_id` (una fila por parada y `trip_id`). Útil para desplegar el recorrido de ida y vuelta.\n\n"
+        "Parámetros:\n- `limit` (int, opcional): tamaño de página (por defecto 1000).\n"
+        "- `cursor` (string, opcional): valor de `meta.next_cursor` de la página anterior."
     ),
+    responses={400: {"description": "Invalid cursor"}, 409: {"description": "Stale cursor"}},
 )
-def route_stops(route_id: str):
-    data = get_route_stops(route_id)
+def route_stops(route_id: str, limit: Optional[int] = 1000, cursor: Optional[str] = None):
+    try:
+        data, meta = get_route_stops_page(route_id, limit=max(1, limit or 1000), cursor=cursor)
+    except CursorError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return success_response(data, meta=meta)
+
+
+@router.get(
+    "/{route_id}/shape",
+    summary="Geometría de una ruta",
+    description=(
+        "Devuelve las formas (`shapes`) recorridas por los viajes de la ruta, de la más usada a la menos, "
+        "como polilíneas codificadas (algoritmo de Google, precisión 5). Cada forma se simplifica al "
+        "construir `gtfs.db` con Douglas-Peucker a varias tolerancias (`SHAPE_TOLERANCES_M`) y se guarda "
+        "como un blob: cada petición lee un blob por forma.\n\n"
+        "Parámetros:\n"
+        "- `zoom` (float, opcional): nivel de zoom del mapa; se usa la tolerancia precalculada más cercana "
+        "por debajo del tamaño de un píxel.\n"
+        "- `tolerance` (float, opcional): tolerancia en metros (tiene prioridad sobre `zoom`). Sin ninguno "
+        "de los dos se devuelve la forma completa.\n"
+        "- `format` (string, opcional): `polyline` (por defecto) o `geojson` (FeatureCollection de LineString).\n\n"
+        "Ejemplo:\n``GET /routes/40T0001C1/shape?zoom=12&format=geojson``"
+    ),
+    responses={400: {"description": "Invalid format"}, 404: {"description": "Route not found"}},
+)
+def route_shape(
+    route_id: str,
+    zoom: Optional[float] = Query(None, ge=0, le=24),
+    tolerance: Optional[float] = Query(None, ge=0),
+    format: str = Query("polyline"),
+):
+    if format not in ("polyline", "geojson"):
+        raise HTTPException(status_code=400, detail="format must be polyline or geojson")
+    data = get_route_shape(route_id, tolerance=requested_tolerance(zoom, tolerance), geojson=format == "geojson")
+    if data is None:
+        raise HTTPException(status_code=404, detail="Route not found")
     return success_response(data)
@@ -1,8 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from typing import List, Optional
-from app.services.gtfs_service import get_schedule
+from app.core.pagination import CursorError
+from app.services.gtfs_service import get_schedule_page
 from app.schemas.schedule import ScheduleEntry
-from app.schemas.response import Envelope
+from app.schemas.response import PagedEnvelope
 from app.utils.response import success_response
 
 router = APIRouter(prefix="/schedule", tags=["Schedule"])
@@ -11,19 +12,31 @@ router = APIRouter(prefix="/schedule", tags=["Schedule"])
 @router.get(
 	"/",
 	summary="Obtener horarios / schedule",
-	response_model=Envelope[List[ScheduleEntry]],
+	response_model=PagedEnvelope[List[ScheduleEntry]],
 	description=(
 		"Consulta los horarios combinando `stop_times`, `trips` y `routes`. "
 		"Soporta filtros por parada, por ruta y por fecha de servicio. Las fechas "
 		"deben proporcionarse en formato `YYYY-MM-DD`.\n\n"
-		"Parámetros opcionales:\n- `stop_id` (int): filtra por identificador de parada.\n- `route_id` (string): filtra por identificador de ruta.\n- `date` (string): fecha en formato `YYYY-MM-DD` para limitar a servicios activos.\n- `limit` (int): límite de resultados (por defecto 200).\n\n"
-		"Ejemplo:\n``GET /schedule/?stop_id=65000&date=2025-06-02``"
+		"Los resultados se ordenan por (`stop_id`, `departure_time`, `trip_id`, `stop_sequence`) y se "
+		"paginan por cursor: `meta.next_cursor` lleva a la página siguiente con los mismos filtros.\n\n"
+		"Parámetros opcionales:\n- `stop_id` (int): filtra por identificador de parada.\n- `route_id` (string): filtra por identificador de ruta.\n- `date` (string): fecha en formato `YYYY-MM-DD` para limitar a servicios activos.\n- `aggregate` (string): `station` para el horario de toda la estación de `stop_id` (todos sus andenes), ordenado por (`departure_time`, `stop_id`, `trip_id`, `stop_sequence`).\n- `limit` (int): tamaño de página (por defecto 200).\n- `cursor` (string): valor de `meta.next_cursor` de la página anterior.\n\n"
+		"Ejemplo:\n``GET /schedule/?stop_id=65000&date=2025-06-02`` o ``GET /schedule/?stop_id=65000&aggregate=station``\n\n"
+		"Respuestas de error:\n- `400 Bad Request`: cursor inválido o emitido para otros filtros; `aggregate` inválido o sin `stop_id`.\n"
+		"- `409 Conflict`: el feed GTFS cambió desde que se emitió el cursor."
 	),
+	responses={400: {"description": "Invalid cursor or aggregate"}, 409: {"description": "Stale cursor"}},
 )
-def list_schedule(stop_id: Optional[int] = None, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200):
+def list_schedule(stop_id: Optional[int] = None, route_id: Optional[str] = None, date: Optional[str] = None, limit: int = 200, cursor: Optional[str] = None, aggregate: Optional[str] = None):
 	"""Devuelve las entradas de horario filtradas por parámetros opcionales.
 
 	El parámetro `date` aplica la lógica de `calendar` y `calendar_dates` del feed.
 	"""
-	data = get_schedule(stop_id=stop_id, route_id=route_id, date=date, limit=limit)
-	return success_response(data)
+	if aggregate is not None and aggregate != "station":
+		raise HTTPException(status_code=400, detail="aggregate must be one of station")
+	if aggregate and stop_id is None:
+		raise HTTPException(status_code=400, detail="aggregate=station requires stop_id")
+	try:
+		data, meta = get_schedule_page(stop_id=stop_id, route_id=route_id, date=date, limit=max(1, limit or 200), cursor=cursor, station=aggregate == "station")
+	except CursorError as e:
+		raise HTTPException(status_code=e.status_code, detail=str(e))
+	return success_response(data, meta=meta)
@@ -1,30 +1,64 @@
-from fastapi import APIRouter, HTTPException
+import json
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-from app.services.gtfs_service import get_stops, get_stop
+from app.core.pagination import CursorError
+from app.services.gtfs_service import get_stops_page, get_stop, get_stop_alerts
 from app.schemas.stop import Stop
-from app.schemas.response import Envelope
-from app.utils.response import success_response
-from app.services.gtfs_service import search_stops, list_stop_names, get_upcoming_trains
-from app.schemas.upcoming import UpcomingTrains
+from app.schemas.response import Envelope, PagedEnvelope
+from app.utils.response import error_response, success_response
+from app.services.gtfs_service import search_stops, list_stop_names_page, get_upcoming_trains, iter_upcoming_trains, get_direct_departures
+from app.schemas.upcoming import MAX_BOARD_LIMIT, DirectDepartures, UpcomingBatchRequest, UpcomingTrains
+from app.utils.time_utils import parse_hhmmss_to_seconds
 
 router = APIRouter(prefix="/stops", tags=["Stops"])
 
+# stop_ids accepted by POST /stops/upcoming:batch
+MAX_BATCH_STOPS = 200
+# longest look-ahead of a departure board
+MAX_WINDOW_HOURS = 48
+# values of the `aggregate` parameter
+AGGREGATE_MODES = ("station",)
+
+
+def _check_board_params(current_time: Optional[str], hours: Optional[float]) -> None:
+	if current_time is not None and parse_hhmmss_to_seconds(current_time) is None:
+		raise HTTPException(status_code=400, detail="current_time must be HH:MM:SS")
+	if hours is not None and not 0 < hours <= MAX_WINDOW_HOURS:
+		raise HTTPException(status_code=400, detail=f"hours must be in (0, {MAX_WINDOW_HOURS}]")
+
+
+def _station_aggregate(aggregate: Optional[str]) -> bool:
+	"""True for `aggregate=station`; 400 for any other value."""
+	if aggregate is not None and aggregate not in AGGREGATE_MODES:
+		raise HTTPException(status_code=400, detail=f"aggregate must be one of {', '.join(AGGREGATE_MODES)}")
+	return aggregate == "station"
+
 
 @router.get(
 	"/",
 	summary="Listar paradas",
-	response_model=Envelope[List[Stop]],
+	response_model=PagedEnvelope[List[Stop]],
 	description=(
-		"Devuelve un listado de paradas disponibles en el feed GTFS. "
-		"Se admite paginación simple mediante el parámetro `limit`.\n\n"
-		"Parámetros:\n- `limit` (int, opcional): límite máximo de resultados a devolver (por defecto 200).\n\n"
-		"Ejemplo:\n``GET /stops/?limit=10``"
+		"Devuelve un listado de paradas disponibles en el feed GTFS, ordenado por `stop_id`. "
+		"Paginación por cursor: si hay más resultados, `meta.next_cursor` contiene el cursor "
+		"de la página siguiente.\n\n"
+		"Parámetros:\n- `limit` (int, opcional): tamaño de página (por defecto 200).\n"
+		"- `cursor` (string, opcional): valor de `meta.next_cursor` de la página anterior.\n\n"
+		"Ejemplo:\n``GET /stops/?limit=10``\n\n"
+		"Respuestas de error:\n- `400 Bad Request`: cursor inválido o de otra consulta.\n"
+		"- `409 Conflict`: el feed GTFS cambió desde que se emitió el cursor; reiniciar la paginación."
 	),
+	responses={400: {"description": "Invalid cursor"}, 409: {"description": "Stale cursor"}},
 )
-def list_stops(limit: Optional[int] = 200):
-	"""Lista paradas. Opcional `limit` para limitar resultados."""
-	data = get_stops(limit=limit)
-	return success_response(data)
+def list_stops(limit: Optional[int] = 200, cursor: Optional[str] = None):
+	"""Lista paradas por páginas (`limit` + `cursor`)."""
+	try:
+		data, meta = get_stops_page(limit=max(1, limit or 200), cursor=cursor)
+	except CursorError as e:
+		raise HTTPException(status_code=e.status_code, detail=str(e))
+	return success_response(data, meta=meta)
 
 
 @router.get(
@@ -45,16 +79,65 @@ def search_stops_endpoint(q: str, limit: Optional[int] = 100):
 @router.get(
 	"/names",
 	summary="Listar nombres de paradas",
-	response_model=Envelope[List[dict]],
+	response_model=PagedEnvelope[List[dict]],
 	description=(
-		"Devuelve una lista de pares `stop_id`/`stop_name` disponibles en el feed. "
-		"Útil para autocompletar o navegación en UIs.\n\n"
-		"Parámetros:\n- `limit` (int, opcional): máximo de entradas a devolver (por defecto 1000)."
+		"Devuelve una lista de pares `stop_id`/`stop_name` disponibles en el feed, ordenada por nombre. "
+		"Útil para autocompletar o navegación en UIs. Paginación por cursor (`meta.next_cursor`).\n\n"
+		"Parámetros:\n- `limit` (int, opcional): tamaño de página (por defecto 1000).\n"
+		"- `cursor` (string, opcional): valor de `meta.next_cursor` de la página anterior."
 	),
+	responses={400: {"description": "Invalid cursor"}, 409: {"description": "Stale cursor"}},
 )
-def list_names(limit: Optional[int] = 1000):
-	data = list_stop_names(limit=limit)
-	return success_response(data)
+def list_names(limit: Optional[int] = 1000, cursor: Optional[str] = None):
+	try:
+		data, meta = list_stop_names_page(limit=max(1, limit or 1000), cursor=cursor)
+	except CursorError as e:
+		raise HTTPException(status_code=e.status_code, detail=str(e))
+	return success_response(data, meta=meta)
+
+
+@router.post(
+	"/upcoming:batch",
+	summary="Próximos trenes en varias estaciones",
+	response_class=StreamingResponse,
+	description=(
+		"Devuelve los paneles de próximos trenes de varias paradas en una sola petición "
+		"(pantallas de estación, controladores de displays). Los servicios activos del día se "
+		"calculan una vez por lote y todas las paradas se leen con la misma conexión.\n\n"
+		"Cuerpo (JSON):\n"
+		"- `stop_ids` (lista de string): paradas a consultar (máximo 200, sin duplicados).\n"
+		"- `current_time` (string, opcional): hora en formato HH:MM:SS (por defecto: hora actual).\n"
+		"- `limit` (int, opcional): trenes por categoría y parada (por defecto 10, entre 1 y 200).\n"
+		"- `hours` (float, opcional): ventana de búsqueda en horas (por defecto `UPCOMING_WINDOW_HOURS`).\n"
+		"- `aggregate` (string, opcional): `station` para el panel de toda la estación de cada parada.\n\n"
+		"Respuesta: `application/x-ndjson`, una línea por parada en el orden pedido, enviada "
+		"en cuanto está lista: `{\"status\": \"ok\", \"data\": {...}}` con el mismo contenido que "
+		"`GET /stops/{stop_id}/upcoming`, o un Problem Details con `stop_id` si la parada no existe.\n\n"
+		"Ejemplo:\n``POST /stops/upcoming:batch`` con ``{\"stop_ids\": [\"17000\", \"18000\"], \"limit\": 5}``\n\n"
+		"Respuestas de error:\n- `400 Bad Request`: `stop_ids` vacío o con más de 200 paradas, "
+		"`current_time`, `hours` o `aggregate` inválidos."
+	),
+	responses={200: {"content": {"application/x-ndjson": {}}}, 400: {"description": "Invalid batch"}},
+)
+def upcoming_trains_batch(body: UpcomingBatchRequest):
+	"""Paneles de varias paradas en streaming NDJSON."""
+	stop_ids = list(dict.fromkeys(str(s) for s in body.stop_ids))
+	if not stop_ids:
+		raise HTTPException(status_code=400, detail="stop_ids must not be empty")
+	if len(stop_ids) > MAX_BATCH_STOPS:
+		raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_STOPS} stop_ids per batch")
+	_check_board_params(body.current_time, body.hours)
+	station = _station_aggregate(body.aggregate)
+
+	def lines():
+		for board in iter_upcoming_trains(stop_ids, current_time=body.current_time, limit=body.limit, hours=body.hours, station=station):
+			if board.get("stop_name"):
+				payload = success_response(UpcomingTrains.model_validate(board).model_dump())
+			else:
+				payload = dict(error_response(title="Stop not found", status=404, detail="Stop not found"), stop_id=board.get("stop_id"))
+			yield json.dumps(payload, ensure_ascii=False) + "\n"
+
+	return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @router.get(
@@ -63,7 +146,8 @@ def list_names(limit: Optional[int] = 1000):
 	response_model=Envelope[Stop],
 	description=(
 		"Recupera la información de una parada concreta identificada por su `stop_id`. "
-		"El `stop_id` se expresa como un entero y corresponde al identificador del feed GTFS.\n\n"
+		"El `stop_id` se expresa como un entero y corresponde al identificador del feed GTFS. "
+		"Incluye en `alerts` las alertas en tiempo real vigentes que afectan a la parada.\n\n"
 		"Parámetros:\n- `stop_id` (int): identificador numérico de la parada.\n\n"
 		"Ejemplo:\n``GET /stops/65000``\n\n"
 		"Respuestas de error:\n- `404 Not Found`: la parada no existe (detalle en formato Problem Details)."
@@ -74,6 +158,7 @@ def read_stop(stop_id: str):
 	s = get_stop(stop_id)
 	if not s:
 		raise HTTPException(status_code=404, detail="Stop not found")
+	s = dict(s, alerts=get_stop_alerts(s.get("stop_id", stop_id)))
 	return success_response(s)
 
 
@@ -82,12 +167,17 @@ def read_stop(stop_id: str):
 	summary="Próximos trenes en una estación",
 	response_model=Envelope[UpcomingTrains],
 	description=(
-		"Devuelve los próximos trenes que salen y llegan a una estación específica, "
-		"con el tiempo restante en minutos hasta la salida/llegada.\n\n"
+		"Devuelve los próximos trenes que salen y llegan a una estación específica dentro de las "
+		"próximas `hours` horas, con el tiempo restante en minutos hasta la salida/llegada. "
+		"Tiene en cuenta el día de servicio: después de medianoche aparecen los trenes del día "
+		"anterior con horas 24:xx/25:xx, y por la noche los primeros trenes del día siguiente.\n\n"
 		"Parámetros:\n"
 		"- `stop_id` (string): identificador de la parada.\n"
 		"- `current_time` (string, opcional): hora actual en formato HH:MM:SS (por defecto: hora actual del sistema).\n"
-		"- `limit` (int, opcional): número máximo de trenes a devolver por categoría (salidas/llegadas, por defecto 10).\n\n"
+		"- `limit` (int, opcional): número máximo de trenes a devolver por categoría (salidas/llegadas, por defecto 10, entre 1 y 200).\n"
+		"- `hours` (float, opcional): ventana de búsqueda en horas (por defecto `UPCOMING_WINDOW_HOURS`, 6; máximo 48).\n"
+		"- `aggregate` (string, opcional): `station` para el panel de toda la estación a la que pertenece la parada: "
+		"se combinan, en orden de hora, los trenes de todos sus andenes (`platforms`).\n\n"
 		"Respuesta:\n"
 		"- `stop_id`: ID de la parada\n"
 		"- `stop_name`: Nombre de la estación\n"
@@ -97,15 +187,54 @@ def read_stop(stop_id: str):
 		"Cada tren incluye:\n"
 		"- `route_short_name`: Línea (ej: 'C1', 'C2')\n"
 		"- `trip_headsign`: Destino del tren\n"
-		"- `scheduled_time`: Hora programada (HH:MM:SS)\n"
-		"- `minutes_until`: Minutos restantes hasta salida/llegada\n\n"
+		"- `scheduled_time`: Hora programada (HH:MM:SS del GTFS, puede ser >= 24:00:00)\n"
+		"- `service_date`: Día de servicio (YYYY-MM-DD) al que pertenece la hora\n"
+		"- `scheduled_at`: Fecha y hora local real de la salida/llegada\n"
+		"- `minutes_until`: Minutos restantes hasta salida/llegada\n"
+		"- `stop_id`: Andén (parada) en el que para el tren\n\n"
 		"Ejemplo:\n``GET /stops/04040/upcoming`` o ``GET /stops/04040/upcoming?current_time=14:30:00&limit=5``"
 	),
-	responses={404: {"description": "Stop not found"}},
+	responses={400: {"description": "Invalid current_time, hours or aggregate"}, 404: {"description": "Stop not found"}},
 )
-def get_upcoming_trains_endpoint(stop_id: str, current_time: Optional[str] = None, limit: Optional[int] = 10):
+def get_upcoming_trains_endpoint(stop_id: str, current_time: Optional[str] = None, limit: int = Query(10, ge=1, le=MAX_BOARD_LIMIT), hours: Optional[float] = None, aggregate: Optional[str] = None):
 	"""Obtiene los próximos trenes que salen y llegan a una estación con minutos restantes."""
-	data = get_upcoming_trains(stop_id=stop_id, current_time=current_time, limit=limit)
+	_check_board_params(current_time, hours)
+	station = _station_aggregate(aggregate)
+	data = get_upcoming_trains(stop_id=stop_id, current_time=current_time, limit=limit, hours=hours, station=station)
 	if not data.get('stop_name'):
 		raise HTTPException(status_code=404, detail="Stop not found")
 	return success_response(data)
+
+
+@router.get(
+	"/{from_stop_id}/to/{to_stop_id}/departures",
+	summary="Próximos trenes directos entre dos estaciones",
+	response_model=Envelope[DirectDepartures],
+	description=(
+		"Devuelve los próximos trenes que salen de `from_stop_id` y paran después en `to_stop_id` "
+		"sin transbordo, dentro de las próximas `hours` horas, con hora de salida, hora de llegada y "
+		"duración del trayecto. Igual que el panel de `/upcoming`, tiene en cuenta el día de servicio.\n\n"
+		"Las conexiones de cada estación de origen se calculan la primera vez que se consultan y se "
+		"guardan en memoria (`CONNECTIONS_CACHE_MAX_MB`) hasta que cambia el feed.\n\n"
+		"Parámetros:\n"
+		"- `from_stop_id` (string): parada de origen.\n"
+		"- `to_stop_id` (string): parada de destino.\n"
+		"- `current_time` (string, opcional): hora actual en formato HH:MM:SS (por defecto: hora actual del sistema).\n"
+		"- `limit` (int, opcional): número máximo de trenes (por defecto 10, entre 1 y 200).\n"
+		"- `hours` (float, opcional): ventana de búsqueda en horas (por defecto `UPCOMING_WINDOW_HOURS`, 6; máximo 48).\n"
+		"- `aggregate` (string, opcional): `station` para tomar como origen y destino las estaciones completas "
+		"(cualquier andén de cada una).\n\n"
+		"Cada tren incluye `departure_time`/`arrival_time` (GTFS), `departure_at`/`arrival_at` (fecha y hora "
+		"local), `duration_minutes`, `minutes_until` y los andenes `from_platform_id`/`to_platform_id`.\n\n"
+		"Ejemplo:\n``GET /stops/18000/to/17000/departures?limit=3``"
+	),
+	responses={400: {"description": "Invalid current_time, hours or aggregate"}, 404: {"description": "Stop not found"}},
+)
+def get_direct_departures_endpoint(from_stop_id: str, to_stop_id: str, current_time: Optional[str] = None, limit: int = Query(10, ge=1, le=MAX_BOARD_LIMIT), hours: Optional[float] = None, aggregate: Optional[str] = None):
+	"""Obtiene los próximos trenes directos de una estación a otra."""
+	_check_board_params(current_time, hours)
+	station = _station_aggregate(aggregate)
+	data = get_direct_departures(from_stop_id, to_stop_id, current_time=current_time, limit=limit, hours=hours, station=station)
+	if data is None:
+		raise HTTPException(status_code=404, detail="Stop not found")
+	return success_response(data)
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from app.core.vector_tiles import MEDIA_TYPE, valid_tile
+from app.services.gtfs_service import get_vector_tile
+
+router = APIRouter(prefix="/tiles", tags=["Tiles"])
+
+
+@router.get(
+	"/{z}/{x}/{y}.mvt",
+	summary="Tesela vectorial (MVT) de paradas, formas y vehículos",
+	response_class=Response,
+	description=(
+		"Devuelve una tesela Mapbox Vector Tile (protobuf, `application/vnd.mapbox-vector-tile`) en la "
+		"rejilla web mercator estándar, para que el mapa sólo descargue lo que hay en pantalla.\n\n"
+		"Capas:\n"
+		"- `stops` (puntos, desde el zoom `TILE_STOPS_MIN_ZOOM`, 9 por defecto): `stop_id`, `stop_name`.\n"
+		"- `shapes` (líneas): `shape_id`, `route_id`, `route_short_name`, `route_type`, `route_color`; "
+		"simplificadas a un píxel del zoom pedido con las tolerancias precalculadas de `/routes/{id}/shape`.\n"
+		"- `vehicles` (puntos): `vehicle_id`, `trip_id`, `route_id`, `bearing`, `current_status`, `timestamp`.\n\n"
+		"Las capas estáticas se proyectan una vez por generación del feed y las de vehículos se regeneran "
+		"tras cada sondeo RT; las teselas codificadas se guardan en una caché LRU acotada "
+		"(`TILE_CACHE_MAX_MB`). Una tesela sin datos es una respuesta vacía.\n\n"
+		"Ejemplo:\n``GET /tiles/12/2005/1544.mvt``"
+	),
+	responses={200: {"content": {MEDIA_TYPE: {}}}, 400: {"description": "Invalid tile coordinates"}},
+)
+def read_tile(z: int, x: int, y: int):
+	"""Obtiene una tesela vectorial con paradas, formas y vehículos."""
+	if not valid_tile(z, x, y):
+		raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+	return Response(content=get_vector_tile(z, x, y), media_type=MEDIA_TYPE)
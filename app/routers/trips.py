@@ -0,0 +1,67 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.core.shape_geometry import requested_tolerance
+from app.schemas.response import Envelope
+from app.schemas.trip import Trip
+from app.services.gtfs_service import get_trip, get_trip_shape
+from app.utils.response import success_response
+
+router = APIRouter(prefix="/trips", tags=["Trips"])
+
+
+@router.get(
+	"/{trip_id}",
+	summary="Detalle de un viaje",
+	response_model=Envelope[Trip],
+	description=(
+		"Devuelve un viaje completo: ruta, paradas en orden de `stop_sequence` con sus horas "
+		"programadas, la forma (`shape`, puntos `[lat, lon]`) y el retraso en tiempo real.\n\n"
+		"Las paradas se leen de `trip_stop_times`, una copia de `stop_times` agrupada por viaje "
+		"(clave primaria `(trip_id, stop_sequence)`, `WITHOUT ROWID`): cada viaje es una única "
+		"lectura por rango.\n\n"
+		"Tiempo real (último sondeo GTFS-RT):\n"
+		"- `realtime`: retraso actual (`delay`, segundos), estado y vehículo del TripUpdate, o `null`.\n"
+		"- `stop_times[].arrival_delay` / `departure_delay`: retraso previsto en cada parada; el de una "
+		"parada se propaga a las siguientes hasta la próxima actualización.\n"
+		"- `vehicle`: última posición del vehículo que realiza el viaje, si la hay.\n\n"
+		"Ejemplo:\n``GET /trips/4024V73001C1``\n\n"
+		"Respuestas de error:\n- `404 Not Found`: viaje no encontrado (Problem Details)."
+	),
+	responses={404: {"description": "Trip not found"}},
+)
+def read_trip(trip_id: str):
+	"""Obtiene las paradas, la forma y el retraso en tiempo real de un viaje."""
+	data = get_trip(trip_id)
+	if data is None:
+		raise HTTPException(status_code=404, detail="Trip not found")
+	return success_response(data)
+
+
+@router.get(
+	"/{trip_id}/shape",
+	summary="Geometría de un viaje",
+	description=(
+		"Devuelve la forma del viaje como polilínea codificada (precisión 5), precalculada al construir "
+		"`gtfs.db` a varias tolerancias Douglas-Peucker (`SHAPE_TOLERANCES_M`): una lectura de un blob.\n\n"
+		"Parámetros:\n"
+		"- `zoom` (float, opcional): nivel de zoom del mapa (tolerancia de un píxel).\n"
+		"- `tolerance` (float, opcional): tolerancia en metros; sin `zoom` ni `tolerance`, forma completa.\n"
+		"- `format` (string, opcional): `polyline` (por defecto) o `geojson` (Feature LineString).\n\n"
+		"`shape` es `null` si el viaje no tiene forma en el feed.\n\n"
+		"Ejemplo:\n``GET /trips/4024V73001C1/shape?tolerance=10``"
+	),
+	responses={400: {"description": "Invalid format"}, 404: {"description": "Trip not found"}},
+)
+def read_trip_shape(
+	trip_id: str,
+	zoom: Optional[float] = Query(None, ge=0, le=24),
+	tolerance: Optional[float] = Query(None, ge=0),
+	format: str = Query("polyline"),
+):
+	"""Obtiene la forma de un viaje simplificada para el nivel de zoom pedido."""
+	if format not in ("polyline", "geojson"):
+		raise HTTPException(status_code=400, detail="format must be polyline or geojson")
+	data = get_trip_shape(trip_id, tolerance=requested_tolerance(zoom, tolerance), geojson=format == "geojson")
+	if data is None:
+		raise HTTPException(status_code=404, detail="Trip not found")
+	return success_response(data)
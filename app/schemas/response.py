@@ -9,6 +9,19 @@ class Envelope(BaseModel, Generic[T]):
     data: Optional[T] = None
 
 
+class Page(BaseModel):
+    # pass `next_cursor` back as `cursor` to read the next page (null on the last one)
+    next_cursor: Optional[str] = None
+    generation: Optional[str] = None
+    limit: Optional[int] = None
+
+
+class PagedEnvelope(BaseModel, Generic[T]):
+    status: str
+    data: Optional[T] = None
+    meta: Optional[Page] = None
+
+
 class ListEnvelope(BaseModel):
     status: str
     data: List[dict]
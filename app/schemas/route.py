@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class Route(BaseModel):
@@ -7,3 +7,5 @@ class Route(BaseModel):
     route_short_name: Optional[str] = None
     route_long_name: Optional[str] = None
     route_type: Optional[int] = None
+    # active GTFS-RT alerts affecting this entity
+    alerts: List[dict] = []
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class Stop(BaseModel):
@@ -7,3 +7,5 @@ class Stop(BaseModel):
     stop_name: Optional[str] = None
     stop_lat: Optional[float] = None
     stop_lon: Optional[float] = None
+    # active GTFS-RT alerts affecting this entity
+    alerts: List[dict] = []
@@ -0,0 +1,43 @@
+"""Schemas para el detalle de un viaje."""
+from pydantic import BaseModel
+from typing import List, Optional
+
+
+class TripStopTime(BaseModel):
+    """Parada de un viaje, en orden de `stop_sequence`."""
+    stop_sequence: int
+    stop_id: str
+    stop_name: Optional[str] = None
+    stop_lat: Optional[float] = None
+    stop_lon: Optional[float] = None
+    arrival_time: Optional[str] = None  # HH:MM:SS (GTFS, may be >= 24:00:00)
+    departure_time: Optional[str] = None
+    # GTFS-RT prediction in seconds, propagated from the last StopTimeUpdate
+    arrival_delay: Optional[int] = None
+    departure_delay: Optional[int] = None
+    schedule_relationship: Optional[str] = None
+
+
+class TripRealtime(BaseModel):
+    """Estado en tiempo real del viaje (último TripUpdate recibido)."""
+    delay: Optional[int] = None  # seconds
+    schedule_relationship: Optional[str] = None
+    start_date: Optional[str] = None
+    vehicle_id: Optional[str] = None
+    timestamp: Optional[int] = None
+
+
+class Trip(BaseModel):
+    trip_id: str
+    route_id: Optional[str] = None
+    service_id: Optional[str] = None
+    trip_headsign: Optional[str] = None
+    direction_id: Optional[int] = None
+    shape_id: Optional[str] = None
+    route_short_name: Optional[str] = None
+    route_long_name: Optional[str] = None
+    route_type: Optional[int] = None
+    stop_times: List[TripStopTime] = []
+    shape: List[List[float]] = []  # [lat, lon] points in shape_pt_sequence order
+    realtime: Optional[TripRealtime] = None
+    vehicle: Optional[dict] = None
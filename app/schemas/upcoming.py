@@ -1,7 +1,10 @@
 """Schemas para próximos trenes."""
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
+# most trains per category a board (or direct departures list) returns
+MAX_BOARD_LIMIT = 200
+
 
 class UpcomingTrain(BaseModel):
     """Información de un tren próximo a salir o llegar."""
@@ -10,9 +13,12 @@ class UpcomingTrain(BaseModel):
     route_long_name: Optional[str] = None
     trip_headsign: Optional[str] = None
     direction_id: Optional[int] = None
-    scheduled_time: str  # HH:MM:SS format
+    scheduled_time: str  # HH:MM:SS format (GTFS, may be >= 24:00:00)
+    service_date: Optional[str] = None  # YYYY-MM-DD service day the time belongs to
+    scheduled_at: Optional[str] = None  # ISO local date-time of the call
     minutes_until: int  # Minutes until departure/arrival (negative if already passed)
     stop_sequence: int
+    stop_id: Optional[str] = None  # andén (parada) de la llamada
 
 
 class UpcomingTrains(BaseModel):
@@ -22,3 +28,40 @@ class UpcomingTrains(BaseModel):
     current_time: str  # HH:MM:SS format of query time
     departures: list[UpcomingTrain] = []  # Trenes que salen
     arrivals: list[UpcomingTrain] = []  # Trenes que llegan
+    platforms: Optional[list[str]] = None  # andenes agregados con aggregate=station
+
+
+class UpcomingBatchRequest(BaseModel):
+    """Petición de varios paneles de salidas/llegadas en una sola llamada."""
+    stop_ids: list[str]
+    current_time: Optional[str] = None  # HH:MM:SS, por defecto la hora actual
+    limit: int = Field(10, ge=1, le=MAX_BOARD_LIMIT)
+    hours: Optional[float] = None  # ventana de búsqueda, por defecto UPCOMING_WINDOW_HOURS
+    aggregate: Optional[str] = None  # "station": panel de toda la estación de cada parada
+
+
+class DirectDeparture(BaseModel):
+    """Tren directo (sin transbordo) entre dos estaciones."""
+    trip_id: str
+    route_id: Optional[str] = None
+    route_short_name: Optional[str] = None
+    trip_headsign: Optional[str] = None
+    service_date: str  # YYYY-MM-DD service day of the trip
+    departure_time: str  # HH:MM:SS en origen (GTFS, puede ser >= 24:00:00)
+    arrival_time: str  # HH:MM:SS en destino
+    departure_at: str  # ISO local date-time
+    arrival_at: str
+    duration_minutes: int
+    minutes_until: int
+    from_platform_id: Optional[str] = None  # andén de salida
+    to_platform_id: Optional[str] = None  # andén de llegada
+
+
+class DirectDepartures(BaseModel):
+    """Próximos trenes directos de una estación a otra."""
+    from_stop_id: str
+    from_stop_name: Optional[str] = None
+    to_stop_id: str
+    to_stop_name: Optional[str] = None
+    current_time: str
+    departures: list[DirectDeparture] = []
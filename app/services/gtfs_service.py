@@ -1,7 +1,10 @@
 import os
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from app.core import pagination
 from app.core.gtfs_manager import gtfs_manager
 from app.core.gtfs_sqlite import GTFSStore
+from app.core.service_analytics import service_analytics
+from app.core.vector_tiles import tile_service
 from app.config.settings import settings
 
 
@@ -15,19 +18,88 @@ def _zip_path() -> str:
     return os.path.join(dirpath, path)
 
 
+# startup progress, reported by /admin/gtfs/meta
+startup_status = {"mode": None, "ready": False, "startup_ms": None, "background_load": None}
+
+
+def gtfs_db_path() -> str:
+    return os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+
+
+def gtfs_db_valid(db_path: Optional[str] = None) -> bool:
+    """True when `gtfs.db` exists and has the core tables (i.e. can serve reads right away)."""
+    import sqlite3
+
+    db_path = db_path or gtfs_db_path()
+    if not os.path.exists(db_path):
+        return False
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            names = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        finally:
+            conn.close()
+    except Exception:
+        return False
+    return {"stops", "routes", "trips", "stop_times"} <= names
+
+
+def feed_file_hash() -> Optional[str]:
+    """sha256 of the GTFS zip on disk: the downloader's recorded `file_hash`, else hashed here."""
+    import hashlib
+    import json
+
+    zip_path = _zip_path()
+    try:
+        with open(f"{zip_path}.meta", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if isinstance(meta, dict) and meta.get("file_hash"):
+            return meta["file_hash"]
+    except Exception:
+        pass
+    if not os.path.exists(zip_path):
+        return None
+    try:
+        sha256 = hashlib.sha256()
+        with open(zip_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 64), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+    except Exception:
+        return None
+
+
+def _load_snapshot() -> bool:
+    """Load the in-memory tables from the Arrow snapshot if it matches the feed on disk."""
+    if not settings.GTFS_SNAPSHOT_ENABLED:
+        return False
+    try:
+        return gtfs_manager.load_snapshot(settings.GTFS_DATA_DIR or "data/gtfs", feed_file_hash())
+    except Exception:
+        import logging
+
+        logging.getLogger("cercanias").exception("Failed to load GTFS snapshot")
+        return False
+
+
 def load_if_present():
     """Intenta cargar GTFS desde directorio o ZIP si existe.
     
     Si AUTO_DOWNLOAD_GTFS está habilitado, no hace nada ya que el downloader
     se encarga de descargar, extraer y construir la BD automáticamente.
     
-    Prioridad: directorio fomento_transit -> ZIP
+    Prioridad: snapshot Arrow válido -> directorio fomento_transit -> ZIP
     Devuelve True si se cargó, False si no existe.
     """
     import logging
 
     logger = logging.getLogger("cercanias")
-    
+
+    # a snapshot built from the current feed loads in well under a second (memory-mapped)
+    if _load_snapshot():
+        logger.info("GTFS loaded from Arrow snapshot in %s", settings.GTFS_DATA_DIR or "data/gtfs")
+        return True
+
     # If auto-download is enabled, let the downloader handle everything
     if settings.AUTO_DOWNLOAD_GTFS:
         logger.info("AUTO_DOWNLOAD_GTFS is enabled, skipping manual load (downloader will handle it)")
@@ -73,6 +145,14 @@ def load_if_present():
                     logger.debug("Failed to build sqlite DB for GTFS", exc_info=True)
             except Exception:
                 pass
+            # the next start (and every other worker) maps the typed tables instead of parsing the zip
+            if settings.GTFS_SNAPSHOT_ENABLED:
+                try:
+                    from app.core.gtfs_snapshot import write_snapshot
+
+                    write_snapshot(gtfs_manager.data, db_dir, feed_file_hash())
+                except Exception:
+                    logger.debug("Failed to write GTFS snapshot", exc_info=True)
             return True
         except Exception as e:
             logger.exception(f"Failed to load GTFS from {zip_path}: {e}")
@@ -143,6 +223,16 @@ def get_stop(stop_id: str):
     return gtfs_manager.get_stop(stop_id)
 
 
+def get_stop_alerts(stop_id: str) -> List[dict]:
+    """Active GTFS-RT alerts informing the given stop (dict lookup on the per-poll alert index)."""
+    return gtfs_manager.rt_alert_index.for_stop(str(stop_id))
+
+
+def get_route_alerts(route_id: str) -> List[dict]:
+    """Active GTFS-RT alerts informing the given route."""
+    return gtfs_manager.rt_alert_index.for_route(str(route_id))
+
+
 def get_routes():
     # Prefer sqlite for routes
     db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
@@ -205,6 +295,7 @@ def get_route_stops(route_id: str):
                             'stop_name': srow.get('stop_name') if srow else None,
                             'stop_lat': srow.get('stop_lat') if srow else None,
                             'stop_lon': srow.get('stop_lon') if srow else None,
+                            'trip_id': row.get('trip_id'),
                         })
                     return out
                 except Exception:
@@ -225,12 +316,29 @@ def get_schedule(stop_id: Optional[str] = None, route_id: Optional[str] = None,
     return gtfs_manager.get_schedule(stop_id=stop_id, route_id=route_id, date=date, limit=limit)
 
 
-def get_upcoming_trains(stop_id: str, current_time: Optional[str] = None, limit: int = 10):
-    """Get upcoming departures and arrivals for a stop with minutes until departure/arrival."""
+def iter_upcoming_trains(stop_ids: List[str], current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False):
+    """Boards of several stops (whole stations with `station`) as a generator (one connection, active services computed once)."""
+    db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+    if os.path.exists(db_path):
+        yield from GTFSStore(db_path).iter_upcoming_trains(stop_ids, current_time=current_time, limit=limit, hours=hours, station=station)
+        return
+    # No fallback to manager for this specialized query
+    for stop_id in stop_ids:
+        yield {
+            'stop_id': stop_id,
+            'stop_name': None,
+            'current_time': current_time or '00:00:00',
+            'departures': [],
+            'arrivals': []
+        }
+
+
+def get_upcoming_trains(stop_id: str, current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False):
+    """Get upcoming departures and arrivals for a stop (or its whole station) with minutes until departure/arrival."""
     db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
     if os.path.exists(db_path):
         store = GTFSStore(db_path)
-        return store.get_upcoming_trains(stop_id=stop_id, current_time=current_time, limit=limit)
+        return store.get_upcoming_trains(stop_id=stop_id, current_time=current_time, limit=limit, hours=hours, station=station)
     # No fallback to manager for this specialized query
     return {
         'stop_id': stop_id,
@@ -239,3 +347,248 @@ def get_upcoming_trains(stop_id: str, current_time: Optional[str] = None, limit:
         'departures': [],
         'arrivals': []
     }
+
+
+def get_direct_departures(from_stop_id: str, to_stop_id: str, current_time: Optional[str] = None, limit: int = 10, hours: Optional[float] = None, station: bool = False):
+    """Next trains from one stop that later call at another (no change of train); None if a stop is unknown."""
+    db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+    if os.path.exists(db_path):
+        return GTFSStore(db_path).get_direct_departures(from_stop_id, to_stop_id, current_time=current_time, limit=limit, hours=hours, station=station)
+    # No fallback to manager for this specialized query
+    return None
+
+
+def _apply_trip_update(stop_times: List[dict], update: Optional[dict]) -> Optional[dict]:
+    """Annotate `stop_times` in place with predicted delays from a decoded TripUpdate.
+
+    As in GTFS-RT, a stop's delay carries over to the following stops until
+    another StopTimeUpdate replaces it; stops before the first update only get
+    the trip-level `delay`, when the feed sends one. Returns the `realtime`
+    summary of the trip, or None without an update.
+    """
+    for st in stop_times:
+        st.update(arrival_delay=None, departure_delay=None, schedule_relationship=None)
+    if not update:
+        return None
+    by_sequence = {u["stop_sequence"]: u for u in update.get("stop_time_updates", []) if u.get("stop_sequence") is not None}
+    by_stop = {u["stop_id"]: u for u in update.get("stop_time_updates", []) if u.get("stop_id")}
+    carried = update.get("delay")
+    current = None
+    for st in stop_times:
+        u = by_sequence.get(st.get("stop_sequence")) or by_stop.get(str(st.get("stop_id")))
+        if u is not None:
+            arrival = u.get("arrival_delay")
+            departure = u.get("departure_delay")
+            st["arrival_delay"] = arrival if arrival is not None else (departure if departure is not None else carried)
+            st["departure_delay"] = departure if departure is not None else st["arrival_delay"]
+            st["schedule_relationship"] = u.get("schedule_relationship")
+            carried = st["departure_delay"]
+            if current is None:
+                current = st["arrival_delay"]
+        else:
+            st["arrival_delay"] = st["departure_delay"] = carried
+    return {
+        "delay": update.get("delay") if update.get("delay") is not None else current,
+        "schedule_relationship": update.get("schedule_relationship"),
+        "start_date": update.get("start_date"),
+        "vehicle_id": update.get("vehicle_id"),
+        "timestamp": update.get("timestamp"),
+    }
+
+
+def get_trip(trip_id: str) -> Optional[dict]:
+    """Trip detail: ordered stop times, shape and the live delay from the last GTFS-RT poll."""
+    db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+    if not os.path.exists(db_path):
+        # No fallback to manager for this specialized query
+        return None
+    trip = GTFSStore(db_path).get_trip(trip_id)
+    if trip is None:
+        return None
+    trip["realtime"] = _apply_trip_update(trip["stop_times"], gtfs_manager.rt_trip_update_index.get(trip_id))
+    vehicles = gtfs_manager.rt_vehicle_index
+    rows = vehicles.by_trip.get(trip_id) or []
+    trip["vehicle"] = vehicles.records[rows[0]] if rows else None
+    return trip
+
+
+def get_route_shape(route_id: str, tolerance: float = 0.0, geojson: bool = False) -> Optional[dict]:
+    """Encoded polylines of a route's shapes (a GeoJSON FeatureCollection with `geojson`)."""
+    from app.core.shape_geometry import as_geojson
+
+    db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+    if not os.path.exists(db_path):
+        # No fallback to manager for this specialized query
+        return None
+    data = GTFSStore(db_path).get_route_shapes(route_id, tolerance=tolerance)
+    if data is None or not geojson:
+        return data
+    return {
+        "type": "FeatureCollection",
+        "features": [as_geojson(dict(shape, route_id=route_id)) for shape in data["shapes"]],
+    }
+
+
+def get_trip_shape(trip_id: str, tolerance: float = 0.0, geojson: bool = False) -> Optional[dict]:
+    """Encoded polyline of a trip's shape (a GeoJSON Feature with `geojson`)."""
+    from app.core.shape_geometry import as_geojson
+
+    db_path = os.path.join(settings.GTFS_DATA_DIR or "data", "gtfs.db")
+    if not os.path.exists(db_path):
+        return None
+    data = GTFSStore(db_path).get_trip_shape(trip_id, tolerance=tolerance)
+    if data is None or not geojson:
+        return data
+    if data["shape"] is None:
+        return {"type": "Feature", "geometry": None, "properties": {"trip_id": trip_id, "route_id": data["route_id"]}}
+    return as_geojson(dict(data["shape"], trip_id=trip_id, route_id=data["route_id"]))
+
+
+# keyset of each paginated listing (see app.core.pagination); must match the ORDER BY in GTFSStore
+def _stop_key(r):
+    return (r.get("stop_id"),)
+
+
+def _stop_name_key(r):
+    return (r.get("stop_name"), r.get("stop_id"))
+
+
+def _schedule_key(r):
+    departure = r["departure_secs"] if "departure_secs" in r else r.get("departure_time")
+    return (r.get("stop_id"), departure, r.get("trip_id"), r.get("stop_sequence"))
+
+
+def _station_schedule_key(r):
+    departure = r["departure_secs"] if "departure_secs" in r else r.get("departure_time")
+    return (departure, r.get("stop_id"), r.get("trip_id"), r.get("stop_sequence"))
+
+
+def _route_stop_key(r):
+    return (r.get("direction_id"), r.get("stop_sequence"), r.get("trip_id"))
+
+
+def feed_generation() -> str:
+    """Generation id pagination cursors are bound to: gtfs.db's, else the in-memory load's."""
+    import hashlib
+
+    generation = pagination.db_feed_generation(gtfs_db_path())
+    if generation:
+        return generation
+    marker = gtfs_manager.metadata.get("snapshot_hash") or gtfs_manager.metadata.get("last_reload_at") or ""
+    return hashlib.sha1(str(marker).encode("utf-8")).hexdigest()[:16]
+
+
+def _store_or_none() -> Optional[GTFSStore]:
+    db_path = gtfs_db_path()
+    return GTFSStore(db_path) if os.path.exists(db_path) else None
+
+
+def get_vector_tile(z: int, x: int, y: int) -> bytes:
+    """MVT bytes of one tile: static layers of the current gtfs.db plus live vehicles."""
+    store = _store_or_none()
+    generation = pagination.db_feed_generation(store.db_path) if store is not None else None
+    return tile_service.tile(z, x, y, store=store, generation=generation, vehicles=gtfs_manager.rt_vehicle_index)
+
+
+def _day_analytics(service_date):
+    """Cached headway / service span tables of `service_date` for the current gtfs.db (None without one)."""
+    store = _store_or_none()
+    if store is None:
+        # No fallback to manager for this specialized query
+        return None
+    return service_analytics.day(store, pagination.db_feed_generation(store.db_path) or "", service_date)
+
+
+def get_headways(service_date, route_id: Optional[str] = None, stop_id: Optional[str] = None, hour: Optional[int] = None) -> List[dict]:
+    """Calls and average headway per route, stop and hour of a service date."""
+    day = _day_analytics(service_date)
+    return day.headways(route_id=route_id, stop_id=stop_id, hour=hour) if day is not None else []
+
+
+def get_service_span(service_date, route_id: Optional[str] = None, stop_id: Optional[str] = None) -> List[dict]:
+    """First and last train per route and stop of a service date."""
+    day = _day_analytics(service_date)
+    return day.service_span(route_id=route_id, stop_id=stop_id) if day is not None else []
+
+
+def get_stops_page(limit: int = 200, cursor: Optional[str] = None) -> Tuple[List[dict], Dict]:
+    """A page of stops ordered by stop_id plus the `meta` block with `next_cursor`."""
+    def fetch(after, n):
+        store = _store_or_none()
+        if store is not None:
+            try:
+                return store.get_stops(limit=n, after=after)
+            except pagination.CursorError:
+                raise
+            except Exception:
+                pass
+        return pagination.rows_after(gtfs_manager.get_stops(), _stop_key, after, n)
+
+    return pagination.paginate("stops", {}, feed_generation(), cursor, limit, fetch, _stop_key)
+
+
+def list_stop_names_page(limit: int = 1000, cursor: Optional[str] = None) -> Tuple[List[dict], Dict]:
+    """A page of (stop_id, stop_name) ordered by stop_name, stop_id."""
+    def fetch(after, n):
+        store = _store_or_none()
+        if store is not None:
+            try:
+                return store.list_stop_names(limit=n, after=after)
+            except pagination.CursorError:
+                raise
+            except Exception:
+                pass
+        names = [{"stop_id": s.get("stop_id"), "stop_name": s.get("stop_name")} for s in gtfs_manager.get_stops()]
+        return pagination.rows_after(names, _stop_name_key, after, n)
+
+    return pagination.paginate("stops/names", {}, feed_generation(), cursor, limit, fetch, _stop_name_key)
+
+
+def get_schedule_page(stop_id: Optional[str] = None, route_id: Optional[str] = None, date: Optional[str] = None,
+                      limit: int = 200, cursor: Optional[str] = None, station: bool = False) -> Tuple[List[dict], Dict]:
+    """A page of schedule rows ordered by (stop_id, departure_time, trip_id, stop_sequence).
+
+    With `station` the rows are those of every platform of the stop's station,
+    ordered by (departure_time, stop_id, trip_id, stop_sequence). The filters
+    (stop, route, service date, aggregation) are part of the cursor scope.
+    """
+    filters = {"stop_id": stop_id, "route_id": route_id, "date": date}
+    key = _schedule_key
+    if station:
+        filters["aggregate"] = "station"
+        key = _station_schedule_key
+
+    def fetch(after, n):
+        store = _store_or_none()
+        if store is not None:
+            try:
+                if station:
+                    return store.get_station_schedule(stop_id=stop_id, route_id=route_id, date=date, limit=n, after=after)
+                return store.get_schedule(stop_id=stop_id, route_id=route_id, date=date, limit=n, after=after)
+            except pagination.CursorError:
+                raise
+            except Exception:
+                pass
+        if station:
+            rows = gtfs_manager.get_schedule(stop_id=stop_id, route_id=route_id, date=date, limit=None)
+            return pagination.rows_after(rows, key, after, n)
+        return gtfs_manager.get_schedule_page(stop_id=stop_id, route_id=route_id, date=date, after=after, limit=n)
+
+    return pagination.paginate("schedule", filters, feed_generation(), cursor, limit, fetch, key)
+
+
+def get_route_stops_page(route_id: str, limit: int = 1000, cursor: Optional[str] = None) -> Tuple[List[dict], Dict]:
+    """A page of a route's stop rows ordered by (direction_id, stop_sequence, trip_id)."""
+    def fetch(after, n):
+        store = _store_or_none()
+        if store is not None:
+            try:
+                return store.get_route_stops(route_id, limit=n, after=after)
+            except pagination.CursorError:
+                raise
+            except Exception:
+                pass
+        return pagination.rows_after(get_route_stops(route_id), _route_stop_key, after, n)
+
+    return pagination.paginate("routes/stops", {"route_id": route_id}, feed_generation(), cursor, limit, fetch, _route_stop_key)
+
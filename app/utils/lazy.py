@@ -0,0 +1,26 @@
+"""Deferred imports for heavy optional-at-startup dependencies (pandas, aiohttp, protobuf).
+
+`lazy_import("pandas")` returns a module object whose code only runs on the
+first attribute access, via `importlib.util.LazyLoader`. Importing the app (and
+answering health checks) therefore does not pay for libraries that only some
+code paths use.
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return `name` from `sys.modules`, or a lazily-executed module registered there."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
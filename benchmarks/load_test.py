@@ -0,0 +1,422 @@
+"""HTTP load test: replay a request log or a synthetic mix against the API.
+
+Targets:
+- in-process (default): the ASGI app through `httpx.ASGITransport`, one fresh
+  interpreter per configuration so settings and caches start clean;
+- `--url http://127.0.0.1:8000`: an already running server over a socket.
+
+Requests come from `--replay FILE` or from a synthetic mix weighted toward
+departure boards (`MIX`). A replay file may be JSON lines with `method`/`path`
+(and optional `body`) or plain access-log lines containing `GET /path ...`;
+unparseable lines are skipped and counted.
+
+In-process runs use `--data-dir` (a directory with `fomento_transit.zip` and
+optionally `gtfs.db`) or generate a synthetic feed (`--stop-times`). Each
+`--config` is a preset from `PRESETS` or `name:ENV=VALUE,ENV=VALUE`; the pseudo
+variable `BACKEND=pandas` serves from the in-memory tables (no `gtfs.db`).
+With several configurations the report includes throughput and p95 ratios
+against the first one.
+
+Usage:
+    python benchmarks/load_test.py --config sqlite --config pandas --requests 2000 --concurrency 16
+    python benchmarks/load_test.py --config sqlite --config cache-off --replay access.jsonl
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --requests 5000 --output run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.query_benchmark import summarize  # noqa: E402
+
+# template -> weight of the synthetic mix
+MIX = {
+    "/stops/{stop_id}/upcoming": 60,
+    "/stops/{stop_id}": 10,
+    "/schedule/": 10,
+    "/stops/search": 8,
+    "/routes/{route_id}/stops": 5,
+    "/realtime/vehicles": 5,
+    "/routes/": 2,
+}
+
+PRESETS = {
+    "sqlite": {},
+    "pandas": {"BACKEND": "pandas"},
+    "cache-off": {"SCHEDULE_CACHE_MAX_MB": "0", "SCHEDULE_PRECOMPUTE_ENABLED": "false"},
+    "profiler": {"QUERY_PROFILER_ENABLED": "true"},
+}
+
+_LOG_LINE_RE = re.compile(r"\b(GET|POST|PUT|PATCH|DELETE|HEAD)\s+(/\S*)")
+
+Request = Tuple[str, str, Optional[str], str]  # method, path, body, label
+
+
+def parse_config(spec: str) -> Tuple[str, Dict[str, str]]:
+    if spec in PRESETS:
+        return spec, dict(PRESETS[spec])
+    name, _, assignments = spec.partition(":")
+    env = {}
+    for item in filter(None, assignments.split(",")):
+        key, _, value = item.partition("=")
+        env[key.strip()] = value.strip()
+    return name or spec, env
+
+
+def read_replay(path: str) -> Tuple[List[Tuple[str, str, Optional[str]]], int]:
+    """(method, path, body) per usable line of a replay file, plus the number of skipped lines."""
+    out, skipped = [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                req_path = rec.get("path") or rec.get("url")
+                if isinstance(req_path, str) and req_path.startswith("/"):
+                    body = rec.get("body")
+                    out.append((str(rec.get("method") or "GET").upper(), req_path, json.dumps(body) if isinstance(body, (dict, list)) else body))
+                else:
+                    skipped += 1
+                continue
+            m = _LOG_LINE_RE.search(line)
+            if m:
+                out.append((m.group(1), m.group(2), None))
+            else:
+                skipped += 1
+    return out, skipped
+
+
+class RouteLabeler:
+    """Map a concrete path to the app's route template (`/stops/17000` -> `/stops/{stop_id}`)."""
+
+    def __init__(self, app=None):
+        self._routes = []
+        if app is not None:
+            self._collect(getattr(app, "routes", []), "")
+
+    def _collect(self, routes, prefix: str) -> None:
+        from starlette.routing import compile_path
+
+        for r in routes:
+            included = getattr(r, "original_router", None)
+            if included is not None:
+                # routers added with include_router are wrapped, not flattened, in recent FastAPI
+                context = getattr(r, "include_context", None)
+                self._collect(included.routes, prefix + (getattr(context, "prefix", "") or ""))
+            elif getattr(r, "path", None) and hasattr(r, "path_regex"):
+                template = prefix + r.path
+                self._routes.append((compile_path(template)[0], template))
+
+    def label(self, path: str) -> str:
+        bare = path.split("?", 1)[0]
+        for regex, template in self._routes:
+            if regex.match(bare):
+                return template
+        return bare
+
+
+def synthetic_requests(n: int, stop_ids: List[str], route_ids: List[str], names: List[str], seed: int = 42) -> List[Request]:
+    rng = random.Random(seed)
+    templates = list(MIX)
+    weights = [MIX[t] for t in templates]
+    today = date.today().isoformat()
+    out = []
+    for template in rng.choices(templates, weights=weights, k=n):
+        if template == "/stops/{stop_id}/upcoming":
+            path = f"/stops/{rng.choice(stop_ids)}/upcoming?current_time={rng.randint(5, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}:00&limit=10"
+        elif template == "/stops/{stop_id}":
+            path = f"/stops/{rng.choice(stop_ids)}"
+        elif template == "/schedule/":
+            path = f"/schedule/?stop_id={rng.choice(stop_ids)}&date={today}&limit=50"
+        elif template == "/stops/search":
+            path = f"/stops/search?q={rng.choice(names)}&limit=20"
+        elif template == "/routes/{route_id}/stops":
+            path = f"/routes/{rng.choice(route_ids)}/stops"
+        elif template == "/realtime/vehicles":
+            path = "/realtime/vehicles?limit=100"
+        else:
+            path = template
+        out.append(("GET", path, None, template))
+    return out
+
+
+async def drive(client, requests: List[Request], concurrency: int, headers: Dict[str, str]) -> Dict:
+    """Send `requests` with `concurrency` workers; per-label latency samples and status counts."""
+    samples: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    statuses: Dict[str, int] = {}
+    queue = iter(requests)
+
+    async def worker():
+        for method, path, body, label in queue:
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, content=body, headers=headers)
+                status = resp.status_code
+            except Exception:
+                status = 0
+            samples.setdefault(label, []).append((time.perf_counter() - start) * 1000.0)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 0 or status >= 500:
+                errors[label] = errors.get(label, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    endpoints = {}
+    for label, values in sorted(samples.items()):
+        endpoints[label] = dict(summarize(values), errors=errors.get(label, 0))
+    return {
+        "requests": len(requests),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(requests) / elapsed, 1) if elapsed else 0.0,
+        "status_counts": statuses,
+        "endpoints": endpoints,
+    }
+
+
+def _feed_ids(data_dir: str) -> Tuple[List[str], List[str], List[str]]:
+    """Stop ids, route ids and search terms from the feed in `data_dir`."""
+    import sqlite3
+
+    db_path = os.path.join(data_dir, "gtfs.db")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        stops = conn.execute("SELECT stop_id, stop_name FROM stops").fetchall()
+        routes = [r[0] for r in conn.execute("SELECT route_id FROM routes")]
+    finally:
+        conn.close()
+    names = sorted({str(n).split()[0][:4].lower() for _, n in stops if n})
+    return [str(s) for s, _ in stops], [str(r) for r in routes], names
+
+
+def prepare_data_dir(stop_times: int, seed: int) -> str:
+    """Synthetic feed written as `fomento_transit.zip` plus `gtfs.db` in a temp dir."""
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+    from app.core.load_gtfs import load_gtfs_from_zip
+    from benchmarks.synthetic_feed import generate_feed, vehicle_positions_payload, write_zip
+
+    data_dir = tempfile.mkdtemp(prefix="cercanias-load-")
+    feed = generate_feed(stop_times=stop_times, seed=seed)
+    zip_path = write_zip(feed, os.path.join(data_dir, "fomento_transit.zip"))
+    build_sqlite_from_dict(load_gtfs_from_zip(zip_path), os.path.join(data_dir, "gtfs.db"))
+    with open(os.path.join(data_dir, "vehicles.pb"), "wb") as f:
+        f.write(vehicle_positions_payload(feed, seed=seed))
+    return data_dir
+
+
+def _child_env(data_dir: str, env: Dict[str, str]) -> Dict[str, str]:
+    out = dict(
+        os.environ,
+        GTFS_DATA_DIR=data_dir,
+        AUTO_DOWNLOAD_GTFS="false",
+        GTFS_SNAPSHOT_ENABLED="false",
+        LOG_LEVEL="WARNING",
+        RT_ALERTS_URL="http://127.0.0.1:9/alerts.pb",
+        RT_VEHICLES_URL="http://127.0.0.1:9/vehicles.pb",
+        RT_TRIP_UPDATES_URL="http://127.0.0.1:9/trip_updates.pb",
+    )
+    out.update({k: v for k, v in env.items() if k != "BACKEND"})
+    return out
+
+
+def run_in_process(args) -> Dict:
+    """Child side of a configuration: load the data the way the config asks and drive the app."""
+    import httpx
+
+    source_dir = args.data_dir
+    backend = os.environ.get("LOADTEST_BACKEND", "sqlite")
+    stop_ids, route_ids, names = _feed_ids(source_dir)
+    if backend == "pandas":
+        # serve from the in-memory tables: a data dir without gtfs.db
+        data_dir = tempfile.mkdtemp(prefix="cercanias-load-pandas-")
+        shutil.copy(os.path.join(source_dir, "fomento_transit.zip"), data_dir)
+    else:
+        data_dir = source_dir
+    os.environ["GTFS_DATA_DIR"] = data_dir
+
+    from app.config.settings import settings
+
+    settings.GTFS_DATA_DIR = data_dir
+    from app import app
+    from app.core.gtfs_manager import gtfs_manager
+    from app.core.rt_fetcher import RTFetcher
+    from app.services import gtfs_service
+
+    load_start = time.perf_counter()
+    gtfs_manager.load(os.path.join(data_dir, "fomento_transit.zip"))
+    load_s = time.perf_counter() - load_start
+    gtfs_service.startup_status.update(mode="loadtest", ready=True)
+    vehicles = os.path.join(source_dir, "vehicles.pb")
+    if os.path.exists(vehicles):
+        fetcher = RTFetcher()
+        with open(vehicles, "rb") as f:
+            snapshot, _ = fetcher._decode("vehicles", f.read())
+        fetcher._publish("vehicles", snapshot)
+
+    labeler = RouteLabeler(app)
+    requests = build_requests(args, labeler, stop_ids, route_ids, names)
+    headers = {"X-API-Key": settings.API_KEY} if settings.API_KEY else {}
+
+    async def _go():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            if args.warmup:
+                await drive(client, requests[: args.warmup], args.concurrency, headers)
+            return await drive(client, requests, args.concurrency, headers)
+
+    result = asyncio.run(_go())
+    result["load_s"] = round(load_s, 3)
+    result["backend"] = backend
+    try:
+        gtfs_manager.stop_precompute()
+    except Exception:
+        pass
+    if data_dir != source_dir:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return result
+
+
+def build_requests(args, labeler: RouteLabeler, stop_ids, route_ids, names) -> List[Request]:
+    if args.replay:
+        replay, skipped = read_replay(args.replay)
+        if not replay:
+            raise SystemExit(f"No usable requests in {args.replay} ({skipped} lines skipped)")
+        reqs = [(m, p, b, labeler.label(p)) for m, p, b in replay]
+        # cycle the log up to --requests (0 = replay once)
+        n = args.requests or len(reqs)
+        return [reqs[i % len(reqs)] for i in range(n)]
+    return synthetic_requests(args.requests or 1000, stop_ids, route_ids, names, seed=args.seed)
+
+
+def run_remote(args) -> Dict:
+    import httpx
+
+    labeler = RouteLabeler()
+    try:
+        from app import app
+
+        labeler = RouteLabeler(app)
+    except Exception:
+        pass
+    headers = {"X-API-Key": args.api_key} if args.api_key else {}
+
+    async def _go():
+        async with httpx.AsyncClient(base_url=args.url, timeout=30.0) as client:
+            stop_ids, route_ids, names = ["0"], [""], ["a"]
+            if not args.replay:
+                r = await client.get("/stops/", params={"limit": 5000}, headers=headers)
+                stops = r.json().get("data") or []
+                stop_ids = [str(s["stop_id"]) for s in stops] or stop_ids
+                names = sorted({str(s.get("stop_name") or "a").split()[0][:4].lower() for s in stops}) or names
+                r = await client.get("/routes/", headers=headers)
+                route_ids = [str(x["route_id"]) for x in (r.json().get("data") or [])] or route_ids
+            requests = build_requests(args, labeler, stop_ids, route_ids, names)
+            if args.warmup:
+                await drive(client, requests[: args.warmup], args.concurrency, headers)
+            return await drive(client, requests, args.concurrency, headers)
+
+    result = asyncio.run(_go())
+    result["target"] = args.url
+    return result
+
+
+def compare(results: Dict[str, Dict]) -> Dict[str, Dict]:
+    """Throughput and per-endpoint p95 ratios of every configuration against the first."""
+    names = list(results)
+    if len(names) < 2:
+        return {}
+    base = results[names[0]]
+    out = {}
+    for name in names[1:]:
+        cur = results[name]
+        ratios = {"throughput": round(cur["throughput_rps"] / base["throughput_rps"], 3) if base["throughput_rps"] else None}
+        for label, stats in cur["endpoints"].items():
+            b = base["endpoints"].get(label)
+            if b and b["p95_ms"]:
+                ratios[label] = round(stats["p95_ms"] / b["p95_ms"], 3)
+        out[f"{name}/{names[0]}"] = ratios
+    return out
+
+
+def _forwarded_args(args) -> List[str]:
+    out = ["--requests", str(args.requests), "--concurrency", str(args.concurrency),
+           "--warmup", str(args.warmup), "--seed", str(args.seed)]
+    if args.replay:
+        out += ["--replay", os.path.abspath(args.replay)]
+    return out
+
+
+def main(argv: Optional[Iterable[str]] = None) -> Dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", action="append", default=[], help="preset (%s) or name:ENV=VAL,..." % ", ".join(PRESETS))
+    parser.add_argument("--url", help="load-test a running server instead of the in-process app")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="X-API-Key for --url")
+    parser.add_argument("--replay", help="request log to replay (JSON lines or access-log lines)")
+    parser.add_argument("--requests", type=int, default=1000, help="requests to send (replay: 0 = the log once)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=50, help="requests sent before measuring")
+    parser.add_argument("--data-dir", help="directory with fomento_transit.zip and gtfs.db (default: synthetic feed)")
+    parser.add_argument("--stop-times", type=int, default=200_000, help="size of the synthetic feed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(list(argv) if argv is not None else None)
+
+    if args.child:
+        print(json.dumps(run_in_process(args)))
+        return {}
+
+    if args.url:
+        result = {"mode": "socket", "results": {args.url: run_remote(args)}}
+    else:
+        own_dir = args.data_dir is None
+        data_dir = args.data_dir or prepare_data_dir(args.stop_times, args.seed)
+        results = {}
+        try:
+            for spec in args.config or ["sqlite"]:
+                name, env = parse_config(spec)
+                child_env = _child_env(data_dir, env)
+                child_env["LOADTEST_BACKEND"] = env.get("BACKEND", "sqlite")
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", "--data-dir", data_dir] + _forwarded_args(args),
+                    cwd=ROOT, env=child_env, capture_output=True, text=True,
+                )
+                if proc.returncode != 0:
+                    raise SystemExit(f"configuration {name!r} failed:\n{proc.stderr}")
+                results[name] = dict(json.loads(proc.stdout.strip().splitlines()[-1]), env=env)
+                print(f"{name:<12} {results[name]['throughput_rps']:>9.1f} req/s", file=sys.stderr)
+        finally:
+            if own_dir:
+                shutil.rmtree(data_dir, ignore_errors=True)
+        result = {"mode": "in-process", "concurrency": args.concurrency, "results": results, "compare": compare(results)}
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
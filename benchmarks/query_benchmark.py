@@ -0,0 +1,232 @@
+"""Benchmark of the core data paths against a synthetic national-scale feed.
+
+Runs fully offline. A feed with about `--stop-times` rows (default 2M, see
+`benchmarks/synthetic_feed.py`) is generated, written as a GTFS zip and then:
+
+One-shot phases (seconds):
+- `generate`, `write_zip`: building the synthetic input (not product code)
+- `load`: `load_gtfs_from_zip` (CSV parse + cleaning)
+- `build_db`: `build_sqlite_from_dict` (tables, indexes, ANALYZE)
+- `manager_load`: `GTFSManager.set_tables` (compaction, indexes)
+- `precompute_today`: building today's in-memory schedule
+
+Repeated operations (milliseconds; min/p50/p95/p99/mean over `--repeat` calls
+with random stops/routes/terms from a fixed seed):
+- `GTFSStore.get_upcoming_trains`, `get_schedule`, `search_stops`, `get_route_stops`
+- `GTFSManager.get_schedule` for a date and stop
+- GTFS-RT: decode + index build of TripUpdates / VehiclePositions payloads and
+  the route / bbox filters served by `/realtime/*`
+
+The result is JSON (`--output`); `--compare old.json` prints the p50 ratio of
+every operation against a previous run.
+
+Usage:
+    python benchmarks/query_benchmark.py [--stop-times 2000000] [--repeat 200]
+        [--seed 42] [--output results.json] [--compare baseline.json] [--workdir DIR]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import Callable, Dict, List, Sequence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_feed import (  # noqa: E402
+    DEFAULT_STOP_TIMES,
+    generate_feed,
+    trip_updates_payload,
+    vehicle_positions_payload,
+    write_zip,
+)
+
+
+def _percentile(sorted_values: Sequence[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    s = sorted(samples_ms)
+    return {
+        "n": len(s),
+        "min_ms": round(s[0], 3) if s else 0.0,
+        "p50_ms": round(_percentile(s, 0.50), 3),
+        "p95_ms": round(_percentile(s, 0.95), 3),
+        "p99_ms": round(_percentile(s, 0.99), 3),
+        "mean_ms": round(sum(s) / len(s), 3) if s else 0.0,
+    }
+
+
+def time_calls(fn: Callable, args_list: Sequence[tuple]) -> Dict[str, float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return summarize(samples)
+
+
+def _phase(phases: Dict[str, float], name: str, fn: Callable, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    phases[name] = round(time.perf_counter() - start, 3)
+    print(f"  {name:<18} {phases[name]:>9.3f}s", file=sys.stderr)
+    return out
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def run(stop_times: int = DEFAULT_STOP_TIMES, repeat: int = 200, seed: int = 42, workdir: str = None) -> Dict:
+    from app.config.settings import settings
+
+    # the benchmark times precompute explicitly; no background thread, no profiler
+    saved = (settings.SCHEDULE_PRECOMPUTE_ENABLED, settings.QUERY_PROFILER_ENABLED)
+    settings.SCHEDULE_PRECOMPUTE_ENABLED = False
+    settings.QUERY_PROFILER_ENABLED = False
+
+    from app.core.gtfs_manager import GTFSManager
+    from app.core.gtfs_sqlite import GTFSStore
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+    from app.core.load_gtfs import load_gtfs_from_zip
+    from app.core.rt_fetcher import RTFetcher
+
+    own_dir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="cercanias-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    zip_path = os.path.join(workdir, "fomento_transit.zip")
+    db_path = os.path.join(workdir, "gtfs.db")
+    for p in (db_path, db_path + "-wal", db_path + "-shm"):
+        if os.path.exists(p):
+            os.remove(p)
+
+    phases: Dict[str, float] = {}
+    print(f"Benchmark with ~{stop_times} stop_times in {workdir}", file=sys.stderr)
+    try:
+        feed = _phase(phases, "generate", generate_feed, stop_times, 12, 6, seed)
+        _phase(phases, "write_zip", write_zip, feed, zip_path)
+        tables = _phase(phases, "load", load_gtfs_from_zip, zip_path)
+        _phase(phases, "build_db", build_sqlite_from_dict, tables, db_path)
+        manager = GTFSManager()
+        _phase(phases, "manager_load", manager.set_tables, tables, zip_path)
+        today = date.today()
+        _phase(phases, "precompute_today", manager._schedule_for_date, today.strftime("%Y%m%d"))
+
+        rng = random.Random(seed)
+        stop_ids = feed["stops"]["stop_id"].tolist()
+        route_ids = feed["routes"]["route_id"].tolist()
+        words = sorted({n.split()[0][:4].lower() for n in feed["stops"]["stop_name"]})
+        today_iso = today.isoformat()
+        times = [f"{h:02d}:{m:02d}:00" for h in range(5, 24) for m in (0, 20, 40)]
+
+        store = GTFSStore(db_path)
+        ops: Dict[str, Dict[str, float]] = {}
+
+        def op(name: str, fn: Callable, args_list: Sequence[tuple]):
+            ops[name] = time_calls(fn, args_list)
+            print(f"  {name:<34} p50 {ops[name]['p50_ms']:>9.3f}ms  p95 {ops[name]['p95_ms']:>9.3f}ms", file=sys.stderr)
+
+        op("store.get_upcoming_trains", store.get_upcoming_trains,
+           [(rng.choice(stop_ids), rng.choice(times), 10) for _ in range(repeat)])
+        op("store.get_schedule", store.get_schedule,
+           [(rng.choice(stop_ids), None, today_iso, 200) for _ in range(repeat)])
+        op("store.search_stops", store.search_stops, [(rng.choice(words), 100) for _ in range(repeat)])
+        op("store.get_route_stops", store.get_route_stops, [(rng.choice(route_ids),) for _ in range(repeat)])
+        op("manager.get_schedule", manager.get_schedule,
+           [(rng.choice(stop_ids), None, today_iso, 200) for _ in range(repeat)])
+
+        fetcher = RTFetcher()
+        now = int(time.time())
+        tu_payload = trip_updates_payload(feed, seed=seed, timestamp=now)
+        vp_payload = vehicle_positions_payload(feed, seed=seed, timestamp=now)
+        rt_repeat = max(1, repeat // 10)
+        op("rt.decode_trip_updates", fetcher._decode, [("trip_updates", tu_payload)] * rt_repeat)
+        op("rt.decode_vehicles", fetcher._decode, [("vehicles", vp_payload)] * rt_repeat)
+        tu_index, _ = fetcher._decode("trip_updates", tu_payload)
+        vp_index, _ = fetcher._decode("vehicles", vp_payload)
+        op("rt.filter_trip_updates_route", tu_index.query, [(None, rng.choice(route_ids)) for _ in range(repeat)])
+        bboxes = []
+        for _ in range(repeat):
+            s = feed["stops"].iloc[rng.randrange(len(feed["stops"]))]
+            lat, lon = float(s["stop_lat"]), float(s["stop_lon"])
+            bboxes.append((None, None, (lon - 0.05, lat - 0.05, lon + 0.05, lat + 0.05)))
+        op("rt.filter_vehicles_bbox", vp_index.query, bboxes)
+
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "seed": seed,
+                "repeat": repeat,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "rows": {name: int(len(df)) for name, df in feed.items()},
+                "zip_bytes": os.path.getsize(zip_path),
+                "db_bytes": os.path.getsize(db_path),
+                "rt_payload_bytes": {"trip_updates": len(tu_payload), "vehicles": len(vp_payload)},
+            },
+            "phases_s": phases,
+            "operations": ops,
+        }
+    finally:
+        settings.SCHEDULE_PRECOMPUTE_ENABLED, settings.QUERY_PROFILER_ENABLED = saved
+        if own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current: Dict, baseline: Dict) -> Dict[str, float]:
+    """p50 ratio current/baseline per operation and phase (< 1.0 is faster)."""
+    out = {}
+    for name, stats in current.get("operations", {}).items():
+        base = baseline.get("operations", {}).get(name)
+        if base and base.get("p50_ms"):
+            out[name] = round(stats["p50_ms"] / base["p50_ms"], 3)
+    for name, secs in current.get("phases_s", {}).items():
+        base = baseline.get("phases_s", {}).get(name)
+        if base:
+            out[f"phase.{name}"] = round(secs / base, 3)
+    return out
+
+
+def main(argv=None) -> Dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stop-times", type=int, default=DEFAULT_STOP_TIMES)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="keep the generated zip and gtfs.db in this directory")
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--compare", help="previous JSON result to compare p50s against")
+    args = parser.parse_args(argv)
+
+    result = run(stop_times=args.stop_times, repeat=args.repeat, seed=args.seed, workdir=args.workdir)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            result["compare"] = {"baseline": args.compare, "p50_ratio": compare(result, json.load(f))}
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Import-time and startup benchmark.
+
+Every measurement runs in a fresh interpreter so module caches do not hide
+cold-start costs:
+
+- `import_package_ms`: `import app` (lazy package, no FastAPI app built yet)
+- `build_app_ms`: first access to `app.app` (executes `app.py`, routers, schemas)
+- `deferred_modules`: heavy modules still not executed after building the app
+- `startup_ms[mode]`: time until the lifespan hands over to the server, with a
+  local GTFS zip plus an existing `gtfs.db`, for `FAST_STARTUP` off and on
+
+Usage:
+    python benchmarks/startup_benchmark.py [--runs 5] [--output results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_SNIPPET = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.app
+t2 = time.perf_counter()
+heavy = ("pandas", "numpy", "aiohttp", "google.protobuf", "pyarrow")
+deferred = [m for m in heavy if m not in sys.modules or type(sys.modules[m]).__name__ == "_LazyModule"]
+print(json.dumps({"import_package_ms": (t1 - t0) * 1000, "build_app_ms": (t2 - t1) * 1000, "deferred": deferred}))
+"""
+
+_STARTUP_SNIPPET = r"""
+import json, time
+from fastapi.testclient import TestClient
+from app import app
+client = TestClient(app)
+t0 = time.perf_counter()
+client.__enter__()
+t1 = time.perf_counter()
+status = client.get("/stops/?limit=1").status_code
+client.__exit__(None, None, None)
+print(json.dumps({"startup_ms": (t1 - t0) * 1000, "first_request_status": status}))
+"""
+
+
+def _run(snippet: str, env: dict) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _write_feed(data_dir: str) -> None:
+    """Write a small feed as a zip plus a ready gtfs.db into `data_dir`."""
+    sys.path.insert(0, ROOT)
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+    from tests.conftest import make_feed
+
+    feed = make_feed()
+    with zipfile.ZipFile(os.path.join(data_dir, "fomento_transit.zip"), "w") as z:
+        for name, df in feed.items():
+            z.writestr(f"{name}.txt", df.to_csv(index=False))
+    build_sqlite_from_dict(feed, os.path.join(data_dir, "gtfs.db"))
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="cercanias-startup-")
+    _write_feed(data_dir)
+    base_env = dict(
+        os.environ,
+        GTFS_DATA_DIR=data_dir,
+        AUTO_DOWNLOAD_GTFS="false",
+        GTFS_SNAPSHOT_ENABLED="false",
+        LOG_LEVEL="WARNING",
+        # keep the RT pollers off the network
+        RT_ALERTS_URL="http://127.0.0.1:9/alerts.pb",
+        RT_VEHICLES_URL="http://127.0.0.1:9/vehicles.pb",
+        RT_TRIP_UPDATES_URL="http://127.0.0.1:9/trip_updates.pb",
+    )
+
+    imports = [_run(_IMPORT_SNIPPET, base_env) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "python": sys.version.split()[0],
+        "import_package_ms": round(statistics.median(r["import_package_ms"] for r in imports), 1),
+        "build_app_ms": round(statistics.median(r["build_app_ms"] for r in imports), 1),
+        "deferred_modules": imports[-1]["deferred"],
+        "startup_ms": {},
+    }
+    for mode, flag in (("blocking", "false"), ("fast", "true")):
+        runs = [_run(_STARTUP_SNIPPET, dict(base_env, FAST_STARTUP=flag)) for _ in range(args.runs)]
+        result["startup_ms"][mode] = round(statistics.median(r["startup_ms"] for r in runs), 1)
+        result.setdefault("first_request_status", {})[mode] = runs[-1]["first_request_status"]
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return result
+
+
+if __name__ == "__main__":
+    main()
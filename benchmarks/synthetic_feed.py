@@ -0,0 +1,246 @@
+"""Synthetic GTFS feed and GTFS-RT payloads at configurable scale.
+
+The national Cercanías feed has a dozen networks of radial lines sharing a few
+trunk stations, three service patterns (weekday/Saturday/Sunday) and trips
+from early morning until past midnight. `generate_feed` reproduces that shape
+with NumPy so that a ~2M-row `stop_times` is built in seconds and is identical
+for a given seed:
+
+- `networks` networks around distinct centres, `lines_per_network` lines each;
+- every line starts at its network hub and shares the first stations of its
+  network's trunk, then runs out along its own bearing;
+- trips run in both directions for services `LAB`, `SAB` and `FES`, spaced
+  evenly between 05:00 and 24:30 (times after midnight use 24:xx:xx);
+- one shape per line and direction.
+
+Ids look like Renfe's (numeric stop ids, `route_id` per network and line) so
+the numeric-tolerant lookups are exercised as in production.
+
+`trip_updates_payload` / `vehicle_positions_payload` encode GTFS-RT messages
+for a sample of the generated trips.
+"""
+import io
+import time
+import zipfile
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_STOP_TIMES = 2_000_000
+
+# (centre lat, centre lon) of the networks, roughly the real Cercanías cities
+NETWORK_CENTRES = [
+    (40.4168, -3.7038), (41.3874, 2.1686), (39.4699, -0.3763), (37.3891, -5.9845),
+    (43.2630, -2.9350), (43.3623, -8.4115), (36.7213, -4.4214), (43.4623, -3.8100),
+    (43.5322, -5.6611), (36.5298, -6.2926), (37.9922, -1.1307), (41.6488, -0.8891),
+]
+SERVICES = (("LAB", (1, 1, 1, 1, 1, 0, 0), 0.6), ("SAB", (0, 0, 0, 0, 0, 1, 0), 0.2), ("FES", (0, 0, 0, 0, 0, 0, 1), 0.2))
+STATION_WORDS = (
+    "Atocha", "Chamartin", "Sol", "Norte", "Sur", "Puerta", "Villa", "Parque", "Estacion", "Universidad",
+    "Hospital", "Aeropuerto", "Puerto", "Playa", "Centro", "Mercado", "Plaza", "Real", "Nueva", "Vieja",
+)
+FIRST_DEPARTURE = 5 * 3600
+LAST_DEPARTURE = 24 * 3600 + 30 * 60
+
+
+def _time_strings(max_secs: int) -> np.ndarray:
+    return np.array([f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(max_secs + 1)], dtype=object)
+
+
+def generate_feed(
+    stop_times: int = DEFAULT_STOP_TIMES,
+    networks: int = 12,
+    lines_per_network: int = 6,
+    seed: int = 42,
+) -> Dict[str, pd.DataFrame]:
+    """Return a feed as a dict of DataFrames with about `stop_times` rows in `stop_times`."""
+    rng = np.random.default_rng(seed)
+    networks = max(1, min(networks, len(NETWORK_CENTRES)))
+
+    stops_rows = []
+    routes_rows = []
+    # per line: (route_id, stop ids, lat, lon, seconds between stops)
+    lines = []
+    next_stop = 10000
+    for n in range(networks):
+        clat, clon = NETWORK_CENTRES[n]
+        trunk_len = 4
+        trunk_ids = []
+        for k in range(trunk_len):
+            trunk_ids.append(str(next_stop))
+            stops_rows.append((str(next_stop), f"{STATION_WORDS[k % len(STATION_WORDS)]} {n}-{k}", clat + 0.01 * k, clon))
+            next_stop += 1
+        for li in range(lines_per_network):
+            bearing = 2 * np.pi * li / lines_per_network + rng.uniform(-0.2, 0.2)
+            n_own = int(rng.integers(10, 36))
+            ids = list(trunk_ids[: int(rng.integers(1, trunk_len + 1))])
+            lat = [clat + 0.01 * k for k in range(len(ids))]
+            lon = [clon] * len(ids)
+            for k in range(1, n_own + 1):
+                dist = 0.018 * k
+                slat = clat + dist * np.cos(bearing)
+                slon = clon + dist * np.sin(bearing) / np.cos(np.radians(clat))
+                word = STATION_WORDS[int(rng.integers(0, len(STATION_WORDS)))]
+                stops_rows.append((str(next_stop), f"{word} {n}-{li}-{k}", round(slat, 6), round(slon, 6)))
+                ids.append(str(next_stop))
+                lat.append(slat)
+                lon.append(slon)
+                next_stop += 1
+            route_id = f"{n + 10}T{li:04d}C{li + 1}"
+            routes_rows.append((route_id, "1071", f"C{li + 1}", f"{ids[0]} - {ids[-1]}", 2))
+            hops = rng.integers(120, 300, size=len(ids) - 1)
+            lines.append((route_id, np.array(ids, dtype=object), np.array(lat), np.array(lon), hops))
+
+    # trips per (line, direction, service) so the total lands near `stop_times`
+    stops_per_trip_pair = sum(2 * len(ids) for _, ids, _, _, _ in lines)
+    trips_per_pattern = max(1, int(round(stop_times / stops_per_trip_pair)))
+
+    stop_names = {r[0]: r[1] for r in stops_rows}
+    max_secs = LAST_DEPARTURE + int(max(h.sum() + 30 * len(h) for *_, h in lines)) + 3600
+    time_str = _time_strings(max_secs)
+
+    trips_rows = []
+    shapes_parts = []
+    st_trip, st_arr, st_dep, st_stop, st_seq = [], [], [], [], []
+    for route_id, ids, lat, lon, hops in lines:
+        for direction in (0, 1):
+            d_ids = ids if direction == 0 else ids[::-1]
+            d_hops = hops if direction == 0 else hops[::-1]
+            d_lat = lat if direction == 0 else lat[::-1]
+            d_lon = lon if direction == 0 else lon[::-1]
+            shape_id = f"{route_id}_{direction}"
+            # 4 intermediate shape points per hop
+            f = np.linspace(0.0, 1.0, 5)[:-1]
+            s_lat = np.concatenate([d_lat[i] + (d_lat[i + 1] - d_lat[i]) * f for i in range(len(d_lat) - 1)] + [d_lat[-1:]])
+            s_lon = np.concatenate([d_lon[i] + (d_lon[i + 1] - d_lon[i]) * f for i in range(len(d_lon) - 1)] + [d_lon[-1:]])
+            shapes_parts.append(pd.DataFrame({
+                "shape_id": shape_id,
+                "shape_pt_lat": np.round(s_lat, 6),
+                "shape_pt_lon": np.round(s_lon, 6),
+                "shape_pt_sequence": np.arange(1, s_lat.size + 1),
+            }))
+            # arrival offsets from the first departure: hops plus 30 s dwell at each stop
+            arr_off = np.concatenate(([0], np.cumsum(d_hops + 30) - 30))
+            dep_off = arr_off + np.where(np.arange(arr_off.size) == 0, 0, 30)
+            dep_off[-1] = arr_off[-1]
+            for service_id, _, weight in SERVICES:
+                n_trips = max(1, int(round(trips_per_pattern * weight)))
+                starts = np.linspace(FIRST_DEPARTURE, LAST_DEPARTURE, n_trips).astype(np.int64)
+                starts += rng.integers(0, 60, size=n_trips)
+                trip_ids = np.array([f"{shape_id}_{service_id}_{i:04d}" for i in range(n_trips)], dtype=object)
+                headsign = stop_names[d_ids[-1]]
+                trips_rows.extend((route_id, service_id, t, headsign, direction, shape_id) for t in trip_ids)
+                k = d_ids.size
+                st_trip.append(np.repeat(trip_ids, k))
+                st_arr.append((starts[:, None] + arr_off[None, :]).ravel())
+                st_dep.append((starts[:, None] + dep_off[None, :]).ravel())
+                st_stop.append(np.tile(d_ids, n_trips))
+                st_seq.append(np.tile(np.arange(1, k + 1), n_trips))
+
+    arr = np.concatenate(st_arr)
+    dep = np.concatenate(st_dep)
+    stop_times_df = pd.DataFrame({
+        "trip_id": np.concatenate(st_trip),
+        "arrival_time": time_str[arr],
+        "departure_time": time_str[dep],
+        "stop_id": np.concatenate(st_stop),
+        "stop_sequence": np.concatenate(st_seq),
+    })
+
+    calendar = pd.DataFrame([
+        {"service_id": sid, "monday": d[0], "tuesday": d[1], "wednesday": d[2], "thursday": d[3], "friday": d[4],
+         "saturday": d[5], "sunday": d[6], "start_date": "20200101", "end_date": "20301231"}
+        for sid, d, _ in SERVICES
+    ])
+    # a handful of holidays: weekday service removed, Sunday service added
+    holidays = ["20250101", "20250106", "20250501", "20250815", "20251012", "20251208", "20251225"]
+    calendar_dates = pd.DataFrame(
+        [{"service_id": "LAB", "date": d, "exception_type": 2} for d in holidays]
+        + [{"service_id": "FES", "date": d, "exception_type": 1} for d in holidays]
+    )
+    return {
+        "agency": pd.DataFrame([{"agency_id": "1071", "agency_name": "Renfe Operadora", "agency_url": "https://www.renfe.com", "agency_timezone": "Europe/Madrid", "agency_lang": "ES"}]),
+        "stops": pd.DataFrame(stops_rows, columns=["stop_id", "stop_name", "stop_lat", "stop_lon"]).assign(
+            location_type=0, parent_station="", zone_id=lambda df: df["stop_id"].str[:3]
+        ),
+        "routes": pd.DataFrame(routes_rows, columns=["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"]),
+        "calendar": calendar,
+        "calendar_dates": calendar_dates,
+        "trips": pd.DataFrame(trips_rows, columns=["route_id", "service_id", "trip_id", "trip_headsign", "direction_id", "shape_id"]),
+        "stop_times": stop_times_df,
+        "shapes": pd.concat(shapes_parts, ignore_index=True),
+    }
+
+
+def write_zip(feed: Dict[str, pd.DataFrame], path: str) -> str:
+    """Write `feed` as a GTFS zip (one `<table>.txt` CSV per table)."""
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        for name, df in feed.items():
+            buf = io.StringIO()
+            df.to_csv(buf, index=False)
+            z.writestr(f"{name}.txt", buf.getvalue())
+    return path
+
+
+def _active_trips(feed: Dict[str, pd.DataFrame], n: int, seed: int):
+    trips = feed["trips"]
+    rng = np.random.default_rng(seed)
+    picked = trips.iloc[rng.choice(len(trips), size=min(n, len(trips)), replace=False)]
+    return picked.reset_index(drop=True)
+
+
+def trip_updates_payload(feed: Dict[str, pd.DataFrame], n_trips: int = 1500, updates_per_trip: int = 10,
+                         seed: int = 42, timestamp: Optional[int] = None) -> bytes:
+    """Serialized GTFS-RT TripUpdates for `n_trips` random trips of `feed`."""
+    from google.transit import gtfs_realtime_pb2
+
+    rng = np.random.default_rng(seed)
+    ts = int(timestamp or time.time())
+    st = feed["stop_times"]
+    first_row = st.groupby("trip_id", sort=False).head(1).set_index("trip_id")
+    msg = gtfs_realtime_pb2.FeedMessage()
+    msg.header.gtfs_realtime_version = "2.0"
+    msg.header.timestamp = ts
+    stops = feed["stops"]["stop_id"].to_numpy()
+    for i, trip in enumerate(_active_trips(feed, n_trips, seed).itertuples(index=False)):
+        ent = msg.entity.add()
+        ent.id = f"tu-{i}"
+        tu = ent.trip_update
+        tu.trip.trip_id = trip.trip_id
+        tu.trip.route_id = trip.route_id
+        delay = int(rng.integers(-60, 900))
+        tu.delay = delay
+        start_seq = int(first_row.loc[trip.trip_id, "stop_sequence"]) if trip.trip_id in first_row.index else 1
+        for k in range(updates_per_trip):
+            stu = tu.stop_time_update.add()
+            stu.stop_sequence = start_seq + k
+            stu.stop_id = str(stops[int(rng.integers(0, stops.size))])
+            stu.arrival.delay = delay
+            stu.departure.delay = delay
+    return msg.SerializeToString()
+
+
+def vehicle_positions_payload(feed: Dict[str, pd.DataFrame], n_vehicles: int = 1500, seed: int = 42,
+                              timestamp: Optional[int] = None) -> bytes:
+    """Serialized GTFS-RT VehiclePositions, one vehicle per random trip, placed on a stop of `feed`."""
+    from google.transit import gtfs_realtime_pb2
+
+    rng = np.random.default_rng(seed)
+    ts = int(timestamp or time.time())
+    stops = feed["stops"]
+    msg = gtfs_realtime_pb2.FeedMessage()
+    msg.header.gtfs_realtime_version = "2.0"
+    msg.header.timestamp = ts
+    for i, trip in enumerate(_active_trips(feed, n_vehicles, seed + 1).itertuples(index=False)):
+        s = stops.iloc[int(rng.integers(0, len(stops)))]
+        ent = msg.entity.add()
+        ent.id = f"vp-{i}"
+        v = ent.vehicle
+        v.trip.trip_id = trip.trip_id
+        v.trip.route_id = trip.route_id
+        v.vehicle.id = f"V{i:05d}"
+        v.position.latitude = float(s["stop_lat"]) + float(rng.normal(0, 0.002))
+        v.position.longitude = float(s["stop_lon"]) + float(rng.normal(0, 0.002))
+        v.timestamp = ts - int(rng.integers(0, 60))
+    return msg.SerializeToString()
@@ -7,8 +7,14 @@ Optional environment variables:
   HOST (default 0.0.0.0)
   PORT (default 8000)
   UVICORN_RELOAD (true/false)
+  WORKERS (default 1)
 
 This script ensures the configured `GTFS_DATA_DIR` exists before starting.
+
+With WORKERS > 1 this process becomes the supervisor: it downloads/rebuilds the
+GTFS data and polls GTFS-RT once (see `app/core/supervisor.py`), while the
+uvicorn worker processes run with PROCESS_ROLE=worker and only read the
+published state.
 """
 import os
 import sys
@@ -38,10 +44,27 @@ def main():
     reload_env = os.getenv("UVICORN_RELOAD", "false").lower()
     reload_flag = reload_env in ("1", "true", "yes", "on")
 
+    try:
+        workers = int(os.getenv("WORKERS", "1"))
+    except ValueError:
+        workers = 1
+
     # run uvicorn programmatically; use module string so reload works
     try:
         import uvicorn
 
+        if workers > 1 and not reload_flag:
+            from app.core.supervisor import supervisor
+
+            # the worker processes inherit the environment
+            os.environ["PROCESS_ROLE"] = "worker"
+            supervisor.start_in_thread()
+            try:
+                uvicorn.run("app:app", host=host, port=port, workers=workers)
+            finally:
+                supervisor.stop()
+            return
+
         uvicorn.run("app:app", host=host, port=port, reload=reload_flag)
     except Exception as e:
         print("Failed to start server:", e)
@@ -0,0 +1,118 @@
+"""Shared fixtures: a tiny synthetic GTFS feed built into a temporary `gtfs.db`, and a larger random one in memory."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.config.settings import settings
+
+
+def make_feed():
+    """Return a small GTFS feed as a dict of DataFrames.
+
+    Three stops on a north-south line, two routes, one trip crossing midnight
+    (T2, times >= 24:00:00) and a shape for route R1.
+    """
+    stops = pd.DataFrame([
+        {"stop_id": "S1", "stop_name": "Alpha", "stop_lat": 40.40, "stop_lon": -3.70},
+        {"stop_id": "S2", "stop_name": "Beta", "stop_lat": 40.41, "stop_lon": -3.70},
+        {"stop_id": "S3", "stop_name": "Gamma", "stop_lat": 40.42, "stop_lon": -3.70},
+    ])
+    routes = pd.DataFrame([
+        {"route_id": "R1", "agency_id": "A1", "route_short_name": "C1", "route_long_name": "Linea C1", "route_type": 2},
+        {"route_id": "R2", "agency_id": "A1", "route_short_name": "C3", "route_long_name": "Linea C3", "route_type": 2},
+    ])
+    calendar = pd.DataFrame([
+        {"service_id": "WK", "monday": 1, "tuesday": 1, "wednesday": 1, "thursday": 1, "friday": 1,
+         "saturday": 1, "sunday": 1, "start_date": "20200101", "end_date": "20301231"},
+    ])
+    trips = pd.DataFrame([
+        {"route_id": "R1", "service_id": "WK", "trip_id": "T1", "trip_headsign": "Gamma", "direction_id": 0, "shape_id": "SH1"},
+        {"route_id": "R1", "service_id": "WK", "trip_id": "T2", "trip_headsign": "Gamma", "direction_id": 0, "shape_id": "SH1"},
+        {"route_id": "R2", "service_id": "WK", "trip_id": "T3", "trip_headsign": "Alpha", "direction_id": 1, "shape_id": None},
+    ])
+    stop_times = pd.DataFrame([
+        {"trip_id": "T1", "arrival_time": "06:00:00", "departure_time": "06:00:00", "stop_id": "S1", "stop_sequence": 1},
+        {"trip_id": "T1", "arrival_time": "06:10:00", "departure_time": "06:11:00", "stop_id": "S2", "stop_sequence": 2},
+        {"trip_id": "T1", "arrival_time": "06:20:00", "departure_time": "06:20:00", "stop_id": "S3", "stop_sequence": 3},
+        {"trip_id": "T2", "arrival_time": "23:50:00", "departure_time": "23:50:00", "stop_id": "S1", "stop_sequence": 1},
+        {"trip_id": "T2", "arrival_time": "24:05:00", "departure_time": "24:06:00", "stop_id": "S2", "stop_sequence": 2},
+        {"trip_id": "T2", "arrival_time": "24:15:00", "departure_time": "24:15:00", "stop_id": "S3", "stop_sequence": 3},
+        {"trip_id": "T3", "arrival_time": "07:00:00", "departure_time": "07:00:00", "stop_id": "S3", "stop_sequence": 1},
+        {"trip_id": "T3", "arrival_time": "07:10:00", "departure_time": "07:10:00", "stop_id": "S2", "stop_sequence": 2},
+        {"trip_id": "T3", "arrival_time": "07:20:00", "departure_time": "07:20:00", "stop_id": "S1", "stop_sequence": 3},
+    ])
+    shapes = pd.DataFrame([
+        {"shape_id": "SH1", "shape_pt_lat": 40.40 + i * 0.0025, "shape_pt_lon": -3.70, "shape_pt_sequence": i + 1}
+        for i in range(9)
+    ])
+    agency = pd.DataFrame([{"agency_id": "A1", "agency_name": "Renfe", "agency_url": "https://renfe.com", "agency_timezone": "Europe/Madrid"}])
+    return {
+        "agency": agency,
+        "stops": stops,
+        "routes": routes,
+        "calendar": calendar,
+        "calendar_dates": pd.DataFrame(columns=["service_id", "date", "exception_type"]),
+        "trips": trips,
+        "stop_times": stop_times,
+        "shapes": shapes,
+    }
+
+
+def make_synthetic_manager(n_trips: int = 800, stops_per_trip: int = 12, n_services: int = 40):
+    """`GTFSManager` over a random (seeded) feed: `n_trips` trips on 25 routes and `n_services` calendars."""
+    from app.core.gtfs_manager import GTFSManager
+
+    rng = np.random.default_rng(42)
+    days = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+    calendar = pd.DataFrame({
+        "service_id": [f"SV{i}" for i in range(n_services)],
+        **{d: rng.integers(0, 2, n_services) for d in days},
+        "start_date": "20250101",
+        "end_date": "20261231",
+    })
+    calendar_dates = pd.DataFrame({
+        "service_id": [f"SV{i}" for i in range(0, n_services, 5)],
+        "date": "20250602",
+        "exception_type": [1 if i % 10 == 0 else 2 for i in range(0, n_services, 5)],
+    })
+    trips = pd.DataFrame({
+        "route_id": [f"R{i % 25}" for i in range(n_trips)],
+        "service_id": [f"SV{i % n_services}" for i in range(n_trips)],
+        "trip_id": [f"T{i}" for i in range(n_trips)],
+    })
+    trip_ids = np.repeat(trips["trip_id"].to_numpy(), stops_per_trip)
+    seq = np.tile(np.arange(1, stops_per_trip + 1), n_trips)
+    secs = np.repeat(rng.integers(5 * 3600, 22 * 3600, n_trips), stops_per_trip) + (seq - 1) * 240
+    times = [f"{s // 3600:02d}:{(s % 3600) // 60:02d}:{s % 60:02d}" for s in secs]
+    stop_times = pd.DataFrame({
+        "trip_id": trip_ids,
+        "arrival_time": times,
+        "departure_time": times,
+        "stop_id": [f"{(i * 7) % 300:05d}" for i in range(trip_ids.size)],
+        "stop_sequence": seq,
+    })
+    routes = pd.DataFrame({"route_id": [f"R{i}" for i in range(25)], "route_short_name": [f"C{i}" for i in range(25)]})
+
+    m = GTFSManager()
+    m.data = {
+        "stop_times": stop_times,
+        "trips": trips,
+        "routes": routes,
+        "calendar": calendar,
+        "calendar_dates": calendar_dates,
+    }
+    return m
+
+
+@pytest.fixture
+def gtfs_db(tmp_path, monkeypatch):
+    """Build the synthetic feed into `<tmp>/gtfs.db` and point `GTFS_DATA_DIR` at it."""
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+
+    db_path = os.path.join(str(tmp_path), "gtfs.db")
+    build_sqlite_from_dict(make_feed(), db_path + ".tmp")
+    os.replace(db_path + ".tmp", db_path)
+    monkeypatch.setattr(settings, "GTFS_DATA_DIR", str(tmp_path))
+    return db_path
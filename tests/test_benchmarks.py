@@ -0,0 +1,54 @@
+from benchmarks.query_benchmark import compare, run
+from benchmarks.synthetic_feed import generate_feed
+
+
+def test_synthetic_feed_scales_to_requested_stop_times():
+    feed = generate_feed(stop_times=20000, networks=2, lines_per_network=3, seed=1)
+    assert 15000 <= len(feed["stop_times"]) <= 25000
+    # every stop_time references a known trip and stop
+    assert set(feed["stop_times"]["trip_id"]) <= set(feed["trips"]["trip_id"])
+    assert set(feed["stop_times"]["stop_id"]) <= set(feed["stops"]["stop_id"])
+    # same seed, same feed
+    again = generate_feed(stop_times=20000, networks=2, lines_per_network=3, seed=1)
+    assert feed["stop_times"].equals(again["stop_times"])
+
+
+def test_benchmark_smoke(tmp_path):
+    result = run(stop_times=3000, repeat=2, seed=1, workdir=str(tmp_path))
+    assert {"load", "build_db", "manager_load"} <= set(result["phases_s"])
+    ops = result["operations"]
+    assert ops["store.get_upcoming_trains"]["n"] == 2
+    assert ops["rt.decode_trip_updates"]["p50_ms"] > 0
+    assert compare(result, result)["store.search_stops"] == 1.0
+
+
+def test_load_test_replay_parsing_and_labels(tmp_path):
+    from app import app
+    from benchmarks.load_test import RouteLabeler, compare as compare_runs, read_replay
+
+    log = tmp_path / "requests.log"
+    log.write_text(
+        '{"method": "get", "path": "/stops/S1/upcoming?limit=5"}\n'
+        '127.0.0.1 - - [19/Oct/2026:08:00:00] "GET /routes/R1/stops HTTP/1.1" 200 512\n'
+        "not a request\n",
+        encoding="utf-8",
+    )
+    reqs, skipped = read_replay(str(log))
+    assert reqs == [("GET", "/stops/S1/upcoming?limit=5", None), ("GET", "/routes/R1/stops", None)]
+    assert skipped == 1
+    labeler = RouteLabeler(app)
+    assert labeler.label(reqs[0][1]) == "/stops/{stop_id}/upcoming"
+    assert labeler.label(reqs[1][1]) == "/routes/{route_id}/stops"
+    base = {"throughput_rps": 100.0, "endpoints": {"/x": {"p95_ms": 10.0}}}
+    cur = {"throughput_rps": 50.0, "endpoints": {"/x": {"p95_ms": 20.0}}}
+    assert compare_runs({"a": base, "b": cur}) == {"b/a": {"throughput": 0.5, "/x": 2.0}}
+
+
+def test_load_test_smoke_in_process():
+    from benchmarks.load_test import main
+
+    result = main(["--stop-times", "3000", "--requests", "40", "--warmup", "0", "--concurrency", "4"])
+    run = result["results"]["sqlite"]
+    assert run["requests"] == 40
+    assert run["status_counts"] == {"200": 40}
+    assert "/stops/{stop_id}/upcoming" in run["endpoints"]
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from google.transit import gtfs_realtime_pb2
+from app import app
+from app.config.settings import settings
+from app.core.delay_history import DelayHistory, delay_history
+
+client = TestClient(app)
+
+
+def make_update(trip_id: str, route_id: str, stops, event_time: int, start_date: str = ""):
+    tu = gtfs_realtime_pb2.TripUpdate()
+    tu.trip.trip_id = trip_id
+    tu.trip.route_id = route_id
+    if start_date:
+        tu.trip.start_date = start_date
+    for stop_id, delay in stops:
+        stu = tu.stop_time_update.add()
+        stu.stop_id = stop_id
+        stu.arrival.delay = delay
+        stu.arrival.time = event_time + delay
+    return tu
+
+
+def test_record_logs_changes_and_keeps_one_sample_per_trip_stop(tmp_path):
+    history = DelayHistory(str(tmp_path / "delays.db"))
+    event = int(datetime.now().replace(hour=8, minute=15, second=0, microsecond=0).timestamp())
+
+    assert history.record([make_update("T1", "C3", [("S1", 60), ("S2", 400)], event)]) == 2
+    # identical poll: nothing new to log
+    assert history.record([make_update("T1", "C3", [("S1", 60), ("S2", 400)], event)]) == 0
+    # S1 delay changes -> one more log row, rollup sample count unchanged
+    assert history.record([make_update("T1", "C3", [("S1", 240), ("S2", 400)], event)]) == 1
+
+    by_stop = {r["stop"]: r for r in history.get_delay_stats(route_id="C3", group_by="stop")}
+    assert by_stop["S1"]["samples"] == 1
+    assert by_stop["S1"]["avg_delay_secs"] == 240
+    assert by_stop["S1"]["punctuality"] == 0
+    assert by_stop["S2"]["samples"] == 1
+
+    by_hour = history.get_delay_stats(route_id="C3", group_by="hour")
+    assert len(by_hour) == 1
+    assert by_hour[0]["hour"] == 8
+    assert by_hour[0]["samples"] == 2
+
+
+def test_latest_map_survives_restart(tmp_path):
+    path = str(tmp_path / "delays.db")
+    event = int(datetime.now().replace(hour=9, minute=0, second=0, microsecond=0).timestamp())
+    DelayHistory(path).record([make_update("T2", "C1", [("S1", 30)], event)])
+    # a fresh instance must not count the same trip/stop twice
+    restarted = DelayHistory(path)
+    assert restarted.record([make_update("T2", "C1", [("S1", 30)], event)]) == 0
+    assert restarted.get_delay_stats(route_id="C1")[0]["samples"] == 1
+
+
+def test_delay_change_after_restart_updates_the_same_hour(tmp_path):
+    path = str(tmp_path / "delays.db")
+    # scheduled at 08:00, observed (and predicted) later, with a delay large enough to cross the hour
+    event = int(datetime.now().replace(hour=8, minute=0, second=0, microsecond=0).timestamp())
+    DelayHistory(path).record([make_update("T4", "C2", [("S1", 300)], event)], observed_at=event - 2 * 3600)
+    restarted = DelayHistory(path)
+    assert restarted.record([make_update("T4", "C2", [("S1", 600)], event)], observed_at=event - 2 * 3600 + 60) == 1
+    by_hour = restarted.get_delay_stats(route_id="C2", group_by="hour")
+    assert [(r["hour"], r["samples"], r["max_delay_secs"], r["avg_delay_secs"]) for r in by_hour] == [(8, 1, 600, 600)]
+
+
+def test_past_midnight_calls_stay_on_their_service_date(tmp_path):
+    history = DelayHistory(str(tmp_path / "delays.db"))
+    service_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    # scheduled 24:30:00 on the previous service day, i.e. 00:30 today on the wall clock
+    event = int((service_day + timedelta(hours=24, minutes=30)).timestamp())
+    history.record([make_update("T5", "C4", [("S1", 120), ("S2", 60)], event, service_day.strftime("%Y%m%d"))])
+
+    rows = history.get_delay_stats(route_id="C4", group_by="date")
+    assert [(r["date"], r["samples"]) for r in rows] == [(service_day.strftime("%Y-%m-%d"), 2)]
+    assert [r["hour"] for r in history.get_delay_stats(route_id="C4", group_by="hour")] == [0]
+    conn = history._connect()
+    try:
+        tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'delay_log_%'")]
+    finally:
+        conn.close()
+    assert tables == [f"delay_log_{service_day:%Y%m%d}"]
+
+
+def test_resolves_missing_route_ids_from_the_app_gtfs_db(gtfs_db, tmp_path):
+    history = DelayHistory(str(tmp_path / "delays.db"))
+    event = int(datetime.now().replace(hour=6, minute=0, second=0, microsecond=0).timestamp())
+    history.record([make_update("T1", "", [("S1", 120)], event)])
+    assert [r["route"] for r in history.get_delay_stats(group_by="route")] == ["R1"]
+
+
+def test_analytics_endpoints_read_rollups(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "GTFS_DATA_DIR", str(tmp_path))
+    event = int(datetime.now().replace(hour=7, minute=30, second=0, microsecond=0).timestamp())
+    delay_history.record([make_update("T3", "C5", [("S9", 0)], event)])
+
+    r = client.get("/analytics/delays?route_id=C5&group_by=hour")
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert data[0]["hour"] == 7
+    assert data[0]["punctuality"] == 1
+
+    r = client.get("/analytics/delays/punctuality?route_id=C5")
+    assert r.status_code == 200
+    assert r.json()["data"][0]["samples"] == 1
+
+    r = client.get("/analytics/delays?group_by=nope")
+    assert r.status_code == 400
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.core.connections import connection_index
+
+client = TestClient(app)
+
+
+def _departures(origin, destination, **params):
+    r = client.get(f"/stops/{origin}/to/{destination}/departures", params=params)
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def test_direct_departures_follow_trip_order(gtfs_db):
+    data = _departures("S1", "S3", current_time="05:00:00", hours=20)
+    assert (data["from_stop_name"], data["to_stop_name"]) == ("Alpha", "Gamma")
+    deps = data["departures"]
+    # T3 runs S3 -> S1, so it never takes you from S1 to S3
+    assert [(d["trip_id"], d["departure_time"], d["arrival_time"], d["duration_minutes"]) for d in deps] == [
+        ("T1", "06:00:00", "06:20:00", 20),
+        ("T2", "23:50:00", "24:15:00", 25),
+    ]
+    assert deps[1]["arrival_at"] == f"{(date.today() + timedelta(days=1)).isoformat()}T00:15:00"
+    assert [d["trip_id"] for d in _departures("S3", "S1", current_time="05:00:00", hours=20)["departures"]] == ["T3"]
+    assert [d["minutes_until"] for d in _departures("S2", "S1", current_time="07:00:00", hours=1)["departures"]] == [10]
+
+
+def test_after_midnight_uses_yesterdays_service_and_the_cache(gtfs_db):
+    connection_index.clear()
+    before = connection_index.cache.stats()
+    deps = _departures("S2", "S3", current_time="00:01:00", hours=1)["departures"]
+    assert [(d["trip_id"], d["service_date"], d["minutes_until"]) for d in deps] == [
+        ("T2", (date.today() - timedelta(days=1)).isoformat(), 5),
+    ]
+    _departures("S2", "S1", current_time="00:01:00", hours=12)
+    after = connection_index.cache.stats()
+    # one build for origin S2, reused for the second destination
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+
+def test_unknown_stop_and_bad_params(gtfs_db):
+    assert client.get("/stops/S1/to/NOPE/departures").status_code == 404
+    assert client.get("/stops/S1/to/S3/departures", params={"hours": 0}).status_code == 400
+    assert client.get("/stops/S1/to/S2/departures", params={"limit": -1}).status_code == 422
+    assert _departures("S3", "S3", current_time="05:00:00")["departures"] == []
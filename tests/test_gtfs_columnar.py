@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from app.core.gtfs_columnar import PrimaryKeyIndex, compact_tables
+from app.core.gtfs_manager import GTFSManager
+from tests.conftest import make_feed, make_synthetic_manager
+
+
+def _key(r):
+    return (r["trip_id"], r["stop_sequence"], r["stop_id"], r["departure_time"])
+
+
+def test_compact_tables_types_and_seconds():
+    data = compact_tables(make_feed())
+    st = data["stop_times"]
+    assert str(st["trip_id"].dtype) == "category"
+    assert str(st["departure_time"].dtype) == "category"
+    assert st["stop_sequence"].dtype == np.int16
+    assert st["departure_secs"].dtype == np.int32
+    t2 = st[st["trip_id"] == "T2"]
+    assert t2["arrival_secs"].tolist() == [23 * 3600 + 50 * 60, 86400 + 300, 86400 + 900]
+    assert data["calendar"]["monday"].dtype == np.int8
+
+
+def test_compaction_shrinks_memory_and_keeps_results():
+    plain = make_synthetic_manager(n_trips=400)
+    compact = make_synthetic_manager(n_trips=400)
+    # pandas >= 3 stores the synthetic strings Arrow-backed, already compact: the
+    # bound is for object-dtype frames (see app.core.gtfs_columnar), the rest must shrink
+    arrow = make_synthetic_manager(n_trips=400).compact()
+    assert arrow["after_bytes"] < arrow["before_bytes"]
+    compact.data = {
+        name: df.astype({c: object for c in df.columns if pd.api.types.is_string_dtype(df[c])})
+        for name, df in compact.data.items()
+    }
+    stats = compact.compact()
+    # synthetic times are almost all distinct; real feeds repeat them far more
+    assert stats["after_bytes"] < stats["before_bytes"] * 0.75
+    assert compact.get_metadata()["memory"]["after_bytes"] == stats["after_bytes"]
+    for kwargs in ({"date": "2025-06-02"}, {"route_id": "R3"}, {"stop_id": "7", "date": "2025-06-03"}):
+        a = plain.get_schedule(limit=0, **kwargs)
+        b = compact.get_schedule(limit=0, **kwargs)
+        assert sorted(map(_key, a)) == sorted(map(_key, b))
+        assert all(isinstance(r["trip_id"], str) for r in b)
+
+
+def test_pk_lookups_are_numeric_tolerant():
+    idx = PrimaryKeyIndex(pd.Series(["04040", "ABC", "17000"]))
+    assert idx.position("04040") == 0
+    assert idx.position("4040") == 0
+    assert idx.position(" ABC ") == 1
+    assert idx.position(17000) == 2
+    assert idx.position("missing") is None
+
+    m = GTFSManager()
+    m.data = make_feed()
+    m.compact()
+    assert m.get_stop("S2")["stop_name"] == "Beta"
+    assert m.get_route("R2")["route_short_name"] == "C3"
+    assert m.get_trip("T3")["route_id"] == "R2"
+    assert m.get_stop("nope") is None
+    # a replaced frame gets a fresh index
+    m.data["routes"] = m.data["routes"].iloc[::-1].reset_index(drop=True)
+    assert m.get_route("R1")["route_short_name"] == "C1"
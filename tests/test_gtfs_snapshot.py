@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from app.config.settings import settings
+from app.core import gtfs_snapshot
+from app.core.gtfs_manager import GTFSManager
+from tests.conftest import make_feed
+
+HASH_A = "a" * 64
+HASH_B = "b" * 64
+
+
+def test_snapshot_roundtrip_is_validated_by_feed_hash(tmp_path):
+    data_dir = str(tmp_path)
+    assert gtfs_snapshot.write_snapshot(make_feed(), data_dir, HASH_A)
+    manifest = gtfs_snapshot.read_manifest(data_dir)
+    assert manifest["file_hash"] == HASH_A
+    assert manifest["tables"]["stop_times"]["rows"] == 9
+
+    tables = gtfs_snapshot.read_snapshot(data_dir, HASH_A)
+    st = tables["stop_times"]
+    # ids stay Arrow strings over the mapped file instead of per-process Categoricals
+    assert isinstance(st["trip_id"].dtype, pd.StringDtype) and st["trip_id"].dtype.storage == "pyarrow"
+    assert st["departure_secs"].tolist()[4] == 86400 + 360
+    assert gtfs_snapshot.read_snapshot(data_dir, HASH_B) is None
+    assert gtfs_snapshot.read_snapshot(data_dir, None) is None
+
+
+def test_new_snapshot_replaces_the_old_directory(tmp_path):
+    data_dir = str(tmp_path)
+    gtfs_snapshot.write_snapshot(make_feed(), data_dir, HASH_A)
+    gtfs_snapshot.write_snapshot(make_feed(), data_dir, HASH_B)
+    dirs = [d for d in os.listdir(data_dir) if d.startswith("snapshot-")]
+    assert dirs == [f"snapshot-{HASH_B[:16]}"]
+    assert gtfs_snapshot.read_snapshot(data_dir, HASH_A) is None
+    assert gtfs_snapshot.read_snapshot(data_dir, HASH_B) is not None
+
+
+def test_manager_loads_snapshot(tmp_path):
+    data_dir = str(tmp_path)
+    gtfs_snapshot.write_snapshot(make_feed(), data_dir, HASH_A)
+
+    plain = GTFSManager()
+    plain.set_tables(make_feed())
+    plain.stop_precompute()
+    m = GTFSManager()
+    assert m.load_snapshot(data_dir, HASH_B) is False
+    assert m.load_snapshot(data_dir, HASH_A) is True
+    m.stop_precompute()
+    assert m.get_metadata()["snapshot_hash"] == HASH_A
+    assert m.get_stop("S2")["stop_name"] == "Beta"
+    key = lambda r: (r["trip_id"], r["stop_sequence"], r["departure_time"])
+    a = plain.get_schedule(route_id="R1", date="2025-06-02", limit=0)
+    b = m.get_schedule(route_id="R1", date="2025-06-02", limit=0)
+    assert sorted(map(key, a)) == sorted(map(key, b)) and len(b) == 6
+
+
+def test_workers_do_not_precompute_the_schedule_window(tmp_path, monkeypatch):
+    gtfs_snapshot.write_snapshot(make_feed(), str(tmp_path), HASH_A)
+    monkeypatch.setattr(settings, "SCHEDULE_PRECOMPUTE_ENABLED", True)
+    monkeypatch.setattr(settings, "PROCESS_ROLE", "worker")
+    m = GTFSManager()
+    assert m.load_snapshot(str(tmp_path), HASH_A) is True
+    assert m._precompute_thread is None
+    # a request still builds (and caches) the date it needs
+    assert len(m.get_schedule(date="2025-06-02", limit=0)) == 9
+    assert m._schedules_by_date.keys() == ["20250602"]
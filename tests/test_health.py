@@ -0,0 +1,58 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.config.settings import settings
+from app.core.gtfs_manager import gtfs_manager
+from app.core.warmup import Warmup, warmup
+from app.services import gtfs_service
+
+client = TestClient(app)
+
+
+def test_healthz_is_public_and_alive():
+    r = client.get("/healthz")
+    assert r.status_code == 200
+    assert r.json()["data"]["alive"] is True
+
+
+def test_warmup_reads_hot_indexes(gtfs_db):
+    w = Warmup()
+    assert not w.is_warm(gtfs_db)
+    report = w.run(gtfs_db)
+    assert report["indexes"]["ix_stop_times_stop_trip"]["rows"] == 9
+    assert report["duration_ms"] >= 0
+    assert w.is_warm(gtfs_db)
+    # replacing the file is a new generation
+    os.replace(gtfs_db, gtfs_db + ".bak")
+    os.replace(gtfs_db + ".bak", gtfs_db)
+    os.utime(gtfs_db, ns=(1, 1))
+    assert not w.is_warm(gtfs_db)
+
+
+def test_readyz_waits_for_startup_and_warmup(gtfs_db, monkeypatch):
+    monkeypatch.setitem(gtfs_service.startup_status, "ready", False)
+    monkeypatch.setattr(warmup, "generation", None)
+    monkeypatch.setattr(gtfs_manager, "data", {})
+    r = client.get("/readyz")
+    assert r.status_code == 503
+    assert r.json()["data"]["checks"]["startup"] is False
+
+    monkeypatch.setitem(gtfs_service.startup_status, "ready", True)
+    warmup.run(gtfs_db)
+    r = client.get("/readyz")
+    assert r.status_code == 200
+    body = r.json()["data"]
+    assert body["ready"] is True
+    assert body["checks"]["database"] is True
+    assert body["warmup"]["duration_ms"] is not None
+
+
+def test_readyz_not_ready_without_data(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "GTFS_DATA_DIR", str(tmp_path))
+    monkeypatch.setitem(gtfs_service.startup_status, "ready", True)
+    monkeypatch.setattr(gtfs_manager, "data", {})
+    r = client.get("/readyz")
+    assert r.status_code == 503
+    assert r.json()["data"]["checks"]["database"] is False
@@ -0,0 +1,52 @@
+import threading
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.core import metrics
+from app.core.gtfs_sqlite import GTFSStore
+
+client = TestClient(app)
+
+
+def test_histogram_merges_thread_shards():
+    h = metrics.Histogram("test_latency_seconds", "test", ("op",), buckets=(0.01, 0.1))
+
+    def work():
+        for _ in range(100):
+            h.observe(0.05, "read")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    h.observe(0.005, "read")
+    h.observe(5.0, "read")
+
+    snap = h.snapshot("read")
+    assert snap["count"] == 402
+    lines = list(h.samples())
+    assert 'test_latency_seconds_bucket{op="read",le="0.01"} 1' in lines
+    assert 'test_latency_seconds_bucket{op="read",le="0.1"} 401' in lines
+    assert 'test_latency_seconds_bucket{op="read",le="+Inf"} 402' in lines
+    assert 'test_latency_seconds_count{op="read"} 402' in lines
+
+
+def test_store_methods_are_timed(gtfs_db):
+    before = metrics.DB_QUERY_SECONDS.snapshot("get_stop")["count"]
+    GTFSStore(gtfs_db).get_stop("S1")
+    assert metrics.DB_QUERY_SECONDS.snapshot("get_stop")["count"] == before + 1
+
+
+def test_metrics_endpoint_labels_by_route_template(gtfs_db):
+    client.get("/stops/S1")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+    assert "# TYPE cercanias_http_request_duration_seconds histogram" in body
+    assert 'route="/stops/{stop_id}"' in body
+    assert 'route="/stops/S1"' not in body
+    assert 'cercanias_db_query_duration_seconds_count{method="get_stop"}' in body
+    assert 'cercanias_cache_hits_total{cache="schedule_by_date"}' in body
@@ -0,0 +1,133 @@
+import os
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.config.settings import settings
+from app.core import pagination
+from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+from app.core.query_profiler import profiler
+from app.services import gtfs_service
+from tests.conftest import make_feed
+
+client = TestClient(app)
+
+
+def test_cursor_roundtrip_scope_and_generation():
+    scope = pagination.scope_of("schedule", stop_id="S1", date="2025-06-02")
+    token = pagination.encode_cursor("gen1", scope, ["S1", "06:00:00", "T1", 1])
+    assert pagination.decode_cursor(token, "gen1", scope) == ["S1", "06:00:00", "T1", 1]
+    with pytest.raises(pagination.StaleCursorError):
+        pagination.decode_cursor(token, "gen2", scope)
+    other = pagination.scope_of("schedule", stop_id="S2", date="2025-06-02")
+    with pytest.raises(pagination.CursorError) as exc:
+        pagination.decode_cursor(token, "gen1", other)
+    assert exc.value.status_code == 400
+    with pytest.raises(pagination.CursorError):
+        pagination.decode_cursor("not-a-cursor", "gen1", scope)
+
+
+def test_keyset_clause_orders_nulls_first():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (a TEXT, b TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?, ?)", [("x", None), ("x", "1"), ("x", "2"), ("y", None), (None, "0")])
+    ordered = conn.execute("SELECT a, b FROM t ORDER BY a, b").fetchall()
+    for i, key in enumerate(ordered):
+        clause, params = pagination.keyset_clause(["a", "b"], list(key))
+        rest = conn.execute(f"SELECT a, b FROM t WHERE {clause} ORDER BY a, b", params).fetchall()
+        assert rest == ordered[i + 1:]
+        # the in-memory fallback agrees with SQLite
+        rows = [{"a": a, "b": b} for a, b in ordered]
+        assert [(r["a"], r["b"]) for r in pagination.rows_after(rows, lambda r: (r["a"], r["b"]), key, 10)] == ordered[i + 1:]
+
+
+def _pages(path, **params):
+    items, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        r = client.get(path, params=query)
+        assert r.status_code == 200, r.text
+        body = r.json()
+        items.extend(body["data"])
+        pages += 1
+        cursor = body["meta"]["next_cursor"]
+        if not cursor:
+            return items, pages
+
+
+def test_stops_and_names_pages(gtfs_db):
+    stops, pages = _pages("/stops/", limit=2)
+    assert [s["stop_id"] for s in stops] == ["S1", "S2", "S3"] and pages == 2
+    names, _ = _pages("/stops/names", limit=1)
+    assert [n["stop_name"] for n in names] == ["Alpha", "Beta", "Gamma"]
+    routes, _ = _pages("/routes/R1/stops", limit=4)
+    assert len(routes) == 6
+    assert [(r["direction_id"], r["stop_sequence"], r["trip_id"]) for r in routes] == sorted(
+        (r["direction_id"], r["stop_sequence"], r["trip_id"]) for r in routes
+    )
+
+
+def test_schedule_pages_cover_the_full_result(gtfs_db):
+    full, meta = gtfs_service.get_schedule_page(date="2025-06-02", limit=100)
+    assert meta["next_cursor"] is None and len(full) == 9
+    seen, cursor = [], None
+    while True:
+        rows, meta = gtfs_service.get_schedule_page(date="2025-06-02", limit=4, cursor=cursor)
+        seen.extend(rows)
+        cursor = meta["next_cursor"]
+        if not cursor:
+            break
+    assert seen == full
+    assert [r["departure_time"] for r in full if r["stop_id"] == "S2"] == ["06:11:00", "07:10:00", "24:06:00"]
+    # a cursor belongs to its filters
+    _, meta = gtfs_service.get_schedule_page(date="2025-06-02", limit=4)
+    with pytest.raises(pagination.CursorError):
+        gtfs_service.get_schedule_page(date="2025-06-03", limit=4, cursor=meta["next_cursor"])
+
+
+def test_cursor_from_previous_feed_is_rejected(gtfs_db):
+    first = client.get("/stops/", params={"limit": 1}).json()["meta"]
+    # rebuilding gtfs.db gives it a new generation
+    build_sqlite_from_dict(make_feed(), gtfs_db + ".tmp")
+    os.replace(gtfs_db + ".tmp", gtfs_db)
+    r = client.get("/stops/", params={"limit": 1, "cursor": first["next_cursor"]})
+    assert r.status_code == 409
+    assert client.get("/stops/", params={"cursor": "bogus"}).status_code == 400
+
+
+def test_stop_schedule_pages_are_index_ranges(gtfs_db, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_PROFILER_ENABLED", True)
+    profiler.reset()
+    seen, cursor = [], None
+    while True:
+        rows, meta = gtfs_service.get_schedule_page(stop_id="S2", date="2025-06-02", limit=1, cursor=cursor)
+        seen.extend(r["departure_time"] for r in rows)
+        cursor = meta["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["06:11:00", "07:10:00", "24:06:00"]
+    # later pages continue inside the stop's index entries instead of re-sorting them
+    page = next(e for e in profiler.report(top=20)["top"] if "(st.departure_secs, st.trip_id, st.stop_sequence) >" in e["shape"])
+    assert page["indexes"][0] == "ix_stop_times_stop_departure" and not page["temp_btree"]
+
+
+def test_in_memory_schedule_pages_match_sorted_rows():
+    from app.core.gtfs_manager import GTFSManager
+
+    m = GTFSManager()
+    m.data = make_feed()
+    m.compact()
+    for filters in ({"date": "2025-06-02"}, {"stop_id": "S2"}, {"route_id": "R1", "date": "20250602"}):
+        expected = pagination.rows_after(m.get_schedule(limit=None, **filters), gtfs_service._schedule_key, None, 100)
+        seen, after = [], None
+        while True:
+            rows = m.get_schedule_page(after=after, limit=2, **filters)
+            seen.extend(rows)
+            if len(rows) < 2:
+                break
+            after = list(gtfs_service._schedule_key(rows[-1]))
+        assert seen == expected
+    # later pages slice the sorted frame cached for those filters
+    assert m._schedule_pages.stats()["entries"] == 3 and m._schedule_pages.hits > 0
@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+from app import app
+from app.config.settings import settings
+from app.core.gtfs_sqlite import GTFSStore
+from app.core.query_profiler import normalize_sql, plan_flags, profiler
+
+client = TestClient(app)
+
+
+def test_normalize_sql_groups_literals_and_in_lists():
+    a = normalize_sql("SELECT * FROM stops\n WHERE stop_id = 'S1' AND x IN (?, ?, ?) LIMIT 5")
+    b = normalize_sql("SELECT * FROM stops WHERE stop_id = 'S22' AND x IN (?,?) LIMIT 10")
+    assert a == b == "SELECT * FROM stops WHERE stop_id = ? AND x IN (?+) LIMIT ?"
+
+
+def test_plan_flags():
+    assert plan_flags(["SCAN stops"]) == {"full_scan": True, "temp_btree": False}
+    assert plan_flags(["SEARCH stops USING INDEX ix_stops_stop_id (stop_id=?)", "USE TEMP B-TREE FOR ORDER BY"]) == {
+        "full_scan": False,
+        "temp_btree": True,
+    }
+
+
+def test_profiler_records_shapes_plans_and_slow_queries(gtfs_db, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_PROFILER_ENABLED", True)
+    monkeypatch.setattr(settings, "SLOW_QUERY_MS", 0.0)
+    profiler.reset()
+    store = GTFSStore(gtfs_db)
+    store.get_stop("S1")
+    store.get_stop("S2")
+    store.search_stops("al")
+    store.get_route_stops("R1")
+
+    report = profiler.report(top=10)
+    by_shape = {e["shape"]: e for e in report["top"]}
+    stop_shape = by_shape["SELECT * FROM stops WHERE stop_id = ? LIMIT ?"]
+    assert stop_shape["count"] == 2
+    assert stop_shape["plan"]
+    assert stop_shape["full_scan"] is False
+    # LIKE '%..%' cannot seek, but ORDER BY stop_name walks ix_stops_name instead of sorting
+    search = next(e for e in report["top"] if "lower(stop_name) LIKE" in e["shape"])
+    assert search["indexes"] == ["ix_stops_name"] and not search["temp_btree"]
+    # ordering by columns of two joined tables needs a temp b-tree
+    route_stops = next(e for e in report["top"] if "FROM trips t JOIN stop_times" in e["shape"])
+    assert route_stops["full_scan"] and route_stops["temp_btree"]
+    assert report["slow_queries"][0]["params"]
+    assert gtfs_db in report["unused_indexes"]
+    assert report["redundant_indexes"][gtfs_db]["ix_stop_times_trip_id"] == "ix_stop_times_trip_sequence"
+
+
+def test_admin_queries_endpoint(gtfs_db, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_PROFILER_ENABLED", True)
+    profiler.reset()
+    GTFSStore(gtfs_db).get_routes()
+    r = client.get("/admin/queries", params={"top": 1, "order": "max"})
+    assert r.status_code == 200
+    data = r.json()["data"]
+    assert data["enabled"] is True
+    assert len(data["top"]) == 1
+    assert client.post("/admin/queries/reset").json()["data"]["reset"] is True
+    assert profiler.report()["shapes_tracked"] == 0
@@ -53,3 +53,90 @@ def test_get_trip_updates():
     data = body.get("data")
     assert len(data) >= 1
     assert data[0].get("trip_id") == "T100"
+
+
+def _vehicle(vid: str, lat: float, lon: float, ts: int):
+    vp = gtfs_realtime_pb2.VehiclePosition()
+    vp.vehicle.id = vid
+    vp.trip.trip_id = f"T{vid}"
+    vp.trip.route_id = "R1"
+    vp.position.latitude = lat
+    vp.position.longitude = lon
+    vp.timestamp = ts
+    return vp
+
+
+def test_vehicle_index_bbox_near_and_delta():
+    from app.core.rt_index import VehicleIndex
+
+    first = VehicleIndex([_vehicle("a", 40.40, -3.70, 100), _vehicle("b", 41.38, 2.17, 100)], feed_timestamp=100)
+    gtfs_manager.rt_vehicle_index = VehicleIndex(
+        [_vehicle("a", 40.41, -3.70, 130), _vehicle("c", 40.42, -3.69, 90)],
+        feed_timestamp=130,
+        previous=first,
+    )
+    try:
+        r = client.get("/realtime/vehicles?bbox=-3.8,40.3,-3.6,40.5")
+        ids = sorted(v["vehicle_id"] for v in r.json()["data"])
+        assert ids == ["a", "c"]
+
+        r = client.get("/realtime/vehicles?near=40.41,-3.70&radius=500")
+        data = r.json()["data"]
+        assert [v["vehicle_id"] for v in data] == ["a"]
+        assert data[0]["distance_m"] < 1
+
+        # client holds the previous snapshot: 'a' moved, 'c' is new (with an older fix), 'b' disappeared
+        body = client.get("/realtime/vehicles?since=100").json()
+        assert body["meta"]["delta"] is True
+        assert sorted(v["vehicle_id"] for v in body["data"]) == ["a", "c"]
+        assert body["meta"]["removed"] == ["b"]
+
+        # too old: full response
+        body = client.get("/realtime/vehicles?since=10").json()
+        assert body["meta"]["delta"] is False
+        assert len(body["data"]) == 2
+
+        assert client.get("/realtime/vehicles?bbox=1,2").status_code == 400
+        # non-finite numbers, out-of-range coordinates and inverted boxes are rejected
+        for query in ("bbox=nan,nan,nan,nan", "near=inf,0", "near=40.4,-inf", "near=91,0", "bbox=-3.6,40.3,-3.8,40.5",
+                      "bbox=-3.8,40.5,-3.6,40.3", "bbox=-181,40.3,-3.6,40.5"):
+            assert client.get(f"/realtime/vehicles?{query}").status_code == 400, query
+    finally:
+        setup_module(None)
+
+
+def test_alerts_and_trip_updates_are_decoded_and_indexed():
+    alert = gtfs_realtime_pb2.Alert()
+    alert.header_text.translation.add().text = "Obras"
+    alert.effect = gtfs_realtime_pb2.Alert.REDUCED_SERVICE
+    alert.cause = gtfs_realtime_pb2.Alert.MAINTENANCE
+    alert.informed_entity.add().route_id = "40T0001C1"
+    alert.informed_entity.add().stop_id = "65000"
+    period = alert.active_period.add()
+    period.start = 1
+
+    tu = gtfs_realtime_pb2.TripUpdate()
+    tu.trip.trip_id = "T200"
+    tu.trip.route_id = "40T0001C1"
+    stu = tu.stop_time_update.add()
+    stu.stop_id = "65000"
+    stu.stop_sequence = 3
+    stu.arrival.delay = 120
+
+    gtfs_manager.rt_alerts = [alert]
+    gtfs_manager.rt_trip_updates = [tu]
+    try:
+        data = client.get("/realtime/alerts?stop_id=65000&active=true").json()["data"]
+        assert len(data) == 1
+        assert data[0]["effect"] == "REDUCED_SERVICE"
+        assert data[0]["cause"] == "MAINTENANCE"
+        assert {"route_id": "40T0001C1"}.items() <= data[0]["informed_entity"][0].items()
+        assert client.get("/realtime/alerts?route_id=OTHER").json()["data"] == []
+
+        data = client.get("/realtime/trip_updates?stop_id=65000").json()["data"]
+        assert data[0]["trip_id"] == "T200"
+        assert data[0]["stop_time_updates"][0]["arrival_delay"] == 120
+
+        assert gtfs_manager.rt_alert_index.for_route("40T0001C1")[0]["header_text"] == "Obras"
+    finally:
+        setup_module(None)
@@ -37,3 +37,19 @@ def test_get_route_not_found():
     assert r.status_code == 404
     body = r.json()
     assert body.get("title") is not None
+
+
+def test_get_route_includes_active_alerts():
+    from google.transit import gtfs_realtime_pb2
+
+    alert = gtfs_realtime_pb2.Alert()
+    alert.header_text.translation.add().text = "Incidencia"
+    alert.informed_entity.add().route_id = "40T0001C1"
+    gtfs_manager.rt_alerts = [alert]
+    try:
+        r = client.get("/routes/40T0001C1")
+        assert r.status_code == 200
+        alerts = r.json()["data"]["alerts"]
+        assert [a["header_text"] for a in alerts] == ["Incidencia"]
+    finally:
+        gtfs_manager.rt_alerts = []
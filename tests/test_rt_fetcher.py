@@ -1,5 +1,6 @@
 from google.transit import gtfs_realtime_pb2
-from app.core.rt_fetcher import rt_fetcher
+from app.core import shared_state
+from app.core.rt_fetcher import RTFetcher, rt_fetcher
 from app.core.gtfs_manager import gtfs_manager
 
 
@@ -61,3 +62,83 @@ def test_parse_alerts():
     assert len(gtfs_manager.rt_alerts) == 1
     a = gtfs_manager.rt_alerts[0]
     assert a.header_text.translation[0].text == "Test alert"
+
+
+def test_decode_runs_off_loop_and_publish_swaps_reference():
+    import asyncio
+
+    feed = make_vehicle_entity("T9")
+    feed.header.gtfs_realtime_version = "2.0"
+    data = feed.SerializeToString()
+    gtfs_manager.rt_vehicles = []
+    previous = gtfs_manager.rt_vehicle_index
+
+    async def _run():
+        snapshot, parse_ms = await asyncio.to_thread(rt_fetcher._decode, "vehicles", data)
+        # decoding must not touch the published snapshot
+        assert gtfs_manager.rt_vehicle_index is previous
+        rt_fetcher._publish("vehicles", snapshot, parse_ms=parse_ms, payload_bytes=len(data))
+        return snapshot
+
+    snapshot = asyncio.run(_run())
+    assert gtfs_manager.rt_vehicle_index is snapshot
+    assert gtfs_manager.rt_vehicles[0].trip.trip_id == "T9"
+    stats = rt_fetcher.get_stats()
+    assert stats["feeds"]["vehicles"]["entities"] == 1
+    assert stats["feeds"]["vehicles"]["payload_bytes"] == len(data)
+
+
+def test_lag_monitor_records_blocking():
+    import asyncio
+    import time
+    from app.core.rt_fetcher import RTFetcher
+
+    fetcher = RTFetcher(lag_interval=0.01)
+
+    async def _run():
+        task = asyncio.get_event_loop().create_task(fetcher._lag_monitor())
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)  # block the loop on purpose
+        await asyncio.sleep(0.03)
+        fetcher._stop.set()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(_run())
+    lag = fetcher.get_stats()["loop_lag_ms"]
+    assert lag["samples"] >= 1
+    assert lag["max"] >= 50
+
+
+def test_worker_follows_payloads_published_by_supervisor(tmp_path):
+    import asyncio
+
+    directory = str(tmp_path)
+    worker = RTFetcher()
+    gtfs_manager.rt_vehicles = []
+
+    def _payload(trip_id):
+        feed = make_vehicle_entity(trip_id)
+        feed.header.gtfs_realtime_version = "2.0"
+        return feed.SerializeToString()
+
+    async def _wait_for(trip_id):
+        for _ in range(100):
+            vehicles = gtfs_manager.rt_vehicles
+            if vehicles and vehicles[0].trip.trip_id == trip_id:
+                return True
+            await asyncio.sleep(0.01)
+        return False
+
+    async def _run():
+        task = asyncio.get_event_loop().create_task(worker._follow_loop("vehicles", directory, 0.01))
+        shared_state.publish_payload("vehicles", _payload("W1"), directory)
+        assert await _wait_for("W1")
+        shared_state.publish_payload("vehicles", _payload("W2"), directory)
+        assert await _wait_for("W2")
+        worker._stop.set()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(_run())
+    assert [p.name for p in tmp_path.iterdir()] == ["rt_vehicles.pb"]
+    assert worker.get_stats()["feeds"]["vehicles"]["entities"] == 1
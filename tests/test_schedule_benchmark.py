@@ -0,0 +1,76 @@
+"""Vectorized `GTFSManager.get_schedule(date=...)` vs the previous per-trip implementation.
+
+The outputs must match. The timing comparison is opt-in (wall-clock results
+depend on the machine): `RUN_BENCHMARKS=1 pytest -q tests/test_schedule_benchmark.py`.
+"""
+import os
+from time import perf_counter
+
+import pandas as pd
+import pytest
+
+from app.core.gtfs_manager import GTFSManager
+from tests.conftest import make_synthetic_manager
+
+
+def _legacy_get_schedule(m: GTFSManager, stop_id=None, route_id=None, date=None, limit=200):
+    """The pre-vectorization implementation (one `_service_active_on` call per trip)."""
+    stop_times = m.data["stop_times"]
+    trips = m.data["trips"]
+    routes = m.data["routes"]
+    df = stop_times.copy()
+    if date:
+        date_str = date.replace("-", "")
+        valid_trips = trips[trips["service_id"].apply(lambda sid: m._service_active_on(sid, date_str) if sid is not None else False)]
+        df = df[df["trip_id"].isin(valid_trips["trip_id"])]
+    df = df.merge(trips, on="trip_id", how="left", suffixes=("", "_trip"))
+    if route_id:
+        df = df[df["route_id"] == route_id]
+    if stop_id:
+        series_num = pd.to_numeric(df["stop_id"], errors="coerce")
+        df = df[series_num == pd.to_numeric(stop_id, errors="coerce")]
+    df = df.merge(routes[["route_id", "route_short_name"]], on="route_id", how="left")
+    df = df[["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence", "route_id", "route_short_name"]]
+    df = df.sort_values(by=["route_id", "stop_sequence"])
+    if limit:
+        df = df.head(limit)
+    if date:
+        df["service_date"] = date
+    return df.to_dict(orient="records")
+
+
+def _as_set(rows):
+    return {tuple(sorted(r.items())) for r in rows}
+
+
+def _timed(fn, *args, **kwargs):
+    start = perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (perf_counter() - start) * 1000.0
+
+
+CASES = [
+    {"date": "2025-06-02"},
+    {"date": "2025-06-03", "route_id": "R3"},
+    {"date": "2025-06-02", "stop_id": "7"},
+]
+
+
+def test_get_schedule_by_date_matches_legacy():
+    m = make_synthetic_manager()
+    for kwargs in CASES:
+        legacy = _legacy_get_schedule(m, limit=0, **kwargs)
+        new = m.get_schedule(limit=0, **kwargs)
+        assert _as_set(new) == _as_set(legacy)
+        assert len(new) > 0
+
+
+@pytest.mark.skipif(not os.getenv("RUN_BENCHMARKS"), reason="timing benchmark; set RUN_BENCHMARKS=1")
+def test_get_schedule_by_date_benchmark():
+    m = make_synthetic_manager()
+    for kwargs in CASES:
+        _, legacy_ms = _timed(_legacy_get_schedule, m, limit=0, **kwargs)
+        m._service_cache.clear()
+        m._schedules_by_date.clear()
+        _, new_ms = _timed(m.get_schedule, limit=0, **kwargs)
+        assert new_ms < legacy_ms, f"get_schedule({kwargs}): legacy={legacy_ms:.1f}ms vectorized={new_ms:.1f}ms"
@@ -0,0 +1,94 @@
+from datetime import date
+
+import pandas as pd
+
+from app.core.cache import ByteLRUCache
+from app.core.gtfs_manager import GTFSManager
+from tests.conftest import make_synthetic_manager
+
+
+def test_byte_lru_evicts_least_recently_used():
+    cache = ByteLRUCache(max_bytes=100)
+    cache.put("a", "x", size=40)
+    cache.put("b", "y", size=40)
+    assert cache.get("a") == "x"  # "a" is now most recent
+    cache.put("c", "z", size=40)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == 80
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    # values bigger than the whole budget are never cached
+    assert cache.put("huge", "h", size=101) is False
+    assert "huge" not in cache
+
+
+def test_byte_lru_sizes_dataframes_deeply():
+    df = pd.DataFrame({"s": ["some-string-value"] * 1000})
+    cache = ByteLRUCache(max_bytes=10 * 1024 * 1024)
+    cache.put("df", df)
+    assert cache.stats()["bytes"] == int(df.memory_usage(deep=True).sum())
+
+
+def test_precompute_window_builds_and_drops_dates():
+    m = make_synthetic_manager(n_trips=100)
+    built = m.precompute_window(today=date(2025, 6, 2))
+    assert built[0] == "20250602"
+    assert sorted(built) == [f"202506{d:02d}" for d in range(1, 10)]
+
+    # next day: only the new tail date is built and the stale head is dropped
+    built = m.precompute_window(today=date(2025, 6, 3))
+    assert built == ["20250610"]
+    assert "20250601" not in m._schedules_by_date
+    meta = m.get_metadata()
+    assert meta["schedule_cache"]["entries"] == 9
+    assert meta["schedule_cache"]["precompute"]["runs"] == 2
+    assert meta["today_schedule_count"] == str(len(m._schedules_by_date.peek("20250603")))
+
+
+def test_get_schedule_uses_cached_frame_for_filters():
+    m = make_synthetic_manager(n_trips=200)
+    fresh = make_synthetic_manager(n_trips=200)
+    m.precompute_window(today=date(2025, 6, 2))
+    hits = m._schedules_by_date.hits
+    cached = m.get_schedule(route_id="R3", date="2025-06-02", limit=0)
+    assert m._schedules_by_date.hits == hits + 1
+    direct = fresh.get_schedule(route_id="R3", date="2025-06-02", limit=0)
+    key = lambda r: (r["trip_id"], r["stop_sequence"])
+    assert sorted(map(key, cached)) == sorted(map(key, direct))
+    stop = direct[0]["stop_id"]
+    assert sorted(map(key, m.get_schedule(stop_id=stop, date="20250602", limit=0))) == sorted(
+        map(key, fresh.get_schedule(stop_id=stop, date="20250602", limit=0))
+    )
+
+
+def test_schedule_cache_respects_byte_budget():
+    m = GTFSManager()
+    src = make_synthetic_manager(n_trips=200)
+    m.data = src.data
+    one_day = int(m._build_schedule_for_date("20250602").memory_usage(deep=True).sum())
+    m._schedules_by_date = ByteLRUCache(max_bytes=int(one_day * 2.5))
+    built = m.precompute_window(today=date(2025, 6, 2))
+    stats = m._schedules_by_date.stats()
+    assert stats["bytes"] <= stats["max_bytes"]
+    # building stops once the budget is full instead of evicting the window
+    assert 0 < len(built) < 9
+    assert stats["evictions"] == 0
+    assert "20250602" in m._schedules_by_date
+
+
+def test_precompute_discards_frames_built_from_replaced_tables():
+    m = GTFSManager()
+    m.data = make_synthetic_manager(n_trips=100).data
+    build = m._build_schedule_for_date
+
+    def build_then_reload(date_str):
+        df = build(date_str)
+        m._data_generation += 1  # what set_tables does on a reload
+        return df
+
+    m._build_schedule_for_date = build_then_reload
+    assert m.precompute_window(today=date(2025, 6, 2)) == []
+    assert len(m._schedules_by_date) == 0
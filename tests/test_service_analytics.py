@@ -0,0 +1,86 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.config.settings import settings
+from app.core.service_analytics import expand_frequencies, service_analytics
+from tests.conftest import make_feed
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def frequency_db(tmp_path, monkeypatch):
+    """The conftest feed plus TF on R2: a S1 -> S2 template run every 15 minutes from 08:00 to 09:00."""
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+
+    feed = make_feed()
+    feed["trips"] = pd.concat([feed["trips"], pd.DataFrame([
+        {"route_id": "R2", "service_id": "WK", "trip_id": "TF", "trip_headsign": "Beta", "direction_id": 0, "shape_id": None},
+    ])], ignore_index=True)
+    feed["stop_times"] = pd.concat([feed["stop_times"], pd.DataFrame([
+        {"trip_id": "TF", "arrival_time": "00:00:00", "departure_time": "00:00:00", "stop_id": "S1", "stop_sequence": 1},
+        {"trip_id": "TF", "arrival_time": "00:05:00", "departure_time": "00:05:00", "stop_id": "S2", "stop_sequence": 2},
+    ])], ignore_index=True)
+    feed["frequencies"] = pd.DataFrame([
+        {"trip_id": "TF", "start_time": "08:00:00", "end_time": "09:00:00", "headway_secs": 900, "exact_times": 0},
+    ])
+    db_path = os.path.join(str(tmp_path), "gtfs.db")
+    build_sqlite_from_dict(feed, db_path + ".tmp")
+    os.replace(db_path + ".tmp", db_path)
+    monkeypatch.setattr(settings, "GTFS_DATA_DIR", str(tmp_path))
+    return db_path
+
+
+def _get(path, **params):
+    r = client.get(path, params=params)
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_service_span_and_headways(gtfs_db):
+    service_analytics.clear()
+    spans = _get("/analytics/service-span", route_id="R1", stop_id="S1")["data"]
+    assert [(s["route_short_name"], s["stop_name"], s["first_departure"], s["last_departure"], s["departures"]) for s in spans] == [
+        ("C1", "Alpha", "06:00:00", "23:50:00", 2),
+    ]
+    # after-midnight calls of the service day keep GTFS hours >= 24
+    assert [s["last_departure"] for s in _get("/analytics/service-span", route_id="R1", stop_id="S3")["data"]] == ["24:15:00"]
+    rows = _get("/analytics/headways", route_id="R1", stop_id="S1")["data"]
+    assert [(r["hour"], r["departures"], r["avg_headway_secs"]) for r in rows] == [(6, 1, None), (23, 1, 64200.0)]
+    assert _get("/analytics/headways", hour=6, stop_id="S2")["data"][0]["route_id"] == "R1"
+
+
+def test_frequencies_are_expanded(frequency_db):
+    service_analytics.clear()
+    body = _get("/analytics/headways", route_id="R2", stop_id="S2", date=date.today().isoformat())
+    (row,) = [r for r in body["data"] if r["hour"] == 8]
+    # 08:05, 08:20, 08:35, 08:50; the first gap is from T3's 07:10 call
+    assert (row["departures"], row["avg_headway_secs"], row["min_headway_secs"], row["max_headway_secs"]) == (4, 1500.0, 900, 3300)
+    (span,) = _get("/analytics/service-span", route_id="R2", stop_id="S1")["data"]
+    # the 00:00 template is replaced by the four runs of the frequency window; T3 arrives at 07:20
+    assert (span["first_departure"], span["last_departure"], span["departures"]) == ("07:20:00", "08:45:00", 5)
+
+
+def test_tables_are_cached_per_service_date(gtfs_db):
+    service_analytics.clear()
+    before = service_analytics.cache.stats()
+    _get("/analytics/headways", date="2025-06-02")
+    _get("/analytics/service-span", date="2025-06-02", route_id="R2")
+    after = service_analytics.cache.stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
+    assert _get("/analytics/headways", date="2019-01-01")["data"] == []
+    assert client.get("/analytics/headways", params={"date": "02/06/2025"}).status_code == 400
+
+
+def test_expand_frequencies_windows():
+    trip = np.array([0, 0, 1, 1, 1])
+    secs = np.array([0, 300, 100, 160, 400])
+    index, out = expand_frequencies(trip, secs, np.array([1, 0]), np.array([1000, 0]), np.array([1100, 600]), np.array([60, 600]))
+    assert index.tolist() == [2, 3, 4, 2, 3, 4, 0, 1]
+    assert out.tolist() == [1000, 1060, 1300, 1060, 1120, 1360, 0, 300]
@@ -0,0 +1,67 @@
+import sqlite3
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app import app
+from app.core import shape_geometry
+from app.core.gtfs_sqlite import GTFSStore
+
+client = TestClient(app)
+
+
+def test_polyline_roundtrip_matches_reference():
+    # example from the Google encoded polyline documentation
+    points = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    encoded = shape_geometry.encode_polyline(points)
+    assert encoded == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert shape_geometry.decode_polyline(encoded) == [list(p) for p in points]
+
+
+def test_douglas_peucker_keeps_corners_and_far_ends():
+    # an L with collinear points on each leg, then straight back to the start
+    lat = np.array([40.0, 40.001, 40.002, 40.002, 40.002, 40.0])
+    lon = np.array([-3.7, -3.7, -3.7, -3.699, -3.698, -3.7])
+    assert shape_geometry.simplify(lat, lon, 5).tolist() == [0, 2, 4, 5]
+    assert shape_geometry.simplify(lat, lon, 0).tolist() == list(range(6))
+    assert shape_geometry.pick_tolerance([0.0, 2.0, 10.0], 7) == 2.0
+
+
+def test_shapes_are_precomputed_per_tolerance(gtfs_db):
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        rows = conn.execute("SELECT tolerance_m, n_points FROM shape_geometry WHERE shape_id = 'SH1' ORDER BY tolerance_m").fetchall()
+    finally:
+        conn.close()
+    assert [t for t, _ in rows] == shape_geometry.configured_tolerances()
+    # SH1 is a straight line: only its end points survive any positive tolerance
+    assert rows[0][1] == 9 and all(n == 2 for _, n in rows[1:])
+
+    full = client.get("/trips/T1/shape").json()["data"]["shape"]
+    assert full["n_points"] == 9 and full["tolerance_m"] == 0
+    assert shape_geometry.decode_polyline(full["polyline"])[-1] == [40.42, -3.7]
+    zoomed = client.get("/trips/T1/shape", params={"zoom": 10}).json()["data"]["shape"]
+    assert zoomed["n_points"] == 2 and zoomed["tolerance_m"] > 0
+
+
+def test_route_shape_geojson_and_errors(gtfs_db):
+    body = client.get("/routes/R1/shape", params={"format": "geojson", "tolerance": 10}).json()["data"]
+    assert body["type"] == "FeatureCollection"
+    feature = body["features"][0]
+    assert feature["geometry"]["coordinates"] == [[-3.7, 40.4], [-3.7, 40.42]]
+    assert feature["properties"]["n_trips"] == 2 and feature["properties"]["shape_id"] == "SH1"
+    assert client.get("/routes/R2/shape").json()["data"]["shapes"] == []
+    assert client.get("/trips/T3/shape").json()["data"]["shape"] is None
+    assert client.get("/routes/NOPE/shape").status_code == 404
+    assert client.get("/trips/T1/shape", params={"format": "kml"}).status_code == 400
+
+
+def test_shape_without_precomputed_table(gtfs_db):
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        conn.execute("DROP TABLE shape_geometry")
+        conn.commit()
+    finally:
+        conn.close()
+    shape = GTFSStore(gtfs_db).get_trip_shape("T1", tolerance=25)["shape"]
+    assert shape["n_points"] == 2 and shape["tolerance_m"] == 10.0
@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app import app
+from app.config.settings import settings
+from tests.conftest import make_feed
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def station_db(tmp_path, monkeypatch):
+    """The conftest feed plus station 17000 with platforms 17001/17002 and trips to 18000."""
+    from app.core.gtfs_sqlite_loader import build_sqlite_from_dict
+
+    feed = make_feed()
+    feed["stops"] = pd.concat([feed["stops"], pd.DataFrame([
+        {"stop_id": "17000", "stop_name": "Central", "stop_lat": 40.45, "stop_lon": -3.69, "location_type": 1, "parent_station": None},
+        {"stop_id": "17001", "stop_name": "Central vía 1", "stop_lat": 40.45, "stop_lon": -3.69, "location_type": 0, "parent_station": "17000"},
+        {"stop_id": "17002", "stop_name": "Central vía 2", "stop_lat": 40.45, "stop_lon": -3.69, "location_type": 0, "parent_station": "17000"},
+        {"stop_id": "17009", "stop_name": "Central acceso", "stop_lat": 40.45, "stop_lon": -3.69, "location_type": 2, "parent_station": "17000"},
+        {"stop_id": "18000", "stop_name": "Norte", "stop_lat": 40.50, "stop_lon": -3.69},
+    ])], ignore_index=True)
+    feed["trips"] = pd.concat([feed["trips"], pd.DataFrame([
+        {"route_id": "R1", "service_id": "WK", "trip_id": trip_id, "trip_headsign": "Norte", "direction_id": 0, "shape_id": None}
+        for trip_id in ("TA", "TB", "TC")
+    ])], ignore_index=True)
+    calls = [("TA", "17001", "08:00:00"), ("TB", "17002", "08:10:00"), ("TC", "17001", "08:20:00")]
+    rows = []
+    for trip_id, platform, departure in calls:
+        arrival = f"{int(departure[:2]):02d}:{int(departure[3:5]) + 30:02d}:00"
+        rows.append({"trip_id": trip_id, "arrival_time": departure, "departure_time": departure, "stop_id": platform, "stop_sequence": 1})
+        rows.append({"trip_id": trip_id, "arrival_time": arrival, "departure_time": arrival, "stop_id": "18000", "stop_sequence": 2})
+    feed["stop_times"] = pd.concat([feed["stop_times"], pd.DataFrame(rows)], ignore_index=True)
+    db_path = os.path.join(str(tmp_path), "gtfs.db")
+    build_sqlite_from_dict(feed, db_path + ".tmp")
+    os.replace(db_path + ".tmp", db_path)
+    monkeypatch.setattr(settings, "GTFS_DATA_DIR", str(tmp_path))
+    return db_path
+
+
+def _board(stop_id, **params):
+    r = client.get(f"/stops/{stop_id}/upcoming", params=dict(current_time="07:30:00", hours=2, **params))
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def test_station_board_merges_platforms(station_db):
+    board = _board("17000", aggregate="station")
+    assert (board["stop_id"], board["stop_name"], board["platforms"]) == ("17000", "Central", ["17001", "17002"])
+    assert [(d["trip_id"], d["stop_id"]) for d in board["departures"]] == [("TA", "17001"), ("TB", "17002"), ("TC", "17001")]
+    # a platform with aggregate=station is its whole station; without it, only that platform
+    assert _board("17002", aggregate="station")["departures"] == board["departures"]
+    assert [d["trip_id"] for d in _board("17001")["departures"]] == ["TA", "TC"]
+    assert [d["trip_id"] for d in _board("17000", aggregate="station", limit=2)["departures"]] == ["TA", "TB"]
+    # a stop outside any station is its own platform
+    assert _board("18000", aggregate="station")["platforms"] == ["18000"]
+    assert client.get("/stops/17000/upcoming", params={"aggregate": "line"}).status_code == 400
+
+
+def test_station_batch_and_direct_departures(station_db):
+    r = client.post("/stops/upcoming:batch", json={"stop_ids": ["17001"], "current_time": "07:30:00", "hours": 2, "aggregate": "station"})
+    assert r.status_code == 200
+    assert '"platforms": ["17001", "17002"]' in r.text
+    r = client.get("/stops/17000/to/18000/departures", params={"current_time": "07:30:00", "hours": 2, "aggregate": "station"})
+    assert r.status_code == 200, r.text
+    deps = r.json()["data"]["departures"]
+    assert [(d["trip_id"], d["from_platform_id"], d["to_platform_id"]) for d in deps] == [
+        ("TA", "17001", "18000"), ("TB", "17002", "18000"), ("TC", "17001", "18000"),
+    ]
+
+
+def test_station_schedule_pages_in_departure_order(station_db):
+    seen, cursor = [], None
+    while True:
+        params = {"stop_id": "17000", "aggregate": "station", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get("/schedule/", params=params)
+        assert r.status_code == 200, r.text
+        body = r.json()
+        seen += [(row["trip_id"], row["stop_id"]) for row in body["data"]]
+        cursor = body["meta"].get("next_cursor")
+        if not cursor:
+            break
+    assert seen == [("TA", 17001), ("TB", 17002), ("TC", 17001)]
+    assert client.get("/schedule/", params={"aggregate": "station"}).status_code == 400
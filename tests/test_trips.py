@@ -0,0 +1,68 @@
+import sqlite3
+
+from fastapi.testclient import TestClient
+from google.transit import gtfs_realtime_pb2
+
+from app import app
+from app.core.gtfs_manager import gtfs_manager
+from app.core.gtfs_sqlite import GTFSStore
+
+client = TestClient(app)
+
+
+def test_trip_stop_times_are_clustered_by_trip(gtfs_db):
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'trip_stop_times'").fetchone()[0]
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM trip_stop_times WHERE trip_id = ? ORDER BY stop_sequence", ("T1",)
+        ))
+        count = conn.execute("SELECT COUNT(*) FROM trip_stop_times").fetchone()[0]
+    finally:
+        conn.close()
+    assert "WITHOUT ROWID" in sql
+    # a primary key range read, already in stop_sequence order
+    assert "PRIMARY KEY" in plan and "TEMP B-TREE" not in plan
+    assert count == 9
+
+
+def test_trip_detail_with_live_delay(gtfs_db):
+    tu = gtfs_realtime_pb2.TripUpdate()
+    tu.trip.trip_id = "T1"
+    stu = tu.stop_time_update.add()
+    stu.stop_sequence = 2
+    stu.arrival.delay = 120
+    stu.departure.delay = 180
+    gtfs_manager.rt_trip_updates = [tu]
+    try:
+        r = client.get("/trips/T1")
+        assert r.status_code == 200, r.text
+        trip = r.json()["data"]
+    finally:
+        gtfs_manager.rt_trip_updates = []
+    assert (trip["route_short_name"], trip["trip_headsign"], trip["shape_id"]) == ("C1", "Gamma", "SH1")
+    assert [(s["stop_id"], s["stop_name"], s["departure_time"]) for s in trip["stop_times"]] == [
+        ("S1", "Alpha", "06:00:00"), ("S2", "Beta", "06:11:00"), ("S3", "Gamma", "06:20:00"),
+    ]
+    assert len(trip["shape"]) == 9 and trip["shape"][0] == [40.40, -3.70]
+    # the delay applies from the updated stop onwards
+    assert [(s["arrival_delay"], s["departure_delay"]) for s in trip["stop_times"]] == [(None, None), (120, 180), (180, 180)]
+    assert trip["realtime"]["delay"] == 120
+
+
+def test_trip_without_realtime_or_shape(gtfs_db):
+    trip = client.get("/trips/T3").json()["data"]
+    assert trip["realtime"] is None and trip["vehicle"] is None and trip["shape"] == []
+    assert [s["stop_id"] for s in trip["stop_times"]] == ["S3", "S2", "S1"]
+    assert client.get("/trips/NOPE").status_code == 404
+
+
+def test_trip_on_database_without_trip_stop_times(gtfs_db):
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        conn.execute("DROP TABLE trip_stop_times")
+        conn.commit()
+    finally:
+        conn.close()
+    trip = GTFSStore(gtfs_db).get_trip("T2")
+    assert [s["arrival_time"] for s in trip["stop_times"]] == ["23:50:00", "24:05:00", "24:15:00"]
@@ -0,0 +1,35 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.core import metrics
+
+client = TestClient(app)
+
+
+def test_batch_streams_one_board_per_stop(gtfs_db):
+    before = metrics.DB_QUERY_SECONDS.snapshot("iter_upcoming_trains")["count"]
+    r = client.post(
+        "/stops/upcoming:batch",
+        json={"stop_ids": ["S1", "NOPE", "S2", "S1"], "current_time": "06:05:00", "limit": 5, "hours": 20},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    # duplicates dropped, request order kept
+    assert [line.get("stop_id") or line["data"]["stop_id"] for line in lines] == ["S1", "NOPE", "S2"]
+    assert lines[1]["status"] == 404
+    single = client.get("/stops/S1/upcoming", params={"current_time": "06:05:00", "limit": 5, "hours": 20}).json()
+    assert lines[0] == single
+    assert [d["trip_id"] for d in lines[0]["data"]["departures"]] == ["T3", "T2"]
+    # the whole batch is one store call
+    assert metrics.DB_QUERY_SECONDS.snapshot("iter_upcoming_trains")["count"] == before + 1
+
+
+def test_batch_rejects_empty_and_oversized(gtfs_db):
+    assert client.post("/stops/upcoming:batch", json={"stop_ids": []}).status_code == 400
+    too_many = [f"S{i}" for i in range(201)]
+    assert client.post("/stops/upcoming:batch", json={"stop_ids": too_many}).status_code == 400
+    # rejected before streaming starts, not with a truncated body
+    assert client.post("/stops/upcoming:batch", json={"stop_ids": ["S1"], "limit": -1}).status_code == 422
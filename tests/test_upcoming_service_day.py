@@ -0,0 +1,73 @@
+import sqlite3
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from app import app
+from app.core.gtfs_sqlite import GTFSStore
+
+client = TestClient(app)
+
+
+def _board(stop_id, current_time, hours):
+    r = client.get(f"/stops/{stop_id}/upcoming", params={"current_time": current_time, "hours": hours})
+    assert r.status_code == 200, r.text
+    return r.json()["data"]
+
+
+def test_stop_times_carry_seconds_past_midnight(gtfs_db):
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        row = conn.execute("SELECT departure_secs, arrival_secs FROM stop_times WHERE trip_id = 'T2' AND stop_id = 'S2'").fetchone()
+    finally:
+        conn.close()
+    assert row == (24 * 3600 + 6 * 60, 24 * 3600 + 5 * 60)
+
+
+def test_after_midnight_board_includes_yesterdays_trips(gtfs_db):
+    board = _board("S2", "00:01:00", 8)
+    deps = board["departures"]
+    assert [(d["trip_id"], d["service_date"]) for d in deps] == [
+        ("T2", (date.today() - timedelta(days=1)).isoformat()),
+        ("T1", date.today().isoformat()),
+        ("T3", date.today().isoformat()),
+    ]
+    assert deps[0]["scheduled_time"] == "24:06:00"
+    assert deps[0]["scheduled_at"] == f"{date.today().isoformat()}T00:06:00"
+    assert [d["minutes_until"] for d in deps] == [5, 370, 429]
+
+
+def test_late_evening_board_reaches_into_tomorrow(gtfs_db):
+    deps = _board("S2", "23:55:00", 7)["departures"]
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    assert [(d["trip_id"], d["service_date"], d["minutes_until"]) for d in deps] == [
+        ("T2", date.today().isoformat(), 11),
+        ("T1", tomorrow, 376),
+    ]
+    # the window bounds the look-ahead
+    assert [d["trip_id"] for d in _board("S2", "23:55:00", 1)["departures"]] == ["T2"]
+
+
+def test_board_without_seconds_columns(gtfs_db):
+    # databases built before departure_secs/arrival_secs parse the text times instead
+    conn = sqlite3.connect(gtfs_db)
+    try:
+        # the test feed lacks optional columns some views use, and ALTER TABLE re-checks every view
+        for (view,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'view'").fetchall():
+            conn.execute(f"DROP VIEW {view}")
+        conn.execute("DROP INDEX ix_stop_times_stop_departure")
+        conn.execute("DROP INDEX ix_stop_times_stop_arrival")
+        conn.execute("ALTER TABLE stop_times DROP COLUMN departure_secs")
+        conn.execute("ALTER TABLE stop_times DROP COLUMN arrival_secs")
+        conn.commit()
+    finally:
+        conn.close()
+    board = GTFSStore(gtfs_db).get_upcoming_trains("S2", current_time="00:01:00", hours=8)
+    assert [d["trip_id"] for d in board["departures"]] == ["T2", "T1", "T3"]
+
+
+def test_invalid_board_params(gtfs_db):
+    assert client.get("/stops/S1/upcoming", params={"current_time": "25h"}).status_code == 400
+    assert client.get("/stops/S1/upcoming", params={"hours": 0}).status_code == 400
+    assert client.get("/stops/S1/upcoming", params={"limit": -1}).status_code == 422
+    assert client.get("/stops/S1/upcoming", params={"limit": 0}).status_code == 422
@@ -0,0 +1,184 @@
+import math
+import struct
+
+from fastapi.testclient import TestClient
+from google.transit import gtfs_realtime_pb2
+
+from app import app
+from app.core import vector_tiles
+from app.core.gtfs_manager import gtfs_manager
+from app.core.warmup import Warmup
+
+client = TestClient(app)
+
+
+def _fields(buf):
+    """(field, value) pairs of a protobuf message: ints for varints, bytes otherwise."""
+    i = 0
+    while i < len(buf):
+        key, i = _read_varint(buf, i)
+        field, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _read_varint(buf, i)
+        elif wire == 1:
+            value, i = buf[i:i + 8], i + 8
+        elif wire == 2:
+            n, i = _read_varint(buf, i)
+            value, i = buf[i:i + n], i + n
+        else:
+            raise AssertionError(f"unexpected wire type {wire}")
+        yield field, value
+
+
+def _read_varint(buf, i):
+    shift = result = 0
+    while True:
+        b = buf[i]
+        i += 1
+        result |= (b & 0x7F) << shift
+        shift += 7
+        if b < 0x80:
+            return result, i
+
+
+def _packed(buf):
+    out, i = [], 0
+    while i < len(buf):
+        v, i = _read_varint(buf, i)
+        out.append(v)
+    return out
+
+
+def _unzig(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def decode_tile(data):
+    """{layer name: [(properties, geometry type, [(x, y), ...])]}."""
+    layers = {}
+    for field, raw_layer in _fields(data):
+        assert field == 3
+        name, keys, values, features = None, [], [], []
+        for f, v in _fields(raw_layer):
+            if f == 1:
+                name = v.decode()
+            elif f == 2:
+                features.append(v)
+            elif f == 3:
+                keys.append(v.decode())
+            elif f == 4:
+                (vf, vv), = list(_fields(v))
+                values.append({1: lambda b: b.decode(), 3: lambda b: struct.unpack("<d", b)[0], 5: int, 6: _unzig, 7: bool}[vf](vv))
+            elif f == 15:
+                assert v == 2
+        decoded = []
+        for raw in features:
+            props, gtype, points = {}, None, []
+            for f, v in _fields(raw):
+                if f == 2:
+                    tags = _packed(v)
+                    props = {keys[k]: values[t] for k, t in zip(tags[0::2], tags[1::2])}
+                elif f == 3:
+                    gtype = v
+                elif f == 4:
+                    geometry, i, x, y = _packed(v), 0, 0, 0
+                    while i < len(geometry):
+                        count = geometry[i] >> 3
+                        i += 1
+                        for _ in range(count):
+                            x, y = x + _unzig(geometry[i]), y + _unzig(geometry[i + 1])
+                            points.append((x, y))
+                            i += 2
+            decoded.append((props, gtype, points))
+        layers[name] = decoded
+    return layers
+
+
+def _tile_of(lat, lon, z):
+    mx, my = vector_tiles.mercator([lat], [lon])
+    return int(mx[0] * 2 ** z), int(my[0] * 2 ** z)
+
+
+def _vehicle(vid, lat, lon):
+    vp = gtfs_realtime_pb2.VehiclePosition()
+    vp.vehicle.id = vid
+    vp.trip.trip_id = "T1"
+    vp.trip.route_id = "R1"
+    vp.position.latitude = lat
+    vp.position.longitude = lon
+    return vp
+
+
+def test_tile_layers(gtfs_db):
+    vector_tiles.tile_service.clear()
+    gtfs_manager.rt_vehicles = [_vehicle("V1", 40.405, -3.70), _vehicle("FAR", 43.0, 2.0)]
+    try:
+        x, y = _tile_of(40.41, -3.70, 12)
+        r = client.get(f"/tiles/12/{x}/{y}.mvt")
+        assert r.status_code == 200
+        assert r.headers["content-type"] == vector_tiles.MEDIA_TYPE
+        layers = decode_tile(r.content)
+    finally:
+        gtfs_manager.rt_vehicles = []
+    assert sorted(p["stop_name"] for p, gtype, _ in layers["stops"]) == ["Alpha", "Beta", "Gamma"]
+    assert all(gtype == 1 for _, gtype, _ in layers["stops"])
+    (props, gtype, points), = layers["shapes"]
+    assert gtype == 2 and props["route_short_name"] == "C1" and props["shape_id"] == "SH1"
+    # a straight north-south line: constant x, y decreasing northwards, inside the tile
+    assert len({px for px, _ in points}) == 1 and points[0][1] > points[-1][1]
+    assert all(0 <= px < 4096 and 0 <= py < 4096 for px, py in points)
+    assert [p["vehicle_id"] for p, _, _ in layers["vehicles"]] == ["V1"]
+
+
+def test_static_layers_are_cached_and_vehicles_follow_polls(gtfs_db):
+    service = vector_tiles.tile_service
+    service.clear()
+    x, y = _tile_of(40.41, -3.70, 14)
+    gtfs_manager.rt_vehicles = [_vehicle("V1", 40.41, -3.70)]
+    try:
+        first = decode_tile(client.get(f"/tiles/14/{x}/{y}.mvt").content)
+        misses = service.cache.stats()["misses"]
+        assert decode_tile(client.get(f"/tiles/14/{x}/{y}.mvt").content) == first
+        assert service.cache.stats()["misses"] == misses
+        # a new poll only rebuilds the vehicles layer
+        gtfs_manager.rt_vehicles = [_vehicle("V2", 40.41, -3.7001)]
+        second = decode_tile(client.get(f"/tiles/14/{x}/{y}.mvt").content)
+        assert service.cache.stats()["misses"] == misses + 1
+    finally:
+        gtfs_manager.rt_vehicles = []
+    assert [p["vehicle_id"] for p, _, _ in second["vehicles"]] == ["V2"]
+    assert second["stops"] == first["stops"] and second["shapes"] == first["shapes"]
+
+
+def test_low_zoom_and_invalid_tiles(gtfs_db):
+    vector_tiles.tile_service.clear()
+    x, y = _tile_of(40.41, -3.70, 5)
+    layers = decode_tile(client.get(f"/tiles/5/{x}/{y}.mvt").content)
+    # no stops below TILE_STOPS_MIN_ZOOM; the shape collapses to its simplified ends
+    assert "stops" not in layers and "shapes" in layers
+    empty = client.get("/tiles/5/0/0.mvt")
+    assert empty.status_code == 200 and empty.content == b""
+    assert client.get("/tiles/5/32/0.mvt").status_code == 400
+    assert client.get("/tiles/23/0/0.mvt").status_code == 400
+
+
+def test_tiles_are_prepared_after_the_warm_up(gtfs_db):
+    # the module the warm-up imports lazily (the suite may have reloaded app.*)
+    from app.core.vector_tiles import tile_service as service
+
+    service.clear()
+    warm = Warmup()
+    # the synchronous warm-up (and its timing) no longer includes the tile layers
+    warm.run(gtfs_db)
+    assert service._static is None
+    assert warm.ensure(gtfs_db) is False
+    warm.generation = None
+    assert warm.ensure(gtfs_db) is True
+    warm._thread.join(5)
+    assert warm.is_warm(gtfs_db) and service._static is not None
+
+
+def test_tile_bounds_match_mercator():
+    min_lon, min_lat, max_lon, max_lat = vector_tiles.tile_bounds(1, 0, 0)
+    assert (min_lon, max_lon) == (-180.0, 0.0)
+    assert math.isclose(min_lat, 0.0, abs_tol=1e-9) and math.isclose(max_lat, 85.0511, abs_tol=1e-4)
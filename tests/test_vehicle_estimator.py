@@ -0,0 +1,100 @@
+from datetime import datetime
+
+import numpy as np
+from fastapi.testclient import TestClient
+from google.transit import gtfs_realtime_pb2
+from app import app
+from app.core.gtfs_manager import gtfs_manager
+from app.core.rt_index import VehicleIndex
+from app.core.vehicle_estimator import TripProfile, VehicleEstimator
+
+client = TestClient(app)
+
+
+def _at(hh: int, mm: int) -> int:
+    return int(datetime.now().replace(hour=hh, minute=mm, second=0, microsecond=0).timestamp())
+
+
+def test_estimate_advances_along_shape_with_schedule(gtfs_db):
+    estimator = VehicleEstimator()
+    # halfway between S1 (06:00) and S2 (06:10): on time
+    record = {"trip_id": "T1", "latitude": 40.405, "longitude": -3.70, "timestamp": _at(6, 5)}
+    est = estimator.estimate(record, now=_at(6, 6))
+    assert est["source"] == "shape"
+    assert est["delay_secs"] == 0
+    assert abs(est["latitude"] - 40.406) < 0.0003
+    assert est["bearing"] == 0.0
+
+    # dwell at S2 between 06:10 and 06:11 keeps the vehicle at the stop
+    record = {"trip_id": "T1", "latitude": 40.41, "longitude": -3.70, "timestamp": _at(6, 10)}
+    est = estimator.estimate(record, now=_at(6, 10) + 30)
+    assert abs(est["latitude"] - 40.41) < 1e-6
+
+
+def test_estimate_without_shape_uses_stops(gtfs_db):
+    est = VehicleEstimator().estimate(
+        {"trip_id": "T3", "latitude": 40.42, "longitude": -3.70, "timestamp": _at(7, 0)}, now=_at(7, 1)
+    )
+    assert est["source"] == "stops"
+    assert est["latitude"] < 40.42
+
+
+def test_fix_between_stations_is_projected_onto_the_segment(gtfs_db):
+    # T3 has no shape: the polyline vertices are its stations S3 (07:00), S2 (07:10), S1 (07:20)
+    est = VehicleEstimator().estimate(
+        {"trip_id": "T3", "latitude": 40.4125, "longitude": -3.70, "timestamp": _at(7, 7) + 30}, now=_at(7, 7) + 30
+    )
+    # three quarters of the way to S2 at 07:07:30 is on time, not snapped to a station
+    assert est["delay_secs"] == 0
+    assert abs(est["latitude"] - 40.4125) < 1e-5
+
+
+def test_projection_follows_the_scheduled_leg_of_an_out_and_back_shape():
+    lat = np.array([40.40, 40.41, 40.42, 40.41, 40.40])
+    lon = np.array([-3.70, -3.70, -3.70, -3.7001, -3.7001])
+    stops_t = np.array([0.0, 600.0, 1200.0])
+    prof = TripProfile(lat, lon, lat[[0, 2, 4]], lon[[0, 2, 4]], stops_t, stops_t, source="shape")
+    half = prof.cum[2]
+    # the same point is on both legs: the scheduled window picks the return leg
+    back = prof.project(40.405, -3.70005, near=(prof.scheduled_distance_at(900.0), prof.scheduled_distance_at(1200.0)))
+    assert half < back < prof.cum[-1]
+    assert abs(back - (half + 0.75 * (prof.cum[-1] - half))) < 20.0
+    assert prof.project(40.405, -3.70005) < half
+
+
+def test_vehicles_endpoint_interpolate(gtfs_db):
+    vp = gtfs_realtime_pb2.VehiclePosition()
+    vp.trip.trip_id = "T1"
+    vp.trip.route_id = "R1"
+    vp.position.latitude = 40.405
+    vp.position.longitude = -3.70
+    vp.timestamp = _at(6, 5)
+    gtfs_manager.rt_vehicle_index = VehicleIndex([vp], feed_timestamp=vp.timestamp)
+    try:
+        data = client.get("/realtime/vehicles?interpolate=true").json()["data"]
+        assert data[0]["estimated"]["source"] == "shape"
+        assert data[0]["latitude"] == vp.position.latitude
+        # the published snapshot is never mutated
+        assert "estimated" not in gtfs_manager.rt_vehicle_index.records[0]
+    finally:
+        gtfs_manager.rt_vehicles = []
+
+
+def test_vehicle_stream_emits_sse_events(gtfs_db):
+    import asyncio
+    from app.routers.realtime import _vehicle_events
+
+    class _Request:
+        async def is_disconnected(self):
+            return False
+
+    async def _first_event():
+        events = _vehicle_events(_Request(), {}, 1.0, True)
+        try:
+            return await events.__anext__()
+        finally:
+            await events.aclose()
+
+    event = asyncio.run(_first_event())
+    assert event.startswith("event: vehicles\ndata: ")
+    assert event.endswith("\n\n")